@@ -5,27 +5,41 @@ AWS Macie结果分析工具
 """
 
 import json
-import boto3
 import argparse
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Union
 import logging
 
+from scan_sharding import merge_job_statistics
+
+# 离线分析本地发现文件时不需要boto3
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class MacieResultsAnalyzer:
-    def __init__(self, region='us-east-1', profile=None):
-        """初始化AWS客户端"""
+    def __init__(self, region='us-east-1', profile=None, offline=False):
+        """初始化AWS客户端 (offline=True 时只分析本地发现文件，不创建客户端)"""
+        self.region = region
+        if offline:
+            self.macie_client = None
+            self.s3_client = None
+            return
+        if boto3 is None:
+            raise ImportError("分析Macie作业需要安装boto3 (离线分析请使用 --findings-file)")
         session = boto3.Session(profile_name=profile) if profile else boto3.Session()
         self.macie_client = session.client('macie2', region_name=region)
         self.s3_client = session.client('s3', region_name=region)
-        self.region = region
         
-    def get_job_findings(self, job_id: str) -> List[Dict]:
-        """获取指定作业的所有发现"""
-        logger.info(f"获取作业发现: {job_id}")
+    def get_job_findings(self, job_id: Union[str, List[str]]) -> List[Dict]:
+        """获取指定作业 (或多个分片作业) 的所有发现"""
+        job_ids = [job_id] if isinstance(job_id, str) else list(job_id)
+        logger.info(f"获取作业发现: {', '.join(job_ids)}")
         
         findings = []
         paginator = self.macie_client.get_paginator('list_findings')
@@ -35,7 +49,7 @@ class MacieResultsAnalyzer:
                 findingCriteria={
                     'criterion': {
                         'classificationDetails.jobId': {
-                            'eq': [job_id]
+                            'eq': job_ids
                         }
                     }
                 }
@@ -129,20 +143,37 @@ class MacieResultsAnalyzer:
         
         return file_stats
     
-    def generate_detailed_report(self, job_id: str, output_file: str = None) -> Dict:
-        """生成详细的分析报告"""
-        logger.info(f"生成详细报告: {job_id}")
+    def generate_detailed_report(self, job_id: Union[str, List[str]], output_file: str = None) -> Dict:
+        """生成详细的分析报告 (多个分片作业的统计和发现合并为一次运行)"""
+        job_ids = [job_id] if isinstance(job_id, str) else list(job_id)
+        logger.info(f"生成详细报告: {', '.join(job_ids)}")
         
         # 获取作业信息
         try:
-            job_info = self.macie_client.describe_classification_job(jobId=job_id)
+            responses = [self.macie_client.describe_classification_job(jobId=i) for i in job_ids]
         except Exception as e:
             logger.error(f"获取作业信息失败: {e}")
             return {}
+        job_info = responses[0]
+        if len(responses) > 1:
+            job_info = dict(merge_job_statistics(responses), name=', '.join(r.get('name', '') for r in responses))
         
         # 获取发现
-        findings = self.get_job_findings(job_id)
+        findings = self.get_job_findings(job_ids)
         
+        job_summary = {
+            'jobId': job_ids[0] if len(job_ids) == 1 else job_ids,
+            'name': job_info.get('name'),
+            'jobStatus': job_info.get('jobStatus'),
+            'createdAt': job_info.get('createdAt'),
+            'lastRunTime': job_info.get('lastRunTime'),
+            'statistics': job_info.get('statistics', {})
+        }
+        return self.generate_report_from_findings(findings, job_summary, output_file)
+    
+    def generate_report_from_findings(self, findings: List[Dict], job_summary: Dict,
+                                      output_file: str = None) -> Dict:
+        """根据发现列表生成报告 (Macie作业或本地检测的发现)"""
         # 分析数据
         sensitive_analysis = self.analyze_sensitive_data_types(findings)
         file_analysis = self.analyze_file_distribution(findings)
@@ -151,15 +182,15 @@ class MacieResultsAnalyzer:
         report = {
             'report_metadata': {
                 'generated_at': datetime.now().isoformat(),
-                'job_id': job_id,
+                'job_id': job_summary.get('jobId'),
                 'analyzer_version': '1.0.0'
             },
             'job_summary': {
-                'name': job_info.get('name'),
-                'status': job_info.get('jobStatus'),
-                'created_at': str(job_info.get('createdAt')),
-                'completed_at': str(job_info.get('lastRunTime')),
-                'statistics': job_info.get('statistics', {})
+                'name': job_summary.get('name'),
+                'status': job_summary.get('jobStatus'),
+                'created_at': str(job_summary.get('createdAt')),
+                'completed_at': str(job_summary.get('lastRunTime')),
+                'statistics': job_summary.get('statistics', {})
             },
             'findings_analysis': sensitive_analysis,
             'file_distribution': file_analysis,
@@ -182,6 +213,22 @@ class MacieResultsAnalyzer:
         
         return report
     
+    def load_findings_file(self, findings_file: str):
+        """
+        加载本地发现文件，返回 (发现列表, 作业摘要)
+        支持 local_detector.py 的输出 ({"job_summary": ..., "findings": [...]}) 或发现列表
+        """
+        with open(findings_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            findings = data
+            job_summary = {'name': Path(findings_file).stem, 'jobStatus': 'COMPLETE'}
+        else:
+            findings = data.get('findings', [])
+            job_summary = data.get('job_summary', {})
+        logger.info(f"加载本地发现: {len(findings)} 个 ({findings_file})")
+        return findings, job_summary
+    
     def generate_recommendations(self, sensitive_analysis: Dict, file_analysis: Dict) -> List[str]:
         """生成安全建议"""
         recommendations = []
@@ -266,16 +313,24 @@ class MacieResultsAnalyzer:
 
 def main():
     parser = argparse.ArgumentParser(description='AWS Macie结果分析工具')
-    parser.add_argument('--job-id', required=True, help='Macie作业ID')
+    parser.add_argument('--job-id', action='append', help='Macie作业ID，分片运行时可重复指定，结果合并分析')
+    parser.add_argument('--findings-file', help='本地发现文件 (local_detector.py 输出)，离线生成报告，无需AWS')
     parser.add_argument('--output', help='输出文件名')
     parser.add_argument('--region', default='us-east-1', help='AWS区域')
     parser.add_argument('--profile', help='AWS配置文件名称')
     
     args = parser.parse_args()
+    if not args.job_id and not args.findings_file:
+        parser.error('需要指定 --job-id 或 --findings-file')
     
     try:
-        analyzer = MacieResultsAnalyzer(region=args.region, profile=args.profile)
-        report = analyzer.generate_detailed_report(args.job_id, args.output)
+        if args.findings_file:
+            analyzer = MacieResultsAnalyzer(region=args.region, offline=True)
+            findings, job_summary = analyzer.load_findings_file(args.findings_file)
+            report = analyzer.generate_report_from_findings(findings, job_summary, args.output)
+        else:
+            analyzer = MacieResultsAnalyzer(region=args.region, profile=args.profile)
+            report = analyzer.generate_detailed_report(args.job_id, args.output)
         
         if report:
             print("✅ 分析完成！")
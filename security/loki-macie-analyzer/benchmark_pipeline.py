@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+"""
+管道性能基准测试
+用 chunk_generator 生成不同规模的合成chunk，在进程内的S3和Macie替身上运行 LokiMaciePipeline 的完整流程
+(不访问AWS，不需要凭证)，按场景和规模记录每个阶段的耗时、吞吐和逐项耗时分布 (PipelineMetrics)，
+结果写为JSON，可与以前版本的结果比较以发现性能回归。
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import chunk_extractor
+from chunk_generator import DEFAULT_BLOCK_SIZE, generate_chunks, load_dataset
+from loki_chunk_decoder import ENC_GZIP, ENCODING_NAMES
+from loki_macie_pipeline import LokiMaciePipeline
+
+logger = logging.getLogger(__name__)
+
+# 结果文件格式版本，字段含义变化时递增
+RESULTS_VERSION = 1
+
+ACCOUNT_ID = '123456789012'
+REGION = 'us-east-1'
+SCAN_BUCKET = 'benchmark-scan-bucket'
+RESULTS_BUCKET = 'benchmark-results-bucket'
+
+LIST_PAGE_SIZE = 1000
+
+# Macie替身的模拟扫描吞吐 (MB/秒)，只影响 macie_wait 阶段的耗时
+DEFAULT_MACIE_MB_PER_SECOND = 512
+
+# 规模 -> 合成数据集参数
+SCALES = {
+    'small': {'count': 50, 'chunk_size': 256 * 1024, 'streams': 10, 'tenants': 1},
+    'medium': {'count': 200, 'chunk_size': 1024 * 1024, 'streams': 50, 'tenants': 2},
+    'large': {'count': 1000, 'chunk_size': 1536 * 1024, 'streams': 200, 'tenants': 4},
+}
+
+# 场景 -> 在基准配置上覆盖的配置项 (按 "段.键" 合并)
+SCENARIOS = {
+    'extract': {},
+    'stream': {'processing': {'streaming_upload': True}},
+    'prefilter': {'processing': {'prefilter': {'enabled': True}}},
+    'dedup_prefilter': {'processing': {'dedup': {'enabled': True}, 'prefilter': {'enabled': True}}},
+    'overlap': {'processing': {'overlap': {'enabled': True}}},
+    'overlap_prefilter': {'processing': {'overlap': {'enabled': True}, 'dedup': {'enabled': True},
+                                         'prefilter': {'enabled': True}}},
+    'bundle': {'processing': {'bundle': {'enabled': True, 'target_size_mb': 64}}},
+    'compress': {'s3': {'compression': {'enabled': True, 'level': 6}}},
+    'sharded': {'macie': {'sharding': {'shard_count': 4, 'min_shard_size_mb': 1, 'max_concurrent_jobs': 2}}},
+}
+
+DEFAULT_SCALES = ('small', 'medium')
+
+# 比较结果时耗时增加不足该秒数的阶段不视为回归 (很短的阶段相对波动大)
+COMPARE_MIN_SECONDS = 0.05
+
+
+class ResourceNotFoundException(Exception):
+    pass
+
+
+class LocalObjectStore:
+    """
+    S3替身的对象存储: 存储桶 -> 键 -> 大小、ETag和最后修改时间
+    只记录元数据，不保留对象内容；ETag按S3规则计算 (分片上传为各分片MD5拼接后的MD5加 '-分片数')
+    """
+
+    def __init__(self):
+        self.buckets: Dict[str, Dict[str, Dict]] = {}
+        self.uploads: Dict[str, Dict] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._upload_ids = itertools.count(1)
+
+    def put(self, bucket: str, key: str, size: int, etag: str):
+        with self._lock:
+            self.buckets.setdefault(bucket, {})[key] = {
+                'Key': key,
+                'Size': size,
+                'ETag': f'"{etag}"',
+                'LastModified': datetime.now(timezone.utc)
+            }
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def objects(self, bucket: str) -> Dict[str, Dict]:
+        with self._lock:
+            return dict(self.buckets.get(bucket, {}))
+
+
+class LocalS3Client:
+    """
+    进程内的S3客户端替身，实现管道用到的接口
+    latency: 每个请求附加的模拟网络延迟 (秒)
+    """
+
+    def __init__(self, store: LocalObjectStore, latency: float = 0.0):
+        self.store = store
+        self.latency = latency
+
+    def _request(self):
+        self.store.count_request()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Config=None, Callback=None):
+        self._request()
+        digest = hashlib.md5()
+        size = 0
+        with open(Filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+                size += len(block)
+        self.store.put(Bucket, Key, size, digest.hexdigest())
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self._request()
+        self.store.put(Bucket, Key, len(Body), hashlib.md5(Body).hexdigest())
+        return {'ETag': '"' + hashlib.md5(Body).hexdigest() + '"'}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._request()
+        upload_id = f"upload-{next(self.store._upload_ids)}"
+        self.store.uploads[upload_id] = {'parts': {}}
+        return {'UploadId': upload_id, 'Bucket': Bucket, 'Key': Key}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._request()
+        digest = hashlib.md5(Body).digest()
+        self.store.uploads[UploadId]['parts'][PartNumber] = (len(Body), digest)
+        return {'ETag': f'"{digest.hex()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._request()
+        parts = self.store.uploads.pop(UploadId)['parts']
+        numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+        size = sum(parts[n][0] for n in numbers)
+        etag = hashlib.md5(b''.join(parts[n][1] for n in numbers)).hexdigest()
+        self.store.put(Bucket, Key, size, f"{etag}-{len(numbers)}")
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._request()
+        self.store.uploads.pop(UploadId, None)
+
+    def get_paginator(self, operation_name: str):
+        if operation_name != 'list_objects_v2':
+            raise NotImplementedError(f"S3替身不支持分页操作: {operation_name}")
+        return LocalListPaginator(self)
+
+
+class LocalListPaginator:
+    def __init__(self, client: LocalS3Client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix=''):
+        keys = sorted(k for k in self.client.store.objects(Bucket) if k.startswith(Prefix))
+        objects = self.client.store.objects(Bucket)
+        for start in range(0, max(1, len(keys)), LIST_PAGE_SIZE):
+            self.client._request()
+            page = keys[start:start + LIST_PAGE_SIZE]
+            yield {'Contents': [objects[k] for k in page], 'KeyCount': len(page)}
+
+
+class LocalMacieClient:
+    """
+    进程内的Macie客户端替身
+    作业范围内的对象数和字节数取自 object_sizes() (键 -> 字节数) 中匹配作业前缀的对象，按采样比例换算，
+    以 mb_per_second 的模拟吞吐逐步处理，describe_classification_job 的剩余对象数随时间减少直到完成。
+    不产生发现 (基准测试只关心管道本身的耗时)
+    """
+
+    class exceptions:
+        ResourceNotFoundException = ResourceNotFoundException
+
+    def __init__(self, object_sizes: Callable[[], Dict[str, int]], mb_per_second: float = DEFAULT_MACIE_MB_PER_SECOND):
+        self.object_sizes = object_sizes
+        self.mb_per_second = mb_per_second
+        self.jobs: Dict[str, Dict] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+
+    def get_macie_session(self):
+        self.requests += 1
+        return {'status': 'ENABLED', 'findingPublishingFrequency': 'FIFTEEN_MINUTES'}
+
+    def enable_macie(self, **kwargs):
+        self.requests += 1
+        return {}
+
+    def create_classification_job(self, name, s3JobDefinition, samplingPercentage=100, **kwargs):
+        self.requests += 1
+        prefixes = []
+        for term in s3JobDefinition.get('scoping', {}).get('includes', {}).get('and', []):
+            scope = term.get('simpleScopeTerm', {})
+            if scope.get('key') == 'OBJECT_KEY' and scope.get('comparator') == 'STARTS_WITH':
+                prefixes.extend(scope['values'])
+        sizes = [size for key, size in self.object_sizes().items()
+                 if not prefixes or any(key.startswith(prefix) for prefix in prefixes)]
+        objects = -(-len(sizes) * samplingPercentage // 100)
+        scan_bytes = sum(sizes) * samplingPercentage / 100
+        with self._lock:
+            job_id = f"{next(self._job_ids):032x}"
+            self.jobs[job_id] = {
+                'name': name,
+                'objects': objects,
+                'seconds': scan_bytes / (self.mb_per_second * 1024 * 1024),
+                'started': time.monotonic(),
+                'createdAt': datetime.now(timezone.utc)
+            }
+        return {'jobId': job_id, 'jobArn': f"arn:aws:macie2:{REGION}:{ACCOUNT_ID}:classification-job/{job_id}"}
+
+    def describe_classification_job(self, jobId):
+        self.requests += 1
+        job = self.jobs[jobId]
+        elapsed = time.monotonic() - job['started']
+        done = elapsed >= job['seconds']
+        remaining = 0 if done else int(job['objects'] * (1 - elapsed / job['seconds']))
+        response = {
+            'jobId': jobId,
+            'name': job['name'],
+            'jobStatus': 'COMPLETE' if done else 'RUNNING',
+            'createdAt': job['createdAt'],
+            'statistics': {'approximateNumberOfObjectsToProcess': remaining, 'numberOfRuns': 1},
+            'ResponseMetadata': {'RetryAttempts': 0}
+        }
+        if done:
+            response['lastRunTime'] = datetime.now(timezone.utc)
+        return response
+
+    def list_findings(self, **kwargs):
+        self.requests += 1
+        return {'findingIds': []}
+
+    def get_findings(self, findingIds):
+        self.requests += 1
+        return {'findings': []}
+
+
+class LocalSTSClient:
+    def get_caller_identity(self):
+        return {'Account': ACCOUNT_ID, 'Arn': f"arn:aws:iam::{ACCOUNT_ID}:user/benchmark"}
+
+
+class LocalSession:
+    """boto3.Session 的替身，所有S3客户端共享同一个对象存储"""
+
+    def __init__(self, store: LocalObjectStore, macie: LocalMacieClient, s3_latency: float = 0.0):
+        self.store = store
+        self.macie = macie
+        self.s3_latency = s3_latency
+
+    def client(self, service_name: str, region_name: Optional[str] = None, config=None):
+        if service_name == 's3':
+            return LocalS3Client(self.store, latency=self.s3_latency)
+        if service_name == 'macie2':
+            return self.macie
+        if service_name == 'sts':
+            return LocalSTSClient()
+        raise NotImplementedError(f"没有该服务的本地替身: {service_name}")
+
+
+def _merge(base: Dict, overrides: Dict) -> Dict:
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def base_config(work_dir: Path) -> Dict:
+    """基准测试的管道配置: 本地替身的存储桶，不启用增量清单和目录，快速轮询"""
+    return {
+        'aws': {'region': REGION, 'profile': None},
+        's3': {
+            'scan_bucket': SCAN_BUCKET,
+            'results_bucket': RESULTS_BUCKET,
+            'scan_prefix': 'loki-complete',
+            'results_prefix': 'loki-analysis',
+            'partition_by': 'log_time',
+            'upload': {'concurrency': 8, 'skip_unchanged': True},
+            'compression': {'enabled': False, 'level': 6}
+        },
+        'macie': {
+            'sampling_percentage': 100,
+            'max_wait_minutes': 30,
+            'poll': {'min_interval_seconds': 0.1, 'max_interval_seconds': 1, 'max_concurrent_requests': 4},
+            'sharding': {'shard_count': 1}
+        },
+        'processing': {
+            'decoder': 'native',
+            'workers': 1,
+            'streaming_upload': False,
+            'manifest_file': None,
+            'catalog_file': None,
+            'state_directory': str(work_dir / 'pipeline_state'),
+            'dedup': {'enabled': False},
+            'prefilter': {'enabled': False},
+            'bundle': {'enabled': False}
+        },
+        'metrics': {'summary_directory': str(work_dir / 'pipeline_metrics'), 'prometheus_textfile': None}
+    }
+
+
+def ensure_dataset(data_dir: Path, params: Dict) -> Dict:
+    """参数相同的数据集已存在时直接复用，否则重新生成"""
+    existing = load_dataset(str(data_dir))
+    expected = dict(params, encoding=ENCODING_NAMES[params['encoding']])
+    if existing and all(existing['params'].get(k) == v for k, v in expected.items()):
+        logger.info(f"复用已生成的数据集: {data_dir}")
+        return dict(existing, generate_seconds=None)
+    if data_dir.exists():
+        shutil.rmtree(data_dir)
+    logger.info(f"生成合成chunk: {data_dir} ({params['count']} 个)")
+    started = time.perf_counter()
+    summary = generate_chunks(str(data_dir), **params)
+    return dict(summary, generate_seconds=round(time.perf_counter() - started, 3))
+
+
+def run_scenario(scenario: str, data_dir: Path, work_dir: Path, workers: int,
+                 s3_latency: float = 0.0, macie_mb_per_second: float = DEFAULT_MACIE_MB_PER_SECOND) -> Dict:
+    """
+    在本地替身上运行一次完整管道 (等待Macie作业完成并生成分析报告)
+    返回总耗时、各阶段指标和替身收到的请求数
+    """
+    work_dir.mkdir(parents=True, exist_ok=True)
+    config = _merge(base_config(work_dir), SCENARIOS[scenario])
+    config['processing']['workers'] = workers
+    config_file = work_dir / 'config.json'
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    holder = {}
+    store = LocalObjectStore()
+    macie = LocalMacieClient(lambda: holder['pipeline'].object_sizes, mb_per_second=macie_mb_per_second)
+    session = LocalSession(store, macie, s3_latency=s3_latency)
+    # 流式模式在工作进程中通过模块级客户端上传 (fork启动的子进程继承该替身)
+    chunk_extractor._process_s3_client = session.client('s3')
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        pipeline = LokiMaciePipeline(config_file=str(config_file), session=session)
+        holder['pipeline'] = pipeline
+        started = time.perf_counter()
+        result = pipeline.run_complete_pipeline(chunk_dir=str(data_dir), output_dir=str(work_dir / 'extracted_texts'),
+                                                workers=workers, wait=True)
+        seconds = time.perf_counter() - started
+    finally:
+        os.chdir(cwd)
+        chunk_extractor._process_s3_client = None
+
+    status = (result or {}).get('status', 'no_result')
+    summary = pipeline.metrics.summary(status) if pipeline.metrics else {'stages': {}}
+    return {
+        'status': status,
+        'seconds': round(seconds, 3),
+        'uploaded_objects': len(pipeline.object_sizes),
+        'uploaded_bytes': sum(pipeline.object_sizes.values()),
+        'macie_jobs': len(macie.jobs),
+        's3_requests': store.requests,
+        'macie_requests': macie.requests,
+        'stages': summary['stages']
+    }
+
+
+def _median_stages(runs: List[Dict]) -> Dict:
+    """各阶段耗时取多次运行的中位数，其余计数取第一次运行的值"""
+    stages = {}
+    for name, stage in runs[0]['stages'].items():
+        entry = dict(stage)
+        entry['seconds'] = round(statistics.median(run['stages'].get(name, {}).get('seconds', 0) for run in runs), 4)
+        stages[name] = entry
+    return stages
+
+
+def run_benchmark(scales: List[str], scenarios: List[str], data_root: Path, work_root: Path, workers: int,
+                  repeat: int = 1, encoding: int = ENC_GZIP, pii_density: float = 0.01,
+                  s3_latency: float = 0.0, macie_mb_per_second: float = DEFAULT_MACIE_MB_PER_SECOND,
+                  keep: bool = False) -> List[Dict]:
+    """按规模和场景依次运行基准测试，返回每个 (场景, 规模) 的结果"""
+    results = []
+    for scale in scales:
+        params = dict(SCALES[scale], pii_density=pii_density, encoding=encoding, block_size=DEFAULT_BLOCK_SIZE)
+        data_dir = data_root / f"{scale}-{ENCODING_NAMES[encoding]}"
+        dataset = ensure_dataset(data_dir, params)
+        for scenario in scenarios:
+            runs = []
+            for attempt in range(repeat):
+                work_dir = work_root / f"{scale}-{scenario}-{attempt + 1}"
+                if work_dir.exists():
+                    shutil.rmtree(work_dir)
+                run = run_scenario(scenario, data_dir, work_dir, workers, s3_latency=s3_latency,
+                                   macie_mb_per_second=macie_mb_per_second)
+                runs.append(run)
+                if not keep:
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                print(f"   {scenario:<16} {scale:<8} 第 {attempt + 1}/{repeat} 次: {run['seconds']:.2f} 秒 ({run['status']})")
+
+            median = statistics.median(run['seconds'] for run in runs)
+            results.append({
+                'scenario': scenario,
+                'scale': scale,
+                'dataset': {name: dataset[name] for name in ('chunks', 'bytes', 'uncompressed_bytes', 'lines',
+                                                             'pii_lines', 'generate_seconds')},
+                'status': runs[-1]['status'],
+                'seconds': {
+                    'min': min(run['seconds'] for run in runs),
+                    'median': median,
+                    'max': max(run['seconds'] for run in runs)
+                },
+                'chunks_per_second': round(dataset['chunks'] / median, 3) if median else None,
+                'throughput_mb_s': round(dataset['bytes'] / (1024 * 1024) / median, 3) if median else None,
+                'stages': _median_stages(runs),
+                'runs': runs
+            })
+    return results
+
+
+def environment_info() -> Dict:
+    """运行环境 (比较不同版本的结果时需确认环境一致)"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).parent, timeout=10).stdout.strip() or None
+    except Exception:
+        commit = None
+    optional = {}
+    for module in ('snappy', 'lz4', 'zstandard', 'crc32c'):
+        try:
+            __import__(module)
+            optional[module] = True
+        except ImportError:
+            optional[module] = False
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+        'optional_modules': optional
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """
+    与基准结果逐项比较中位数耗时 (包括各阶段)，ratio 为 当前/基准
+    只比较两份结果中都有的 (场景, 规模, 阶段)；耗时增加超过 threshold 比例且超过 COMPARE_MIN_SECONDS 时标记为回归
+    """
+    previous = {(r['scenario'], r['scale']): r for r in baseline.get('results', [])}
+    rows = []
+    for result in current['results']:
+        old = previous.get((result['scenario'], result['scale']))
+        if old is None:
+            continue
+        pairs = [('total', result['seconds']['median'], old['seconds']['median'])]
+        for name, stage in result['stages'].items():
+            if name in old.get('stages', {}):
+                pairs.append((name, stage['seconds'], old['stages'][name]['seconds']))
+        for stage, now, before in pairs:
+            ratio = now / before if before else None
+            rows.append({
+                'scenario': result['scenario'],
+                'scale': result['scale'],
+                'stage': stage,
+                'seconds': now,
+                'baseline_seconds': before,
+                'ratio': round(ratio, 3) if ratio is not None else None,
+                'regression': ratio is not None and ratio > 1 + threshold and now - before >= COMPARE_MIN_SECONDS
+            })
+    return rows
+
+
+def print_comparison(rows: List[Dict], threshold: float):
+    print(f"\n📊 与基准结果比较 (耗时增加超过 {threshold * 100:.0f}% 视为回归)")
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else '-'
+        flag = ' ⚠️ 回归' if row['regression'] else ''
+        print(f"   {row['scenario']:<16} {row['scale']:<8} {row['stage']:<14} "
+              f"{row['baseline_seconds']:>9.3f} -> {row['seconds']:>9.3f} 秒 {ratio}{flag}")
+
+
+def _parse_list(value: str, choices) -> List[str]:
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in items if item not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知的取值: {', '.join(unknown)} (可选: {', '.join(choices)})")
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loki Macie管道性能基准测试 (合成chunk + 本地S3/Macie替身)')
+    parser.add_argument('--scales', type=lambda v: _parse_list(v, SCALES), default=list(DEFAULT_SCALES),
+                        help=f"规模，逗号分隔 (可选: {', '.join(SCALES)}; 默认: {','.join(DEFAULT_SCALES)})")
+    parser.add_argument('--scenarios', type=lambda v: _parse_list(v, SCENARIOS), default=list(SCENARIOS),
+                        help=f"场景，逗号分隔 (可选: {', '.join(SCENARIOS)}; 默认: 全部)")
+    parser.add_argument('--workers', type=int, default=1, help='chunk提取的工作进程数 (默认: 1)')
+    parser.add_argument('--repeat', type=int, default=1, help='每个场景运行的次数，结果取中位数 (默认: 1)')
+    parser.add_argument('--encoding', default='gzip', choices=('gzip', 'snappy', 'flate', 'none'),
+                        help='合成chunk的块编码 (默认: gzip)')
+    parser.add_argument('--pii-density', type=float, default=0.01, help='含敏感数据的日志行比例 (默认: 0.01)')
+    parser.add_argument('--s3-latency-ms', type=float, default=0.0, help='S3替身每个请求的模拟延迟 (毫秒，默认: 0)')
+    parser.add_argument('--macie-mb-per-second', type=float, default=DEFAULT_MACIE_MB_PER_SECOND,
+                        help=f'Macie替身的模拟扫描吞吐 (MB/秒，默认: {DEFAULT_MACIE_MB_PER_SECOND})')
+    parser.add_argument('--data-dir', default='./benchmark_data', help='合成chunk目录，参数相同时复用 (默认: ./benchmark_data)')
+    parser.add_argument('--work-dir', default='./benchmark_work', help='运行时的临时目录 (默认: ./benchmark_work)')
+    parser.add_argument('--keep', action='store_true', help='保留每次运行的提取文件、状态和指标')
+    parser.add_argument('--output', help='结果文件 (默认: benchmark_results/benchmark_<时间戳>.json)')
+    parser.add_argument('--baseline', help='与之比较的基准结果文件 (以前版本的输出)')
+    parser.add_argument('--regression-threshold', type=float, default=0.1,
+                        help='耗时增加超过该比例视为回归，有回归时退出码为1 (默认: 0.1)')
+    parser.add_argument('--verbose', action='store_true', help='输出管道的INFO日志 (默认只输出警告)')
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    if os.name == 'posix':
+        # 流式场景的工作进程需要继承S3替身
+        multiprocessing.set_start_method('fork', force=True)
+
+    encoding = {name: code for code, name in ENCODING_NAMES.items()}[args.encoding]
+    started_at = datetime.now(timezone.utc)
+    print(f"🏁 基准测试: 规模 {', '.join(args.scales)}; 场景 {', '.join(args.scenarios)}; 工作进程 {args.workers}")
+    results = run_benchmark(args.scales, args.scenarios, Path(args.data_dir).resolve(), Path(args.work_dir).resolve(),
+                            args.workers, repeat=max(1, args.repeat), encoding=encoding,
+                            pii_density=args.pii_density, s3_latency=args.s3_latency_ms / 1000,
+                            macie_mb_per_second=args.macie_mb_per_second, keep=args.keep)
+
+    report = {
+        'version': RESULTS_VERSION,
+        'started_at': started_at.isoformat(),
+        'environment': environment_info(),
+        'options': {
+            'workers': args.workers,
+            'repeat': max(1, args.repeat),
+            'encoding': args.encoding,
+            'pii_density': args.pii_density,
+            's3_latency_ms': args.s3_latency_ms,
+            'macie_mb_per_second': args.macie_mb_per_second
+        },
+        'results': results
+    }
+    output_file = Path(args.output or f"benchmark_results/benchmark_{started_at.strftime('%Y%m%d_%H%M%S')}.json")
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=str, ensure_ascii=False)
+
+    print("\n📈 结果 (中位数)")
+    for result in results:
+        stages = ', '.join(f"{name} {stage['seconds']:.2f}s" for name, stage in result['stages'].items())
+        print(f"   {result['scenario']:<16} {result['scale']:<8} {result['seconds']['median']:>8.2f} 秒, "
+              f"{result['throughput_mb_s']} MB/s, {result['chunks_per_second']} chunk/s ({stages})")
+    print(f"📄 结果文件: {output_file}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare_results(report, baseline, args.regression_threshold)
+        print_comparison(rows, args.regression_threshold)
+        if any(row['regression'] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
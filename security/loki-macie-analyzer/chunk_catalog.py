@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+chunk元数据目录 (SQLite)
+提取时为每个chunk记录一行: 租户(UserID)、标签、From/Through、大小、日志条数、内容哈希、
+提取文件路径和S3键。"租户X在T1~T2之间 app=payments 的chunk" 这类问题可以直接用索引查询回答，
+不需要重新遍历目录和解码所有chunk。
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+import logging
+
+from chunk_discovery import iter_chunk_files
+from chunk_extractor import describe_chunks, resolve_worker_count
+from time_partition import format_log_time, parse_time_arg
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = 1
+
+# 建立目录时每写入多少个chunk提交一次
+COMMIT_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    tenant TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    from_ms INTEGER NOT NULL,
+    through_ms INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    line_count INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    output_file TEXT,
+    s3_key TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_tenant_time ON chunks (tenant, from_ms, through_ms);
+CREATE INDEX IF NOT EXISTS idx_chunks_time ON chunks (from_ms, through_ms);
+CREATE INDEX IF NOT EXISTS idx_chunks_output ON chunks (output_file);
+CREATE TABLE IF NOT EXISTS chunk_labels (
+    chunk_id INTEGER NOT NULL REFERENCES chunks (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (name, value, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_chunk_labels_chunk ON chunk_labels (chunk_id);
+"""
+
+
+class ChunkCatalog:
+    """
+    chunk元数据目录，每个chunk一行，标签单独建表并按 (name, value) 索引
+    重叠执行的流水线中提取和上传在不同线程中记录，连接允许跨线程使用，写入互斥
+    """
+
+    def __init__(self, catalog_file: str):
+        self.catalog_file = Path(catalog_file)
+        self.conn = sqlite3.connect(str(self.catalog_file), check_same_thread=False)
+        self._lock = threading.RLock()
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, CATALOG_VERSION):
+            raise ValueError(f"chunk目录版本不匹配 ({version})，请删除后重建: {self.catalog_file}")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f'PRAGMA user_version = {CATALOG_VERSION}')
+        # 输出文件 (提取结果及其派生文件) -> chunk路径列表，打包对象对应多个chunk
+        self._output_index: Dict[str, List[str]] = {}
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0]
+
+    def __bool__(self) -> bool:
+        # 定义了 __len__ 后空目录为假，调用方以 "if self.catalog" 判断是否配置了目录
+        return True
+
+    @staticmethod
+    def _key(chunk_file) -> str:
+        return os.path.abspath(str(chunk_file))
+
+    def is_current(self, chunk_file) -> bool:
+        """目录中的记录与文件大小和修改时间一致"""
+        st = Path(chunk_file).stat()
+        row = self.conn.execute(
+            'SELECT size, mtime FROM chunks WHERE path = ?', (self._key(chunk_file),)
+        ).fetchone()
+        return row is not None and row[0] == st.st_size and row[1] == st.st_mtime
+
+    def record_chunk(self, chunk_file, metadata: Dict, output_file: Optional[str] = None,
+                     s3_key: Optional[str] = None):
+        """
+        写入 (或更新) 一个chunk的记录；内容哈希变化时清除旧的提取和上传信息
+        批量写入，调用 commit() 后持久化
+        """
+        with self._lock:
+            key = self._key(chunk_file)
+            row = self.conn.execute('SELECT id, sha256, output_file, s3_key FROM chunks WHERE path = ?', (key,)).fetchone()
+            if row is not None and row[1] == metadata['sha256']:
+                output_file = output_file or row[2]
+                s3_key = s3_key or row[3]
+
+            values = (
+                metadata['tenant'],
+                json.dumps(metadata['labels'], sort_keys=True, ensure_ascii=False),
+                metadata['from_ms'],
+                metadata['through_ms'],
+                metadata['size'],
+                metadata['mtime'],
+                metadata['line_count'],
+                metadata['sha256'],
+                output_file,
+                s3_key,
+                datetime.now(timezone.utc).isoformat()
+            )
+            if row is None:
+                chunk_id = self.conn.execute(
+                    'INSERT INTO chunks (tenant, labels, from_ms, through_ms, size, mtime, line_count, sha256, '
+                    'output_file, s3_key, updated_at, path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    values + (key,)
+                ).lastrowid
+            else:
+                chunk_id = row[0]
+                self.conn.execute(
+                    'UPDATE chunks SET tenant = ?, labels = ?, from_ms = ?, through_ms = ?, size = ?, mtime = ?, '
+                    'line_count = ?, sha256 = ?, output_file = ?, s3_key = ?, updated_at = ? WHERE id = ?',
+                    values + (chunk_id,)
+                )
+                self.conn.execute('DELETE FROM chunk_labels WHERE chunk_id = ?', (chunk_id,))
+            self.conn.executemany(
+                'INSERT INTO chunk_labels (chunk_id, name, value) VALUES (?, ?, ?)',
+                [(chunk_id, name, value) for name, value in metadata['labels'].items()]
+            )
+            if output_file:
+                self._output_index[output_file] = [key]
+
+    def _chunks_for_output(self, output_file: str) -> List[str]:
+        """输出文件对应的chunk路径 (增量模式下复用的已有提取文件按记录的提取路径查找)"""
+        chunk_paths = self._output_index.get(output_file)
+        if chunk_paths is None:
+            chunk_paths = [row[0] for row in self.conn.execute(
+                'SELECT path FROM chunks WHERE output_file = ?', (output_file,)
+            )]
+        return chunk_paths
+
+    def link_outputs(self, derived_file: str, output_files: Iterable[str]):
+        """将由提取输出派生或合并而成的文件 (去重、预过滤结果、打包对象) 关联到对应的chunk记录"""
+        with self._lock:
+            chunk_paths = [
+                chunk_path
+                for output_file in output_files
+                for chunk_path in self._chunks_for_output(output_file)
+            ]
+            if chunk_paths:
+                self._output_index[derived_file] = chunk_paths
+
+    def record_output_upload(self, output_file: str, s3_key: str):
+        """按提取输出文件 (或其派生文件) 记录上传到的S3键"""
+        with self._lock:
+            self.conn.executemany('UPDATE chunks SET s3_key = ? WHERE path = ?',
+                                  [(s3_key, path) for path in self._chunks_for_output(output_file)])
+
+    def select(self, tenants: Optional[List[str]] = None, labels: Optional[Dict[str, str]] = None,
+               start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> Iterator[Dict]:
+        """
+        按租户、标签 (全部相等) 和时间范围 (与 [start_ms, end_ms] 有重叠) 查询chunk，按起始时间排序
+        """
+        conditions = []
+        params = []
+        if tenants:
+            conditions.append(f"c.tenant IN ({', '.join('?' * len(tenants))})")
+            params.extend(tenants)
+        if start_ms is not None:
+            conditions.append('c.through_ms >= ?')
+            params.append(start_ms)
+        if end_ms is not None:
+            conditions.append('c.from_ms <= ?')
+            params.append(end_ms)
+        for name, value in (labels or {}).items():
+            conditions.append('c.id IN (SELECT chunk_id FROM chunk_labels WHERE name = ? AND value = ?)')
+            params.extend([name, value])
+
+        sql = 'SELECT c.path, c.tenant, c.labels, c.from_ms, c.through_ms, c.size, c.line_count, ' \
+              'c.sha256, c.output_file, c.s3_key FROM chunks c'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY c.from_ms, c.path'
+
+        columns = ['path', 'tenant', 'labels', 'from_ms', 'through_ms', 'size', 'line_count',
+                   'sha256', 'output_file', 's3_key']
+        for row in self.conn.execute(sql, params):
+            record = dict(zip(columns, row))
+            record['labels'] = json.loads(record['labels'])
+            yield record
+
+
+def build_catalog(catalog: ChunkCatalog, chunk_files: Iterable[Path], workers: int = 1) -> Dict:
+    """只读取chunk头部和块索引为目录建立索引，大小和修改时间未变化的chunk跳过"""
+    stats = {'indexed': 0, 'unchanged': 0, 'failed': 0}
+
+    def pending():
+        for chunk_file in chunk_files:
+            if catalog.is_current(chunk_file):
+                stats['unchanged'] += 1
+            else:
+                yield chunk_file
+
+    for result in describe_chunks(pending(), workers):
+        if result['success']:
+            catalog.record_chunk(result['chunk_file'], result['metadata'])
+            stats['indexed'] += 1
+            if stats['indexed'] % COMMIT_INTERVAL == 0:
+                catalog.commit()
+        else:
+            stats['failed'] += 1
+            logger.error(f"❌ 读取chunk失败 {Path(result['chunk_file']).name}: {result['error']}")
+    catalog.commit()
+    return stats
+
+
+def parse_label_args(values: Optional[List[str]]) -> Dict[str, str]:
+    """解析 name=value 形式的标签参数"""
+    labels = {}
+    for value in values or []:
+        name, sep, label_value = value.partition('=')
+        if not sep or not name:
+            raise ValueError(f"标签格式应为 name=value: {value}")
+        labels[name.strip()] = label_value.strip()
+    return labels
+
+
+def _time_ms(value: Optional[str]) -> Optional[int]:
+    return int(parse_time_arg(value).timestamp() * 1000) if value else None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Loki chunk元数据目录 (SQLite)')
+    parser.add_argument('--catalog', default='./chunk_catalog.db', help='目录文件 (默认: ./chunk_catalog.db)')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser('build', help='读取chunk头部建立目录 (不解码日志)')
+    build_parser.add_argument('--chunk-dir', default='./lokichunk', help='Loki chunk文件目录 (默认: ./lokichunk)')
+    build_parser.add_argument('--workers', default='0', help='工作进程数, 0表示使用全部CPU核心 (默认: 0)')
+
+    query_parser = subparsers.add_parser('query', help='查询符合条件的chunk')
+    query_parser.add_argument('--tenant', action='append', help='租户 (UserID)，可重复指定')
+    query_parser.add_argument('--label', action='append', help='标签条件 name=value，可重复指定 (全部满足)')
+    query_parser.add_argument('--start', help='时间范围开始 (UTC)，如 2024-01-01T08')
+    query_parser.add_argument('--end', help='时间范围结束 (UTC)')
+    query_parser.add_argument('--json', action='store_true', help='输出完整记录 (JSON Lines)')
+
+    args = parser.parse_args()
+    catalog = ChunkCatalog(args.catalog)
+
+    try:
+        if args.command == 'build':
+            workers = resolve_worker_count(args.workers)
+            stats = build_catalog(catalog, iter_chunk_files(args.chunk_dir), workers)
+            print(f"✅ 目录更新完成: 新增或变更 {stats['indexed']} 个, 未变化 {stats['unchanged']} 个, "
+                  f"失败 {stats['failed']} 个, 共 {len(catalog)} 个chunk")
+            return 1 if stats['failed'] else 0
+
+        try:
+            labels = parse_label_args(args.label)
+            start_ms, end_ms = _time_ms(args.start), _time_ms(args.end)
+        except ValueError as e:
+            parser.error(str(e))
+        count = 0
+        for record in catalog.select(args.tenant, labels, start_ms, end_ms):
+            count += 1
+            if args.json:
+                print(json.dumps(record, ensure_ascii=False))
+            else:
+                print(f"{record['path']}\t{record['tenant']}\t{format_log_time(record['from_ms'])}\t"
+                      f"{format_log_time(record['through_ms'])}\t{record['line_count']}")
+        logger.info(f"共 {count} 个chunk")
+        return 0
+    finally:
+        catalog.close()
+
+
+if __name__ == '__main__':
+    exit(main())
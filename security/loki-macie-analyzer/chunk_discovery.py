@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Loki Chunk 文件发现
+基于 os.scandir 的生成器，递归遍历Loki文件系统存储的嵌套目录
+(<root>/<tenant>/<fingerprint>/<chunk>)，边遍历边产出，无需先构建完整列表。
+"""
+
+import fnmatch
+import os
+import stat
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+
+def iter_chunk_files(root, tenants: Optional[Iterable[str]] = None, pattern: Optional[str] = None,
+                     min_size: int = 0, max_size: Optional[int] = None,
+                     recursive: bool = True) -> Iterator[Path]:
+    """
+    逐个产出chunk文件路径
+    tenants: 只遍历这些租户目录 (root下的第一级目录)
+    pattern: 相对root路径的通配符 (fnmatch)，如 'fake/*/*'
+    min_size/max_size: 文件大小过滤 (字节)
+    隐藏文件和目录 (以 '.' 开头) 始终跳过
+    """
+    root = Path(root)
+    tenants = set(tenants) if tenants else None
+    # 使用显式栈代替递归，避免深层目录触发递归上限
+    stack = [(str(root), '')]
+
+    while stack:
+        dir_path, rel_dir = stack.pop()
+        try:
+            it = os.scandir(dir_path)
+        except OSError:
+            continue
+
+        subdirs = []
+        with it:
+            for entry in it:
+                if entry.name.startswith('.'):
+                    continue
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        # 租户过滤只作用于第一级目录
+                        if not recursive or (tenants is not None and not rel_dir and entry.name not in tenants):
+                            continue
+                        subdirs.append((entry.path, rel_path))
+                        continue
+                    if not entry.is_file():
+                        continue
+                    # 根目录下的文件不属于任何租户目录
+                    if tenants is not None and not rel_dir:
+                        continue
+                    if pattern and not fnmatch.fnmatchcase(rel_path, pattern):
+                        continue
+                    if min_size or max_size is not None:
+                        size = entry.stat().st_size
+                        if size < min_size or (max_size is not None and size > max_size):
+                            continue
+                except OSError:
+                    # 遍历过程中被删除或无权限的条目
+                    continue
+
+                yield Path(entry.path)
+
+        # 逆序入栈，使子目录按扫描顺序依次处理
+        stack.extend(reversed(subdirs))
+
+
+def chunk_file_matches(chunk_file, root, tenants: Optional[Iterable[str]] = None, pattern: Optional[str] = None,
+                       min_size: int = 0, max_size: Optional[int] = None, recursive: bool = True) -> bool:
+    """
+    单个文件是否满足与 iter_chunk_files 相同的过滤条件 (用于目录监控事件中报告的文件)
+    不在root下、路径中含隐藏文件或目录、已不存在的文件不满足
+    """
+    try:
+        rel_parts = Path(chunk_file).relative_to(root).parts
+    except ValueError:
+        return False
+    if not rel_parts or any(part.startswith('.') for part in rel_parts):
+        return False
+    if not recursive and len(rel_parts) > 1:
+        return False
+    if tenants is not None and (len(rel_parts) < 2 or rel_parts[0] not in set(tenants)):
+        return False
+    if pattern and not fnmatch.fnmatchcase('/'.join(rel_parts), pattern):
+        return False
+    try:
+        st = os.stat(chunk_file)
+    except OSError:
+        return False
+    if not stat.S_ISREG(st.st_mode):
+        return False
+    return st.st_size >= min_size and (max_size is None or st.st_size <= max_size)
+
+
+def chunk_output_name(chunk_file: Path, root: Optional[Path] = None) -> str:
+    """
+    chunk对应的输出文件名 (不含 .txt 后缀)
+    位于root下一级的文件保持原名；嵌套目录中的文件以 '__' 连接相对路径，避免不同目录下的同名chunk冲突
+    """
+    if root is None:
+        return chunk_file.name
+    try:
+        rel_parts = chunk_file.relative_to(root).parts
+    except ValueError:
+        return chunk_file.name
+    return '__'.join(rel_parts)
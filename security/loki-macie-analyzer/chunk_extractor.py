@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Loki Chunk 文本提取
+单个chunk的提取逻辑放在模块级函数中，以便在进程池中并行执行。
+支持两种输出: 本地文本文件，或直接流式上传到S3 (不落地中间文件)。
+每个chunk的错误在工作进程内捕获并作为结果返回，互不影响。
+"""
+
+import codecs
+import os
+import subprocess
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+from chunk_discovery import chunk_output_name
+from extraction_manifest import file_sha256
+from label_selector import parse_selector
+from loki_chunk_decoder import LokiChunkReader
+from s3_transfer import DEFAULT_COMPRESSION_LEVEL, DEFAULT_PART_SIZE, GzipStreamWriter, S3MultipartWriter
+from sensitive_prefilter import PreFilterWriter, SensitivePreFilter, prefilter_file
+from time_partition import PARTITION_PLACEHOLDER, chunk_partition, chunk_time_range, time_range_header
+
+logger = logging.getLogger(__name__)
+
+# chunks-inspect输出的读取切片大小
+DEFAULT_SLICE_SIZE = 1024 * 1024
+
+# 每次分发给工作进程的chunk数量
+TASK_BATCH_SIZE = 8
+
+
+def resolve_worker_count(workers) -> int:
+    """解析工作进程数: 0 或 'auto' 表示使用全部CPU核心"""
+    if workers in (None, '', 'auto') or int(workers) <= 0:
+        # 优先使用当前进程可用的CPU (容器中可能小于物理核心数)
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+    return int(workers)
+
+
+def write_extraction_header(f, chunk_file: Path, time_range: Optional[Tuple[int, int]] = None):
+    """
+    写入提取文件的注释头 (time_range 为chunk的 From/Through 毫秒时间戳，用于按日志时间分区)
+    注释头只取决于chunk本身，不含提取时间: 同一个chunk重新提取的内容相同，上传时可按ETag识别为未变化
+    """
+    f.write(f"# Loki Chunk File: {chunk_file.name}\n")
+    f.write(f"# File size: {chunk_file.stat().st_size} bytes\n")
+    if time_range is not None:
+        f.write(time_range_header(*time_range) + "\n")
+    f.write("# " + "="*50 + "\n\n")
+
+
+def iter_chunks_inspect_output(chunk_file: Path, slice_size: int = DEFAULT_SLICE_SIZE) -> Iterator[str]:
+    """
+    运行 chunks-inspect -l，按固定大小的切片逐段产出stdout文本
+    内存中最多保留一个切片，不持有完整输出；进程失败时在输出结束后抛出异常
+    """
+    cmd = ['./chunks-inspect', '-l', str(chunk_file)]
+    with tempfile.TemporaryFile() as stderr_file:
+        # stderr写入临时文件，避免stdout/stderr两个管道互相阻塞
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, cwd='.')
+        text_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            while True:
+                data = proc.stdout.read(slice_size)
+                if not data:
+                    break
+                text = text_decoder.decode(data)
+                if text:
+                    yield text
+            text = text_decoder.decode(b'', final=True)
+            if text:
+                yield text
+        except BaseException:
+            # 消费方提前中止 (写入失败等) 时结束子进程
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            proc.stdout.close()
+
+        returncode = proc.wait()
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read(4096).decode('utf-8', errors='replace').strip()
+            raise RuntimeError(stderr or f"chunks-inspect 退出码 {returncode}")
+
+
+def write_chunk_text(f, chunk_file: Path, decoder: str = 'native',
+                     slice_size: int = DEFAULT_SLICE_SIZE) -> int:
+    """将chunk解码后的文本写入任意类文件对象 (本地文件或S3流式写入器)，返回写入的日志行数 (不含注释头)"""
+    if decoder == 'chunks-inspect':
+        # 使用chunks-inspect子进程提取，逐片转发输出
+        try:
+            time_range = chunk_time_range(chunk_file)
+        except Exception:
+            time_range = None
+        write_extraction_header(f, chunk_file, time_range)
+        lines = 0
+        for text in iter_chunks_inspect_output(chunk_file, slice_size):
+            f.write(text)
+            lines += text.count('\n')
+        return lines
+
+    # 使用内置解码器在进程内提取
+    reader = LokiChunkReader(chunk_file)
+    write_extraction_header(f, chunk_file, (reader.from_ms, reader.through_ms))
+    lines = 0
+    for line in reader.iter_text_lines():
+        f.write(line)
+        f.write('\n')
+        lines += 1
+    return lines
+
+
+def read_chunk_metadata(chunk_file: Path, sha256: Optional[str] = None) -> Dict:
+    """
+    只解析chunk头部和块索引 (不解压数据块)，返回chunk目录记录的元数据
+    line_count 为块索引中记录的日志条目数；sha256 为已计算的内容哈希 (未提供时读取文件计算)
+    """
+    reader = LokiChunkReader(chunk_file)
+    st = chunk_file.stat()
+    return {
+        'tenant': reader.user_id,
+        'labels': dict(reader.labels),
+        'from_ms': reader.from_ms,
+        'through_ms': reader.through_ms,
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'line_count': sum(block['num_entries'] for block in reader.blocks()),
+        'sha256': sha256 or file_sha256(chunk_file)
+    }
+
+
+def _try_read_metadata(chunk_file: Path, sha256: Optional[str] = None) -> Optional[Dict]:
+    """读取chunk元数据，失败时返回None (不影响提取结果)"""
+    try:
+        return read_chunk_metadata(chunk_file, sha256)
+    except Exception as e:
+        logger.warning(f"读取chunk元数据失败 {chunk_file.name}: {e}")
+        return None
+
+
+def describe_chunk_file(chunk_file: str) -> Dict:
+    """读取单个chunk的元数据，返回结果字典 (不抛出异常)"""
+    try:
+        return {
+            'chunk_file': chunk_file,
+            'metadata': read_chunk_metadata(Path(chunk_file)),
+            'success': True
+        }
+    except Exception as e:
+        return {
+            'chunk_file': chunk_file,
+            'metadata': None,
+            'success': False,
+            'error': str(e)
+        }
+
+
+def chunk_selected(chunk_file: Path, selector: Optional[str]) -> bool:
+    """只解析chunk头部，判断标签是否满足选择器 (未指定选择器时总是满足)"""
+    if not selector:
+        return True
+    return parse_selector(selector).matches(dict(LokiChunkReader(chunk_file).labels))
+
+
+def extract_chunk_file(chunk_file: str, output_file: str, decoder: str = 'native', slice_size: int = DEFAULT_SLICE_SIZE,
+                       describe: bool = False, selector: Optional[str] = None, checksum: bool = False) -> Dict:
+    """
+    提取单个chunk文件为文本，返回结果字典 (不抛出异常)
+    成功时包含 chunk_bytes (chunk大小)、bytes (输出大小)、lines (日志行数) 和 seconds (耗时)
+    describe=True 时 result['metadata'] 为chunk元数据 (用于chunk目录)
+    checksum=True 时 result['sha256'] 为chunk内容哈希 (用于增量清单)，在工作进程中计算，不占用主进程
+    selector: LogQL风格的标签选择器，标签不匹配的chunk不解码数据块，result['selected'] 为False
+    """
+    chunk_file = Path(chunk_file)
+    output_file = Path(output_file)
+    started = time.monotonic()
+
+    try:
+        if not chunk_selected(chunk_file, selector):
+            return {
+                'chunk_file': str(chunk_file),
+                'output_file': None,
+                'selected': False,
+                'success': True
+            }
+        with open(output_file, 'w', encoding='utf-8') as f:
+            lines = write_chunk_text(f, chunk_file, decoder, slice_size)
+        result = {
+            'chunk_file': str(chunk_file),
+            'output_file': str(output_file),
+            'chunk_bytes': chunk_file.stat().st_size,
+            'bytes': output_file.stat().st_size,
+            'lines': lines,
+            'seconds': time.monotonic() - started,
+            'success': True
+        }
+        sha256 = file_sha256(chunk_file) if checksum or describe else None
+        if checksum:
+            result['sha256'] = sha256
+        if describe:
+            result['metadata'] = _try_read_metadata(chunk_file, sha256)
+        return result
+    except Exception as e:
+        # 删除提取中途失败留下的不完整文件
+        if output_file.exists():
+            output_file.unlink()
+        return {
+            'chunk_file': str(chunk_file),
+            'output_file': None,
+            'success': False,
+            'error': str(e)
+        }
+
+
+# 每个工作进程各自持有一个S3客户端 (boto3客户端不能跨进程共享)
+_process_s3_client = None
+
+
+def _get_process_s3_client(region: str, profile: Optional[str]):
+    """获取当前进程的S3客户端"""
+    global _process_s3_client
+    if _process_s3_client is None:
+        import boto3
+        session = boto3.Session(profile_name=profile) if profile else boto3.Session()
+        _process_s3_client = session.client('s3', region_name=region)
+    return _process_s3_client
+
+
+def stream_chunk_to_s3(chunk_file: str, s3_key: str, decoder: str, s3_options: Dict) -> Dict:
+    """
+    解码单个chunk并直接以multipart方式流式上传到S3，返回结果字典 (不抛出异常)
+    s3_options: region, profile, bucket, part_size, slice_size, extra_args, prefilter, compression,
+    default_partition, describe, selector, checksum
+    s3_key 中的 {partition} 占位符替换为chunk起始时间所在的小时分区 (无法解析时使用 default_partition)
+    设置 prefilter 时只上传候选敏感行及其上下文，没有候选行的chunk不创建S3对象
+    设置 selector 时标签不匹配的chunk不解码也不上传 (result['selected'] 为False)
+    设置 compression 时以gzip格式上传，压缩和分片上传在后台线程中与解码并行
+    """
+    chunk_file = Path(chunk_file)
+    started = time.monotonic()
+
+    try:
+        if not chunk_selected(chunk_file, s3_options.get('selector')):
+            return {
+                'chunk_file': str(chunk_file),
+                's3_key': None,
+                'selected': False,
+                'success': True
+            }
+        if PARTITION_PLACEHOLDER in s3_key:
+            partition = chunk_partition(chunk_file, s3_options.get('default_partition', ''))
+            s3_key = s3_key.replace(PARTITION_PLACEHOLDER, partition)
+        s3_client = _get_process_s3_client(s3_options['region'], s3_options.get('profile'))
+        writer = S3MultipartWriter(
+            s3_client,
+            s3_options['bucket'],
+            s3_key,
+            part_size=s3_options.get('part_size', DEFAULT_PART_SIZE),
+            extra_args=s3_options.get('extra_args')
+        )
+        sink = writer
+        compressor = None
+        if s3_options.get('compression') is not None:
+            compressor = GzipStreamWriter(
+                writer,
+                level=s3_options['compression'].get('level', DEFAULT_COMPRESSION_LEVEL),
+                threaded=True
+            )
+            sink = compressor
+        prefilter = None
+        if s3_options.get('prefilter') is not None:
+            prefilter = SensitivePreFilter(s3_options['prefilter'])
+            sink = PreFilterWriter(sink, prefilter)
+
+        try:
+            lines = write_chunk_text(sink, chunk_file, decoder, s3_options.get('slice_size', DEFAULT_SLICE_SIZE))
+            if prefilter is not None:
+                sink.flush()
+            if compressor is not None:
+                compressor.close()
+        except BaseException:
+            if compressor is not None:
+                compressor.abort()
+            writer.abort()
+            raise
+
+        result = {
+            'chunk_file': str(chunk_file),
+            's3_key': s3_key,
+            'bytes': writer.bytes_written,
+            'chunk_bytes': chunk_file.stat().st_size,
+            'lines': lines,
+            'success': True
+        }
+        sha256 = file_sha256(chunk_file) if s3_options.get('checksum') or s3_options.get('describe') else None
+        if s3_options.get('checksum'):
+            result['sha256'] = sha256
+        if s3_options.get('describe'):
+            result['metadata'] = _try_read_metadata(chunk_file, sha256)
+        if compressor is not None:
+            result['uncompressed_bytes'] = compressor.bytes_in
+        if prefilter is not None:
+            result['prefilter'] = prefilter.stats
+            if not prefilter.has_candidates:
+                writer.abort()
+                result['s3_key'] = None
+                result['filtered_out'] = True
+                result['seconds'] = time.monotonic() - started
+                return result
+        try:
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        result['seconds'] = time.monotonic() - started
+        return result
+    except Exception as e:
+        return {
+            'chunk_file': str(chunk_file),
+            's3_key': None,
+            'success': False,
+            'error': str(e)
+        }
+
+
+def _run_batch(func, batch: List[Tuple]) -> List[Dict]:
+    """在工作进程中依次处理一批任务"""
+    return [func(*args) for args in batch]
+
+
+def _failed_results(batch: List[Tuple], error: str) -> List[Dict]:
+    """整批任务失败时为每个chunk生成失败结果"""
+    return [{'chunk_file': args[0], 'success': False, 'error': error} for args in batch]
+
+
+def _run_ordered(func, tasks: Iterable[Tuple], workers: int, batch_size: int = TASK_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    对每个任务执行func (任务元组的第一个元素为chunk路径)，workers > 1 时使用进程池并行
+    任务按需从迭代器中读取，发现阶段尚未结束时即可开始处理；
+    进行中的任务数有上限，结果按输入顺序产出，与并行度无关
+    """
+    if workers <= 1:
+        for args in tasks:
+            yield func(*args)
+        return
+
+    max_in_flight = workers * 2
+    pending = deque()
+
+    def collect(batch, future):
+        try:
+            return future.result()
+        except Exception as e:
+            # 工作进程异常退出 (如OOM) 等，整批标记为失败
+            logger.error(f"进程池任务失败: {e}")
+            return _failed_results(batch, f"进程池任务失败: {e}")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tasks = iter(tasks)
+        while True:
+            # 大量小chunk时批量分发任务，减少进程间通信次数
+            batch = list(islice(tasks, batch_size))
+            if not batch:
+                break
+            try:
+                pending.append((batch, executor.submit(_run_batch, func, batch)))
+            except BrokenProcessPool as e:
+                logger.error(f"进程池异常终止: {e}")
+                yield from _failed_results(batch, f"进程池异常终止: {e}")
+                continue
+            while len(pending) >= max_in_flight:
+                yield from collect(*pending.popleft())
+
+        while pending:
+            yield from collect(*pending.popleft())
+
+
+def extract_chunks(chunk_files: Iterable[Path], output_path: Path, decoder: str = 'native', workers: int = 1,
+                   slice_size: int = DEFAULT_SLICE_SIZE, chunk_root: Optional[Path] = None,
+                   describe: bool = False, selector: Optional[str] = None,
+                   checksum: bool = False) -> Iterator[Dict]:
+    """
+    批量提取chunk文件到本地文本文件 (chunk_files 可以是惰性迭代器)
+    selector 在工作进程中按chunk头部的标签过滤，不匹配的chunk不解码
+    checksum 时在工作进程中计算chunk内容哈希 (result['sha256'])
+    """
+    tasks = (
+        (str(chunk_file),
+         str(output_path / f"{chunk_output_name(chunk_file, chunk_root)}.txt"),
+         decoder,
+         slice_size,
+         describe,
+         selector,
+         checksum)
+        for chunk_file in chunk_files
+    )
+    return _run_ordered(extract_chunk_file, tasks, workers)
+
+
+def describe_chunks(chunk_files: Iterable[Path], workers: int = 1) -> Iterator[Dict]:
+    """批量读取chunk元数据 (只解析头部和块索引)"""
+    return _run_ordered(describe_chunk_file, ((str(chunk_file),) for chunk_file in chunk_files), workers)
+
+
+def stream_chunks_to_s3(chunk_files: Iterable[Path], key_prefix: str, s3_options: Dict,
+                        decoder: str = 'native', workers: int = 1,
+                        chunk_root: Optional[Path] = None) -> Iterator[Dict]:
+    """
+    批量解码chunk文件并流式上传到 key_prefix/<chunk>.txt (启用压缩时为 .txt.gz)，不写本地中间文件
+    key_prefix 可以包含 {partition} 占位符，由工作进程按chunk的日志时间替换
+    """
+    suffix = '.txt.gz' if s3_options.get('compression') is not None else '.txt'
+    tasks = (
+        (str(chunk_file),
+         f"{key_prefix}/{chunk_output_name(chunk_file, chunk_root)}{suffix}",
+         decoder,
+         s3_options)
+        for chunk_file in chunk_files
+    )
+    return _run_ordered(stream_chunk_to_s3, tasks, workers)
+
+
+def prefilter_files(text_files: Iterable[str], output_path: Path, options: Dict,
+                    workers: int = 1) -> Iterator[Dict]:
+    """批量预过滤提取文件到 output_path/<同名文件> (结果中的 chunk_file 为输入文本文件)"""
+    tasks = (
+        (str(text_file), str(output_path / Path(text_file).name), options)
+        for text_file in text_files
+    )
+    return _run_ordered(prefilter_file, tasks, workers)
+
+
+def detect_files(tasks: Iterable[Tuple], workers: int = 1) -> Iterator[Dict]:
+    """批量本地敏感数据检测 (任务为 local_detector.detect_file 的参数元组)"""
+    # 延迟导入，避免与 local_detector 循环导入
+    from local_detector import detect_file
+    return _run_ordered(detect_file, tasks, workers)
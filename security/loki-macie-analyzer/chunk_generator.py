@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+合成Loki chunk生成器
+按指定的chunk数量、大小、标签基数 (日志流数)、租户数和敏感数据密度生成与Loki chunkenc格式一致的chunk文件
+(snappy帧格式的JSON头部、带CRC32C校验和的压缩数据块和块索引)，按 <租户>/<指纹>/<from>:<through>:<校验和>
+的目录结构存放，用于基准测试和不依赖真实数据的离线测试。相同参数和随机种子生成的文件完全相同。
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import struct
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from loki_chunk_decoder import (CHUNK_FORMAT_V2, CHUNK_FORMAT_V3, CHUNK_FORMAT_V4, CHUNK_MAGIC, ENC_FLATE, ENC_GZIP,
+                                ENC_NONE, ENC_SNAPPY, ENCODING_NAMES, SNAPPY_STREAM_IDENTIFIER)
+
+# 可选的C扩展加速，未安装时使用纯Python实现
+try:
+    import crc32c as _crc32c_lib
+except ImportError:
+    _crc32c_lib = None
+
+try:
+    import snappy as _snappy_lib
+except ImportError:
+    _snappy_lib = None
+
+logger = logging.getLogger(__name__)
+
+# 数据集描述文件 (生成参数和统计)，基准测试据此判断能否复用已生成的数据
+# 以 '.' 开头，chunk发现时跳过，输出目录可直接作为管道的chunk目录
+DATASET_FILE = '.dataset.json'
+
+# Loki默认的块大小 (未压缩) 和chunk目标大小
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_CHUNK_SIZE = 1536 * 1024
+
+DEFAULT_START = '2024-01-01T00:00:00'
+
+# Loki chunk头部中的编码字段 (logs chunk)
+HEADER_ENCODING = 129
+
+# 可生成的块编码 (其余编码只能解码)
+GENERATED_ENCODINGS = (ENC_GZIP, ENC_SNAPPY, ENC_FLATE, ENC_NONE)
+
+SNAPPY_FRAME_SIZE = 65536
+SNAPPY_MAX_OFFSET = 65535
+SNAPPY_MAX_COPY = 64
+
+NAMESPACES = ('default', 'payments', 'orders', 'auth', 'search', 'billing', 'ingest', 'monitoring')
+APPS = ('api-gateway', 'checkout', 'user-service', 'inventory', 'notifier', 'worker', 'frontend', 'scheduler')
+LEVELS = ('info', 'info', 'info', 'info', 'debug', 'warn', 'error')
+METHODS = ('GET', 'GET', 'GET', 'POST', 'PUT', 'DELETE')
+PATHS = ('/api/v1/orders', '/api/v1/users', '/api/v1/cart', '/api/v1/search', '/healthz', '/metrics',
+         '/api/v1/payments', '/api/v1/inventory')
+MESSAGES = ('request completed', 'cache miss', 'retrying upstream call', 'connection pool exhausted',
+            'job finished', 'slow query detected', 'token refreshed', 'message published')
+# 追踪ID以字母为主，避免长数字串被误识别为卡号或电话号码，含敏感数据的行数与生成时的统计一致
+TRACE_ID_ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+_CRC32C_TABLE = []
+for _n in range(256):
+    _c = _n
+    for _ in range(8):
+        _c = (_c >> 1) ^ 0x82F63B78 if _c & 1 else _c >> 1
+    _CRC32C_TABLE.append(_c)
+
+
+def crc32c(data: bytes) -> int:
+    """CRC32C (Castagnoli)，Loki块校验和与snappy帧校验和使用的算法"""
+    if _crc32c_lib is not None:
+        return _crc32c_lib.crc32c(data)
+    crc = 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for b in data:
+        crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def _uvarint(value: int) -> bytes:
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _varint(value: int) -> bytes:
+    """zigzag编码的有符号varint"""
+    return _uvarint((value << 1) ^ (value >> 63))
+
+
+def _snappy_literal(out: bytearray, data: bytes):
+    length = len(data) - 1
+    if length < 60:
+        out.append(length << 2)
+    elif length < 256:
+        out += bytes((60 << 2, length))
+    else:
+        out.append(61 << 2)
+        out += length.to_bytes(2, 'little')
+    out += data
+
+
+def snappy_compress_block(data: bytes) -> bytes:
+    """
+    snappy原始块格式压缩 (已安装python-snappy时使用C扩展)
+    纯Python实现为贪心的4字节哈希匹配，压缩率略低于C实现，输入不超过64KB (帧格式的单帧大小)
+    """
+    if _snappy_lib is not None:
+        return _snappy_lib.compress(data)
+    out = bytearray(_uvarint(len(data)))
+    table: Dict[bytes, int] = {}
+    end = len(data)
+    pos = 0
+    literal_start = 0
+    while pos + 4 <= end:
+        key = data[pos:pos + 4]
+        candidate = table.get(key)
+        table[key] = pos
+        if candidate is None or pos - candidate > SNAPPY_MAX_OFFSET:
+            pos += 1
+            continue
+        length = 4
+        while pos + length < end and length < SNAPPY_MAX_COPY and data[candidate + length] == data[pos + length]:
+            length += 1
+        if literal_start < pos:
+            _snappy_literal(out, data[literal_start:pos])
+        out.append(((length - 1) << 2) | 2)
+        out += (pos - candidate).to_bytes(2, 'little')
+        pos += length
+        literal_start = pos
+    if literal_start < end:
+        _snappy_literal(out, data[literal_start:])
+    return bytes(out)
+
+
+def _masked_crc32c(data: bytes) -> int:
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+def snappy_compress_stream(data: bytes) -> bytes:
+    """snappy帧格式压缩 (与 golang/snappy NewBufferedWriter 的输出结构相同)"""
+    out = bytearray(b'\xff' + len(SNAPPY_STREAM_IDENTIFIER).to_bytes(3, 'little') + SNAPPY_STREAM_IDENTIFIER)
+    for start in range(0, len(data), SNAPPY_FRAME_SIZE):
+        frame = data[start:start + SNAPPY_FRAME_SIZE]
+        compressed = snappy_compress_block(frame)
+        checksum = _masked_crc32c(frame).to_bytes(4, 'little')
+        if len(compressed) < len(frame):
+            chunk_type, body = 0x00, checksum + compressed
+        else:
+            chunk_type, body = 0x01, checksum + frame
+        out.append(chunk_type)
+        out += len(body).to_bytes(3, 'little')
+        out += body
+    return bytes(out)
+
+
+def compress_block(encoding: int, data: bytes) -> bytes:
+    """按chunk编码压缩数据块 (decompress_block 的逆操作)"""
+    if encoding == ENC_NONE:
+        return data
+    if encoding == ENC_GZIP:
+        return gzip.compress(data, mtime=0)
+    if encoding == ENC_SNAPPY:
+        return snappy_compress_stream(data)
+    if encoding == ENC_FLATE:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+    raise ValueError(f"不支持生成该编码的chunk: {ENCODING_NAMES.get(encoding, encoding)}")
+
+
+def _symbols_section(structured_metadata: Dict[str, str]) -> Tuple[bytes, List[str]]:
+    """V4日志条目的结构化元数据段 (符号编号对) 及其引用的符号表"""
+    symbols = []
+    section = bytearray(_uvarint(len(structured_metadata)))
+    for name, value in sorted(structured_metadata.items()):
+        for symbol in (name, value):
+            if symbol not in symbols:
+                symbols.append(symbol)
+            section += _uvarint(symbols.index(symbol))
+    return bytes(section), symbols
+
+
+def encode_chunk(entries: List[Tuple[int, bytes]], labels: Dict[str, str], user_id: str, fingerprint: int,
+                 encoding: int = ENC_GZIP, block_size: int = DEFAULT_BLOCK_SIZE,
+                 format_version: int = CHUNK_FORMAT_V3,
+                 structured_metadata: Optional[Dict[str, str]] = None) -> bytes:
+    """
+    把 (纳秒时间戳, 日志行) 编码为Loki chunk文件内容 (默认V3格式)
+    每个数据块未压缩时约 block_size 字节，块和块索引之后各有一个CRC32C校验和
+    V2的块索引不含未压缩大小；V4的每个条目带结构化元数据段 (structured_metadata，默认为空)，
+    块索引之后依次是符号表、符号表长度和偏移、块索引长度和偏移
+    """
+    if format_version not in (CHUNK_FORMAT_V2, CHUNK_FORMAT_V3, CHUNK_FORMAT_V4):
+        raise ValueError(f"不支持生成该格式版本的chunk: {format_version}")
+    section, symbols = _symbols_section(structured_metadata or {})
+    entry_suffix = _uvarint(len(section)) + section if format_version >= CHUNK_FORMAT_V4 else b''
+
+    data = bytearray(struct.pack('>I', CHUNK_MAGIC) + bytes((format_version, encoding)))
+    metas = []
+    index = 0
+    while index < len(entries):
+        raw = bytearray()
+        first = index
+        while index < len(entries) and (len(raw) < block_size or index == first):
+            ts, line = entries[index]
+            raw += _varint(ts) + _uvarint(len(line)) + line + entry_suffix
+            index += 1
+        compressed = compress_block(encoding, bytes(raw))
+        offset = len(data)
+        data += compressed + struct.pack('>I', crc32c(compressed))
+        metas.append((index - first, entries[first][0], entries[index - 1][0], offset, len(raw), len(compressed)))
+
+    metas_offset = len(data)
+    meta_bytes = bytearray(_uvarint(len(metas)))
+    for num_entries, min_t, max_t, offset, uncompressed_size, length in metas:
+        meta_bytes += _uvarint(num_entries) + _varint(min_t) + _varint(max_t) + _uvarint(offset)
+        if format_version >= CHUNK_FORMAT_V3:
+            meta_bytes += _uvarint(uncompressed_size)
+        meta_bytes += _uvarint(length)
+    data += meta_bytes + struct.pack('>I', crc32c(bytes(meta_bytes)))
+    if format_version >= CHUNK_FORMAT_V4:
+        symbols_offset = len(data)
+        symbol_bytes = bytearray(_uvarint(len(symbols)))
+        for symbol in symbols:
+            encoded = symbol.encode('utf-8')
+            symbol_bytes += _uvarint(len(encoded)) + encoded
+        data += symbol_bytes + struct.pack('>I', crc32c(bytes(symbol_bytes)))
+        data += struct.pack('>QQ', len(symbol_bytes), symbols_offset)
+        data += struct.pack('>Q', len(meta_bytes))
+    data += struct.pack('>Q', metas_offset)
+
+    header = json.dumps({
+        'fingerprint': fingerprint,
+        'userID': user_id,
+        'from': round(entries[0][0] / 1e9, 3),
+        'through': round(entries[-1][0] / 1e9, 3),
+        'metric': labels,
+        'encoding': HEADER_ENCODING
+    }, separators=(',', ':')).encode('utf-8')
+    header = snappy_compress_stream(header)
+    return struct.pack('>I', len(header) + 4) + header + struct.pack('>I', len(data)) + bytes(data)
+
+
+def stream_labels(index: int) -> Dict[str, str]:
+    """第 index 个日志流的标签 (命名空间和应用循环组合，pod名称保证唯一)"""
+    namespace = NAMESPACES[index % len(NAMESPACES)]
+    app = APPS[(index // len(NAMESPACES)) % len(APPS)]
+    suffix = hashlib.sha1(str(index).encode()).hexdigest()[:5]
+    return {
+        '__name__': 'logs',
+        'app': app,
+        'container': app,
+        'namespace': namespace,
+        'pod': f"{app}-{suffix}-{index}"
+    }
+
+
+def labels_fingerprint(labels: Dict[str, str]) -> int:
+    """标签集合的64位指纹 (与Loki的算法不同，只保证同一标签集合的指纹稳定且互不相同)"""
+    text = '\xff'.join(f"{name}\xff{value}" for name, value in sorted(labels.items()))
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def _luhn_complete(digits: str) -> str:
+    """补上Luhn校验位"""
+    total = 0
+    for i, ch in enumerate(reversed(digits)):
+        d = int(ch)
+        if i % 2 == 0:
+            d = d * 2 - 9 if d * 2 > 9 else d * 2
+        total += d
+    return digits + str((10 - total % 10) % 10)
+
+
+def _china_id(rng: random.Random) -> str:
+    body = f"{rng.choice(('110101', '310104', '440305', '330106'))}{rng.randint(1960, 2005)}" \
+           f"{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}{rng.randint(0, 999):03d}"
+    weights = (7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2)
+    check = '10X98765432'[sum(int(d) * w for d, w in zip(body, weights)) % 11]
+    return body + check
+
+
+# 敏感数据类型 -> 生成含该类型数据的日志消息
+PII_GENERATORS = {
+    'EMAIL_ADDRESS': lambda rng: f'msg="user signed in" email={rng.choice(("alice", "bob", "carol", "dave"))}'
+                                 f'.{rng.randint(1, 9999)}@example.{rng.choice(("com", "org", "net"))}',
+    'PHONE_NUMBER': lambda rng: f'msg="sms sent" phone=1{rng.choice("3456789")}{rng.randint(0, 999999999):09d}',
+    'CREDIT_CARD_NUMBER': lambda rng: 'msg="payment authorized" card_number='
+                                      + _luhn_complete('4' + ''.join(rng.choice('0123456789') for _ in range(14))),
+    'AWS_CREDENTIALS': lambda rng: 'msg="loaded credentials" access_key=AKIA'
+                                   + ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567') for _ in range(16)),
+    'USA_SOCIAL_SECURITY_NUMBER': lambda rng: f'msg="identity verified" ssn={rng.randint(100, 899)}-'
+                                              f'{rng.randint(10, 99)}-{rng.randint(1000, 9999)}',
+    'CHINA_IDENTIFICATION': lambda rng: f'msg="实名认证通过" id_card={_china_id(rng)}',
+}
+
+
+def _log_line(rng: random.Random, ts_ns: int, level: str, message: str) -> bytes:
+    moment = datetime.fromtimestamp(ts_ns / 1e9, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]
+    trace = ''.join(rng.choices(TRACE_ID_ALPHABET, k=24))
+    return (f"ts={moment}Z level={level} caller=handler.go:{rng.randint(20, 400)} {message} "
+            f"method={rng.choice(METHODS)} path={rng.choice(PATHS)} status={rng.choice((200, 200, 200, 201, 404, 500))} "
+            f"duration_ms={rng.randint(1, 900)} trace_id={trace}").encode('utf-8')
+
+
+def generate_entries(rng: random.Random, from_ns: int, through_ns: int, target_bytes: int,
+                     pii_density: float, pii_counts: Dict[str, int]) -> List[Tuple[int, bytes]]:
+    """
+    生成未压缩约 target_bytes 字节的日志行，时间戳在 [from_ns, through_ns] 内递增
+    pii_density 比例的行含一个敏感数据值，按类型计入 pii_counts
+    """
+    lines = []
+    size = 0
+    pii_types = list(PII_GENERATORS)
+    while size < target_bytes:
+        if rng.random() < pii_density:
+            pii_type = rng.choice(pii_types)
+            pii_counts[pii_type] = pii_counts.get(pii_type, 0) + 1
+            message = PII_GENERATORS[pii_type](rng)
+        else:
+            message = f'msg="{rng.choice(MESSAGES)}"'
+        lines.append((rng.choice(LEVELS), message))
+        size += len(message) + 170
+    step = max(1, (through_ns - from_ns) // max(1, len(lines) - 1))
+    entries = []
+    for i, (level, message) in enumerate(lines):
+        ts = min(through_ns, from_ns + i * step)
+        entries.append((ts, _log_line(rng, ts, level, message)))
+    return entries
+
+
+def parse_start(value: Optional[str]) -> datetime:
+    start = datetime.fromisoformat(value or DEFAULT_START)
+    return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+
+
+def generate_chunks(output_dir: str, count: int = 100, chunk_size: int = DEFAULT_CHUNK_SIZE, streams: int = 10,
+                    tenants: int = 1, pii_density: float = 0.01, encoding: int = ENC_GZIP,
+                    block_size: int = DEFAULT_BLOCK_SIZE, start: Optional[str] = None, hours: int = 24,
+                    seed: int = 0) -> Dict:
+    """
+    生成一组合成chunk
+    count: chunk数量，按顺序轮流分配给 streams 个日志流 (标签基数)，每个日志流属于一个租户
+    chunk_size: 每个chunk未压缩的日志字节数
+    pii_density: 含敏感数据的日志行比例 (0-1)
+    每个日志流的chunk在 start 开始的 hours 小时内依次排列、时间互不重叠
+    返回数据集描述 (参数、文件数、字节数、日志行数和各类敏感数据的行数)，同时写入 .dataset.json
+    """
+    if encoding not in GENERATED_ENCODINGS:
+        raise ValueError(f"不支持生成该编码的chunk: {ENCODING_NAMES.get(encoding, encoding)}")
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    params = {
+        'count': count, 'chunk_size': chunk_size, 'streams': streams, 'tenants': tenants,
+        'pii_density': pii_density, 'encoding': ENCODING_NAMES[encoding], 'block_size': block_size,
+        'start': parse_start(start).isoformat(), 'hours': hours, 'seed': seed
+    }
+    rng = random.Random(seed)
+    streams = max(1, min(streams, count))
+    start_ns = int(parse_start(start).timestamp()) * 10 ** 9
+    chunks_per_stream = -(-count // streams)
+    span_ns = hours * 3600 * 10 ** 9 // chunks_per_stream
+
+    summary = {'params': params, 'chunks': 0, 'bytes': 0, 'uncompressed_bytes': 0, 'lines': 0,
+               'pii_lines': 0, 'pii_types': {}}
+    for index in range(count):
+        stream = index % streams
+        labels = stream_labels(stream)
+        tenant = 'fake' if tenants <= 1 else f"tenant-{stream % tenants}"
+        fingerprint = labels_fingerprint(labels)
+        # 同一日志流的第k个chunk，起点错开避免所有日志流的chunk边界对齐
+        from_ns = start_ns + (index // streams) * span_ns + stream * span_ns // (streams + 1) // 2
+        through_ns = from_ns + span_ns // 2
+        entries = generate_entries(rng, from_ns, through_ns, chunk_size, pii_density, summary['pii_types'])
+        content = encode_chunk(entries, labels, tenant, fingerprint, encoding=encoding, block_size=block_size)
+
+        name = f"{entries[0][0] // 10 ** 6:x}:{entries[-1][0] // 10 ** 6:x}:{crc32c(content):x}"
+        chunk_file = output_path / tenant / f"{fingerprint:x}" / name
+        chunk_file.parent.mkdir(parents=True, exist_ok=True)
+        chunk_file.write_bytes(content)
+
+        summary['chunks'] += 1
+        summary['bytes'] += len(content)
+        summary['uncompressed_bytes'] += sum(len(line) for _, line in entries)
+        summary['lines'] += len(entries)
+        if (index + 1) % 100 == 0:
+            logger.info(f"已生成 {index + 1}/{count} 个chunk")
+    summary['pii_lines'] = sum(summary['pii_types'].values())
+
+    with open(output_path / DATASET_FILE, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    return summary
+
+
+def load_dataset(output_dir: str) -> Optional[Dict]:
+    """读取已生成数据集的描述，不存在或无法解析时返回None"""
+    try:
+        with open(Path(output_dir) / DATASET_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def parse_encoding(name: str) -> int:
+    encodings = {ENCODING_NAMES[e]: e for e in GENERATED_ENCODINGS}
+    if name not in encodings:
+        raise argparse.ArgumentTypeError(f"编码必须是 {', '.join(encodings)} 之一")
+    return encodings[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成Loki chunk文件 (用于基准测试和离线测试)')
+    parser.add_argument('--output-dir', default='./synthetic_chunks', help='输出目录 (默认: ./synthetic_chunks)')
+    parser.add_argument('--count', type=int, default=100, help='chunk数量 (默认: 100)')
+    parser.add_argument('--chunk-size-kb', type=int, default=DEFAULT_CHUNK_SIZE // 1024,
+                        help=f'每个chunk未压缩的日志大小 (KB，默认: {DEFAULT_CHUNK_SIZE // 1024})')
+    parser.add_argument('--block-size-kb', type=int, default=DEFAULT_BLOCK_SIZE // 1024,
+                        help=f'数据块未压缩大小 (KB，默认: {DEFAULT_BLOCK_SIZE // 1024})')
+    parser.add_argument('--streams', type=int, default=10, help='日志流数量，即标签基数 (默认: 10)')
+    parser.add_argument('--tenants', type=int, default=1, help='租户数量, 1表示单租户 fake (默认: 1)')
+    parser.add_argument('--pii-density', type=float, default=0.01, help='含敏感数据的日志行比例 0-1 (默认: 0.01)')
+    parser.add_argument('--encoding', type=parse_encoding, default=ENC_GZIP,
+                        help='块编码 gzip/snappy/flate/none (默认: gzip)')
+    parser.add_argument('--start', default=DEFAULT_START, help=f'日志起始时间 (UTC，默认: {DEFAULT_START})')
+    parser.add_argument('--hours', type=int, default=24, help='日志覆盖的小时数 (默认: 24)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子 (默认: 0)')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if not 0 <= args.pii_density <= 1:
+        parser.error('--pii-density 必须在0到1之间')
+
+    summary = generate_chunks(args.output_dir, count=args.count, chunk_size=args.chunk_size_kb * 1024,
+                              streams=args.streams, tenants=args.tenants, pii_density=args.pii_density,
+                              encoding=args.encoding, block_size=args.block_size_kb * 1024, start=args.start,
+                              hours=args.hours, seed=args.seed)
+    print(f"✅ 已生成 {summary['chunks']} 个chunk: {summary['bytes']:,} 字节 "
+          f"(未压缩 {summary['uncompressed_bytes']:,} 字节), {summary['lines']:,} 行, "
+          f"{summary['pii_lines']:,} 行含敏感数据")
+    for pii_type, lines in sorted(summary['pii_types'].items()):
+        print(f"   {pii_type}: {lines:,}")
+    print(f"📄 数据集描述: {Path(args.output_dir) / DATASET_FILE}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
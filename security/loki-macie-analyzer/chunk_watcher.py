@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Chunk目录监控与微批
+Linux上通过inotify (ctypes调用libc，无需第三方库) 监听Loki写完的chunk文件，不可用时退回定期扫描目录；
+新chunk按数量或等待时间聚合为微批，从写入到开始处理的延迟不超过微批的最长等待时间。
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from chunk_discovery import iter_chunk_files
+
+logger = logging.getLogger(__name__)
+
+# inotify事件和标志 (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+# 文件写完 (关闭) 或移入，以及新建子目录
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+# struct inotify_event: wd, mask, cookie, len，后接 len 字节的文件名
+_EVENT_HEADER = struct.Struct('iIII')
+READ_BUFFER_SIZE = 64 * 1024
+
+DEFAULT_POLL_INTERVAL = 10
+DEFAULT_SETTLE_SECONDS = 5
+DEFAULT_BATCH_MAX_CHUNKS = 200
+DEFAULT_BATCH_MAX_AGE = 60
+DEFAULT_BATCH_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 30
+DEFAULT_MAX_RETRY_BACKOFF = 600
+DEFAULT_JOB_INTERVAL_MINUTES = 60
+
+WATCH_MODES = ('auto', 'inotify', 'poll')
+
+
+def _load_libc():
+    """加载提供inotify的libc，非Linux或不可用时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyWatcher:
+    """
+    递归监听目录树中写完 (IN_CLOSE_WRITE) 或移入 (IN_MOVED_TO) 的文件
+    新建的租户/指纹子目录自动加入监听，并补扫加入监听前已写入的文件；内核事件队列溢出时补扫整个目录树。
+    监听数超过 fs.inotify.max_user_watches 时 degraded 为True，调用方应改为定期扫描。
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.degraded = False
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "当前系统不支持inotify")
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise self._error('inotify_init1')
+        # 监听描述符 -> 目录
+        self._dirs: Dict[int, Path] = {}
+        # 补扫得到、尚未返回的文件
+        self._pending: List[Path] = []
+        try:
+            self._add_tree(self.root, rescan=False)
+        except OSError:
+            self.close()
+            raise
+        logger.info(f"inotify监听 {len(self._dirs)} 个目录: {self.root}")
+
+    @staticmethod
+    def _error(call: str, path=None) -> OSError:
+        err = ctypes.get_errno()
+        return OSError(err, f"{call} 失败: {os.strerror(err)}" + (f" ({path})" if path else ''))
+
+    def _add_watch(self, path: Path) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(path)), WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = path
+            return True
+        err = ctypes.get_errno()
+        if err in (errno.ENOENT, errno.ENOTDIR):
+            # 加入监听前目录已被删除
+            return False
+        raise self._error('inotify_add_watch', path)
+
+    def _add_tree(self, directory: Path, rescan: bool):
+        """
+        监听目录及其全部子目录 (隐藏目录除外)
+        rescan: 同时收集其中已有的文件 (先加监听再列目录，之后写完的文件都会产生事件，重复的由调用方去重)
+        """
+        stack = [Path(directory)]
+        while stack:
+            path = stack.pop()
+            if not self._add_watch(path):
+                continue
+            try:
+                entries = list(os.scandir(path))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif rescan and entry.is_file():
+                        self._pending.append(Path(entry.path))
+                except OSError:
+                    continue
+
+    def _add_tree_at_runtime(self, directory: Path):
+        try:
+            self._add_tree(directory, rescan=True)
+        except OSError as e:
+            # 通常是监听数达到上限；补扫到的文件仍然返回，之后交给定期扫描
+            logger.error(f"无法监听目录 {directory}: {e} (可调大 fs.inotify.max_user_watches)")
+            self.degraded = True
+
+    def _read_events(self) -> List[Path]:
+        files = []
+        while True:
+            try:
+                data = os.read(self._fd, READ_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning("inotify事件队列溢出，重新扫描整个目录")
+                    self._add_tree_at_runtime(self.root)
+                    continue
+                if mask & IN_IGNORED:
+                    # 目录被删除或移走
+                    self._dirs.pop(wd, None)
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or not name or name.startswith('.'):
+                    continue
+                path = directory / name
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._add_tree_at_runtime(path)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    files.append(path)
+        return files
+
+    def poll(self, timeout: float) -> List[Path]:
+        """等待最多timeout秒，返回期间写完的文件 (可能有重复)"""
+        if not self._pending:
+            select.select([self._fd], [], [], max(0.0, timeout))
+        files = self._read_events()
+        pending, self._pending = self._pending, []
+        return pending + files
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """
+    定期扫描目录树 (inotify不可用时使用)
+    大小或修改时间变化、且最后修改已超过 settle_seconds 的文件视为写完；
+    report_existing=False 时第一次扫描只记录已写完的文件，不返回
+    """
+
+    def __init__(self, root, interval: float = DEFAULT_POLL_INTERVAL,
+                 settle_seconds: float = DEFAULT_SETTLE_SECONDS, report_existing: bool = False):
+        self.root = Path(root)
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.degraded = False
+        # 已返回文件的 (大小, 修改时间)
+        self._seen: Dict[str, Tuple[int, int]] = {}
+        self._next_scan = 0.0
+        if not report_existing:
+            self._scan()
+            self._next_scan = time.monotonic() + interval
+        logger.info(f"定期扫描目录 (每 {interval:g} 秒): {self.root}")
+
+    def _scan(self) -> List[Path]:
+        files = []
+        seen = {}
+        now = time.time()
+        for path in iter_chunk_files(self.root):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            key = str(path)
+            signature = (st.st_size, st.st_mtime_ns)
+            if now - st.st_mtime < self.settle_seconds:
+                # 可能仍在写入，下次扫描再判断
+                continue
+            seen[key] = signature
+            if self._seen.get(key) != signature:
+                files.append(path)
+        # 已删除的文件不再记录
+        self._seen = seen
+        return files
+
+    def poll(self, timeout: float) -> List[Path]:
+        """等待最多timeout秒；到达扫描时间时返回新写完的文件"""
+        wait = self._next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(max(0.0, timeout))
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        files = self._scan()
+        self._next_scan = time.monotonic() + self.interval
+        return files
+
+    def close(self):
+        pass
+
+
+def create_watcher(root, mode: str = 'auto', poll_interval: float = DEFAULT_POLL_INTERVAL,
+                   settle_seconds: float = DEFAULT_SETTLE_SECONDS):
+    """
+    创建目录监控器
+    mode: auto (优先inotify，不可用时定期扫描)、inotify、poll
+    """
+    if mode not in WATCH_MODES:
+        raise ValueError(f"不支持的监控方式: {mode} (可选: {', '.join(WATCH_MODES)})")
+    if mode != 'poll':
+        try:
+            return InotifyWatcher(root)
+        except OSError as e:
+            if mode == 'inotify':
+                raise
+            logger.warning(f"inotify不可用，改为定期扫描目录: {e}")
+    return PollingWatcher(root, poll_interval, settle_seconds)
+
+
+class MicroBatcher:
+    """
+    按数量或等待时间聚合chunk
+    达到 max_chunks 个，或最早加入的chunk已等待 max_age_seconds 时可以取出；取出前重复加入的文件只保留一次。
+    处理失败的chunk用 retry() 放回: 等待退避时间 (retry_backoff_seconds，每次失败加倍，不超过 max_retry_backoff_seconds)
+    后优先取出，连续失败 max_attempts 次后放弃
+    """
+
+    def __init__(self, max_chunks: int = DEFAULT_BATCH_MAX_CHUNKS, max_age_seconds: float = DEFAULT_BATCH_MAX_AGE,
+                 max_attempts: int = DEFAULT_BATCH_MAX_ATTEMPTS, retry_backoff_seconds: float = DEFAULT_RETRY_BACKOFF,
+                 max_retry_backoff_seconds: float = DEFAULT_MAX_RETRY_BACKOFF):
+        self.max_chunks = max(1, max_chunks)
+        self.max_age_seconds = max_age_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.max_retry_backoff_seconds = max_retry_backoff_seconds
+        # 文件 -> 加入时间
+        self._items: 'OrderedDict[str, float]' = OrderedDict()
+        # 等待重试的文件 -> 可以再次取出的时间
+        self._retries: Dict[str, float] = {}
+        # 文件 -> 已失败次数
+        self._attempts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._items) + len(self._retries)
+
+    def add(self, chunk_files: Iterable, now: Optional[float] = None) -> int:
+        """加入chunk，返回新加入的数量 (等待重试的chunk不重复加入)"""
+        now = time.monotonic() if now is None else now
+        added = 0
+        for chunk_file in chunk_files:
+            key = str(chunk_file)
+            if key not in self._items and key not in self._retries:
+                self._items[key] = now
+                added += 1
+        return added
+
+    def retry(self, chunk_files: Iterable, now: Optional[float] = None) -> List[Path]:
+        """处理失败的chunk在退避时间后重新取出，返回达到最大尝试次数而放弃的chunk"""
+        now = time.monotonic() if now is None else now
+        abandoned = []
+        for chunk_file in chunk_files:
+            key = str(chunk_file)
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(key, None)
+                abandoned.append(Path(key))
+                continue
+            self._attempts[key] = attempts
+            backoff = min(self.retry_backoff_seconds * 2 ** (attempts - 1), self.max_retry_backoff_seconds)
+            self._retries[key] = now + backoff
+        return abandoned
+
+    def done(self, chunk_files: Iterable):
+        """chunk处理成功，清除失败次数"""
+        for chunk_file in chunk_files:
+            self._attempts.pop(str(chunk_file), None)
+
+    def release_retries(self, now: Optional[float] = None):
+        """
+        退避时间已到的chunk放到队首，可以立即取出 (加入时间按已等待 max_age_seconds 计)
+        now 为 math.inf 时不论退避时间全部放回 (停止前处理剩余的chunk)
+        """
+        now = time.monotonic() if now is None else now
+        due = sorted((retry_at, key) for key, retry_at in self._retries.items() if retry_at <= now)
+        for retry_at, key in reversed(due):
+            del self._retries[key]
+            self._items[key] = retry_at - self.max_age_seconds
+            self._items.move_to_end(key, last=False)
+
+    def oldest_age(self, now: Optional[float] = None) -> float:
+        """最早加入的chunk已等待的秒数"""
+        if not self._items:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return now - next(iter(self._items.values()))
+
+    def time_until_ready(self, now: Optional[float] = None) -> Optional[float]:
+        """距离可以取出还需等待的秒数 (包括等待重试的chunk)，为空时返回None"""
+        now = time.monotonic() if now is None else now
+        waits = []
+        if self._items:
+            if len(self._items) >= self.max_chunks:
+                return 0.0
+            waits.append(max(0.0, self.max_age_seconds - self.oldest_age(now)))
+        if self._retries:
+            waits.append(max(0.0, min(self._retries.values()) - now))
+        return min(waits) if waits else None
+
+    def ready(self, now: Optional[float] = None) -> bool:
+        return self.time_until_ready(now) == 0.0
+
+    def take(self, now: Optional[float] = None) -> List[Path]:
+        """按加入顺序取出最多 max_chunks 个chunk，退避时间已到的重试chunk优先"""
+        self.release_retries(now)
+        batch = []
+        while self._items and len(batch) < self.max_chunks:
+            key, _ = self._items.popitem(last=False)
+            batch.append(Path(key))
+        return batch
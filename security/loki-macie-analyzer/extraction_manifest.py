@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+增量提取清单
+记录每个chunk的路径、大小、修改时间、内容哈希、提取输出以及上传的S3键，
+后续运行只处理新增或内容发生变化的chunk。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, block_size: int = 1024 * 1024) -> str:
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionManifest:
+    """
+    持久化的chunk处理清单 (JSON文件)
+    重叠执行的流水线中提取、派生和上传在不同线程中记录，记录和写回互斥
+    """
+
+    def __init__(self, manifest_file: str):
+        self.manifest_file = Path(manifest_file)
+        self.chunks: Dict[str, Dict] = {}
+        # 本次运行中已计算过的文件状态，避免重复计算哈希
+        self._current: Dict[str, Dict] = {}
+        # 输出文件 (提取结果及其派生文件) -> chunk路径列表，打包对象对应多个chunk
+        self._output_index: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        """加载清单文件，不存在时从空清单开始"""
+        if not self.manifest_file.exists():
+            logger.info(f"增量清单不存在，将创建: {self.manifest_file}")
+            return
+        with open(self.manifest_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != MANIFEST_VERSION:
+            logger.warning(f"增量清单版本不匹配，忽略旧清单: {self.manifest_file}")
+            return
+        self.chunks = data.get('chunks', {})
+        self._output_index = {
+            entry['output_file']: [path]
+            for path, entry in self.chunks.items()
+            if entry.get('output_file')
+        }
+        logger.info(f"增量清单加载成功: {len(self.chunks)} 条记录")
+
+    def save(self):
+        """原子方式写回清单文件"""
+        with self._lock:
+            data = {
+                'version': MANIFEST_VERSION,
+                'updated_at': datetime.now(timezone.utc).isoformat(),
+                'chunks': self.chunks
+            }
+            tmp_file = self.manifest_file.with_name(self.manifest_file.name + '.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_file, self.manifest_file)
+
+    @staticmethod
+    def _key(chunk_file) -> str:
+        return os.path.abspath(str(chunk_file))
+
+    def _stat(self, chunk_file: Path) -> Tuple[int, float]:
+        st = chunk_file.stat()
+        return st.st_size, st.st_mtime
+
+    def _is_unchanged(self, key: str, chunk_file: Path, entry: Optional[Dict]) -> bool:
+        """
+        判断chunk是否未变化: 大小和修改时间一致时直接认定未变化，
+        否则计算内容哈希比对 (仅touch过的文件不会被重新解码)
+        没有之前记录的新chunk无需比对，不在主进程中计算哈希 (由提取工作进程计算)
+        """
+        if entry is None:
+            return False
+        size, mtime = self._stat(chunk_file)
+        if entry and entry.get('size') == size and entry.get('mtime') == mtime:
+            return True
+
+        sha256 = file_sha256(chunk_file)
+        self._current[key] = {'size': size, 'mtime': mtime, 'sha256': sha256}
+        if entry and entry.get('sha256') == sha256:
+            entry['size'] = size
+            entry['mtime'] = mtime
+            return True
+        return False
+
+    def iter_pending(self, chunk_files: Iterable[Path], stats: Dict, streaming: bool = False) -> Iterator[Path]:
+        """
+        逐个产出需要解码的chunk (新增或内容变化)
+        stats 中累计 'reusable_outputs' (可直接上传的已有输出文件) 和 'skipped' (已处理跳过的数量)
+        streaming=True 时没有本地输出文件，未上传的chunk都需要重新解码
+        """
+        stats.setdefault('reusable_outputs', [])
+        stats.setdefault('skipped', 0)
+
+        for chunk_file in chunk_files:
+            key = self._key(chunk_file)
+            entry = self.chunks.get(key)
+            if not self._is_unchanged(key, chunk_file, entry):
+                yield chunk_file
+            elif entry.get('s3_key') or entry.get('filtered_out'):
+                stats['skipped'] += 1
+            elif not streaming and entry.get('output_file') and Path(entry['output_file']).exists():
+                stats['reusable_outputs'].append(entry['output_file'])
+            else:
+                yield chunk_file
+
+    def _entry_for_update(self, chunk_file, sha256: Optional[str] = None) -> Dict:
+        """
+        获取 (必要时创建) chunk的清单记录，并刷新文件状态
+        sha256: 工作进程中已计算的内容哈希，提供时不再读取文件
+        """
+        key = self._key(chunk_file)
+        state = self._current.pop(key, None)
+        if state is None:
+            size, mtime = self._stat(Path(chunk_file))
+            entry = self.chunks.get(key)
+            if sha256 is not None:
+                state = {'size': size, 'mtime': mtime, 'sha256': sha256}
+            elif entry and entry.get('size') == size and entry.get('mtime') == mtime:
+                state = {'size': size, 'mtime': mtime, 'sha256': entry.get('sha256')}
+            else:
+                state = {'size': size, 'mtime': mtime, 'sha256': file_sha256(chunk_file)}
+
+        entry = self.chunks.setdefault(key, {'path': key})
+        if entry.get('sha256') != state['sha256']:
+            # 内容变化后旧的上传记录失效
+            entry['s3_key'] = None
+            entry['uploaded_at'] = None
+            entry['filtered_out'] = False
+        entry.update(state)
+        return entry
+
+    def record_extraction(self, chunk_file, output_file: str, sha256: Optional[str] = None):
+        """记录chunk的提取结果"""
+        with self._lock:
+            entry = self._entry_for_update(chunk_file, sha256)
+            entry['output_file'] = output_file
+            entry['extracted_at'] = datetime.now(timezone.utc).isoformat()
+            self._output_index[output_file] = [entry['path']]
+
+    def record_upload(self, chunk_file, s3_key: str, sha256: Optional[str] = None):
+        """记录chunk上传到的S3键"""
+        with self._lock:
+            entry = self._entry_for_update(chunk_file, sha256)
+            entry['s3_key'] = s3_key
+            entry['uploaded_at'] = datetime.now(timezone.utc).isoformat()
+
+    def record_output_upload(self, output_file: str, s3_key: str):
+        """按提取输出文件 (或其派生文件) 记录上传结果"""
+        with self._lock:
+            now = datetime.now(timezone.utc).isoformat()
+            for chunk_path in self._output_index.get(output_file, []):
+                entry = self.chunks[chunk_path]
+                entry['s3_key'] = s3_key
+                entry['uploaded_at'] = now
+
+    def record_filtered(self, chunk_file, sha256: Optional[str] = None):
+        """记录chunk经预过滤后没有候选敏感行，无需上传"""
+        with self._lock:
+            entry = self._entry_for_update(chunk_file, sha256)
+            entry['s3_key'] = None
+            entry['filtered_out'] = True
+
+    def link_output(self, derived_file: str, output_file: str):
+        """将由提取输出派生的文件 (如预过滤结果) 关联到同一个chunk记录"""
+        self.link_outputs(derived_file, [output_file])
+
+    def link_outputs(self, derived_file: str, output_files: Iterable[str]):
+        """将由多个输出合并而成的文件 (如打包对象) 关联到所有对应的chunk记录"""
+        with self._lock:
+            chunk_paths = [
+                chunk_path
+                for output_file in output_files
+                for chunk_path in self._output_index.get(output_file, [])
+            ]
+            if chunk_paths:
+                self._output_index[derived_file] = chunk_paths
+
+    def chunks_for_output(self, output_file: str) -> List[str]:
+        """输出文件 (或其派生文件) 对应的chunk路径"""
+        with self._lock:
+            return list(self._output_index.get(output_file, []))
+
+    def record_output_filtered(self, output_file: str):
+        """按提取输出文件记录预过滤后无需上传"""
+        with self._lock:
+            for chunk_path in self._output_index.get(output_file, []):
+                entry = self.chunks[chunk_path]
+                entry['s3_key'] = None
+                entry['filtered_out'] = True
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+LogQL风格的标签选择器
+解析 {namespace="payments", app=~"pay.*"} 形式的流选择器 (支持 =、!=、=~、!~)，
+在解码数据块之前按chunk头部的标签判断是否需要处理该chunk。
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+_NAME = r'[a-zA-Z_][a-zA-Z0-9_]*'
+_MATCHER = re.compile(
+    r'\s*(?P<name>' + _NAME + r')\s*(?P<op>=~|!~|!=|=)\s*'
+    r'(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|`(?P<raw>[^`]*)`)\s*'
+)
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '\\': '\\', '"': '"'}
+
+
+def _unescape(value: str) -> str:
+    """处理双引号字符串中的转义 (未知转义保持原样，便于书写正则，如 "a\\.b")"""
+    return re.sub(r'\\(.)', lambda m: _ESCAPES.get(m.group(1), m.group(0)), value)
+
+
+class LabelSelector:
+    """
+    标签匹配器列表，全部满足时匹配
+    与Prometheus/Loki一致: 正则完整匹配标签值，不存在的标签按空字符串处理
+    """
+
+    def __init__(self, matchers: List[Tuple[str, str, str]]):
+        self.matchers = matchers
+        self._compiled = [
+            (name, op, re.compile(value, re.DOTALL) if op in ('=~', '!~') else value)
+            for name, op, value in matchers
+        ]
+
+    def matches(self, labels: Dict[str, str]) -> bool:
+        for name, op, expected in self._compiled:
+            value = labels.get(name, '')
+            if op == '=':
+                ok = value == expected
+            elif op == '!=':
+                ok = value != expected
+            elif op == '=~':
+                ok = expected.fullmatch(value) is not None
+            else:
+                ok = expected.fullmatch(value) is None
+            if not ok:
+                return False
+        return True
+
+    def equality_labels(self) -> Dict[str, str]:
+        """非空的相等匹配条件 (可直接用于chunk目录的索引查询)"""
+        return {name: value for name, op, value in self.matchers if op == '=' and value}
+
+    def __str__(self) -> str:
+        return '{' + ', '.join(f'{name}{op}"{value}"' for name, op, value in self.matchers) + '}'
+
+
+@lru_cache(maxsize=32)
+def parse_selector(text: str) -> LabelSelector:
+    """解析选择器字符串，格式错误时抛出ValueError"""
+    body = text.strip()
+    if body.startswith('{'):
+        if not body.endswith('}'):
+            raise ValueError(f"选择器缺少右括号: {text}")
+        body = body[1:-1]
+
+    matchers = []
+    pos = 0
+    while body[pos:].strip():
+        match = _MATCHER.match(body, pos)
+        if not match:
+            raise ValueError(f"无法解析选择器 (位置 {pos}): {text}")
+        value = match.group('raw') if match.group('raw') is not None else _unescape(match.group('quoted'))
+        if match.group('op') in ('=~', '!~'):
+            try:
+                re.compile(value)
+            except re.error as e:
+                raise ValueError(f"选择器中的正则无效 {match.group('name')}{match.group('op')}\"{value}\": {e}")
+        matchers.append((match.group('name'), match.group('op'), value))
+        pos = match.end()
+        if pos < len(body):
+            if body[pos] != ',':
+                raise ValueError(f"选择器中的匹配条件应以逗号分隔 (位置 {pos}): {text}")
+            pos += 1
+
+    if not matchers:
+        raise ValueError(f"选择器中至少需要一个匹配条件: {text}")
+    return LabelSelector(matchers)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+跨chunk日志行去重
+副本写入和重复的日志模板会产生大量完全相同的日志行，每一份都要被Macie扫描计费。
+按顺序处理提取文件，对规范化后的日志行计算哈希，每个不同的行只保留第一次出现，
+被丢弃的重复行记录到压缩的旁路索引文件中，可追溯到来源chunk和偏移量。
+"""
+
+import gzip
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 默认最多记住的不同日志行数量 (每条约100字节)
+DEFAULT_MAX_ENTRIES = 1_000_000
+
+# chunks-inspect格式的日志条目行: "<时间戳> UTC\t<日志内容>"，其他行 (注释头、chunk元数据) 不参与去重
+ENTRY_PREFIX = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)? UTC\t')
+
+# 日志内容中常见的时间戳格式 (ISO 8601 / 常见日志时间)
+EMBEDDED_TIMESTAMP = re.compile(
+    r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'
+    r'|\b\d{2}:\d{2}:\d{2}(?:[.,]\d+)?\b'
+)
+
+SIDECAR_HEADER = "# dropped_file\tline\toffset\tkept_file\tkept_line\n"
+
+
+class LineDeduplicator:
+    """
+    有界内存的跨文件行去重器
+    已见集合分为当前和上一代两个字典，当前代写满一半容量时整体淘汰上一代，
+    内存占用不超过 max_entries 条记录；在上一代中再次出现的行提升到当前代，
+    只有连续两代都没有出现的行才会被淘汰，被淘汰的行再次出现时会被重新保留 (只会多上传，不会漏扫)
+    """
+
+    def __init__(self, strip_timestamps: bool = False, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.strip_timestamps = strip_timestamps
+        self.max_entries = max(int(max_entries), 2)
+        self.files = []
+        self.stats = {'lines_in': 0, 'lines_out': 0, 'bytes_in': 0, 'bytes_out': 0, 'duplicates': 0}
+        self._current: Dict[bytes, Tuple[int, int]] = {}
+        self._previous: Dict[bytes, Tuple[int, int]] = {}
+
+    def normalize(self, line: str) -> str:
+        """规范化日志条目: 去掉行尾空白，可选去掉条目时间戳和内容中的时间戳"""
+        line = line.rstrip()
+        if self.strip_timestamps:
+            line = ENTRY_PREFIX.sub('', line, count=1)
+            line = EMBEDDED_TIMESTAMP.sub('', line)
+        return line
+
+    def _lookup(self, digest: bytes, location: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        """
+        查找已保留的位置，不存在时记录当前位置并返回None
+        在上一代中命中的行复制到当前代，经常重复的行不会随上一代一起被淘汰
+        """
+        kept = self._current.get(digest)
+        if kept is not None:
+            return kept
+
+        kept = self._previous.get(digest)
+        self._remember(digest, kept if kept is not None else location)
+        return kept
+
+    def _remember(self, digest: bytes, location: Tuple[int, int]):
+        """记录到当前代，当前代写满一半容量时成为上一代"""
+        self._current[digest] = location
+        if len(self._current) >= self.max_entries // 2:
+            self._previous = self._current
+            self._current = {}
+
+    def dedup_file(self, input_file: str, output_file: str, sidecar) -> Dict:
+        """
+        去重单个提取文件，返回该文件的统计
+        sidecar: 已打开的旁路索引文本文件，每个被丢弃的行写入一条记录
+        """
+        file_index = len(self.files)
+        file_name = Path(input_file).name
+        self.files.append(file_name)
+        stats = {'lines_in': 0, 'lines_out': 0, 'bytes_in': 0, 'bytes_out': 0, 'duplicates': 0, 'entries_out': 0}
+
+        offset = 0
+        with open(input_file, 'r', encoding='utf-8', errors='replace', newline='') as src, \
+                open(output_file, 'w', encoding='utf-8', newline='') as dst:
+            for line_number, line in enumerate(src, 1):
+                size = len(line.encode('utf-8'))
+                stats['lines_in'] += 1
+                stats['bytes_in'] += size
+
+                if ENTRY_PREFIX.match(line):
+                    digest = hashlib.blake2b(self.normalize(line).encode('utf-8'), digest_size=12).digest()
+                    kept = self._lookup(digest, (file_index, line_number))
+                    if kept is not None:
+                        stats['duplicates'] += 1
+                        sidecar.write(f"{file_name}\t{line_number}\t{offset}\t{self.files[kept[0]]}\t{kept[1]}\n")
+                        offset += size
+                        continue
+                    stats['entries_out'] += 1
+
+                dst.write(line)
+                stats['lines_out'] += 1
+                stats['bytes_out'] += size
+                offset += size
+
+        for name in self.stats:
+            self.stats[name] += stats[name]
+        return stats
+
+
+def dedup_text_files(text_files: Iterable[str], output_path: Path, sidecar_file: Path,
+                     options: Optional[Dict] = None) -> Iterator[Dict]:
+    """
+    按顺序去重提取文件到 output_path/<同名文件>，逐个产出结果字典 (不抛出异常)
+    所有日志条目都是重复行的文件不生成输出 (output_file 为None)
+    """
+    options = options or {}
+    deduplicator = LineDeduplicator(
+        strip_timestamps=options.get('strip_timestamps', False),
+        max_entries=options.get('max_entries', DEFAULT_MAX_ENTRIES)
+    )
+
+    with gzip.open(sidecar_file, 'wt', encoding='utf-8') as sidecar:
+        sidecar.write(SIDECAR_HEADER)
+        for text_file in text_files:
+            output_file = output_path / Path(text_file).name
+            try:
+                stats = deduplicator.dedup_file(text_file, str(output_file), sidecar)
+                if stats['entries_out'] == 0 and stats['duplicates'] > 0:
+                    output_file.unlink()
+                    output_file = None
+                yield {
+                    'chunk_file': text_file,
+                    'output_file': str(output_file) if output_file else None,
+                    'success': True,
+                    'stats': stats
+                }
+            except Exception as e:
+                if output_file.exists():
+                    output_file.unlink()
+                yield {
+                    'chunk_file': text_file,
+                    'output_file': None,
+                    'success': False,
+                    'error': str(e)
+                }
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+本地离线敏感数据检测
+使用全部CPU核心扫描提取后的文本文件，生成与Macie相同结构的发现
+(classificationDetails.result.sensitiveData[].detections[] / resourcesAffected.s3Object)，
+可直接交给 analyze_macie_results.py 生成报告，用于离线测试和快速排查。
+"""
+
+import argparse
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+import logging
+
+from chunk_extractor import detect_files, resolve_worker_count
+from sensitive_prefilter import DEFAULT_PATTERNS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Macie在每个检测类型中最多记录的出现位置数量
+MAX_OCCURRENCES = 15
+
+# 检测类型 -> (Macie敏感数据类别, 正则)
+DETECTORS = {
+    'AWS_CREDENTIALS': ('CREDENTIALS', DEFAULT_PATTERNS['AWS_CREDENTIALS'] +
+                        r'|(?i:aws_secret_access_key)\s*[:=]\s*[A-Za-z0-9/+]{40}'),
+    'HTTP_BASIC_AUTH_HEADER': ('CREDENTIALS', r'(?i:authorization)\s*:\s*(?i:basic)\s+[A-Za-z0-9+/]{8,}={0,2}'),
+    'JSON_WEB_TOKEN': ('CREDENTIALS', DEFAULT_PATTERNS['JSON_WEB_TOKEN']),
+    'PRIVATE_KEY': ('CREDENTIALS', DEFAULT_PATTERNS['PRIVATE_KEY']),
+    'CREDIT_CARD_NUMBER': ('FINANCIAL_INFORMATION', DEFAULT_PATTERNS['CREDIT_CARD_NUMBER']),
+    'EMAIL_ADDRESS': ('PERSONAL_INFORMATION', DEFAULT_PATTERNS['EMAIL_ADDRESS']),
+    'USA_SOCIAL_SECURITY_NUMBER': ('PERSONAL_INFORMATION', DEFAULT_PATTERNS['USA_SOCIAL_SECURITY_NUMBER']),
+    'PHONE_NUMBER': ('PERSONAL_INFORMATION', DEFAULT_PATTERNS['PHONE_NUMBER']),
+    'CHINA_IDENTIFICATION': ('PERSONAL_INFORMATION', DEFAULT_PATTERNS['CHINA_IDENTIFICATION']),
+}
+
+# 类别 -> (Macie发现类型后缀, 严重程度)
+CATEGORY_SEVERITY = {
+    'CREDENTIALS': ('Credentials', 'HIGH'),
+    'FINANCIAL_INFORMATION': ('Financial', 'HIGH'),
+    'PERSONAL_INFORMATION': ('Personal', 'MEDIUM'),
+}
+
+SEVERITY_SCORES = {'LOW': 1, 'MEDIUM': 2, 'HIGH': 3}
+
+# 所有检测类型合并为一个带命名分组的正则，每行只扫描一遍
+_DETECTOR_REGEX = re.compile('|'.join(f"(?P<{name}>{pattern})" for name, (_, pattern) in DETECTORS.items()))
+
+
+def luhn_valid(number: str) -> bool:
+    """信用卡号Luhn校验"""
+    digits = [int(c) for c in number if c.isdigit()]
+    if len(digits) < 13:
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def china_id_valid(number: str) -> bool:
+    """18位居民身份证号校验码验证 (GB 11643)"""
+    weights = [7, 9, 10, 5, 8, 4, 2, 1, 6, 3, 7, 9, 10, 5, 8, 4, 2]
+    total = sum(int(c) * w for c, w in zip(number[:17], weights))
+    return '10X98765432'[total % 11] == number[17].upper()
+
+
+# 需要额外校验的检测类型，过滤正则的误报
+VALIDATORS = {
+    'CREDIT_CARD_NUMBER': luhn_valid,
+    'CHINA_IDENTIFICATION': china_id_valid,
+}
+
+
+def iter_detections(lines: Iterable[str]) -> Iterator[tuple]:
+    """逐行检测，产出 (检测类型, 行号(从1开始), 列号(从1开始))"""
+    for line_number, line in enumerate(lines, 1):
+        # 跳过提取文件的注释头
+        if line.startswith('#'):
+            continue
+        for match in _DETECTOR_REGEX.finditer(line):
+            detection_type = match.lastgroup
+            validator = VALIDATORS.get(detection_type)
+            if validator and not validator(match.group()):
+                continue
+            yield detection_type, line_number, match.start() + 1
+
+
+def build_finding(s3_object: Dict, detections: Dict[str, Dict], job_id: str, created_at: str) -> Dict:
+    """按Macie发现的结构组装一个敏感数据发现"""
+    categories = {}
+    for detection_type, info in detections.items():
+        category = DETECTORS[detection_type][0]
+        categories.setdefault(category, []).append({
+            'type': detection_type,
+            'count': info['count'],
+            'occurrences': {
+                'lineRanges': [
+                    {'start': line, 'end': line, 'startColumn': column}
+                    for line, column in info['occurrences']
+                ]
+            }
+        })
+
+    sensitive_data = [
+        {
+            'category': category,
+            'totalCount': sum(d['count'] for d in category_detections),
+            'detections': category_detections
+        }
+        for category, category_detections in sorted(categories.items())
+    ]
+
+    if len(categories) > 1:
+        finding_type = 'SensitiveData:S3Object/Multiple'
+    else:
+        finding_type = f"SensitiveData:S3Object/{CATEGORY_SEVERITY[next(iter(categories))][0]}"
+    severity = max((CATEGORY_SEVERITY[c][1] for c in categories), key=SEVERITY_SCORES.get)
+
+    resources_affected = {
+        's3Bucket': {'name': s3_object['bucketName']},
+        's3Object': s3_object
+    }
+    finding_id = hashlib.sha256(f"{job_id}:{s3_object['bucketName']}/{s3_object['key']}".encode()).hexdigest()[:32]
+
+    return {
+        'id': finding_id,
+        'type': finding_type,
+        'category': 'CLASSIFICATION',
+        'severity': {'description': severity, 'score': SEVERITY_SCORES[severity]},
+        'createdAt': created_at,
+        'updatedAt': created_at,
+        'count': 1,
+        'title': f"The S3 object contains {finding_type.rsplit('/', 1)[-1].lower()} information.",
+        'classificationDetails': {
+            'jobId': job_id,
+            'originType': 'SENSITIVE_DATA_DISCOVERY_JOB',
+            'detailedResultsLocation': None,
+            'result': {
+                'status': {'code': 'COMPLETE'},
+                'mimeType': 'text/plain',
+                'sizeClassified': s3_object['size'],
+                'sensitiveData': sensitive_data
+            }
+        },
+        'resourcesAffected': resources_affected,
+        # analyze_file_distribution 按 resources[].resourcesAffected 读取对象信息
+        'resources': [{'resourcesAffected': resources_affected}]
+    }
+
+
+def detect_file(text_file: str, s3_object: Dict, job_id: str, created_at: str) -> Dict:
+    """
+    扫描单个文本文件，返回结果字典 (不抛出异常)
+    result['finding'] 为Macie结构的发现，没有敏感数据时为None
+    """
+    try:
+        detections = {}
+        with open(text_file, 'r', encoding='utf-8', errors='replace') as f:
+            for detection_type, line, column in iter_detections(f):
+                info = detections.setdefault(detection_type, {'count': 0, 'occurrences': []})
+                info['count'] += 1
+                if len(info['occurrences']) < MAX_OCCURRENCES:
+                    info['occurrences'].append((line, column))
+
+        finding = build_finding(s3_object, detections, job_id, created_at) if detections else None
+        return {
+            'chunk_file': text_file,
+            'finding': finding,
+            'success': True
+        }
+    except Exception as e:
+        return {
+            'chunk_file': text_file,
+            'finding': None,
+            'success': False,
+            'error': str(e)
+        }
+
+
+def local_s3_object(text_file: Path, bucket: str, key_prefix: Optional[str]) -> Dict:
+    """本地文件对应的s3Object描述 (键名与上传到S3时一致)"""
+    st = text_file.stat()
+    key = f"{key_prefix}/{text_file.name}" if key_prefix else text_file.name
+    return {
+        'bucketName': bucket,
+        'key': key,
+        'path': f"{bucket}/{key}",
+        'extension': text_file.suffix.lstrip('.'),
+        'size': st.st_size,
+        'lastModified': datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat(),
+        'storageClass': 'LOCAL'
+    }
+
+
+def run_local_detection(text_files: List[Path], workers: int = 1, bucket: str = 'local',
+                        key_prefix: Optional[str] = None) -> Dict:
+    """
+    并行扫描文本文件，返回 {'job_summary': ..., 'findings': [...]}
+    job_summary 的字段与 describe_classification_job 在报告中使用的字段一致
+    """
+    started_at = datetime.now(timezone.utc)
+    job_id = f"local-{started_at.strftime('%Y%m%d-%H%M%S')}"
+    created_at = started_at.isoformat()
+
+    tasks = (
+        (str(text_file), local_s3_object(text_file, bucket, key_prefix), job_id, created_at)
+        for text_file in text_files
+    )
+
+    findings = []
+    processed = 0
+    for result in detect_files(tasks, workers):
+        if not result['success']:
+            logger.error(f"❌ 扫描失败 {Path(result['chunk_file']).name}: {result['error']}")
+            continue
+        processed += 1
+        if result['finding']:
+            findings.append(result['finding'])
+
+    completed_at = datetime.now(timezone.utc)
+    logger.info(f"本地检测完成: 扫描 {processed} 个文件, {len(findings)} 个发现, "
+                f"耗时 {(completed_at - started_at).total_seconds():.1f} 秒")
+
+    return {
+        'job_summary': {
+            'jobId': job_id,
+            'name': f"loki-local-scan-{started_at.strftime('%Y%m%d-%H%M%S')}",
+            'jobStatus': 'COMPLETE',
+            'createdAt': created_at,
+            'lastRunTime': completed_at.isoformat(),
+            'statistics': {
+                'approximateNumberOfObjectsToProcess': len(text_files),
+                'approximateNumberOfObjectsProcessed': processed
+            }
+        },
+        'findings': findings
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地离线敏感数据检测 (输出Macie格式的发现)')
+    parser.add_argument('--input-dir', default='./extracted_texts',
+                        help='提取文本目录，只扫描目录下的 .txt 文件，不进入子目录 (默认: ./extracted_texts)')
+    parser.add_argument('--output', help='发现输出文件 (默认: local_findings_<时间戳>.json)')
+    parser.add_argument('--workers', default='0', help='工作进程数, 0表示使用全部CPU核心 (默认: 0)')
+    parser.add_argument('--bucket', default='local', help='发现中记录的存储桶名称 (默认: local)')
+    parser.add_argument('--key-prefix', help='发现中记录的S3键前缀，如 loki-complete/2024/01/01')
+    parser.add_argument('--report', action='store_true', help='检测完成后直接生成分析报告')
+
+    args = parser.parse_args()
+
+    # 子目录 prefiltered/、deduped/、bundles/ 是管道从同一批提取文件派生的副本，递归扫描会重复计数同一个发现
+    text_files = sorted(p for p in Path(args.input_dir).glob('*.txt') if p.is_file())
+    if not text_files:
+        print(f"❌ 目录中没有提取文本文件: {args.input_dir}")
+        return 1
+
+    workers = resolve_worker_count(args.workers)
+    logger.info(f"本地检测: {len(text_files)} 个文件, 工作进程: {workers}")
+    results = run_local_detection(text_files, workers=workers, bucket=args.bucket, key_prefix=args.key_prefix)
+
+    output_file = args.output or f"local_findings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"✅ 本地检测完成: {len(results['findings'])} 个发现")
+    print(f"📄 发现文件: {output_file}")
+
+    if args.report:
+        from analyze_macie_results import MacieResultsAnalyzer
+        analyzer = MacieResultsAnalyzer(offline=True)
+        analyzer.generate_report_from_findings(
+            results['findings'], results['job_summary'],
+            output_file.replace('.json', '_report.json')
+        )
+    else:
+        print(f"🔍 生成报告: python3 analyze_macie_results.py --findings-file {output_file}")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
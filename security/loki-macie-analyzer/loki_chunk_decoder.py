@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Loki Chunk 纯Python解码器
+在进程内直接解析Loki chunk文件 (头部元数据、块索引、压缩数据块)，
+输出格式与 `chunks-inspect -l` 保持一致，无需再为每个chunk启动子进程。
+
+文件结构:
+| 元数据长度(4字节,含自身) | snappy帧格式压缩的JSON元数据 |
+| 数据长度(4字节) | magic(4字节) | 版本(1字节) | 编码(1字节) |
+| 块1数据 | 校验和(4字节) | ... | 块索引 | 校验和(4字节) | 块索引偏移(8字节) |
+"""
+
+import gzip
+import json
+import struct
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 可选的C扩展加速，未安装时使用纯Python实现
+try:
+    import snappy as _snappy_lib
+except ImportError:
+    _snappy_lib = None
+
+try:
+    import lz4.frame as _lz4_frame
+except ImportError:
+    _lz4_frame = None
+
+try:
+    import zstandard as _zstd
+except ImportError:
+    _zstd = None
+
+CHUNK_MAGIC = 0x012EE56A
+
+CHUNK_FORMAT_V1 = 1
+CHUNK_FORMAT_V2 = 2
+CHUNK_FORMAT_V3 = 3
+CHUNK_FORMAT_V4 = 4
+
+# Loki chunkenc 中的编码编号及其名称
+ENC_NONE = 0
+ENC_GZIP = 1
+ENC_DUMB = 2
+ENC_LZ4_64K = 3
+ENC_SNAPPY = 4
+ENC_LZ4_256K = 5
+ENC_LZ4_1M = 6
+ENC_LZ4_4M = 7
+ENC_FLATE = 8
+ENC_ZSTD = 9
+
+ENCODING_NAMES = {
+    ENC_NONE: 'none',
+    ENC_GZIP: 'gzip',
+    ENC_DUMB: 'dumb',
+    ENC_LZ4_64K: 'lz4-64k',
+    ENC_SNAPPY: 'snappy',
+    ENC_LZ4_256K: 'lz4-256k',
+    ENC_LZ4_1M: 'lz4-1M',
+    ENC_LZ4_4M: 'lz4',
+    ENC_FLATE: 'flate',
+    ENC_ZSTD: 'zstd',
+}
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+SNAPPY_STREAM_IDENTIFIER = b'sNaPpY'
+LZ4_FRAME_MAGIC = 0x184D2204
+
+
+def _read_uvarint(buf, pos: int) -> Tuple[int, int]:
+    """读取无符号varint，返回 (值, 新位置)"""
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise ValueError("varint数据被截断")
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise ValueError("varint溢出")
+
+
+def _read_varint(buf, pos: int) -> Tuple[int, int]:
+    """读取zigzag编码的有符号varint"""
+    value, pos = _read_uvarint(buf, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _copy_back(out: bytearray, offset: int, length: int):
+    """LZ77式回溯复制，支持源和目标区域重叠"""
+    if offset <= 0 or offset > len(out):
+        raise ValueError(f"无效的回溯偏移: {offset}")
+    start = len(out) - offset
+    if offset >= length:
+        out += out[start:start + length]
+    else:
+        pattern = bytes(out[start:])
+        out += (pattern * (length // offset + 1))[:length]
+
+
+def snappy_decompress_block(data: bytes) -> bytes:
+    """解压snappy原始块格式"""
+    if _snappy_lib is not None:
+        return _snappy_lib.uncompress(data)
+
+    expected, pos = _read_uvarint(data, 0)
+    out = bytearray()
+    end = len(data)
+    while pos < end:
+        tag = data[pos]
+        pos += 1
+        tag_type = tag & 0x03
+        if tag_type == 0:
+            # 字面量
+            length = tag >> 2
+            if length >= 60:
+                extra = length - 59
+                length = int.from_bytes(data[pos:pos + extra], 'little')
+                pos += extra
+            length += 1
+            out += data[pos:pos + length]
+            pos += length
+            continue
+        if tag_type == 1:
+            length = 4 + ((tag >> 2) & 0x07)
+            offset = ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        elif tag_type == 2:
+            length = 1 + (tag >> 2)
+            offset = int.from_bytes(data[pos:pos + 2], 'little')
+            pos += 2
+        else:
+            length = 1 + (tag >> 2)
+            offset = int.from_bytes(data[pos:pos + 4], 'little')
+            pos += 4
+        _copy_back(out, offset, length)
+
+    if len(out) != expected:
+        raise ValueError(f"snappy解压长度不符: 期望 {expected}, 实际 {len(out)}")
+    return bytes(out)
+
+
+def snappy_decompress_stream(data: bytes) -> bytes:
+    """解压snappy帧格式 (golang/snappy NewBufferedWriter 的输出)"""
+    out = bytearray()
+    pos = 0
+    end = len(data)
+    while pos < end:
+        if pos + 4 > end:
+            raise ValueError("snappy帧头被截断")
+        chunk_type = data[pos]
+        chunk_len = int.from_bytes(data[pos + 1:pos + 4], 'little')
+        pos += 4
+        body = data[pos:pos + chunk_len]
+        pos += chunk_len
+
+        if chunk_type == 0xFF:
+            if body != SNAPPY_STREAM_IDENTIFIER:
+                raise ValueError("无效的snappy流标识")
+        elif chunk_type == 0x00:
+            # 前4字节为masked CRC32C校验和
+            out += snappy_decompress_block(body[4:])
+        elif chunk_type == 0x01:
+            out += body[4:]
+        elif chunk_type <= 0x7F:
+            raise ValueError(f"不支持的snappy帧类型: {chunk_type:#x}")
+        # 0x80-0xfe 为可跳过的填充/保留帧
+    return bytes(out)
+
+
+def lz4_decompress_block(src: bytes, out: bytearray):
+    """解压单个LZ4块并追加到out (out同时作为依赖块的历史窗口)"""
+    pos = 0
+    end = len(src)
+    while pos < end:
+        token = src[pos]
+        pos += 1
+
+        literal_len = token >> 4
+        if literal_len == 15:
+            while True:
+                b = src[pos]
+                pos += 1
+                literal_len += b
+                if b != 255:
+                    break
+        out += src[pos:pos + literal_len]
+        pos += literal_len
+        if pos >= end:
+            # 最后一个序列只有字面量
+            break
+
+        offset = src[pos] | (src[pos + 1] << 8)
+        pos += 2
+        match_len = token & 0x0F
+        if match_len == 15:
+            while True:
+                b = src[pos]
+                pos += 1
+                match_len += b
+                if b != 255:
+                    break
+        _copy_back(out, offset, match_len + 4)
+
+
+def lz4_decompress_frame(data: bytes) -> bytes:
+    """解压LZ4帧格式 (pierrec/lz4 Writer 的输出)，支持多个连续帧"""
+    if _lz4_frame is not None:
+        return _lz4_frame.decompress(data)
+
+    out = bytearray()
+    pos = 0
+    end = len(data)
+    while pos < end:
+        magic = struct.unpack_from('<I', data, pos)[0]
+        pos += 4
+        if 0x184D2A50 <= magic <= 0x184D2A5F:
+            # 可跳过帧
+            skip = struct.unpack_from('<I', data, pos)[0]
+            pos += 4 + skip
+            continue
+        if magic != LZ4_FRAME_MAGIC:
+            raise ValueError(f"无效的LZ4帧magic: {magic:#x}")
+
+        flg = data[pos]
+        pos += 2  # FLG + BD
+        block_checksum = bool(flg & 0x10)
+        if flg & 0x08:
+            pos += 8  # 内容大小
+        if flg & 0x01:
+            pos += 4  # 字典ID
+        pos += 1  # 头部校验
+
+        while True:
+            block_size = struct.unpack_from('<I', data, pos)[0]
+            pos += 4
+            if block_size == 0:
+                break
+            uncompressed = bool(block_size & 0x80000000)
+            block_size &= 0x7FFFFFFF
+            block = data[pos:pos + block_size]
+            pos += block_size
+            if block_checksum:
+                pos += 4
+            if uncompressed:
+                out += block
+            else:
+                lz4_decompress_block(block, out)
+
+        if flg & 0x04:
+            pos += 4  # 内容校验和
+    return bytes(out)
+
+
+def decompress_block(encoding: int, data: bytes) -> bytes:
+    """按chunk编码解压数据块"""
+    if encoding in (ENC_NONE, ENC_DUMB):
+        return data
+    if encoding == ENC_GZIP:
+        return gzip.decompress(data)
+    if encoding == ENC_SNAPPY:
+        return snappy_decompress_stream(data)
+    if encoding in (ENC_LZ4_64K, ENC_LZ4_256K, ENC_LZ4_1M, ENC_LZ4_4M):
+        return lz4_decompress_frame(data)
+    if encoding == ENC_FLATE:
+        return zlib.decompress(data, -15)
+    if encoding == ENC_ZSTD:
+        if _zstd is None:
+            raise ValueError("zstd编码的chunk需要安装zstandard: pip install zstandard")
+        return _zstd.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"未知的chunk编码: {encoding}")
+
+
+def format_timestamp(ts_ns: int) -> str:
+    """按chunks-inspect的格式输出UTC时间 (微秒精度，截断不舍入)"""
+    seconds, remainder = divmod(ts_ns, 1_000_000_000)
+    dt = _EPOCH + timedelta(seconds=seconds)
+    return f"{dt.strftime(TIME_FORMAT)}.{remainder // 1000:06d} UTC"
+
+
+def format_duration_ms(duration_ms: int) -> str:
+    """按Go time.Duration.String()的格式输出毫秒时长"""
+    if duration_ms == 0:
+        return '0s'
+    sign = '-' if duration_ms < 0 else ''
+    duration_ms = abs(duration_ms)
+    if duration_ms < 1000:
+        return f"{sign}{duration_ms}ms"
+
+    hours, rest = divmod(duration_ms, 3_600_000)
+    minutes, rest = divmod(rest, 60_000)
+    seconds, millis = divmod(rest, 1000)
+    seconds_str = str(seconds)
+    if millis:
+        seconds_str += f".{millis:03d}".rstrip('0')
+
+    if hours:
+        return f"{sign}{hours}h{minutes}m{seconds_str}s"
+    if minutes:
+        return f"{sign}{minutes}m{seconds_str}s"
+    return f"{sign}{seconds_str}s"
+
+
+def _parse_model_time(value) -> int:
+    """将Prometheus model.Time (秒，带小数的数字或字符串) 转为毫秒"""
+    if value is None:
+        return 0
+    return int(round(float(value) * 1000))
+
+
+def _parse_labels(metric) -> List[Tuple[str, str]]:
+    """解析标签，兼容 map 和 [{name, value}] 两种JSON形式，按名称排序"""
+    if not metric:
+        return []
+    if isinstance(metric, dict):
+        pairs = list(metric.items())
+    else:
+        pairs = [(item.get('name', ''), item.get('value', '')) for item in metric]
+    return sorted(pairs)
+
+
+class LokiChunkReader:
+    """Loki chunk文件读取器: 头部元数据立即解析，数据块按需逐块解压"""
+
+    def __init__(self, chunk_file):
+        self.path = Path(chunk_file)
+        self.file_size = self.path.stat().st_size
+
+        self.metadata_length = 0
+        self.data_length = 0
+        self.fingerprint = 0
+        self.user_id = ''
+        self.from_ms = 0
+        self.through_ms = 0
+        self.labels: List[Tuple[str, str]] = []
+
+        self.format_version: Optional[int] = None
+        self.encoding: Optional[int] = None
+        self._data: Optional[bytes] = None
+        self._blocks: Optional[List[Dict]] = None
+
+        with open(self.path, 'rb') as f:
+            self._read_header(f)
+
+    def _read_header(self, f):
+        """读取并解析snappy压缩的JSON头部"""
+        raw = f.read(4)
+        if len(raw) < 4:
+            raise ValueError(f"文件过短，不是有效的Loki chunk: {self.path}")
+        self.metadata_length = struct.unpack('>I', raw)[0]
+        if self.metadata_length < 4 or self.metadata_length > self.file_size:
+            raise ValueError(f"无效的元数据长度: {self.metadata_length}")
+
+        metadata_bytes = f.read(self.metadata_length - 4)
+        try:
+            header = json.loads(snappy_decompress_stream(metadata_bytes))
+        except (ValueError, IndexError) as e:
+            raise ValueError(f"解析chunk头部失败: {e}")
+
+        raw = f.read(4)
+        if len(raw) < 4:
+            raise ValueError("chunk数据长度字段被截断")
+        self.data_length = struct.unpack('>I', raw)[0]
+
+        self.fingerprint = header.get('fingerprint', 0)
+        self.user_id = header.get('userID', '')
+        self.from_ms = _parse_model_time(header.get('from'))
+        self.through_ms = _parse_model_time(header.get('through'))
+        self.labels = _parse_labels(header.get('metric'))
+
+    @property
+    def data_offset(self) -> int:
+        """chunk数据在文件中的起始偏移"""
+        return self.metadata_length + 4
+
+    def _load_data(self) -> bytes:
+        """读取chunk数据部分 (块索引位于末尾，必须整体读入)"""
+        if self._data is None:
+            with open(self.path, 'rb') as f:
+                f.seek(self.data_offset)
+                data = f.read(self.data_length)
+            if len(data) != self.data_length:
+                raise ValueError(f"chunk数据被截断: 期望 {self.data_length} 字节, 实际 {len(data)} 字节")
+            if len(data) < 6 or struct.unpack_from('>I', data, 0)[0] != CHUNK_MAGIC:
+                raise ValueError("无效的Loki chunk magic number")
+            self.format_version = data[4]
+            if self.format_version == CHUNK_FORMAT_V1:
+                self.encoding = ENC_GZIP
+            elif self.format_version in (CHUNK_FORMAT_V2, CHUNK_FORMAT_V3, CHUNK_FORMAT_V4):
+                self.encoding = data[5]
+            else:
+                raise ValueError(f"不支持的chunk格式版本: {self.format_version}")
+            self._data = data
+        return self._data
+
+    def blocks(self) -> List[Dict]:
+        """解析块索引"""
+        if self._blocks is not None:
+            return self._blocks
+
+        data = self._load_data()
+        if self.format_version >= CHUNK_FORMAT_V4:
+            # V4 在偏移之前写入各段长度
+            metas_len, metas_offset = struct.unpack_from('>QQ', data, len(data) - 16)
+        else:
+            metas_offset = struct.unpack_from('>Q', data, len(data) - 8)[0]
+            metas_len = len(data) - 12 - metas_offset
+        if metas_offset + metas_len > len(data):
+            raise ValueError("块索引偏移超出数据范围")
+        metas = data[metas_offset:metas_offset + metas_len]
+
+        num_blocks, pos = _read_uvarint(metas, 0)
+        blocks = []
+        for _ in range(num_blocks):
+            num_entries, pos = _read_uvarint(metas, pos)
+            min_t, pos = _read_varint(metas, pos)
+            max_t, pos = _read_varint(metas, pos)
+            offset, pos = _read_uvarint(metas, pos)
+            uncompressed_size = 0
+            if self.format_version >= CHUNK_FORMAT_V3:
+                uncompressed_size, pos = _read_uvarint(metas, pos)
+            length, pos = _read_uvarint(metas, pos)
+            if offset + length > len(data):
+                raise ValueError(f"数据块超出范围: offset={offset}, length={length}")
+            blocks.append({
+                'num_entries': num_entries,
+                'min_t': min_t,
+                'max_t': max_t,
+                'offset': offset,
+                'length': length,
+                'uncompressed_size': uncompressed_size,
+            })
+        self._blocks = blocks
+        return blocks
+
+    def iter_block_entries(self, block: Dict) -> Iterator[Tuple[int, str]]:
+        """逐条产出单个数据块中的 (纳秒时间戳, 日志行)"""
+        data = self._load_data()
+        raw = data[block['offset']:block['offset'] + block['length']]
+        decompressed = decompress_block(self.encoding, raw)
+        structured_metadata = self.format_version >= CHUNK_FORMAT_V4
+
+        pos = 0
+        end = len(decompressed)
+        while pos < end:
+            ts, pos = _read_varint(decompressed, pos)
+            line_len, pos = _read_uvarint(decompressed, pos)
+            if pos + line_len > end:
+                raise ValueError("日志行长度超出块数据范围")
+            line = decompressed[pos:pos + line_len].decode('utf-8', errors='replace')
+            pos += line_len
+            if structured_metadata:
+                # 跳过结构化元数据符号段
+                section_len, pos = _read_uvarint(decompressed, pos)
+                pos += section_len
+            yield ts, line
+
+    def iter_entries(self) -> Iterator[Tuple[int, str]]:
+        """逐条产出整个chunk的 (纳秒时间戳, 日志行)"""
+        for block in self.blocks():
+            yield from self.iter_block_entries(block)
+
+    def header_lines(self) -> List[str]:
+        """与chunks-inspect一致的头部信息行"""
+        from_ns = self.from_ms * 1_000_000
+        through_ns = self.through_ms * 1_000_000
+        lines = [
+            '',
+            f"Chunks file: {self.path}",
+            f"Metadata length: {self.metadata_length}",
+            f"Data length: {self.data_length}",
+            f"UserID: {self.user_id}",
+            f"From: {format_timestamp(from_ns)}",
+            f"Through: {format_timestamp(through_ns)} ({format_duration_ms(self.through_ms - self.from_ms)})",
+            'Labels:',
+        ]
+        lines.extend(f"\t {name} = {value}" for name, value in self.labels)
+        return lines
+
+    def iter_text_lines(self) -> Iterator[str]:
+        """
+        逐行产出与 `chunks-inspect -l` 相同格式的文本 (不含换行符)
+        """
+        yield from self.header_lines()
+
+        blocks = self.blocks()
+        yield f"Format (Version): {self.format_version}"
+        yield f"Encoding: {ENCODING_NAMES.get(self.encoding, self.encoding)}"
+        yield f"Found {len(blocks)} block(s), use -b to show block details"
+        if blocks:
+            yield f"Minimum time (from first block): {format_timestamp(blocks[0]['min_t'])}"
+            yield f"Maximum time (from last block): {format_timestamp(blocks[-1]['max_t'])}"
+
+        total_size = 0
+        for block in blocks:
+            for ts, line in self.iter_block_entries(block):
+                total_size += len(line)
+                yield f"{format_timestamp(ts)}\t{line.strip()}"
+
+        ratio = total_size / self.file_size if self.file_size else 0
+        yield f"Total size of original data: {total_size} file size: {self.file_size} ratio: {ratio:.3g}"
+
+
+def iter_chunk_text(chunk_file) -> Iterator[str]:
+    """解码单个chunk文件并逐行产出文本"""
+    return LokiChunkReader(chunk_file).iter_text_lines()
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Loki chunk解码器 (与 chunks-inspect -l 输出兼容)')
+    parser.add_argument('files', nargs='+', help='Loki chunk文件')
+    args = parser.parse_args()
+
+    exit_code = 0
+    for chunk_file in args.files:
+        try:
+            for line in iter_chunk_text(chunk_file):
+                sys.stdout.write(line + '\n')
+        except (OSError, ValueError) as e:
+            print(f"❌ 解析失败 {chunk_file}: {e}", file=sys.stderr)
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -11,15 +11,43 @@ Loki Chunk 到 AWS Macie 完整分析管道
 
 import os
 import json
-import boto3
+import math
+import signal
+import sys
 import time
-import subprocess
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import argparse
-from typing import Dict, List, Any, Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Tuple
 import logging
 
+from chunk_catalog import ChunkCatalog, parse_label_args
+from chunk_discovery import chunk_file_matches, iter_chunk_files
+from chunk_watcher import (DEFAULT_BATCH_MAX_AGE, DEFAULT_BATCH_MAX_ATTEMPTS, DEFAULT_BATCH_MAX_CHUNKS,
+                           DEFAULT_JOB_INTERVAL_MINUTES, DEFAULT_MAX_RETRY_BACKOFF, DEFAULT_POLL_INTERVAL,
+                           DEFAULT_RETRY_BACKOFF, DEFAULT_SETTLE_SECONDS, MicroBatcher, PollingWatcher, create_watcher)
+from chunk_extractor import chunk_selected, extract_chunks, prefilter_files, resolve_worker_count, stream_chunks_to_s3
+from extraction_manifest import ExtractionManifest
+from label_selector import parse_selector
+from line_dedup import dedup_text_files
+from macie_poller import (DEFAULT_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_INTERVAL, DEFAULT_MAX_PAUSED_SECONDS,
+                          DEFAULT_MIN_INTERVAL, MacieJobPoller, wait_for_jobs)
+from scan_sharding import effective_shard_count, merge_job_statistics, plan_shards, submit_sharded_jobs
+from pipeline_metrics import PipelineMetrics
+from pipeline_state import PipelineState
+from sampling_budget import plan_sampling, sampling_tags
+from scan_ledger import LEDGER_FILE_NAME, ScanLedger, ScannedObjectIndex
+from sensitive_prefilter import reduction_ratio
+from stage_pipeline import DEFAULT_QUEUE_SIZE, StagePipeline
+from text_bundler import DEFAULT_TARGET_SIZE, pack_text_files
+from s3_transfer import (DEFAULT_COMPRESSION_LEVEL, DEFAULT_UPLOAD_CONCURRENCY, ConcurrentUploader,
+                         PartitionedObjectIndex, S3ObjectIndex, build_transfer_config, pool_connections_for)
+from time_partition import (MAX_SCOPE_PREFIXES, PARTITION_PLACEHOLDER, collapse_partitions, hour_partition, read_time_range,
+                            parse_time_arg, window_partitions)
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -32,11 +60,24 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class LokiMaciePipeline:
-    def __init__(self, region=None, profile=None, config_file='config.json'):
-        """初始化AWS客户端"""
+    def __init__(self, region=None, profile=None, config_file='config.json', manifest_file=None,
+                 catalog_file=None, session=None, interactive=None, extract_only=False):
+        """
+        初始化管道
+        AWS会话、客户端和账户ID在首次使用时才创建和查询，只提取不上传时完全不访问AWS
+        session: 用于创建客户端的会话 (默认按 profile 创建boto3会话)，基准测试传入本地替身
+        interactive: 配置有问题时是否提示输入 (默认仅在标准输入为终端时提示)；
+                     非交互模式下只校验配置，有问题时直接报错，不会等待输入或改写配置文件
+        extract_only: 只提取模式，不检查AWS相关配置
+        """
         
         # 加载配置文件
+        self.config_file = config_file
         self.config = self.load_config(config_file)
+        if interactive is None:
+            interactive = sys.stdin is not None and sys.stdin.isatty()
+        self.interactive = interactive
+        self.extract_only = extract_only
         
         # 检查并引导用户配置
         self.interactive_config_setup()
@@ -45,32 +86,112 @@ class LokiMaciePipeline:
         self.region = region or self.config['aws']['region']
         self.profile = profile or self.config['aws']['profile']
         
-        # 配置AWS会话
-        session = boto3.Session(profile_name=self.profile) if self.profile else boto3.Session()
-        self.s3_client = session.client('s3', region_name=self.region)
-        self.macie_client = session.client('macie2', region_name=self.region)
-        self.sts_client = session.client('sts', region_name=self.region)
+        # AWS会话、客户端 (服务名称 -> 客户端) 和账户ID，首次使用时创建；分片作业在线程池中并发使用
+        self._session = session
+        self._clients = {}
+        self._account_id = self.config['aws'].get('account_id')
+        self._aws_lock = threading.RLock()
+        # 并发上传专用的S3客户端 (连接池按并发数配置)，首次上传时创建
+        self._upload_client = None
         
         # S3存储桶配置 - 从配置文件读取
         self.scan_bucket = self.config['s3']['scan_bucket']
         self.results_bucket = self.config['s3']['results_bucket']
         self.s3_prefix = self.config['s3']['scan_prefix']
         
-        # 获取账户信息
-        try:
-            self.account_id = self.sts_client.get_caller_identity()['Account']
-            logger.info(f"当前AWS账户: {self.account_id}")
-        except Exception as e:
-            logger.error(f"获取账户ID失败: {e}")
-            raise
-            
-        # 时间戳用于分区
+        # 本次运行的时间戳、作业名称和运行中累计的状态
+        self._begin_run()
+        
+        # 增量提取清单 (未配置时每次全量处理)
+        manifest_file = manifest_file or self.config['processing'].get('manifest_file')
+        self.manifest = ExtractionManifest(manifest_file) if manifest_file else None
+        
+        # chunk元数据目录 (SQLite，未配置时不记录)
+        catalog_file = catalog_file or self.config['processing'].get('catalog_file')
+        self.catalog = ChunkCatalog(catalog_file) if catalog_file else None
+        
+        # Macie扫描记录 (跳过未变化的对象时使用: 只有当前内容已被作业扫描过的对象才跳过上传)
+        self.scan_ledger = None
+        if self._upload_options().get('skip_unchanged', True):
+            state_directory = self.config['processing'].get('state_directory', './pipeline_state')
+            self.scan_ledger = ScanLedger(self.config['processing'].get('scan_ledger_file') or
+                                          Path(state_directory) / LEDGER_FILE_NAME)
+    
+    def _begin_run(self, job_prefix: str = 'loki-analysis', sequence: Optional[int] = None):
+        """
+        开始新的一次运行: 设置时间戳 (用于分区)、作业名称，清空上一次运行累计的状态
+        持续监控模式下每个微批是一次运行，sequence 为微批序号 (同一秒内的微批作业名称不重复)
+        """
         self.timestamp = datetime.now(timezone.utc)
         self.date_partition = self.timestamp.strftime('%Y/%m/%d')
-        self.job_name = f"loki-analysis-{self.timestamp.strftime('%Y%m%d-%H%M%S')}"
+        self.job_name = f"{job_prefix}-{self.timestamp.strftime('%Y%m%d-%H%M%S')}"
+        if sequence is not None:
+            self.job_name += f"-{sequence:04d}"
+        # 本次运行中因内容未变化且已被扫描而跳过上传的对象，扫描它们的作业的创建时间 (用于限定Macie作业范围)
+        self.unchanged_scanned_at = []
+        # 本次运行上传 (或跳过) 的对象所在的分区 (用于限定Macie作业范围)
+        self.scan_partitions = set()
+        # 最近一次创建的Macie作业的扫描前缀
+        self.scan_prefixes = []
+        # 本次上传的对象字节数 (S3键 -> 字节数)，用于按字节数均衡分片作业
+        self.object_sizes = {}
+        # 本次运行选择的采样比例及置信度估计
+        self.sampling = None
+        # 本次运行的性能指标 (run_complete_pipeline 中创建)
+        self.metrics = None
+        # 运行状态检查点 (run_complete_pipeline 中创建或恢复)
+        self.state = None
+    
+    @property
+    def session(self):
+        """AWS会话 (首次使用时创建，只提取时不导入boto3)"""
+        with self._aws_lock:
+            if self._session is None:
+                import boto3
+                self._session = boto3.Session(profile_name=self.profile) if self.profile else boto3.Session()
+            return self._session
+    
+    def _client(self, service_name: str):
+        """按服务名称创建并缓存客户端"""
+        with self._aws_lock:
+            if service_name not in self._clients:
+                self._clients[service_name] = self.session.client(service_name, region_name=self.region)
+            return self._clients[service_name]
+    
+    @property
+    def s3_client(self):
+        return self._client('s3')
+    
+    @property
+    def macie_client(self):
+        return self._client('macie2')
+    
+    @property
+    def sts_client(self):
+        return self._client('sts')
+    
+    @property
+    def account_id(self) -> str:
+        """当前AWS账户ID (配置了 aws.account_id 时直接使用，否则首次使用时调用 get_caller_identity)"""
+        with self._aws_lock:
+            if self._account_id is None:
+                try:
+                    self._account_id = self.sts_client.get_caller_identity()['Account']
+                    logger.info(f"当前AWS账户: {self._account_id}")
+                except Exception as e:
+                    logger.error(f"获取账户ID失败: {e}")
+                    raise
+            return self._account_id
     
     def interactive_config_setup(self):
-        """交互式配置设置 - 加强版"""
+        """
+        交互式配置设置 - 加强版
+        非交互模式下只校验，有问题时报错退出；只提取模式不检查AWS相关配置
+        """
+        if self.extract_only:
+            logger.info("只提取模式，跳过AWS配置检查")
+            return
+        
         needs_config = False
         config_issues = []
         
@@ -96,6 +217,11 @@ class LokiMaciePipeline:
             needs_config = True
             config_issues.append("结果存储桶名称看起来像测试值")
         
+        if needs_config and not self.interactive:
+            for i, issue in enumerate(config_issues, 1):
+                logger.error(f"配置问题 {i}: {issue}")
+            raise ValueError(f"配置检查失败 (非交互模式，请修改 {self.config_file}): {'; '.join(config_issues)}")
+        
         if needs_config:
             print("\n" + "🚨" * 20)
             print("⚠️  配置检查失败 - 需要用户输入")
@@ -213,9 +339,9 @@ class LokiMaciePipeline:
         return True
     
     def save_config(self):
-        """保存配置到文件"""
+        """保存配置到加载时的配置文件"""
         try:
-            with open('config.json', 'w', encoding='utf-8') as f:
+            with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(self.config, f, indent=2, ensure_ascii=False)
         except Exception as e:
             logger.error(f"保存配置文件失败: {e}")
@@ -235,9 +361,20 @@ class LokiMaciePipeline:
             logger.error(f"配置文件格式错误: {e}")
             raise
         
-    def extract_loki_chunks_to_text(self, chunk_dir: str, output_dir: str) -> List[str]:
+    def extract_loki_chunks_to_text(self, chunk_dir: str, output_dir: str, workers: Optional[int] = None,
+                                    chunk_files: Optional[Iterable] = None) -> List[str]:
         """
         将Loki chunk文件转换为文本格式
+        workers > 1 时使用进程池并行提取 (默认从配置文件读取)
+        chunk_files: 只处理这些chunk (chunk_dir下的路径)，不遍历目录
+        """
+        return list(self.iter_extracted_texts(chunk_dir, output_dir, workers=workers, chunk_files=chunk_files))
+    
+    def iter_extracted_texts(self, chunk_dir: str, output_dir: str, workers: Optional[int] = None,
+                             chunk_files: Optional[Iterable] = None) -> Iterator[str]:
+        """
+        逐个产出提取的文本文件，每个chunk提取完成 (并记录到清单和状态文件) 后立即产出
+        顺序: 恢复运行时已提取的文件、新提取的文件、增量模式下可直接复用的已有提取文件
         """
         logger.info(f"开始提取Loki chunk文件: {chunk_dir}")
         
@@ -245,85 +382,654 @@ class LokiMaciePipeline:
         output_path = Path(output_dir)
         output_path.mkdir(exist_ok=True)
         
-        text_files = []
+        decoder = self.config['processing'].get('decoder', 'native')
+        workers = self._resolve_workers(workers)
+        selector = self._selector()
+        logger.info(f"解码器: {decoder}, 工作进程: {workers}")
         
-        # 获取所有chunk文件
-        chunk_files = list(chunk_path.glob('*'))
-        chunk_files = [f for f in chunk_files if f.is_file() and not f.name.startswith('.')]
+        # 边遍历目录边提取，无需等待遍历结束
+        chunk_files = self._iter_chunk_files(chunk_path) if chunk_files is None else (Path(c) for c in chunk_files)
+        # 恢复运行时跳过本次运行中已提取的chunk
+        done = self.state.items('extract') if self.state else {}
+        resumed_files = [output_file for output_file in done.values() if output_file]
+        if done:
+            logger.info(f"🔁 恢复运行: {len(done)} 个chunk已处理")
+            chunk_files = (c for c in chunk_files if os.path.abspath(str(c)) not in done)
+        incremental = {}
+        if self.manifest:
+            chunk_files = self.manifest.iter_pending(chunk_files, incremental)
         
-        logger.info(f"找到 {len(chunk_files)} 个chunk文件")
+        yield from resumed_files
+        generated = len(resumed_files)
+        results = extract_chunks(
+            chunk_files,
+            output_path,
+            decoder=decoder,
+            workers=workers,
+            slice_size=self._slice_size(),
+            chunk_root=chunk_path,
+            describe=self.catalog is not None,
+            selector=selector,
+            checksum=self.manifest is not None
+        )
         
-        for chunk_file in chunk_files:
-            try:
-                logger.info(f"处理文件: {chunk_file.name}")
-                
-                # 使用chunks-inspect工具提取
-                output_file = output_path / f"{chunk_file.name}.txt"
-                
-                # 运行chunks-inspect命令
-                cmd = ['./chunks-inspect', '-l', str(chunk_file)]
-                result = subprocess.run(cmd, capture_output=True, text=True, cwd='.')
-                
-                if result.returncode == 0:
-                    # 保存提取的文本
-                    with open(output_file, 'w', encoding='utf-8') as f:
-                        f.write(f"# Loki Chunk File: {chunk_file.name}\n")
-                        f.write(f"# Extracted at: {self.timestamp.isoformat()}\n")
-                        f.write(f"# File size: {chunk_file.stat().st_size} bytes\n")
-                        f.write("# " + "="*50 + "\n\n")
-                        f.write(result.stdout)
-                    
-                    text_files.append(str(output_file))
-                    logger.info(f"✅ 成功提取: {output_file.name}")
-                else:
-                    logger.error(f"❌ 提取失败 {chunk_file.name}: {result.stderr}")
-                    
-            except Exception as e:
-                logger.error(f"处理文件 {chunk_file.name} 时出错: {e}")
+        processed = 0
+        unselected = 0
+        for result in results:
+            processed += 1
+            chunk_name = Path(result['chunk_file']).name
+            if result['success'] and self.state:
+                self.state.record_item('extract', os.path.abspath(result['chunk_file']), result['output_file'])
+            self._record_item_metrics('extract', seconds=result.get('seconds'), success=result['success'],
+                                      skipped=result.get('selected') is False,
+                                      bytes_in=result.get('chunk_bytes'), bytes_out=result.get('bytes'),
+                                      lines_out=result.get('lines'))
+            if result.get('selected') is False:
+                unselected += 1
+                logger.debug(f"⏭️ 标签不匹配选择器，跳过: {chunk_name}")
+            elif result['success']:
+                if self.manifest:
+                    self.manifest.record_extraction(result['chunk_file'], result['output_file'], result.get('sha256'))
+                if self.catalog and result.get('metadata'):
+                    self.catalog.record_chunk(result['chunk_file'], result['metadata'], output_file=result['output_file'])
+                logger.info(f"✅ 成功提取: {Path(result['output_file']).name}")
+                generated += 1
+                yield result['output_file']
+            else:
+                logger.error(f"❌ 提取失败 {chunk_name}: {result['error']}")
+        
+        if self.catalog:
+            self.catalog.commit()
+        if self.manifest:
+            self.manifest.save()
+            reusable_outputs = incremental['reusable_outputs']
+            if selector:
+                # 之前运行中已提取的文件同样按选择器过滤
+                reusable_outputs = [
+                    output_file for output_file in reusable_outputs
+                    if all(chunk_selected(Path(chunk), selector) for chunk in self.manifest.chunks_for_output(output_file))
+                ]
+            logger.info(f"增量模式: {processed} 个新增或变更, {len(reusable_outputs)} 个已提取待上传, {incremental['skipped']} 个已处理跳过")
+            generated += len(reusable_outputs)
+            yield from reusable_outputs
+        
+        if selector:
+            logger.info(f"标签选择器 {selector}: {unselected} 个chunk不匹配，未解码")
+        logger.info(f"提取完成，处理 {processed} 个chunk文件，生成 {generated} 个文本文件")
+    
+    def _iter_chunk_files(self, chunk_path: Path) -> Iterator[Path]:
+        """按配置的过滤条件惰性遍历chunk文件 (默认递归租户/指纹子目录)"""
+        processing = self.config['processing']
+        if processing.get('catalog_select') is not None:
+            return self._select_from_catalog(chunk_path, processing['catalog_select'])
+        return iter_chunk_files(
+            chunk_path,
+            tenants=processing.get('tenants'),
+            pattern=processing.get('path_pattern'),
+            min_size=processing.get('min_chunk_size', 0),
+            max_size=processing.get('max_chunk_size'),
+            recursive=processing.get('recursive', True)
+        )
+    
+    def _select_from_catalog(self, chunk_path: Path, select: Dict) -> Iterator[Path]:
+        """
+        按租户、标签和日志时间从chunk目录中用索引查询选择chunk，不遍历目录
+        select: tenants (UserID列表), labels ({name: value}), start / end (UTC时间)
+        """
+        if self.catalog is None:
+            raise ValueError("从chunk目录选择chunk需要配置 catalog_file (或 --catalog)")
+        start_ms = int(parse_time_arg(select['start']).timestamp() * 1000) if select.get('start') else None
+        end_ms = int(parse_time_arg(select['end']).timestamp() * 1000) if select.get('end') else None
+        root = os.path.join(os.path.abspath(str(chunk_path)), '')
+        # 标签选择器直接按目录中记录的标签判断，相等条件合并到索引查询中
+        selector_text = self._selector()
+        selector = parse_selector(selector_text) if selector_text else None
+        labels = dict(select.get('labels') or {})
+        if selector is not None:
+            labels.update(selector.equality_labels())
+        
+        selected = 0
+        for record in self.catalog.select(select.get('tenants'), labels, start_ms, end_ms):
+            if not record['path'].startswith(root):
                 continue
+            if selector is not None and not selector.matches(record['labels']):
+                continue
+            # 与遍历目录时的路径形式一致 (输出文件名按相对chunk根目录的路径生成)
+            chunk_file = chunk_path / os.path.relpath(record['path'], root)
+            if not chunk_file.exists():
+                logger.warning(f"chunk目录中的文件已不存在: {record['path']}")
+                continue
+            selected += 1
+            yield chunk_file
+        logger.info(f"从chunk目录选择了 {selected} 个chunk")
+    
+    def _selector(self) -> Optional[str]:
+        """标签选择器 (processing.selector)，格式错误时抛出ValueError"""
+        selector = self.config['processing'].get('selector')
+        if not selector:
+            return None
+        parse_selector(selector)
+        return selector
+    
+    def _resolve_workers(self, workers: Optional[int]) -> int:
+        """解析工作进程数，未指定时从配置文件读取"""
+        if workers is None:
+            workers = self.config['processing'].get('workers', 1)
+        return resolve_worker_count(workers)
+    
+    def _slice_size(self) -> int:
+        """chunks-inspect输出的流式读取切片大小 (字节)"""
+        return int(self.config['processing'].get('stream_slice_kb', 1024) * 1024)
+    
+    def _upload_extra_args(self, compressed: bool = False) -> Dict:
+        """扫描对象上传时附带的元数据"""
+        extra_args = {
+            'Metadata': {
+                'source': 'loki-chunk',
+                'extraction-time': self.timestamp.isoformat(),
+                'pipeline-job': self.job_name
+            }
+        }
+        if compressed:
+            extra_args['ContentType'] = 'application/gzip'
+        return extra_args
+    
+    def _compression_options(self) -> Optional[Dict]:
+        """扫描对象gzip压缩配置，未启用时返回None"""
+        compression = self.config['s3'].get('compression') or {}
+        if not compression.get('enabled', False):
+            return None
+        return {'level': int(compression.get('level', DEFAULT_COMPRESSION_LEVEL))}
+    
+    def _log_compression_summary(self, bytes_in: int, bytes_out: int):
+        """输出压缩前后的上传字节数"""
+        ratio = bytes_in / bytes_out if bytes_out else 0
+        logger.info(f"gzip压缩: {bytes_in:,} -> {bytes_out:,} 字节, 压缩比 {ratio:.1f}x")
+    
+    def dedup_text_files(self, text_files: List[str], output_dir: str) -> List[str]:
+        """
+        跨chunk日志行去重: 按顺序处理提取文件，每个不同的日志行只上传一次
+        被丢弃的重复行记录到旁路索引 (来源文件、行号、字节偏移、保留副本的位置)
+        """
+        return list(self.iter_deduped_texts(text_files, output_dir))
+    
+    def iter_deduped_texts(self, text_files: Iterable[str], output_dir: str) -> Iterator[str]:
+        """逐个去重输入文件并产出需要上传的文件，输入可以是惰性迭代器 (按到达顺序去重)"""
+        dedup_config = self.config['processing'].get('dedup') or {}
+        output_path = Path(dedup_config.get('output_directory') or Path(output_dir) / 'deduped')
+        output_path.mkdir(parents=True, exist_ok=True)
+        sidecar_file = Path(dedup_config.get('sidecar_file') or
+                            output_path / f"dedup_sidecar_{self.timestamp.strftime('%Y%m%d_%H%M%S')}.tsv.gz")
+        logger.info(f"开始跨chunk去重 -> {output_path}")
         
-        logger.info(f"提取完成，生成 {len(text_files)} 个文本文件")
-        return text_files
+        processed = 0
+        totals = {'lines_in': 0, 'bytes_in': 0, 'bytes_out': 0, 'duplicates': 0}
+        dropped = 0
+        for result in dedup_text_files(text_files, output_path, sidecar_file, dedup_config):
+            processed += 1
+            text_file = result['chunk_file']
+            stats = result.get('stats') or {}
+            self._record_item_metrics('dedup', success=result['success'],
+                                      skipped=result['success'] and not result['output_file'],
+                                      bytes_in=stats.get('bytes_in'), bytes_out=stats.get('bytes_out'),
+                                      lines_in=stats.get('lines_in'), lines_out=stats.get('lines_out'))
+            if not result['success']:
+                # 去重失败时保守地上传完整文件
+                logger.error(f"❌ 去重失败 {Path(text_file).name}: {result['error']}，将上传完整文件")
+                yield text_file
+                continue
+            for name in totals:
+                totals[name] += result['stats'][name]
+            if result['output_file']:
+                if self.manifest:
+                    self.manifest.link_output(result['output_file'], text_file)
+                if self.catalog:
+                    self.catalog.link_outputs(result['output_file'], [text_file])
+                yield result['output_file']
+            else:
+                dropped += 1
+                if self.manifest:
+                    self.manifest.record_output_filtered(text_file)
+        
+        if self.manifest:
+            self.manifest.save()
+        ratio = reduction_ratio(totals['bytes_in'], totals['bytes_out'])
+        logger.info(f"去重完成: {processed} 个文件, {totals['duplicates']:,}/{totals['lines_in']:,} 行为重复行, "
+                    f"{dropped} 个文件全部重复未上传")
+        logger.info(f"去重字节: {totals['bytes_in']:,} -> {totals['bytes_out']:,}, 扫描量缩减 {ratio:.1f}x")
+        logger.info(f"重复行索引: {sidecar_file}")
+    
+    def bundle_text_files(self, text_files: List[str], output_dir: str) -> List[str]:
+        """
+        将小文件按顺序打包为接近目标大小的对象，减少上传对象数
+        每个打包对象末尾嵌入chunk边界索引 (行号和字节范围)
+        """
+        return list(self.iter_bundled_texts(text_files, output_dir))
+    
+    def iter_bundled_texts(self, text_files: Iterable[str], output_dir: str) -> Iterator[str]:
+        """
+        逐个产出打包对象，输入可以是惰性迭代器: 达到目标大小即写出一个对象
+        按日志时间分区时需要先收集全部输入按分区分组，第一个对象在输入结束后才产出
+        """
+        bundle_config = self.config['processing'].get('bundle') or {}
+        target_size = int(bundle_config.get('target_size_mb', DEFAULT_TARGET_SIZE // (1024 * 1024)) * 1024 * 1024)
+        output_path = Path(bundle_config.get('output_directory') or Path(output_dir) / 'bundles')
+        output_path.mkdir(parents=True, exist_ok=True)
+        logger.info(f"开始打包: 目标大小 {target_size // (1024 * 1024)}MB -> {output_path}")
+        
+        members = 0
+        objects = 0
+        # 按日志时间分区时，同一个打包对象只包含同一小时分区的文件
+        group_key = self._partition_for_file if self._partition_by() == 'log_time' else None
+        for result in pack_text_files(text_files, output_path, 'bundle', target_size, group_key):
+            self._record_item_metrics('bundle', success=result['success'])
+            members += len(result['members'])
+            if not result['success']:
+                # 打包失败时成员文件单独上传
+                logger.error(f"❌ 打包失败: {result['error']}，{len(result['members'])} 个文件将单独上传")
+                objects += len(result['members'])
+                yield from result['members']
+                continue
+            if self.manifest:
+                self.manifest.link_outputs(result['output_file'], result['members'])
+            if self.catalog:
+                self.catalog.link_outputs(result['output_file'], result['members'])
+            logger.info(f"✅ 打包完成: {Path(result['output_file']).name} ({len(result['members'])} 个chunk文件)")
+            objects += 1
+            yield result['output_file']
+        
+        logger.info(f"打包完成: {members} 个文件 -> {objects} 个对象")
+    
+    def _prefilter_options(self) -> Optional[Dict]:
+        """本地预过滤配置，未启用时返回None"""
+        prefilter = self.config['processing'].get('prefilter') or {}
+        if not prefilter.get('enabled', False):
+            return None
+        return {
+            'context_lines': prefilter.get('context_lines', 2),
+            'keywords': prefilter.get('keywords', []),
+            'patterns': prefilter.get('patterns', {})
+        }
+    
+    def _log_prefilter_summary(self, totals: Dict, kept: int, dropped: int):
+        """输出预过滤的扫描量缩减情况"""
+        ratio = reduction_ratio(totals['bytes_in'], totals['bytes_out'])
+        logger.info(f"预过滤完成: {kept} 个文件保留候选行, {dropped} 个文件无候选行未上传")
+        logger.info(f"预过滤行数: {totals['lines_in']:,} -> {totals['lines_out']:,} (候选行 {totals['matched_lines']:,})")
+        logger.info(f"预过滤字节: {totals['bytes_in']:,} -> {totals['bytes_out']:,}, 扫描量缩减 {ratio:.1f}x")
+    
+    def prefilter_text_files(self, text_files: List[str], output_dir: str,
+                             workers: Optional[int] = None) -> List[str]:
+        """
+        本地预过滤: 只保留候选敏感行及其上下文，写入预过滤输出目录
+        没有任何候选行的文件不再上传
+        """
+        return list(self.iter_prefiltered_texts(text_files, output_dir, workers=workers))
+    
+    def iter_prefiltered_texts(self, text_files: Iterable[str], output_dir: str,
+                               workers: Optional[int] = None) -> Iterator[str]:
+        """逐个产出预过滤后保留候选行的文件 (按输入顺序)，输入可以是惰性迭代器"""
+        options = self._prefilter_options() or {}
+        prefilter_config = self.config['processing'].get('prefilter') or {}
+        output_path = Path(prefilter_config.get('output_directory') or Path(output_dir) / 'prefiltered')
+        output_path.mkdir(parents=True, exist_ok=True)
+        workers = self._resolve_workers(workers)
+        logger.info(f"开始本地预过滤 -> {output_path}")
+        
+        kept = 0
+        totals = {'lines_in': 0, 'lines_out': 0, 'bytes_in': 0, 'bytes_out': 0, 'matched_lines': 0}
+        dropped = 0
+        for result in prefilter_files(text_files, output_path, options, workers=workers):
+            text_file = result['chunk_file']
+            stats = result.get('stats') or {}
+            self._record_item_metrics('prefilter', success=result['success'],
+                                      skipped=result['success'] and not result['output_file'],
+                                      bytes_in=stats.get('bytes_in'), bytes_out=stats.get('bytes_out'),
+                                      lines_in=stats.get('lines_in'), lines_out=stats.get('lines_out'))
+            if not result['success']:
+                # 过滤失败时保守地上传完整文件
+                logger.error(f"❌ 预过滤失败 {Path(text_file).name}: {result['error']}，将上传完整文件")
+                kept += 1
+                yield text_file
+                continue
+            for name in totals:
+                totals[name] += result['stats'][name]
+            if result['output_file']:
+                if self.manifest:
+                    self.manifest.link_output(result['output_file'], text_file)
+                if self.catalog:
+                    self.catalog.link_outputs(result['output_file'], [text_file])
+                kept += 1
+                yield result['output_file']
+            else:
+                dropped += 1
+                if self.manifest:
+                    self.manifest.record_output_filtered(text_file)
+        
+        if self.manifest:
+            self.manifest.save()
+        self._log_prefilter_summary(totals, kept, dropped)
+    
+    def stream_chunks_to_s3(self, chunk_dir: str, workers: Optional[int] = None,
+                            chunk_files: Optional[Iterable] = None) -> List[str]:
+        """
+        流式模式: 解码后的文本直接以multipart分片上传到S3
+        不生成本地中间文件，内存中每个chunk最多缓冲一个分片
+        chunk_files: 只处理这些chunk (chunk_dir下的路径)，不遍历目录
+        """
+        logger.info(f"开始流式提取并上传Loki chunk文件: {chunk_dir} -> s3://{self.scan_bucket}")
+        
+        chunk_path = Path(chunk_dir)
+        decoder = self.config['processing'].get('decoder', 'native')
+        workers = self._resolve_workers(workers)
+        part_size_mb = self.config['s3'].get('multipart_part_size_mb', 8)
+        logger.info(f"解码器: {decoder}, 工作进程: {workers}, 分片大小: {part_size_mb}MB")
+        
+        uploaded_keys = self._restore_uploads('stream')
+        if self.state and self.state.stage_done('stream'):
+            return uploaded_keys
+        
+        chunk_files = self._iter_chunk_files(chunk_path) if chunk_files is None else (Path(c) for c in chunk_files)
+        done = self.state.items('stream') if self.state else {}
+        if done:
+            chunk_files = (c for c in chunk_files if os.path.abspath(str(c)) not in done)
+        incremental = {}
+        if self.manifest:
+            chunk_files = self.manifest.iter_pending(chunk_files, incremental, streaming=True)
+        
+        s3_options = {
+            'region': self.region,
+            'profile': self.profile,
+            'bucket': self.scan_bucket,
+            'part_size': int(part_size_mb * 1024 * 1024),
+            'slice_size': self._slice_size(),
+            'prefilter': self._prefilter_options(),
+            'compression': self._compression_options(),
+            'default_partition': self.date_partition,
+            'describe': self.catalog is not None,
+            'checksum': self.manifest is not None,
+            'selector': self._selector()
+        }
+        s3_options['extra_args'] = self._upload_extra_args(compressed=s3_options['compression'] is not None)
+        if s3_options['compression'] is not None:
+            logger.info(f"已启用gzip压缩上传 (级别 {s3_options['compression']['level']})")
+        if s3_options['prefilter'] is not None:
+            logger.info("已启用本地预过滤，只上传候选敏感行及其上下文")
+        if (self.config['processing'].get('dedup') or {}).get('enabled', False):
+            logger.warning("流式上传模式下各chunk在不同进程中独立处理，跨chunk去重不生效")
+        if (self.config['processing'].get('bundle') or {}).get('enabled', False):
+            logger.warning("流式上传模式下每个chunk单独上传，打包不生效")
+        
+        totals = {'lines_in': 0, 'lines_out': 0, 'bytes_in': 0, 'bytes_out': 0, 'matched_lines': 0}
+        dropped = 0
+        uncompressed_bytes = 0
+        compressed_bytes = 0
+        # 按日志时间分区时由工作进程解析chunk头部后替换分区占位符
+        partition = PARTITION_PLACEHOLDER if self._partition_by() == 'log_time' else self.date_partition
+        results = stream_chunks_to_s3(
+            chunk_files,
+            f"{self.s3_prefix}/{partition}",
+            s3_options,
+            decoder=decoder,
+            workers=workers,
+            chunk_root=chunk_path
+        )
+        
+        processed = 0
+        unselected = 0
+        for result in results:
+            processed += 1
+            chunk_name = Path(result['chunk_file']).name
+            if result['success'] and self.state:
+                self.state.record_item('stream', os.path.abspath(result['chunk_file']),
+                                       {'s3_key': result['s3_key'], 'skipped': False, 'bytes': result['bytes']})
+            self._record_item_metrics('stream', seconds=result.get('seconds'), success=result['success'],
+                                      skipped=result.get('selected') is False or bool(result.get('filtered_out')),
+                                      bytes_in=result.get('chunk_bytes'), bytes_out=result.get('bytes'),
+                                      lines_out=result.get('lines'))
+            if result.get('selected') is False:
+                unselected += 1
+                logger.debug(f"⏭️ 标签不匹配选择器，跳过: {chunk_name}")
+                continue
+            if result['success'] and 'prefilter' in result:
+                for name in totals:
+                    totals[name] += result['prefilter'][name]
+            if result['success'] and result.get('filtered_out'):
+                dropped += 1
+                if self.manifest:
+                    self.manifest.record_filtered(result['chunk_file'], result.get('sha256'))
+                logger.info(f"⏭️ 无候选敏感行，跳过上传: {chunk_name}")
+            elif result['success']:
+                uploaded_keys.append(result['s3_key'])
+                self.object_sizes[result['s3_key']] = result['bytes']
+                self.scan_partitions.add(self._partition_of_key(result['s3_key']))
+                if 'uncompressed_bytes' in result:
+                    uncompressed_bytes += result['uncompressed_bytes']
+                    compressed_bytes += result['bytes']
+                if self.manifest:
+                    self.manifest.record_upload(result['chunk_file'], result['s3_key'], result.get('sha256'))
+                if self.catalog and result.get('metadata'):
+                    self.catalog.record_chunk(result['chunk_file'], result['metadata'], s3_key=result['s3_key'])
+                logger.info(f"✅ 上传成功: s3://{self.scan_bucket}/{result['s3_key']} ({result['bytes']:,} 字节)")
+            else:
+                logger.error(f"❌ 流式上传失败 {chunk_name}: {result['error']}")
+        
+        if s3_options['selector']:
+            logger.info(f"标签选择器 {s3_options['selector']}: {unselected} 个chunk不匹配，未解码")
+        if s3_options['prefilter'] is not None:
+            self._log_prefilter_summary(totals, len(uploaded_keys), dropped)
+        if s3_options['compression'] is not None:
+            self._log_compression_summary(uncompressed_bytes, compressed_bytes)
+        
+        if self.catalog:
+            self.catalog.commit()
+        if self.manifest:
+            self.manifest.save()
+            logger.info(f"增量模式: {processed} 个新增或变更, {incremental['skipped']} 个已处理跳过")
+        
+        logger.info(f"流式上传完成，处理 {processed} 个chunk文件，共上传 {len(uploaded_keys)} 个文件")
+        return uploaded_keys
+    
+    def _upload_options(self) -> Dict:
+        """并发上传配置 (s3.upload)"""
+        return self.config['s3'].get('upload') or {}
+    
+    def _get_upload_client(self):
+        """
+        获取连接池大小与上传并发数匹配的S3客户端 (默认连接池只有10个连接)
+        未安装botocore时 (只可能是传入的替身会话，如基准测试) 不设置连接池
+        """
+        if self._upload_client is None:
+            try:
+                from botocore.config import Config as BotoConfig
+            except ImportError:
+                self._upload_client = self.session.client('s3', region_name=self.region)
+                return self._upload_client
+            
+            pool_size = pool_connections_for(self._upload_options())
+            self._upload_client = self.session.client(
+                's3',
+                region_name=self.region,
+                config=BotoConfig(max_pool_connections=pool_size)
+            )
+        return self._upload_client
+    
+    def _restore_uploads(self, stage: str) -> List[str]:
+        """
+        恢复运行时从状态文件中恢复本次运行已上传 (或未变化而跳过) 的对象，返回已上传的S3键
+        同时恢复Macie作业范围所需的分区和扫描跳过对象的作业的创建时间
+        """
+        uploaded_keys = []
+        if not self.state:
+            return uploaded_keys
+        for value in self.state.items(stage).values():
+            if not value or not value.get('s3_key'):
+                continue
+            self.scan_partitions.add(self._partition_of_key(value['s3_key']))
+            if value.get('skipped'):
+                self.unchanged_scanned_at.append(datetime.fromtimestamp(value['scanned_at'], timezone.utc))
+            else:
+                uploaded_keys.append(value['s3_key'])
+                self.object_sizes[value['s3_key']] = value.get('bytes', 0)
+        if uploaded_keys or self.unchanged_scanned_at:
+            logger.info(f"🔁 恢复运行: {len(uploaded_keys)} 个对象已上传, {len(self.unchanged_scanned_at)} 个未变化")
+        return uploaded_keys
+    
+    def _partition_by(self) -> str:
+        """分区方式: log_time 按chunk的日志时间 (小时)，run_time 按管道运行日期"""
+        return self.config['s3'].get('partition_by', 'run_time')
+    
+    def _partition_for_file(self, text_file: str) -> str:
+        """
+        文件所属的分区
+        log_time: 注释头中chunk起始时间所在的小时 YYYY/MM/DD/HH，没有时间信息时使用运行日期
+        """
+        if self._partition_by() != 'log_time':
+            return self.date_partition
+        time_range = read_time_range(text_file)
+        if time_range is None:
+            logger.warning(f"文件中没有chunk时间信息，使用运行日期分区: {Path(text_file).name}")
+            return self.date_partition
+        return hour_partition(time_range[0])
+    
+    def _partition_of_key(self, s3_key: str) -> str:
+        """从S3键中取出分区部分 (<scan_prefix>/<分区>/<文件名>)"""
+        return s3_key[len(self.s3_prefix) + 1:].rsplit('/', 1)[0]
     
     def upload_to_s3_with_partition(self, text_files: List[str]) -> List[str]:
         """
-        按时间分区上传文件到S3
+        按时间分区上传文件到S3 (按运行日期或每个chunk的日志时间)
+        多个对象并发上传，共享可调的TransferConfig (分片阈值、分片大小、单对象并发数)
+        启用压缩时边读取边gzip压缩并分片上传为 <文件名>.gz，压缩在后台线程中进行
         """
         logger.info(f"开始上传文件到S3存储桶: {self.scan_bucket}")
         
-        uploaded_keys = []
+        uploaded_keys = self._restore_uploads('upload')
+        done = self.state.items('upload') if self.state else {}
+        uploads = [
+            (text_file, self._upload_key(text_file))
+            for text_file in text_files
+            if text_file not in done
+        ]
+        # 所有分区的公共前缀 (按日志时间分区时可能跨越多个小时或日期)
+        partition_prefix = os.path.commonprefix([key for _, key in uploads])
+        partition_prefix = partition_prefix[:partition_prefix.rfind('/') + 1]
         
-        for text_file in text_files:
+        # 一次分页列出分区下已有对象，内容未变化且已被扫描过的对象不再重复上传
+        index = None
+        if uploads and self.scan_ledger is not None:
             try:
-                file_path = Path(text_file)
-                
-                # 构建S3键名，包含时间分区
-                s3_key = f"{self.s3_prefix}/{self.date_partition}/{file_path.name}"
-                
-                # 上传文件
-                self.s3_client.upload_file(
-                    str(file_path),
-                    self.scan_bucket,
-                    s3_key,
-                    ExtraArgs={
-                        'Metadata': {
-                            'source': 'loki-chunk',
-                            'extraction-time': self.timestamp.isoformat(),
-                            'pipeline-job': self.job_name
-                        }
-                    }
-                )
-                
-                uploaded_keys.append(s3_key)
-                logger.info(f"✅ 上传成功: s3://{self.scan_bucket}/{s3_key}")
-                
+                index = S3ObjectIndex.build(self._get_upload_client(), self.scan_bucket, partition_prefix)
+                logger.info(f"已有对象索引: s3://{self.scan_bucket}/{partition_prefix} 下 {len(index)} 个对象")
+                index = self.scan_ledger.filter_index(index)
             except Exception as e:
-                logger.error(f"上传文件 {text_file} 失败: {e}")
-                continue
+                logger.warning(f"列出已有对象失败，将全部上传: {e}")
         
-        logger.info(f"上传完成，共上传 {len(uploaded_keys)} 个文件")
+        uploaded_keys.extend(self._upload_files(uploads, index))
         return uploaded_keys
     
+    def iter_uploaded_keys(self, text_files: Iterable[str]) -> Iterator[str]:
+        """
+        逐个上传到达的文件并产出上传的S3键 (恢复运行时先产出已上传的键)，输入可以是惰性迭代器
+        事先不知道全部分区，已有对象索引按分区在第一次查询时列出
+        """
+        logger.info(f"开始上传文件到S3存储桶: {self.scan_bucket}")
+        
+        yield from self._restore_uploads('upload')
+        done = self.state.items('upload') if self.state else {}
+        uploads = (
+            (text_file, self._upload_key(text_file))
+            for text_file in text_files
+            if text_file not in done
+        )
+        index = None
+        if self.scan_ledger is not None:
+            index = self.scan_ledger.filter_index(PartitionedObjectIndex(self._get_upload_client(), self.scan_bucket))
+        yield from self._upload_files(uploads, index)
+    
+    def _upload_key(self, text_file: str) -> str:
+        """构建S3键名，包含时间分区 (启用压缩时加 .gz 后缀)"""
+        suffix = '.gz' if self._compression_options() is not None else ''
+        return f"{self.s3_prefix}/{self._partition_for_file(text_file)}/{Path(text_file).name}{suffix}"
+    
+    def _upload_files(self, uploads: Iterable[Tuple[str, str]], index) -> Iterator[str]:
+        """
+        并发上传 (本地路径, S3键)，记录每个结果并产出上传成功的S3键 (内容未变化而跳过的不产出)
+        index: 只包含已被扫描过的已有对象的索引 (ScannedObjectIndex)，为None时全部上传
+        """
+        upload_options = self._upload_options()
+        compression = self._compression_options()
+        concurrency = int(upload_options.get('concurrency', DEFAULT_UPLOAD_CONCURRENCY))
+        uploader = ConcurrentUploader(
+            self._get_upload_client(),
+            self.scan_bucket,
+            transfer_config=build_transfer_config(upload_options),
+            concurrency=concurrency,
+            extra_args=self._upload_extra_args(compressed=compression is not None),
+            compression_level=compression['level'] if compression is not None else None,
+            part_size=int(self.config['s3'].get('multipart_part_size_mb', 8) * 1024 * 1024),
+            index=index
+        )
+        logger.info(f"并发上传: {concurrency} 个对象同时上传, 连接池 {pool_connections_for(upload_options)}")
+        
+        uploaded = 0
+        failures = []
+        for result in uploader.upload(uploads):
+            self._record_item_metrics('upload', seconds=result.get('seconds'), success=result['success'],
+                                      skipped=bool(result.get('skipped')),
+                                      bytes_in=result.get('bytes'), bytes_out=result.get('uploaded_bytes'))
+            if result['success']:
+                self.scan_partitions.add(self._partition_of_key(result['s3_key']))
+                scanned_at = None
+                if result.get('skipped'):
+                    scanned_at = index.get(result['s3_key'])['scanned']['job_created_at']
+                if self.state:
+                    self.state.record_item('upload', result['file'], {
+                        's3_key': result['s3_key'],
+                        'skipped': bool(result.get('skipped')),
+                        'scanned_at': scanned_at,
+                        'bytes': result['uploaded_bytes']
+                    })
+            if result.get('skipped'):
+                self.unchanged_scanned_at.append(datetime.fromtimestamp(scanned_at, timezone.utc))
+                if self.manifest:
+                    self.manifest.record_output_upload(result['file'], result['s3_key'])
+                if self.catalog:
+                    self.catalog.record_output_upload(result['file'], result['s3_key'])
+                logger.info(f"⏭️ 内容未变化且已被扫描，跳过上传: s3://{self.scan_bucket}/{result['s3_key']}")
+            elif result['success']:
+                self.object_sizes[result['s3_key']] = result['uploaded_bytes']
+                if self.manifest:
+                    self.manifest.record_output_upload(result['file'], result['s3_key'])
+                if self.catalog:
+                    self.catalog.record_output_upload(result['file'], result['s3_key'])
+                logger.info(f"✅ 上传成功: s3://{self.scan_bucket}/{result['s3_key']} "
+                            f"({result['uploaded_bytes']:,} 字节, {result['seconds']:.1f} 秒)")
+                uploaded += 1
+                yield result['s3_key']
+            else:
+                failures.append(result)
+                logger.error(f"上传文件 {result['file']} 失败: {result['error']}")
+        
+        if self.catalog:
+            self.catalog.commit()
+        if self.manifest:
+            self.manifest.save()
+        
+        stats = uploader.stats
+        if compression is not None:
+            self._log_compression_summary(stats['bytes'], stats['uploaded_bytes'])
+        if stats['skipped']:
+            logger.info(f"{stats['skipped']} 个对象内容未变化且已被扫描，已跳过上传")
+        if isinstance(index, ScannedObjectIndex) and index.unscanned:
+            logger.info(f"{index.unscanned} 个已有对象尚未被Macie作业扫描 (如上次运行在创建作业前中断)，不跳过上传")
+        logger.info(f"上传完成，共上传 {uploaded} 个文件, {stats['uploaded_bytes']:,} 字节, "
+                    f"耗时 {stats['seconds']:.1f} 秒, 吞吐 {uploader.throughput_mb_s:.1f} MB/s")
+        if failures:
+            logger.error(f"❌ {len(failures)} 个文件上传失败:")
+            for result in failures:
+                logger.error(f"   {result['file']}: {result['error']}")
+    
     def ensure_macie_enabled(self):
         """
         确保Macie服务已启用
@@ -348,11 +1054,47 @@ class LokiMaciePipeline:
             logger.error(f"检查Macie状态失败: {e}")
             return False
     
-    def create_macie_job(self, s3_keys: List[str]) -> str:
+    def _scan_prefixes(self, time_window: Optional[Tuple[datetime, datetime]] = None,
+                       max_prefixes: int = MAX_SCOPE_PREFIXES) -> List[str]:
+        """
+        Macie作业扫描的对象键前缀
+        按日志时间分区时为时间窗口覆盖的小时分区 (未指定窗口时为本次运行写入的分区)，
+        分区超过 max_prefixes 时合并为天或月；按运行日期分区时为当天分区
+        """
+        if self._partition_by() != 'log_time':
+            if time_window is not None:
+                logger.warning("按运行日期分区时无法按日志时间窗口限定扫描范围，扫描当天分区")
+            return [f"{self.s3_prefix}/{self.date_partition}/"]
+        
+        if time_window is not None:
+            lookback_hours = int(self.config['s3'].get('partition_lookback_hours', 2))
+            partitions = window_partitions(time_window[0], time_window[1], lookback_hours)
+            logger.info(f"时间窗口 {time_window[0].isoformat()} ~ {time_window[1].isoformat()} "
+                        f"覆盖 {len(partitions)} 个小时分区 (含向前 {lookback_hours} 小时)")
+        else:
+            partitions = self.scan_partitions or {self.date_partition}
+        return [f"{self.s3_prefix}/{partition}/" for partition in collapse_partitions(partitions, max_prefixes)]
+    
+    def create_macie_job(self, s3_keys: List[str], modified_after: Optional[datetime] = None,
+                         time_window: Optional[Tuple[datetime, datetime]] = None,
+                         scan_prefixes: Optional[List[str]] = None, job_name: Optional[str] = None,
+                         tags: Optional[Dict[str, str]] = None) -> str:
         """
         创建Macie分类作业
+        modified_after: 只扫描在此时间之后修改的对象 (跳过上传的未变化对象不会被重复扫描)
+        time_window: (开始, 结束) UTC日志时间，只扫描窗口覆盖的分区 (需要按日志时间分区)
+        scan_prefixes / job_name / tags: 分片作业的扫描前缀、名称和附加标签 (默认为整个扫描范围和本次运行的作业名称)
+        启用扫描记录时，创建前列出作业范围内的对象，作业创建成功后记录为已被该作业扫描
         """
-        logger.info(f"创建Macie分类作业: {self.job_name}")
+        job_name = job_name or self.job_name
+        sampling_percentage = self.sampling['percentage'] if self.sampling else int(
+            self.config['macie'].get('sampling_percentage', 100))
+        logger.info(f"创建Macie分类作业: {job_name} (采样 {sampling_percentage}%)")
+        if scan_prefixes is None:
+            scan_prefixes = self._scan_prefixes(time_window)
+            self.scan_prefixes = scan_prefixes
+        logger.info(f"扫描范围: {len(scan_prefixes)} 个前缀 ({scan_prefixes[0]}"
+                    f"{' ... ' + scan_prefixes[-1] if len(scan_prefixes) > 1 else ''})")
         
         # 构建S3作业范围
         s3_job_definition = {
@@ -369,95 +1111,233 @@ class LokiMaciePipeline:
                             'simpleScopeTerm': {
                                 'comparator': 'STARTS_WITH',
                                 'key': 'OBJECT_KEY',
-                                'values': [f"{self.s3_prefix}/{self.date_partition}/"]
+                                # 多个前缀之间为OR关系
+                                'values': scan_prefixes
                             }
                         }
                     ]
                 }
             }
         }
+        if modified_after is not None:
+            s3_job_definition['scoping']['includes']['and'].append({
+                'simpleScopeTerm': {
+                    'comparator': 'GT',
+                    'key': 'OBJECT_LAST_MODIFIED_DATE',
+                    'values': [modified_after.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')]
+                }
+            })
+            logger.info(f"作业只扫描 {modified_after.isoformat()} 之后修改的对象")
+        
+        # 在创建作业前列出: 列出的对象在作业创建时都已存在，会被作业扫描
+        scope_objects = self._list_job_scope(scan_prefixes, modified_after)
         
         try:
             response = self.macie_client.create_classification_job(
-                name=self.job_name,
+                name=job_name,
                 description=f"Loki chunk文件敏感数据分析 - {self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}",
                 jobType='ONE_TIME',
                 s3JobDefinition=s3_job_definition,
-                samplingPercentage=100,  # 100%采样
+                samplingPercentage=sampling_percentage,
                 tags={
                     'Source': 'loki-chunks',
                     'Pipeline': 'loki-macie-pipeline',
-                    'Date': self.date_partition.replace('/', '-')
+                    'Date': self.date_partition.replace('/', '-'),
+                    **(sampling_tags(self.sampling) if self.sampling else {}),
+                    **(tags or {})
                 }
             )
             
             job_id = response['jobId']
             logger.info(f"✅ Macie作业创建成功: {job_id}")
-            return job_id
             
         except Exception as e:
             logger.error(f"创建Macie作业失败: {e}")
             raise
+        
+        if scope_objects is not None:
+            self.scan_ledger.record_job(scope_objects, job_id, self._job_created_at(job_id, scope_objects))
+        return job_id
+    
+    def _list_job_scope(self, scan_prefixes: List[str], modified_after: Optional[datetime]) -> Optional[Dict[str, Dict]]:
+        """
+        列出作业范围内的对象 (扫描前缀下、最后修改时间条件与作业一致)，用于记录扫描记录
+        未启用扫描记录或列出失败时返回None: 这些对象不记录为已扫描，之后不会被跳过上传 (只会多扫描，不会漏扫)
+        """
+        if self.scan_ledger is None:
+            return None
+        # 作业范围的时间条件精确到秒
+        cutoff = modified_after.replace(microsecond=0) if modified_after is not None else None
+        objects = {}
+        try:
+            for prefix in scan_prefixes:
+                index = S3ObjectIndex.build(self._get_upload_client(), self.scan_bucket, prefix)
+                objects.update((key, obj) for key, obj in index.objects.items()
+                               if cutoff is None or obj['last_modified'] > cutoff)
+        except Exception as e:
+            logger.warning(f"列出作业范围内的对象失败，不记录扫描记录: {e}")
+            return None
+        return objects
     
-    def wait_for_job_completion(self, job_id: str, max_wait_minutes: int = 60) -> Dict:
+    def _job_created_at(self, job_id: str, scope_objects: Dict[str, Dict]) -> datetime:
+        """
+        作业的创建时间 (Macie服务端时间，与S3对象的最后修改时间可直接比较)
+        查询失败时使用范围内对象的最晚修改时间 (同样不早于这些对象，之后上传的对象都比它新)
+        """
+        try:
+            return self.macie_client.describe_classification_job(jobId=job_id)['createdAt']
+        except Exception as e:
+            logger.warning(f"查询作业创建时间失败，使用范围内对象的最晚修改时间: {e}")
+            return max((obj['last_modified'] for obj in scope_objects.values()),
+                       default=datetime.now(timezone.utc))
+    
+    def _sharding_options(self) -> Dict:
+        """分片作业配置 (macie.sharding)"""
+        return self.config['macie'].get('sharding') or {}
+    
+    def _plan_shards(self, time_window: Optional[Tuple[datetime, datetime]] = None) -> List[Dict]:
+        """
+        按本次上传的对象字节数规划分片作业，未配置分片或扫描量不足以分片时返回空列表 (创建单个作业)
+        """
+        options = self._sharding_options()
+        total_bytes = sum(self.object_sizes.values())
+        shard_count = effective_shard_count(total_bytes, int(options.get('shard_count', 1)),
+                                            int(options.get('min_shard_size_mb', 256) * 1024 * 1024))
+        if shard_count <= 1:
+            return []
+        scope_prefixes = self._scan_prefixes(time_window, max_prefixes=MAX_SCOPE_PREFIXES * shard_count)
+        shards = plan_shards(self.object_sizes, scope_prefixes, shard_count, is_exclusive=self._prefix_is_exclusive)
+        logger.info(f"扫描分片: {total_bytes:,} 字节, {len(self.object_sizes)} 个对象 -> {len(shards)} 个作业")
+        for index, shard in enumerate(shards, 1):
+            logger.info(f"   分片 {index}: {shard['objects']} 个对象, {shard['bytes']:,} 字节, "
+                        f"{len(shard['prefixes'])} 个前缀 ({shard['prefixes'][0]}"
+                        f"{' ... ' + shard['prefixes'][-1] if len(shard['prefixes']) > 1 else ''})")
+        return shards
+    
+    def _prefix_is_exclusive(self, prefix: str, keys: List[str]) -> bool:
+        """
+        扫描前缀下是否只有本次上传的对象 (细分前缀前检查，细分后的前缀不会覆盖其他对象)
+        列出失败时视为否
+        """
+        try:
+            index = S3ObjectIndex.build(self._get_upload_client(), self.scan_bucket, prefix)
+        except Exception as e:
+            logger.warning(f"列出扫描前缀失败，不细分该前缀: s3://{self.scan_bucket}/{prefix}: {e}")
+            return False
+        return set(index.objects) <= set(keys)
+    
+    def _plan_sampling(self, shards: List[Dict], override: Optional[int] = None) -> Dict:
+        """
+        根据本次上传量和 macie.sampling_budget 选择采样比例 (不超过 macie.sampling_percentage)
+        分片时时间预算按同时运行的作业数计算
+        """
+        parallel_jobs = min(len(shards), int(self._sharding_options().get('max_concurrent_jobs', 4))) if shards else 1
+        sampling = plan_sampling(
+            sum(self.object_sizes.values()), len(self.object_sizes),
+            self.config['macie'].get('sampling_budget') or {},
+            max_percentage=int(self.config['macie'].get('sampling_percentage', 100)),
+            override=override, parallel_jobs=parallel_jobs
+        )
+        logger.info(f"采样比例: {sampling['percentage']}% ({sampling['reason']}), "
+                    f"约 {sampling['sampled_objects']}/{sampling['total_objects']} 个对象, "
+                    f"{sampling['sampled_bytes']:,} 字节, 预计 {sampling['estimated_minutes']} 分钟, "
+                    f"约 ${sampling['estimated_cost_usd']}")
+        if sampling['percentage'] < 100:
+            logger.info(f"采样置信度: 敏感对象比例误差 ±{sampling['margin_of_error'] * 100:.1f}% (95%), "
+                        f"1%对象含敏感数据时被发现的概率 {sampling['detection_probability'] * 100:.1f}%")
+        return sampling
+    
+    def _poller(self, max_wait_minutes: Optional[int] = None) -> MacieJobPoller:
+        poll = self.config['macie'].get('poll') or {}
+        return MacieJobPoller(
+            self.macie_client,
+            max_wait_seconds=(max_wait_minutes or self.config['macie']['max_wait_minutes']) * 60,
+            min_interval=poll.get('min_interval_seconds', DEFAULT_MIN_INTERVAL),
+            max_interval=poll.get('max_interval_seconds', DEFAULT_MAX_INTERVAL),
+            max_concurrent_requests=poll.get('max_concurrent_requests', DEFAULT_MAX_CONCURRENT_REQUESTS),
+            max_paused_seconds=(poll['max_paused_minutes'] * 60 if poll.get('max_paused_minutes') is not None
+                                else DEFAULT_MAX_PAUSED_SECONDS)
+        )
+    
+    def create_sharded_macie_jobs(self, shards: List[Dict], modified_after: Optional[datetime] = None,
+                                  wait: bool = False) -> Dict[str, Optional[Dict]]:
+        """
+        为每个分片创建一个Macie作业 (名称为 <作业名称>-<序号>of<分片数>)，同时运行的作业数不超过 max_concurrent_jobs
+        分片数超过上限时等待前面的作业结束后再提交后续分片；wait 为True时等待全部作业结束
+        已创建的分片作业记录在状态文件中，恢复运行时不会重复创建
+        返回 作业ID -> 结束时的作业描述 (未等待的作业为None)，按分片顺序
+        """
+        max_concurrent_jobs = int(self._sharding_options().get('max_concurrent_jobs', 4))
+        self.scan_prefixes = sorted(prefix for shard in shards for prefix in shard['prefixes'])
+        created = {}
+        if self.state:
+            created = {int(index): job_id for index, job_id in self.state.items('macie_job').items()}
+        if created:
+            logger.info(f"⏭️ {len(created)} 个分片作业已创建，跳过")
+        if len(shards) > max_concurrent_jobs:
+            logger.info(f"分片数 {len(shards)} 超过并发作业上限 {max_concurrent_jobs}，前面的作业结束后再提交后续分片")
+        
+        state_lock = threading.Lock()
+        
+        def create_job(index):
+            shard = shards[index]
+            job_id = self.create_macie_job(
+                [], modified_after=modified_after, scan_prefixes=shard['prefixes'],
+                job_name=f"{self.job_name}-{index + 1:02d}of{len(shards):02d}",
+                tags={'Run': self.job_name, 'Shard': f"{index + 1}/{len(shards)}"}
+            )
+            if self.state:
+                with state_lock:
+                    self.state.record_item('macie_job', str(index), job_id)
+            return job_id
+        
+        poller = self._poller()
+        results = submit_sharded_jobs(create_job, shards, lambda: poller, max_concurrent_jobs,
+                                      created=created, wait=wait)
+        self._record_poller_stats('macie_job', poller)
+        return {results[index]['job_id']: results[index].get('response') for index in range(len(shards))}
+    
+    def wait_for_job_completion(self, job_id: str, max_wait_minutes: int = 60,
+                                total_objects: Optional[int] = None) -> Dict:
         """
         等待Macie作业完成
         """
-        logger.info(f"等待Macie作业完成: {job_id}")
+        totals = {job_id: total_objects} if total_objects else None
+        return self.wait_for_jobs_completion([job_id], max_wait_minutes, totals)[job_id]
+    
+    def wait_for_jobs_completion(self, job_ids: List[str], max_wait_minutes: int = 60,
+                                 total_objects: Optional[Dict[str, int]] = None) -> Dict[str, Dict]:
+        """
+        同时等待多个Macie作业完成 (异步轮询，自适应间隔，限流时退避)
+        total_objects: 作业ID -> 扫描对象数，用于估算进度和剩余时间
+        """
+        logger.info(f"等待Macie作业完成: {', '.join(job_ids)}")
         logger.info(f"最大等待时间: {max_wait_minutes} 分钟")
         
-        start_time = time.time()
-        max_wait_seconds = max_wait_minutes * 60
-        
-        while True:
-            try:
-                response = self.macie_client.describe_classification_job(jobId=job_id)
-                job_status = response['jobStatus']
-                
-                logger.info(f"作业状态: {job_status}")
-                
-                if job_status == 'COMPLETE':
-                    logger.info("✅ Macie作业完成")
-                    return response
-                elif job_status in ['CANCELLED', 'USER_PAUSED']:
-                    logger.warning(f"⚠️ 作业状态异常: {job_status}")
-                    return response
-                elif job_status == 'RUNNING':
-                    # 显示进度信息
-                    if 'statistics' in response:
-                        stats = response['statistics']
-                        logger.info(f"进度 - 已处理对象: {stats.get('approximateNumberOfObjectsToProcess', 0)}")
-                
-                # 检查超时
-                elapsed = time.time() - start_time
-                if elapsed > max_wait_seconds:
-                    logger.warning(f"⚠️ 等待超时 ({max_wait_minutes} 分钟)")
-                    return response
-                
-                # 等待30秒后再次检查
-                time.sleep(30)
-                
-            except Exception as e:
-                logger.error(f"检查作业状态失败: {e}")
-                time.sleep(30)
-                continue
+        poller = self._poller(max_wait_minutes)
+        responses = wait_for_jobs(self.macie_client, job_ids, total_objects=total_objects, poller=poller)
+        self._record_poller_stats('macie_wait', poller)
+        return responses
     
-    def analyze_macie_results(self, job_id: str) -> Dict:
+    def analyze_macie_results(self, job_id: str, shard_job_ids: Optional[List[str]] = None) -> Dict:
         """
         分析Macie扫描结果
+        shard_job_ids: 分片运行时全部分片作业的ID，统计和发现合并为一次运行 (job_id 为第一个分片)
         """
-        logger.info(f"分析Macie扫描结果: {job_id}")
+        job_ids = shard_job_ids or [job_id]
+        logger.info(f"分析Macie扫描结果: {', '.join(job_ids)}")
         
         try:
-            # 获取作业统计信息
-            job_response = self.macie_client.describe_classification_job(jobId=job_id)
+            # 获取作业统计信息 (分片作业合并)
+            responses = [self.macie_client.describe_classification_job(jobId=i) for i in job_ids]
+            job_response = responses[0] if len(responses) == 1 else merge_job_statistics(responses)
             
             # 获取发现的敏感数据
             findings_response = self.macie_client.list_findings(
                 findingCriteria={
                     'criterion': {
                         'classificationDetails.jobId': {
-                            'eq': [job_id]
+                            'eq': job_ids
                         }
                     }
                 },
@@ -468,12 +1348,23 @@ class LokiMaciePipeline:
             analysis_report = {
                 'job_info': {
                     'job_id': job_id,
+                    'job_ids': job_ids,
                     'job_name': self.job_name,
                     'status': job_response.get('jobStatus'),
                     'created_at': job_response.get('createdAt'),
                     'completed_at': job_response.get('lastRunTime')
                 },
                 'statistics': job_response.get('statistics', {}),
+                'shards': [
+                    {
+                        'job_id': response.get('jobId', shard_id),
+                        'job_name': response.get('name'),
+                        'status': response.get('jobStatus'),
+                        'statistics': response.get('statistics', {})
+                    }
+                    for shard_id, response in zip(job_ids, responses)
+                ] if len(job_ids) > 1 else [],
+                'sampling': self.sampling,
                 'findings_summary': {
                     'total_findings': len(findings_response.get('findingIds', [])),
                     'finding_ids': findings_response.get('findingIds', [])
@@ -481,6 +1372,8 @@ class LokiMaciePipeline:
                 'scan_scope': {
                     'bucket': self.scan_bucket,
                     'prefix': f"{self.s3_prefix}/{self.date_partition}/",
+                    'prefixes': self.scan_prefixes or [f"{self.s3_prefix}/{self.date_partition}/"],
+                    'partition_by': self._partition_by(),
                     'date_partition': self.date_partition
                 }
             }
@@ -522,66 +1415,670 @@ class LokiMaciePipeline:
             logger.error(f"分析Macie结果失败: {e}")
             raise
     
-    def run_complete_pipeline(self, chunk_dir: str = './lokichunk', output_dir: str = './extracted_texts'):
+    def _open_state(self, chunk_dir: str, output_dir: str, streaming: bool,
+                    time_window: Optional[Tuple[datetime, datetime]], resume: Optional[str],
+                    chunk_files: Optional[List[str]] = None, create_job: bool = True) -> Dict:
+        """
+        创建本次运行的状态文件，或恢复之前中断的运行 (resume 为作业名称，空字符串表示最近一次未完成的运行)
+        返回运行参数，恢复时使用原运行的参数、时间戳和作业名称 (S3分区和对象键与原运行一致)
+        """
+        state_directory = self.config['processing'].get('state_directory', './pipeline_state')
+        if resume is None:
+            run = {
+                'timestamp': self.timestamp.timestamp(),
+                'chunk_dir': chunk_dir,
+                'output_dir': output_dir,
+                'streaming': streaming,
+                'time_window': [t.timestamp() for t in time_window] if time_window else None,
+                'chunk_files': [str(c) for c in chunk_files] if chunk_files is not None else None,
+                'create_job': create_job
+            }
+            self.state = PipelineState.create(state_directory, self.job_name, run)
+            logger.info(f"运行状态文件: {self.state.state_file}")
+            return run
+        
+        state_file = PipelineState.find(state_directory, resume or None)
+        if state_file is None:
+            raise ValueError(f"没有找到可恢复的运行状态: {resume or state_directory}")
+        self.state = PipelineState.load(state_file)
+        run = self.state.run
+        self.timestamp = datetime.fromtimestamp(run['timestamp'], timezone.utc)
+        self.date_partition = self.timestamp.strftime('%Y/%m/%d')
+        self.job_name = run['job_name']
+        logger.info(f"🔁 恢复运行: {self.job_name} (状态文件 {state_file}, "
+                    f"已完成阶段: {', '.join(self.state.stages) or '无'})")
+        return run
+    
+    def _timed(self, stage: str):
+        """统计阶段耗时 (未启用指标时不做任何事)"""
+        return self.metrics.timed(stage) if self.metrics else nullcontext()
+    
+    def _record_item_metrics(self, stage: str, **kwargs):
+        if self.metrics:
+            self.metrics.record_item(stage, **kwargs)
+    
+    def _record_poller_stats(self, stage: str, poller: MacieJobPoller):
+        if self.metrics:
+            self.metrics.add(stage, retries=poller.stats['retries'], errors=poller.stats['errors'])
+    
+    def _write_metrics(self, status: str, **details):
+        """
+        写出JSON运行摘要 (metrics.summary_directory/<作业名称>.metrics.json)
+        和Prometheus textfile collector指标文件 (metrics.prometheus_textfile，未配置时不写)
+        """
+        metrics_config = self.config.get('metrics') or {}
+        try:
+            summary_directory = metrics_config.get('summary_directory', './pipeline_metrics')
+            if summary_directory:
+                summary_file = self.metrics.write_summary(
+                    Path(summary_directory) / f"{self.job_name}.metrics.json", status, **details)
+                logger.info(f"📈 运行指标摘要: {summary_file}")
+            if metrics_config.get('prometheus_textfile'):
+                textfile = self.metrics.write_prometheus(metrics_config['prometheus_textfile'], status)
+                logger.info(f"📈 Prometheus指标文件: {textfile}")
+        except Exception as e:
+            logger.warning(f"写出运行指标失败: {e}")
+        for name, stage in self.metrics.stages.items():
+            logger.info(f"   阶段 {name}: {stage['seconds']:.1f} 秒, {stage['items']} 成功, {stage['skipped']} 跳过, "
+                        f"{stage['failed']} 失败, {stage['bytes_in']:,} -> {stage['bytes_out']:,} 字节")
+    
+    def _run_stage(self, stage: str, func):
+        """运行一个阶段并记录其输出；恢复运行时已完成的阶段直接返回记录的输出"""
+        if self.state.stage_done(stage):
+            logger.info(f"⏭️ 阶段已完成，跳过: {stage}")
+            return self.state.stages[stage]
+        with self._timed(stage):
+            value = func()
+        self.state.complete_stage(stage, value)
+        return value
+    
+    def _overlap_options(self) -> Optional[Dict]:
+        """阶段重叠执行配置 (processing.overlap)，未启用时返回None"""
+        overlap = self.config['processing'].get('overlap') or {}
+        if not overlap.get('enabled', False):
+            return None
+        return {'queue_size': int(overlap.get('queue_size', DEFAULT_QUEUE_SIZE))}
+    
+    def _overlap_stage(self, stage: str, func) -> Tuple[str, Any]:
+        """
+        包装为流水线阶段: 统计耗时，输入结束后记录阶段输出 (恢复运行时从最后完成的阶段继续)
+        重叠执行时阶段耗时包含等待上游输入和下游队列的时间，各阶段的耗时相互重叠
+        """
+        def run(items):
+            outputs = []
+            with self._timed(stage):
+                for output in func(items):
+                    outputs.append(output)
+                    yield output
+            if not self.state.stage_done(stage):
+                self.state.complete_stage(stage, outputs)
+        return stage, run
+    
+    def _run_overlapped(self, chunk_dir: str, output_dir: str, workers: Optional[int],
+                        chunk_files: Optional[List[str]], queue_size: int, upload: bool = True) -> List[str]:
+        """
+        提取、去重、预过滤、打包和上传各在一个线程中运行，阶段之间通过有界队列逐个传递文件:
+        第一个chunk提取完成后即开始上传，下游处理不过来时上游阻塞 (背压)，内存中缓冲的文件数有上限
+        恢复运行时跳过已完成的阶段，从最后完成阶段记录的输出继续 (上传阶段总是运行，以恢复已上传的对象)
+        返回最后一个阶段的输出 (上传的S3键，不上传时为文本文件)
+        """
+        processing = self.config['processing']
+        extract_workers = prefilter_workers = self._resolve_workers(workers)
+        if self._prefilter_options() is not None and not self.state.stage_done('extract'):
+            # 提取和预过滤的进程池同时运行，两者分摊 workers 个工作进程 (总进程数不超过配置)
+            extract_workers = max(1, extract_workers // 2)
+            prefilter_workers = max(1, prefilter_workers - extract_workers)
+            logger.info(f"提取与预过滤同时运行，工作进程分配: 提取 {extract_workers}, 预过滤 {prefilter_workers}")
+        stages = [self._overlap_stage('extract', lambda items: self.iter_extracted_texts(
+            chunk_dir, output_dir, workers=extract_workers, chunk_files=items))]
+        if (processing.get('dedup') or {}).get('enabled', False):
+            stages.append(self._overlap_stage('dedup', lambda items: self.iter_deduped_texts(items, output_dir)))
+        if self._prefilter_options() is not None:
+            stages.append(self._overlap_stage('prefilter', lambda items: self.iter_prefiltered_texts(
+                items, output_dir, workers=prefilter_workers)))
+        if (processing.get('bundle') or {}).get('enabled', False):
+            stages.append(self._overlap_stage('bundle', lambda items: self.iter_bundled_texts(items, output_dir)))
+        
+        source = chunk_files if chunk_files is not None else self._iter_chunk_files(Path(chunk_dir))
+        for index in range(len(stages) - 1, -1, -1):
+            if self.state.stage_done(stages[index][0]):
+                logger.info(f"⏭️ 阶段已完成，跳过: {', '.join(name for name, _ in stages[:index + 1])}")
+                source = self.state.stages[stages[index][0]]
+                stages = stages[index + 1:]
+                break
+        if upload:
+            stages.append(self._overlap_stage('upload', self.iter_uploaded_keys))
+        if not stages:
+            return list(source)
+        
+        logger.info(f"重叠执行阶段: {' -> '.join(name for name, _ in stages)} (阶段间队列 {queue_size} 项)")
+        pipeline = StagePipeline(stages, queue_size)
+        outputs = list(pipeline.run(source))
+        for name, _ in stages[:-1]:
+            logger.info(f"   阶段 {name} 输出队列最多积压 {pipeline.max_queued[name]} 项")
+        return outputs
+    
+    def _overlap_stop_status(self) -> Optional[str]:
+        """重叠执行后按各阶段记录的输出判断是否提前结束 (与逐阶段执行时的判断一致)"""
+        stages = self.state.stages
+        if not stages.get('extract'):
+            logger.error("❌ 没有成功提取任何文件，终止流程")
+            return 'no_files'
+        if 'dedup' in stages and not stages['dedup']:
+            logger.error("❌ 去重后没有需要上传的文件，终止流程")
+            return 'no_files'
+        if 'prefilter' in stages and not stages['prefilter']:
+            logger.info("✅ 预过滤未发现任何候选敏感行，无需创建Macie作业")
+            return 'no_candidates'
+        return None
+    
+    def _start_macie_check(self) -> Future:
+        """在后台线程中检查 (必要时启用) Macie服务，与提取和上传同时进行"""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='macie-check')
+        future = executor.submit(self.ensure_macie_enabled)
+        executor.shutdown(wait=False)
+        return future
+    
+    def run_complete_pipeline(self, chunk_dir: str = './lokichunk', output_dir: str = './extracted_texts',
+                              workers: Optional[int] = None, streaming: Optional[bool] = None,
+                              time_window: Optional[Tuple[datetime, datetime]] = None,
+                              resume: Optional[str] = None, wait: bool = False,
+                              sampling_percentage: Optional[int] = None, extract_only: Optional[bool] = None,
+                              chunk_files: Optional[List[str]] = None, create_job: bool = True):
         """
         运行完整的分析管道
+        time_window: 只扫描该日志时间窗口内的分区 (需要按日志时间分区)
+        resume: 恢复中断的运行 (作业名称，空字符串表示最近一次未完成的运行)，从第一个未完成的项目继续
+        wait: 创建作业后等待其完成并生成分析报告
+        sampling_percentage: 指定采样比例，不按预算自适应选择
+        extract_only: 只提取 (及去重、预过滤、打包) 到本地文本文件，不上传也不创建作业 (默认按初始化参数)
+        chunk_files: 只处理这些chunk，不遍历chunk目录 (持续监控模式的微批)
+        create_job: 为False时上传后结束本次运行，由调用方稍后统一创建Macie作业
         """
+        if extract_only is None:
+            extract_only = self.extract_only
+        if streaming is None:
+            streaming = self.config['processing'].get('streaming_upload', False) and not extract_only
+        if streaming and extract_only:
+            logger.warning("只提取模式不上传，忽略流式上传设置")
+            streaming = False
+        overlap = self._overlap_options()
+        if overlap is not None and streaming:
+            logger.info("流式上传中提取和上传已经重叠执行，忽略阶段重叠设置")
+            overlap = None
+        
+        run = self._open_state(chunk_dir, output_dir, streaming, time_window, resume, chunk_files, create_job)
+        chunk_dir, output_dir, streaming = run['chunk_dir'], run['output_dir'], run['streaming']
+        chunk_files, create_job = run.get('chunk_files'), run.get('create_job', True)
+        if run['time_window']:
+            time_window = tuple(datetime.fromtimestamp(t, timezone.utc) for t in run['time_window'])
+        
         logger.info("🚀 开始运行Loki Macie分析管道")
+        logger.info(f"作业名称: {self.job_name}")
         logger.info(f"Chunk目录: {chunk_dir}")
         logger.info(f"输出目录: {output_dir}")
-        logger.info(f"扫描存储桶: {self.scan_bucket}")
-        logger.info(f"结果存储桶: {self.results_bucket}")
-        logger.info(f"时间分区: {self.date_partition}")
+        if extract_only:
+            logger.info("只提取模式: 不上传也不创建Macie作业")
+        else:
+            logger.info(f"扫描存储桶: {self.scan_bucket}")
+            logger.info(f"结果存储桶: {self.results_bucket}")
+        if self._partition_by() == 'log_time':
+            logger.info("时间分区: 按chunk日志时间 (YYYY/MM/DD/HH)")
+        else:
+            logger.info(f"时间分区: {self.date_partition}")
         
+        failed = False
+        final_status = None
+        macie_check = None
         try:
-            # 步骤1: 提取Loki chunk文件为文本
-            logger.info("📝 步骤1: 提取Loki chunk文件")
-            text_files = self.extract_loki_chunks_to_text(chunk_dir, output_dir)
+            if self.state.finished:
+                logger.info(f"✅ 该运行已结束 ({self.state.finished['status']})，无需恢复")
+                job_id = self.state.finished.get('job_id')
+                if self.state.finished['status'] == 'extracted':
+                    return {'status': 'extracted', 'output_dir': output_dir}
+                if self.state.finished['status'] == 'uploaded':
+                    return {'status': 'uploaded', 'uploaded_keys': self.state.finished.get('uploaded_keys', [])}
+                if not job_id:
+                    return None
+                result = {'job_id': job_id, 'status': self.state.finished['status']}
+                if self.state.finished.get('job_ids'):
+                    result['job_ids'] = self.state.finished['job_ids']
+                return result
             
-            if not text_files:
-                logger.error("❌ 没有成功提取任何文件，终止流程")
-                return None
+            self.metrics = PipelineMetrics(self.job_name)
             
-            # 步骤2: 上传到S3
-            logger.info("☁️ 步骤2: 上传文件到S3")
-            uploaded_keys = self.upload_to_s3_with_partition(text_files)
+            if streaming:
+                # 步骤1+2: 流式提取并直接上传到S3，不写本地文本文件
+                logger.info("📝☁️ 步骤1-2: 流式提取Loki chunk并上传到S3")
+                with self._timed('stream'):
+                    uploaded_keys = self.stream_chunks_to_s3(chunk_dir, workers=workers, chunk_files=chunk_files)
+                if not self.state.stage_done('stream'):
+                    self.state.complete_stage('stream', uploaded_keys)
+            elif overlap is not None:
+                # 步骤1+2: 提取、去重/预过滤/打包和上传重叠执行；Macie作业仍在全部上传完成后创建 (作业只扫描创建时已有的对象)
+                logger.info("🔀 步骤1-2: 重叠执行提取、转换和上传")
+                if create_job and not extract_only and not self.state.stage_done('macie_job'):
+                    macie_check = self._start_macie_check()
+                outputs = self._run_overlapped(chunk_dir, output_dir, workers, chunk_files, overlap['queue_size'],
+                                               upload=not extract_only)
+                stop_status = self._overlap_stop_status()
+                if stop_status:
+                    self.state.finish(stop_status)
+                    return None
+                if extract_only:
+                    logger.info(f"✅ 只提取模式完成: {len(outputs)} 个文本文件位于 {output_dir}")
+                    self.state.finish('extracted')
+                    final_status = 'extracted'
+                    return {'status': 'extracted', 'output_dir': output_dir, 'text_files': outputs}
+                uploaded_keys = outputs
+            else:
+                # 步骤1: 提取Loki chunk文件为文本
+                logger.info("📝 步骤1: 提取Loki chunk文件")
+                text_files = self._run_stage(
+                    'extract', lambda: self.extract_loki_chunks_to_text(chunk_dir, output_dir, workers=workers,
+                                                                        chunk_files=chunk_files))
+                
+                if not text_files:
+                    logger.error("❌ 没有成功提取任何文件，终止流程")
+                    self.state.finish('no_files')
+                    return None
+                
+                # 可选: 跨chunk去重，每个不同的日志行只上传一次
+                if (self.config['processing'].get('dedup') or {}).get('enabled', False):
+                    logger.info("🧹 步骤1.5: 跨chunk日志行去重")
+                    text_files = self._run_stage('dedup', lambda: self.dedup_text_files(text_files, output_dir))
+                    if not text_files:
+                        logger.error("❌ 去重后没有需要上传的文件，终止流程")
+                        self.state.finish('no_files')
+                        return None
+                
+                # 可选: 本地预过滤，只上传候选敏感行
+                if self._prefilter_options() is not None:
+                    logger.info("🔎 步骤1.6: 本地预过滤候选敏感行")
+                    text_files = self._run_stage(
+                        'prefilter', lambda: self.prefilter_text_files(text_files, output_dir, workers=workers))
+                    if not text_files:
+                        logger.info("✅ 预过滤未发现任何候选敏感行，无需创建Macie作业")
+                        self.state.finish('no_candidates')
+                        return None
+                
+                # 可选: 小文件打包为接近目标大小的对象
+                if (self.config['processing'].get('bundle') or {}).get('enabled', False):
+                    logger.info("📦 步骤1.7: 打包提取文件")
+                    text_files = self._run_stage('bundle', lambda: self.bundle_text_files(text_files, output_dir))
+                
+                if extract_only:
+                    logger.info(f"✅ 只提取模式完成: {len(text_files)} 个文本文件位于 {output_dir}")
+                    self.state.finish('extracted')
+                    final_status = 'extracted'
+                    return {'status': 'extracted', 'output_dir': output_dir, 'text_files': text_files}
+                
+                # 步骤2: 上传到S3
+                logger.info("☁️ 步骤2: 上传文件到S3")
+                with self._timed('upload'):
+                    uploaded_keys = self.upload_to_s3_with_partition(text_files)
+                if not self.state.stage_done('upload'):
+                    self.state.complete_stage('upload', uploaded_keys)
             
             if not uploaded_keys:
-                logger.error("❌ 没有成功上传任何文件，终止流程")
+                if self.unchanged_scanned_at:
+                    logger.info("✅ 所有对象内容均未变化且已被Macie作业扫描，无需重新扫描")
+                    self.state.finish('unchanged')
+                else:
+                    logger.error("❌ 没有成功上传任何文件，终止流程")
+                    self.state.finish('no_uploads')
                 return None
             
-            # 步骤3: 确保Macie已启用
-            logger.info("🔍 步骤3: 检查Macie服务")
-            if not self.ensure_macie_enabled():
-                logger.error("❌ Macie服务启用失败，终止流程")
-                return None
+            if not create_job:
+                logger.info(f"✅ 上传完成: {len(uploaded_keys)} 个对象，稍后统一创建Macie作业")
+                self.state.finish('uploaded', uploaded_keys=uploaded_keys)
+                final_status = 'uploaded'
+                return {'status': 'uploaded', 'uploaded_keys': uploaded_keys}
             
-            # 步骤4: 创建Macie作业
-            logger.info("⚙️ 步骤4: 创建Macie分类作业")
-            job_id = self.create_macie_job(uploaded_keys)
+            job_ids = None
+            shard_responses = {}
+            if self.state.stage_done('macie_job'):
+                job_id = self.state.stages['macie_job']
+                if isinstance(job_id, list):
+                    job_ids, job_id = job_id, job_id[0]
+                    self.scan_prefixes = sorted(p for shard in self.state.stages['shard_plan'] for p in shard['prefixes'])
+                self.sampling = self.state.stages.get('sampling')
+                logger.info(f"⏭️ Macie作业已创建，跳过: {', '.join(job_ids or [job_id])}")
+            else:
+                # 步骤3: 确保Macie已启用
+                logger.info("🔍 步骤3: 检查Macie服务")
+                with self._timed('macie_enable'):
+                    macie_enabled = macie_check.result() if macie_check else self.ensure_macie_enabled()
+                if not macie_enabled:
+                    logger.error("❌ Macie服务启用失败，终止流程")
+                    return None
+                
+                # 步骤4: 创建Macie作业 (扫描量较大且配置了分片时拆分为多个作业)
+                # 有未变化而跳过的对象时，只扫描最近一次扫描它们的作业创建之后修改的对象 (本次上传的对象都比它新)
+                modified_after = max(self.unchanged_scanned_at) if self.unchanged_scanned_at else None
+                shards = self._run_stage('shard_plan', lambda: self._plan_shards(time_window))
+                self.sampling = self._run_stage('sampling', lambda: self._plan_sampling(shards, sampling_percentage))
+                if not shards:
+                    logger.info("⚙️ 步骤4: 创建Macie分类作业")
+                    with self._timed('macie_job'):
+                        job_id = self.create_macie_job(uploaded_keys, modified_after=modified_after,
+                                                       time_window=time_window)
+                    self.state.complete_stage('macie_job', job_id)
+                else:
+                    logger.info(f"⚙️ 步骤4: 创建 {len(shards)} 个Macie分片作业")
+                    # 分片数超过并发上限时包含等待前面作业结束的排队时间
+                    with self._timed('macie_job'):
+                        shard_responses = self.create_sharded_macie_jobs(shards, modified_after=modified_after,
+                                                                         wait=wait)
+                    job_ids = list(shard_responses)
+                    job_id = job_ids[0]
+                    self.state.complete_stage('macie_job', job_ids)
             
             # 🎯 关键变更：获得job ID后直接返回命令行，不等待完成
             logger.info("✅ Macie作业创建成功！")
+            self.state.finish('job_created', job_id=job_id, job_ids=job_ids)
             
-            # 生成分析命令
-            analyze_command = f"python3 analyze_macie_results.py --job-id {job_id} --region {self.region}"
+            # 生成分析命令 (分片作业的结果合并分析)
+            job_args = ' '.join(f"--job-id {i}" for i in job_ids or [job_id])
+            analyze_command = f"python3 analyze_macie_results.py {job_args} --region {self.region}"
             if self.profile:
                 analyze_command += f" --profile {self.profile}"
             
             # 打印结果摘要
-            self.print_job_created_summary(job_id, analyze_command)
+            self.print_job_created_summary(job_id, analyze_command, job_ids)
             
-            return {
+            result = {
                 'job_id': job_id,
                 'analyze_command': analyze_command,
                 'status': 'job_created'
             }
+            if job_ids:
+                result['job_ids'] = job_ids
+            
+            # 可选: 等待作业完成并生成分析报告
+            if wait:
+                logger.info("⏳ 步骤5: 等待Macie作业完成")
+                with self._timed('macie_wait'):
+                    if job_ids:
+                        # 提交分片时已等待结束的作业不再轮询
+                        pending = [i for i in job_ids if not shard_responses.get(i)]
+                        if pending:
+                            shard_responses.update(self.wait_for_jobs_completion(
+                                pending, self.config['macie']['max_wait_minutes']))
+                        response = merge_job_statistics([shard_responses[i] for i in job_ids])
+                    else:
+                        response = self.wait_for_job_completion(
+                            job_id, self.config['macie']['max_wait_minutes'], total_objects=len(uploaded_keys))
+                result['job_status'] = response.get('jobStatus')
+                if response.get('jobStatus') == 'COMPLETE':
+                    logger.info("📊 步骤6: 分析Macie扫描结果")
+                    with self._timed('analyze'):
+                        analysis_report = self.analyze_macie_results(job_id, shard_job_ids=job_ids)
+                    self.print_pipeline_summary(analysis_report)
+                    result['status'] = 'job_complete'
+            
+            final_status = result['status']
+            return result
             
         except Exception as e:
+            failed = True
             logger.error(f"❌ 管道执行失败: {e}")
+            logger.error(f"可使用 --resume {self.job_name} 从中断处继续")
             raise
+        finally:
+            if self.metrics:
+                finished = self.state.finished or {}
+                status = final_status or finished.get('status') or ('failed' if failed else 'incomplete')
+                self._write_metrics(status, job_id=finished.get('job_id'), job_ids=finished.get('job_ids'),
+                                    uploaded_objects=len(self.object_sizes),
+                                    uploaded_bytes=sum(self.object_sizes.values()),
+                                    sampling_percentage=self.sampling['percentage'] if self.sampling else None)
+            self.state.close()
+    
+    def _watch_options(self) -> Dict:
+        """持续监控配置 (processing.watch)"""
+        return self.config['processing'].get('watch') or {}
+    
+    def _watch_window_file(self) -> Path:
+        state_directory = self.config['processing'].get('state_directory', './pipeline_state')
+        return Path(state_directory) / 'watch_window.json'
+    
+    def _load_watch_window(self) -> Dict:
+        """
+        尚未被Macie作业扫描的上传窗口: 起始时间、对象所在分区、对象数和字节数
+        持久化在状态目录中，进程异常退出后重启时继续为之前上传的对象创建作业
+        """
+        window = {'since': datetime.now(timezone.utc), 'partitions': set(), 'objects': 0, 'bytes': 0}
+        window_file = self._watch_window_file()
+        if window_file.exists():
+            with open(window_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            window.update(since=datetime.fromtimestamp(data['since'], timezone.utc),
+                          partitions=set(data['partitions']), objects=data['objects'], bytes=data['bytes'])
+            if window['objects']:
+                logger.info(f"🔁 上次运行中 {window['objects']} 个已上传对象尚未创建Macie作业")
+        return window
+    
+    def _save_watch_window(self, window: Dict):
+        window_file = self._watch_window_file()
+        window_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = window_file.with_name(window_file.name + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'since': window['since'].timestamp(), 'partitions': sorted(window['partitions']),
+                       'objects': window['objects'], 'bytes': window['bytes']}, f, indent=2)
+        os.replace(tmp_file, window_file)
+    
+    def _watch_selected(self, chunk_file: Path, chunk_path: Path) -> bool:
+        """监控事件中的文件是否满足chunk目录遍历的过滤条件"""
+        processing = self.config['processing']
+        return chunk_file_matches(
+            chunk_file,
+            chunk_path,
+            tenants=processing.get('tenants'),
+            pattern=processing.get('path_pattern'),
+            min_size=processing.get('min_chunk_size', 0),
+            max_size=processing.get('max_chunk_size'),
+            recursive=processing.get('recursive', True)
+        )
+    
+    def _unprocessed_chunks(self, chunk_files: Iterable[Path], chunk_path: Path, streaming: bool,
+                            stats: Dict) -> List[Path]:
+        """按增量清单筛选尚未处理 (或已提取未上传) 的chunk"""
+        pending = list(self.manifest.iter_pending(chunk_files, stats, streaming=streaming))
+        root = os.path.abspath(str(chunk_path))
+        for output_file in stats['reusable_outputs']:
+            # 与遍历目录时的路径形式一致 (输出文件名按相对chunk根目录的路径生成)
+            pending.extend(chunk_path / os.path.relpath(chunk, root)
+                           for chunk in self.manifest.chunks_for_output(output_file))
+        return pending
+    
+    def _watch_backlog(self, chunk_path: Path, streaming: bool) -> List[Path]:
+        """启动前已写入但尚未处理的chunk，需要增量清单识别"""
+        if not self.manifest:
+            logger.warning("未配置 manifest_file: 启动前已存在的chunk不处理，只处理之后写入的chunk")
+            return []
+        stats = {}
+        backlog = self._unprocessed_chunks(self._iter_chunk_files(chunk_path), chunk_path, streaming, stats)
+        logger.info(f"启动前的chunk: {len(backlog)} 个待处理, {stats['skipped']} 个已处理")
+        return backlog
+    
+    def _run_watch_batch(self, chunk_files: List[Path], chunk_dir: str, output_dir: str, workers: Optional[int],
+                         streaming: bool, extract_only: bool, window: Dict, summary: Dict) -> bool:
+        """
+        把一个微批作为一次运行完成提取和上传，上传的对象计入待扫描窗口
+        返回是否成功，失败时由调用方把这些chunk放回微批重试
+        """
+        if self.manifest:
+            # 同一个chunk可能先由补扫、再由监控事件报告 (或只是touch)，已处理且内容未变化的不再处理
+            chunk_files = self._unprocessed_chunks(chunk_files, Path(chunk_dir), streaming, {})
+            if not chunk_files:
+                logger.info("⏭️ 微批中的chunk均已处理，跳过")
+                return True
+        summary['batches'] += 1
+        self._begin_run('loki-watch', sequence=summary['batches'])
+        logger.info(f"📦 微批 {self.job_name}: {len(chunk_files)} 个chunk")
+        started = time.monotonic()
+        try:
+            result = self.run_complete_pipeline(chunk_dir, output_dir, workers=workers, streaming=streaming,
+                                                extract_only=extract_only, chunk_files=chunk_files, create_job=False)
+        except Exception as e:
+            # 未处理的chunk不计入增量清单，放弃重试后重启时仍会作为启动前的chunk重新处理
+            logger.error(f"❌ 微批失败 {self.job_name}: {e}")
+            summary['failed_batches'] += 1
+            return False
+        summary['chunks'] += len(chunk_files)
+        uploaded_keys = (result or {}).get('uploaded_keys') or []
+        if uploaded_keys:
+            summary['uploaded_objects'] += len(uploaded_keys)
+            window['objects'] += len(uploaded_keys)
+            window['bytes'] += sum(self.object_sizes.values())
+            window['partitions'].update(self.scan_partitions)
+            self._save_watch_window(window)
+        logger.info(f"✅ 微批完成: {self.job_name}, {len(uploaded_keys)} 个对象待扫描, "
+                    f"耗时 {time.monotonic() - started:.1f} 秒")
+        return True
     
-    def print_job_created_summary(self, job_id: str, analyze_command: str):
+    def _create_watch_job(self, window: Dict, summary: Dict):
+        """
+        为上一个作业之后上传的对象创建Macie作业 (扫描窗口内写入的分区，只扫描窗口开始后修改的对象)
+        创建失败时保留窗口，下个周期重试
+        """
+        if not window['objects']:
+            return
+        window_end = datetime.now(timezone.utc)
+        job_name = f"loki-watch-scan-{window_end.strftime('%Y%m%d-%H%M%S')}"
+        scan_prefixes = [f"{self.s3_prefix}/{partition}/"
+                         for partition in collapse_partitions(window['partitions'], MAX_SCOPE_PREFIXES)]
+        logger.info(f"⚙️ 为 {window['objects']} 个对象 ({window['bytes']:,} 字节) 创建Macie作业: {job_name}")
+        try:
+            if not self.ensure_macie_enabled():
+                logger.error("❌ Macie服务不可用，下个周期重试")
+                return
+            # S3对象的最后修改时间精确到秒，向前留1秒余量: 边界上的对象宁可重复扫描也不遗漏
+            job_id = self.create_macie_job([], modified_after=window['since'] - timedelta(seconds=1),
+                                           scan_prefixes=scan_prefixes, job_name=job_name)
+        except Exception as e:
+            logger.error(f"❌ 创建Macie作业失败，下个周期重试: {e}")
+            return
+        summary['job_ids'].append(job_id)
+        window.update(since=window_end, partitions=set(), objects=0, bytes=0)
+        self._save_watch_window(window)
+        analyze_command = f"python3 analyze_macie_results.py --job-id {job_id} --region {self.region}"
+        if self.profile:
+            analyze_command += f" --profile {self.profile}"
+        logger.info(f"🔍 查看结果: {analyze_command}")
+    
+    def _install_stop_handlers(self, stop_event: threading.Event) -> Dict:
+        """SIGINT/SIGTERM 设置停止标志 (处理完当前微批后退出)，再次收到时立即中断；只能在主线程中安装"""
+        if threading.current_thread() is not threading.main_thread():
+            return {}
+        
+        def handle(signum, frame):
+            if stop_event.is_set():
+                raise KeyboardInterrupt
+            logger.info(f"收到信号 {signal.Signals(signum).name}，处理完剩余的chunk后退出 (再次发送立即中断)")
+            stop_event.set()
+        
+        return {signum: signal.signal(signum, handle) for signum in (signal.SIGINT, signal.SIGTERM)}
+    
+    def watch_chunks(self, chunk_dir: str, output_dir: str, workers: Optional[int] = None,
+                     streaming: Optional[bool] = None, extract_only: Optional[bool] = None,
+                     stop_event: Optional[threading.Event] = None) -> Dict:
+        """
+        持续监控模式: 监听chunk目录，新写完的chunk按数量或等待时间聚合为微批，
+        每个微批作为一次运行完成提取 (及去重、预过滤、打包) 和上传；
+        Macie作业按 job_interval_minutes 周期创建，只扫描上一个作业之后上传的对象
+        收到SIGINT/SIGTERM或 stop_event 被设置后处理完剩余的chunk、为未扫描的对象创建最后一个作业后返回
+        """
+        if self.config['processing'].get('catalog_select') is not None:
+            raise ValueError("持续监控模式不支持从chunk目录选择chunk")
+        if extract_only is None:
+            extract_only = self.extract_only
+        if streaming is None:
+            streaming = self.config['processing'].get('streaming_upload', False) and not extract_only
+        options = self._watch_options()
+        chunk_path = Path(chunk_dir)
+        poll_interval = float(options.get('poll_interval_seconds', DEFAULT_POLL_INTERVAL))
+        settle_seconds = float(options.get('settle_seconds', DEFAULT_SETTLE_SECONDS))
+        job_interval = float(options.get('job_interval_minutes', DEFAULT_JOB_INTERVAL_MINUTES)) * 60
+        batcher = MicroBatcher(int(options.get('batch_max_chunks', DEFAULT_BATCH_MAX_CHUNKS)),
+                               float(options.get('batch_max_age_seconds', DEFAULT_BATCH_MAX_AGE)),
+                               int(options.get('batch_max_attempts', DEFAULT_BATCH_MAX_ATTEMPTS)),
+                               float(options.get('retry_backoff_seconds', DEFAULT_RETRY_BACKOFF)),
+                               float(options.get('max_retry_backoff_seconds', DEFAULT_MAX_RETRY_BACKOFF)))
+        
+        logger.info(f"👀 持续监控: {chunk_dir} (微批最多 {batcher.max_chunks} 个chunk / 最长等待 "
+                    f"{batcher.max_age_seconds:g} 秒"
+                    + ("，只提取不上传)" if extract_only else f"，每 {job_interval / 60:g} 分钟创建Macie作业)"))
+        stop_event = stop_event or threading.Event()
+        previous_handlers = self._install_stop_handlers(stop_event)
+        window = self._load_watch_window() if not extract_only else None
+        summary = {'status': 'stopped', 'batches': 0, 'failed_batches': 0, 'chunks': 0,
+                   'abandoned_chunks': 0, 'uploaded_objects': 0, 'job_ids': []}
+        
+        def run_batch(batch: List[Path], retry: bool = True):
+            if self._run_watch_batch(batch, chunk_dir, output_dir, workers, streaming, extract_only, window, summary):
+                batcher.done(batch)
+                return
+            abandoned = batcher.retry(batch) if retry else batch
+            if len(abandoned) < len(batch):
+                logger.info(f"🔁 {len(batch) - len(abandoned)} 个chunk稍后重试")
+            if abandoned:
+                # 不计入增量清单，重启后作为启动前的chunk重新处理
+                summary['abandoned_chunks'] += len(abandoned)
+                logger.error(f"❌ 放弃 {len(abandoned)} 个chunk (重启后重新处理): "
+                             f"{', '.join(str(c) for c in abandoned[:5])}" + (' ...' if len(abandoned) > 5 else ''))
+        
+        # 先建立监听再补扫，补扫期间写完的chunk不会遗漏 (重复的由微批和增量清单去重)
+        watcher = create_watcher(chunk_path, options.get('mode', 'auto'), poll_interval, settle_seconds)
+        try:
+            batcher.add(self._watch_backlog(chunk_path, streaming))
+            next_job_at = time.monotonic() + job_interval
+            while not stop_event.is_set():
+                now = time.monotonic()
+                waits = [1.0, next_job_at - now, batcher.time_until_ready(now)]
+                changed = watcher.poll(min(w for w in waits if w is not None))
+                batcher.add(c for c in changed if self._watch_selected(c, chunk_path))
+                
+                if watcher.degraded:
+                    logger.warning("inotify无法监听全部目录，改为定期扫描")
+                    watcher.close()
+                    watcher = PollingWatcher(chunk_path, poll_interval, settle_seconds, report_existing=True)
+                
+                if batcher.ready():
+                    batcher.release_retries()
+                    logger.info(f"最早的chunk已等待 {batcher.oldest_age():.1f} 秒")
+                    run_batch(batcher.take())
+                if time.monotonic() >= next_job_at:
+                    if not extract_only:
+                        self._create_watch_job(window, summary)
+                    next_job_at = time.monotonic() + job_interval
+            
+            logger.info("停止监控: 处理剩余的chunk")
+            # 等待重试的chunk不再等待退避时间，停止前只再尝试一次
+            batcher.release_retries(math.inf)
+            while len(batcher):
+                run_batch(batcher.take(), retry=False)
+            if not extract_only:
+                self._create_watch_job(window, summary)
+        finally:
+            watcher.close()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        
+        logger.info(f"✅ 持续监控结束: {summary['batches']} 个微批 ({summary['failed_batches']} 个失败), "
+                    f"{summary['chunks']} 个chunk ({summary['abandoned_chunks']} 个放弃), 上传 {summary['uploaded_objects']} 个对象, "
+                    f"创建 {len(summary['job_ids'])} 个Macie作业")
+        return summary
+    
+    def _scan_location(self) -> str:
+        """摘要中显示的扫描数据位置"""
+        prefixes = self.scan_prefixes or [f"{self.s3_prefix}/{self.date_partition}/"]
+        if len(prefixes) == 1:
+            return f"s3://{self.scan_bucket}/{prefixes[0]}"
+        return f"s3://{self.scan_bucket}/{prefixes[0]} 等 {len(prefixes)} 个分区"
+    
+    def print_job_created_summary(self, job_id: str, analyze_command: str, job_ids: Optional[List[str]] = None):
         """
         打印作业创建成功的摘要
         """
@@ -591,11 +2088,18 @@ class LokiMaciePipeline:
         
         print(f"📋 作业信息:")
         print(f"   作业ID: {job_id}")
+        if job_ids:
+            print(f"   分片作业: {len(job_ids)} 个 ({', '.join(job_ids)})")
         print(f"   作业名称: {self.job_name}")
         print(f"   创建时间: {self.timestamp.isoformat()}")
+        if self.sampling:
+            print(f"   采样比例: {self.sampling['percentage']}% ({self.sampling['reason']})")
+            if self.sampling['percentage'] < 100:
+                print(f"   采样置信度: 误差 ±{self.sampling['margin_of_error'] * 100:.1f}% (95%), "
+                      f"1%对象含敏感数据时发现概率 {self.sampling['detection_probability'] * 100:.1f}%")
         
         print(f"\n📁 数据位置:")
-        print(f"   扫描数据: s3://{self.scan_bucket}/{self.s3_prefix}/{self.date_partition}/")
+        print(f"   扫描数据: {self._scan_location()}")
         print(f"   结果存储: s3://{self.results_bucket}/loki-analysis/{self.date_partition}/")
         
         print(f"\n⏳ 作业状态:")
@@ -637,7 +2141,7 @@ class LokiMaciePipeline:
         print(f"   敏感数据发现数: {findings.get('total_findings', 0)}")
         
         print(f"\n📁 存储位置:")
-        print(f"   扫描数据: s3://{self.scan_bucket}/{self.s3_prefix}/{self.date_partition}/")
+        print(f"   扫描数据: {self._scan_location()}")
         print(f"   分析结果: s3://{self.results_bucket}/loki-analysis/{self.date_partition}/")
         
         print("="*60)
@@ -649,28 +2153,180 @@ def main():
     parser.add_argument('--region', help='AWS区域 (默认从配置文件读取)')
     parser.add_argument('--profile', help='AWS配置文件名称 (默认从配置文件读取)')
     parser.add_argument('--max-wait', type=int, help='最大等待时间(分钟) (默认从配置文件读取)')
+    parser.add_argument('--shards', type=int,
+                        help='按对象字节数把扫描拆分为最多N个Macie作业 (默认从配置文件读取，未配置时不分片)')
+    parser.add_argument('--max-concurrent-jobs', type=int,
+                        help='同时运行的分片作业数上限 (默认从配置文件读取，未配置时为4)')
+    parser.add_argument('--sampling-percentage', type=int, choices=range(1, 101), metavar='1-100',
+                        help='指定Macie采样比例，不按 sampling_budget 自适应选择')
+    parser.add_argument('--metrics-dir', help='运行指标JSON摘要的输出目录 (默认从配置文件读取，未配置时为 ./pipeline_metrics)')
+    parser.add_argument('--prometheus-textfile',
+                        help='写出Prometheus textfile collector格式的指标文件，如 /var/lib/node_exporter/loki_macie.prom')
+    parser.add_argument('--wait', action='store_true',
+                        help='创建Macie作业后等待其完成并生成分析报告 (默认创建后立即返回)')
     parser.add_argument('--config', default='config.json', help='配置文件路径 (默认: config.json)')
+    parser.add_argument('--workers', type=int, help='并行提取的工作进程数, 0表示使用全部CPU核心 (默认从配置文件读取)')
+    parser.add_argument('--tenant', action='append', help='只处理指定租户目录下的chunk，可重复指定；使用 --from-catalog 时按UserID匹配 (默认从配置文件读取)')
+    parser.add_argument('--selector', help='LogQL风格的标签选择器，如 \'{namespace="payments", app=~"pay.*"}\'，'
+                                           '只解码和上传匹配的chunk (默认从配置文件读取)')
+    parser.add_argument('--path-pattern', help='chunk相对路径的通配符过滤，如 "fake/*/*" (默认从配置文件读取)')
+    parser.add_argument('--catalog', help='chunk元数据目录 (SQLite)，提取时记录每个chunk的元数据 (默认从配置文件读取)')
+    parser.add_argument('--from-catalog', action='store_true',
+                        help='从chunk目录中按 --tenant / --label / --window-start / --window-end 查询选择chunk，不遍历目录')
+    parser.add_argument('--label', action='append', help='与 --from-catalog 一起使用的标签条件 name=value，可重复指定')
+    parser.add_argument('--manifest', help='增量提取清单文件，只处理新增或变更的chunk (默认从配置文件读取)')
+    parser.add_argument('--dedup', action='store_true', default=None,
+                        help='上传前跨chunk去重相同的日志行 (默认从配置文件读取)')
+    parser.add_argument('--compress', action='store_true', default=None,
+                        help='以gzip压缩格式上传扫描对象 (默认从配置文件读取)')
+    parser.add_argument('--compress-level', type=int, choices=range(1, 10), metavar='1-9',
+                        help='gzip压缩级别 1-9 (默认从配置文件读取，未配置时为6)')
+    parser.add_argument('--upload-concurrency', type=int,
+                        help='同时上传的对象数 (默认从配置文件读取，未配置时为8)')
+    parser.add_argument('--bundle', action='store_true', default=None,
+                        help='将提取文件打包为接近目标大小的对象后上传 (默认从配置文件读取)')
+    parser.add_argument('--prefilter', action='store_true', default=None,
+                        help='上传前本地预过滤，只上传候选敏感行及其上下文 (默认从配置文件读取)')
+    parser.add_argument('--partition-by', choices=['log_time', 'run_time'],
+                        help='S3分区方式: log_time 按chunk日志时间(小时), run_time 按运行日期 (默认从配置文件读取)')
+    parser.add_argument('--window-start', help='只扫描该日志时间之后的分区 (UTC)，如 2024-01-01T08')
+    parser.add_argument('--window-end', help='只扫描该日志时间之前的分区 (UTC)，默认为当前时间')
+    parser.add_argument('--resume', nargs='?', const='', metavar='JOB_NAME',
+                        help='恢复中断的运行，从第一个未完成的项目继续 (不指定作业名称时恢复最近一次未完成的运行)')
+    parser.add_argument('--stream-upload', action='store_true', default=None,
+                        help='流式提取并直接分片上传到S3，不生成本地文本文件 (默认从配置文件读取)')
+    parser.add_argument('--overlap-stages', action='store_true', default=None,
+                        help='提取、去重/预过滤/打包和上传各在一个线程中重叠执行，阶段之间通过有界队列传递文件 (默认从配置文件读取)')
+    parser.add_argument('--extract-only', action='store_true',
+                        help='只提取 (及去重、预过滤、打包) 到本地文本文件，不访问AWS')
+    parser.add_argument('--non-interactive', action='store_true',
+                        help='不提示输入: 配置有问题时直接报错退出，不改写配置文件 (标准输入不是终端时自动启用)')
+    parser.add_argument('--watch', action='store_true',
+                        help='持续监控chunk目录，新写入的chunk按微批提取上传，按周期创建Macie作业 (SIGINT/SIGTERM退出)')
+    parser.add_argument('--job-interval', type=float, metavar='MINUTES',
+                        help='持续监控模式下创建Macie作业的周期(分钟) (默认从配置文件读取，未配置时为60)')
     
     args = parser.parse_args()
     
+    if args.extract_only and (args.wait or args.stream_upload):
+        parser.error('--extract-only 不能与 --wait 或 --stream-upload 同时使用')
+    if args.watch and (args.wait or args.resume is not None or args.from_catalog
+                       or args.window_start or args.window_end):
+        parser.error('--watch 不能与 --wait、--resume、--from-catalog 或时间窗口参数同时使用')
+    if args.job_interval is not None and not args.watch:
+        parser.error('--job-interval 需要与 --watch 一起使用')
+    
+    time_window = None
+    if args.window_start or args.window_end:
+        if not args.window_start:
+            parser.error('--window-end 需要同时指定 --window-start')
+        try:
+            window_start = parse_time_arg(args.window_start)
+            window_end = parse_time_arg(args.window_end) if args.window_end else datetime.now(timezone.utc)
+        except ValueError as e:
+            parser.error(str(e))
+        if window_end < window_start:
+            parser.error('--window-end 不能早于 --window-start')
+        time_window = (window_start, window_end)
+    
+    if args.selector:
+        try:
+            parse_selector(args.selector)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    catalog_select = None
+    if args.from_catalog:
+        try:
+            catalog_select = {
+                'tenants': args.tenant,
+                'labels': parse_label_args(args.label),
+                'start': args.window_start,
+                'end': args.window_end
+            }
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.label:
+        parser.error('--label 需要与 --from-catalog 一起使用')
+    
     try:
         # 创建管道实例
         pipeline = LokiMaciePipeline(
             region=args.region, 
             profile=args.profile,
-            config_file=args.config
+            config_file=args.config,
+            manifest_file=args.manifest,
+            catalog_file=args.catalog,
+            interactive=False if args.non_interactive else None,
+            extract_only=args.extract_only
         )
         
+        # 命令行过滤条件覆盖配置文件
+        if args.tenant:
+            pipeline.config['processing']['tenants'] = args.tenant
+        if args.path_pattern:
+            pipeline.config['processing']['path_pattern'] = args.path_pattern
+        if args.selector:
+            pipeline.config['processing']['selector'] = args.selector
+        if catalog_select is not None:
+            pipeline.config['processing']['catalog_select'] = catalog_select
+        if args.dedup:
+            pipeline.config['processing'].setdefault('dedup', {})['enabled'] = True
+        if args.prefilter:
+            pipeline.config['processing'].setdefault('prefilter', {})['enabled'] = True
+        if args.bundle:
+            pipeline.config['processing'].setdefault('bundle', {})['enabled'] = True
+        if args.overlap_stages:
+            pipeline.config['processing'].setdefault('overlap', {})['enabled'] = True
+        if args.compress:
+            pipeline.config['s3'].setdefault('compression', {})['enabled'] = True
+        if args.upload_concurrency:
+            pipeline.config['s3'].setdefault('upload', {})['concurrency'] = args.upload_concurrency
+        if args.compress_level:
+            pipeline.config['s3'].setdefault('compression', {})['level'] = args.compress_level
+        if args.partition_by:
+            pipeline.config['s3']['partition_by'] = args.partition_by
+        if args.max_wait:
+            pipeline.config['macie']['max_wait_minutes'] = args.max_wait
+        if args.metrics_dir:
+            pipeline.config.setdefault('metrics', {})['summary_directory'] = args.metrics_dir
+        if args.prometheus_textfile:
+            pipeline.config.setdefault('metrics', {})['prometheus_textfile'] = args.prometheus_textfile
+        if args.shards:
+            pipeline.config['macie'].setdefault('sharding', {})['shard_count'] = args.shards
+        if args.max_concurrent_jobs:
+            pipeline.config['macie'].setdefault('sharding', {})['max_concurrent_jobs'] = args.max_concurrent_jobs
+        
         # 从配置文件或参数获取设置
         chunk_dir = args.chunk_dir or pipeline.config['processing']['chunk_directory']
         output_dir = args.output_dir or pipeline.config['processing']['output_directory']
         
+        if args.watch:
+            if args.job_interval:
+                pipeline.config['processing'].setdefault('watch', {})['job_interval_minutes'] = args.job_interval
+            if args.sampling_percentage:
+                pipeline.config['macie']['sampling_percentage'] = args.sampling_percentage
+            summary = pipeline.watch_chunks(chunk_dir, output_dir, workers=args.workers,
+                                            streaming=args.stream_upload, extract_only=args.extract_only)
+            return 1 if summary['failed_batches'] else 0
+        
         # 运行完整管道
         result = pipeline.run_complete_pipeline(
             chunk_dir=chunk_dir,
-            output_dir=output_dir
+            output_dir=output_dir,
+            workers=args.workers,
+            streaming=args.stream_upload,
+            time_window=time_window,
+            resume=args.resume,
+            wait=args.wait,
+            sampling_percentage=args.sampling_percentage,
+            extract_only=args.extract_only
         )
         
+        if result and result.get('status') == 'extracted':
+            print(f"\n✅ 提取完成: {result['output_dir']}")
+            print("💡 去掉 --extract-only 重新运行即可上传并创建Macie作业 (配置 manifest_file 时复用已提取的文件)")
+            return 0
         if result:
             print("\n✅ 管道执行成功完成！")
             return 0
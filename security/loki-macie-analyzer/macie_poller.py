@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Macie作业异步轮询
+在一个事件循环中同时跟踪多个分类作业: 按进度自适应调整轮询间隔，被限流时使用带抖动的指数退避，
+根据剩余对象数的变化估算完成时间，每个作业结束时单独完成对应的Future。
+"""
+
+import asyncio
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 作业结束 (不会再自行变化) 的状态
+# PAUSED 是Macie因配额暂停，会自行恢复；IDLE 只出现在定期作业上，均不视为结束
+TERMINAL_STATUSES = ('COMPLETE', 'CANCELLED', 'USER_PAUSED')
+
+# 作业连续处于 PAUSED 状态多久后停止等待 (秒)，None 表示只受总等待时间限制
+DEFAULT_MAX_PAUSED_SECONDS = 1800
+
+# 视为限流的错误码
+THROTTLING_ERROR_CODES = ('ThrottlingException', 'TooManyRequestsException', 'Throttling',
+                          'RequestLimitExceeded', 'RequestThrottled')
+
+DEFAULT_MIN_INTERVAL = 10
+DEFAULT_MAX_INTERVAL = 300
+DEFAULT_MAX_BACKOFF = 600
+
+# 同时进行的 describe_classification_job 请求数
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+
+# 连续失败多少次后放弃跟踪该作业
+MAX_CONSECUTIVE_ERRORS = 10
+
+# 用于估算速率的最近进度样本数
+PROGRESS_SAMPLES = 10
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """botocore ClientError 的错误码是否为限流"""
+    code = (getattr(error, 'response', None) or {}).get('Error', {}).get('Code')
+    return code in THROTTLING_ERROR_CODES
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """带完全抖动的指数退避: [0, min(cap, base * 2^attempt)] 内均匀取值，避免多个作业同时重试"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class JobProgress:
+    """
+    根据 approximateNumberOfObjectsToProcess 的变化估算进度
+    该字段是剩余待处理的对象数 (不是已处理数)，总数取创建作业时已知的对象数与观察到的最大剩余数中较大者
+    """
+
+    def __init__(self, total_objects: Optional[int] = None):
+        self.total = total_objects or 0
+        self.samples: List[Tuple[float, float]] = []
+
+    def update(self, remaining: float, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.total = max(self.total, remaining)
+        self.samples.append((now, remaining))
+        del self.samples[:-PROGRESS_SAMPLES]
+
+    @property
+    def remaining(self) -> Optional[float]:
+        return self.samples[-1][1] if self.samples else None
+
+    @property
+    def processed(self) -> float:
+        return self.total - self.remaining if self.samples else 0
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.samples or not self.total:
+            return None
+        return self.processed / self.total * 100
+
+    def rate(self) -> Optional[float]:
+        """最近样本窗口内的处理速率 (对象/秒)，没有进展时返回None"""
+        if len(self.samples) < 2:
+            return None
+        (t0, r0), (t1, r1) = self.samples[0], self.samples[-1]
+        if t1 <= t0 or r0 <= r1:
+            return None
+        return (r0 - r1) / (t1 - t0)
+
+    def eta_seconds(self) -> Optional[float]:
+        rate = self.rate()
+        if rate is None:
+            return None
+        return self.remaining / rate
+
+    def describe(self) -> str:
+        if not self.samples:
+            return '等待统计信息'
+        text = f"已处理约 {self.processed:.0f}/{self.total:.0f} 个对象"
+        if self.percent is not None:
+            text += f" ({self.percent:.1f}%)"
+        eta = self.eta_seconds()
+        text += f"，预计剩余 {eta / 60:.1f} 分钟" if eta is not None else "，暂无法估算剩余时间"
+        return text
+
+
+class MacieJobPoller:
+    """
+    异步轮询多个Macie作业
+    track() 为每个作业返回一个Future，作业进入结束状态、等待超时或连续失败时完成，结果为最后一次的
+    describe_classification_job 响应 (超时时附加 timedOut=True，无法获取状态时 jobStatus 为 UNKNOWN 并附加 error)。
+    作业连续处于 PAUSED 状态超过 max_paused_seconds 时同样按超时结束 (配额暂停通常要到下个计费周期才恢复)。
+    boto3客户端是同步的，请求在线程池中执行，由信号量限制并发。
+    """
+
+    def __init__(self, macie_client, max_wait_seconds: float = 3600,
+                 min_interval: float = DEFAULT_MIN_INTERVAL, max_interval: float = DEFAULT_MAX_INTERVAL,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+                 max_paused_seconds: Optional[float] = DEFAULT_MAX_PAUSED_SECONDS):
+        self.macie_client = macie_client
+        self.max_wait_seconds = max_wait_seconds
+        self.max_paused_seconds = max_paused_seconds
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_backoff = max_backoff
+        self.max_concurrent_requests = max_concurrent_requests
+        self.progress: Dict[str, JobProgress] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._throttled_until = 0.0
+        self._throttle_attempts = 0
+        self._tasks: List[asyncio.Task] = []
+        # 请求数、重试次数 (含botocore内部重试) 和非限流错误次数
+        self.stats = {'requests': 0, 'retries': 0, 'errors': 0}
+
+    def track(self, job_id: str, total_objects: Optional[int] = None) -> 'asyncio.Future':
+        """开始跟踪一个作业 (需在事件循环中调用)"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+        future = asyncio.get_running_loop().create_future()
+        self.progress[job_id] = JobProgress(total_objects)
+        self._tasks.append(asyncio.ensure_future(self._poll_job(job_id, future)))
+        return future
+
+    async def _describe(self, job_id: str) -> Dict:
+        # 任一作业被限流时，所有作业都等到退避结束再请求
+        delay = self._throttled_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            self.stats['requests'] += 1
+            response = await loop.run_in_executor(
+                None, lambda: self.macie_client.describe_classification_job(jobId=job_id))
+        self.stats['retries'] += (response.get('ResponseMetadata') or {}).get('RetryAttempts', 0)
+        return response
+
+    def _next_interval(self, progress: JobProgress, interval: float) -> float:
+        """
+        有ETA时按剩余时间的四分之一轮询 (接近完成时更频繁)，没有进展时逐步拉长间隔
+        """
+        eta = progress.eta_seconds()
+        if eta is not None:
+            interval = eta / 4
+        else:
+            interval = interval * 1.5
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    async def _poll_job(self, job_id: str, future: 'asyncio.Future'):
+        progress = self.progress[job_id]
+        deadline = time.monotonic() + self.max_wait_seconds
+        interval = self.min_interval
+        errors = 0
+        response: Optional[Dict] = None
+        last_status = None
+        paused_since: Optional[float] = None
+
+        while True:
+            try:
+                response = await self._describe(job_id)
+                errors = 0
+                self._throttle_attempts = 0
+            except Exception as e:
+                self.stats['retries'] += 1
+                if is_throttling_error(e):
+                    delay = backoff_delay(self._throttle_attempts, self.min_interval, self.max_backoff)
+                    self._throttle_attempts += 1
+                    self._throttled_until = max(self._throttled_until, time.monotonic() + delay)
+                    logger.warning(f"🔁 Macie请求被限流，{delay:.0f} 秒后重试: {job_id}")
+                else:
+                    errors += 1
+                    self.stats['errors'] += 1
+                    delay = backoff_delay(errors, self.min_interval, self.max_backoff)
+                    logger.error(f"检查作业状态失败 ({errors}/{MAX_CONSECUTIVE_ERRORS}) {job_id}: {e}")
+                    if errors >= MAX_CONSECUTIVE_ERRORS:
+                        result = dict(response or {'jobId': job_id, 'jobStatus': 'UNKNOWN'}, error=str(e))
+                        future.set_result(result)
+                        return
+                if time.monotonic() + delay > deadline:
+                    logger.warning(f"⚠️ 等待超时: {job_id}")
+                    future.set_result(dict(response or {'jobId': job_id, 'jobStatus': 'UNKNOWN', 'error': str(e)},
+                                           timedOut=True))
+                    return
+                await asyncio.sleep(delay)
+                continue
+
+            job_status = response.get('jobStatus')
+            if job_status != last_status:
+                logger.info(f"作业状态: {job_id} {job_status}")
+                last_status = job_status
+
+            if job_status in TERMINAL_STATUSES:
+                if job_status == 'COMPLETE':
+                    logger.info(f"✅ Macie作业完成: {job_id}")
+                else:
+                    logger.warning(f"⚠️ 作业状态异常: {job_id} {job_status}")
+                future.set_result(response)
+                return
+
+            if job_status == 'PAUSED':
+                paused_since = paused_since or time.monotonic()
+                if self.max_paused_seconds is not None and \
+                        time.monotonic() - paused_since >= self.max_paused_seconds:
+                    logger.warning(f"⚠️ 作业因配额暂停超过 {self.max_paused_seconds / 60:.0f} 分钟，停止等待: {job_id}")
+                    future.set_result(dict(response, timedOut=True))
+                    return
+            else:
+                paused_since = None
+
+            remaining = (response.get('statistics') or {}).get('approximateNumberOfObjectsToProcess')
+            if remaining is not None:
+                progress.update(float(remaining))
+            if job_status == 'RUNNING':
+                logger.info(f"进度 {job_id}: {progress.describe()}")
+
+            interval = self._next_interval(progress, interval)
+            remaining_wait = deadline - time.monotonic()
+            if remaining_wait <= 0:
+                logger.warning(f"⚠️ 等待超时: {job_id}")
+                future.set_result(dict(response, timedOut=True))
+                return
+            await asyncio.sleep(min(interval, remaining_wait))
+
+    async def wait_all(self) -> None:
+        """等待所有已跟踪作业的轮询任务结束"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+
+async def poll_jobs(macie_client, jobs: Dict[str, Optional[int]], max_wait_seconds: float = 3600,
+                    poller: Optional[MacieJobPoller] = None, **poller_options) -> Dict[str, Dict]:
+    """
+    同时等待多个作业结束
+    jobs: 作业ID -> 已知的扫描对象数 (用于估算进度，可为None)
+    poller: 使用已创建的轮询器 (调用方可在结束后读取 poller.stats)，此时忽略其他轮询参数
+    返回 作业ID -> 最后一次的作业描述
+    """
+    poller = poller or MacieJobPoller(macie_client, max_wait_seconds=max_wait_seconds, **poller_options)
+    futures = {job_id: poller.track(job_id, total) for job_id, total in jobs.items()}
+    for future in asyncio.as_completed(list(futures.values())):
+        response = await future
+        logger.info(f"作业已结束: {response.get('jobId')} {response.get('jobStatus')}")
+    return {job_id: future.result() for job_id, future in futures.items()}
+
+
+def wait_for_jobs(macie_client, job_ids: Iterable[str], max_wait_minutes: int = 60,
+                  total_objects: Optional[Dict[str, int]] = None, poller: Optional[MacieJobPoller] = None,
+                  **poller_options) -> Dict[str, Dict]:
+    """poll_jobs 的同步入口"""
+    total_objects = total_objects or {}
+    jobs = {job_id: total_objects.get(job_id) for job_id in job_ids}
+    return asyncio.run(poll_jobs(macie_client, jobs, max_wait_seconds=max_wait_minutes * 60, poller=poller,
+                                 **poller_options))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+管道性能指标
+记录每个阶段的耗时、逐项耗时分布、输入/输出字节数和行数、重试和错误次数，
+运行结束时写出JSON运行摘要和Prometheus textfile collector格式的指标文件，用于跟踪每晚运行的性能回归。
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+METRIC_PREFIX = 'loki_macie'
+
+# 每个阶段保留的逐项耗时样本数 (蓄水池抽样)，用于估算分位数
+MAX_DURATION_SAMPLES = 10000
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# 阶段计数字段 -> (Prometheus指标名, 说明, 标签)
+_COUNTERS = {
+    'items': ('stage_items', '阶段处理的项目数', {'result': 'success'}),
+    'failed': ('stage_items', '阶段处理的项目数', {'result': 'failed'}),
+    'skipped': ('stage_items', '阶段处理的项目数', {'result': 'skipped'}),
+    'bytes_in': ('stage_bytes', '阶段输入/输出字节数', {'direction': 'in'}),
+    'bytes_out': ('stage_bytes', '阶段输入/输出字节数', {'direction': 'out'}),
+    'lines_in': ('stage_lines', '阶段输入/输出行数', {'direction': 'in'}),
+    'lines_out': ('stage_lines', '阶段输入/输出行数', {'direction': 'out'}),
+    'retries': ('stage_retries', '阶段内的重试次数', {}),
+    'errors': ('stage_errors', '阶段内的错误次数', {}),
+}
+
+
+def _new_stage() -> Dict:
+    return {'seconds': 0.0, 'items': 0, 'failed': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0,
+            'lines_in': 0, 'lines_out': 0, 'retries': 0, 'errors': 0}
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+class PipelineMetrics:
+    """
+    一次管道运行的指标
+    阶段按首次出现的顺序记录；同一阶段多次计时 (如恢复运行) 时耗时累加
+    重叠执行的流水线中多个阶段线程同时记录，计数更新互斥
+    """
+
+    def __init__(self, job_name: str):
+        self.job_name = job_name
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self.stages: Dict[str, Dict] = {}
+        self._durations: Dict[str, List[float]] = {}
+        self._duration_stats: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+    def stage(self, name: str) -> Dict:
+        """阶段的计数字典 (不存在时创建)"""
+        with self._lock:
+            return self.stages.setdefault(name, _new_stage())
+
+    @contextmanager
+    def timed(self, name: str):
+        """统计阶段的墙钟耗时"""
+        stage = self.stage(name)
+        started = time.monotonic()
+        try:
+            yield stage
+        finally:
+            with self._lock:
+                stage['seconds'] += time.monotonic() - started
+
+    def add(self, name: str, **counts):
+        """累加阶段的计数 (bytes_in、lines_out、retries 等)"""
+        with self._lock:
+            stage = self.stage(name)
+            for key, value in counts.items():
+                stage[key] += value or 0
+
+    def record_item(self, name: str, seconds: Optional[float] = None, success: bool = True,
+                    skipped: bool = False, **counts):
+        """记录阶段内一个项目的结果、耗时和字节数/行数"""
+        with self._lock:
+            stage = self.stage(name)
+            if skipped:
+                stage['skipped'] += 1
+            elif success:
+                stage['items'] += 1
+            else:
+                stage['failed'] += 1
+                stage['errors'] += 1
+            self.add(name, **counts)
+            if seconds is not None:
+                self._record_duration(name, seconds)
+
+    def _record_duration(self, name: str, seconds: float):
+        stats = self._duration_stats.setdefault(name, {'count': 0, 'sum': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['sum'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        samples = self._durations.setdefault(name, [])
+        if len(samples) < MAX_DURATION_SAMPLES:
+            samples.append(seconds)
+        else:
+            index = random.randrange(stats['count'])
+            if index < MAX_DURATION_SAMPLES:
+                samples[index] = seconds
+
+    def item_durations(self, name: str) -> Optional[Dict]:
+        """阶段内逐项耗时的分布 (count、sum、max 和分位数)，没有逐项耗时时返回None"""
+        stats = self._duration_stats.get(name)
+        if not stats:
+            return None
+        samples = sorted(self._durations[name])
+        return dict(stats, quantiles={str(q): _quantile(samples, q) for q in QUANTILES})
+
+    def summary(self, status: str, **details) -> Dict:
+        """JSON运行摘要"""
+        elapsed = time.monotonic() - self._started
+        stages = {}
+        for name, stage in self.stages.items():
+            entry = dict(stage)
+            if stage['seconds'] > 0:
+                entry['throughput_mb_s'] = round(max(stage['bytes_in'], stage['bytes_out']) / (1024 * 1024)
+                                                 / stage['seconds'], 3)
+                entry['items_per_second'] = round((stage['items'] + stage['skipped']) / stage['seconds'], 3)
+            durations = self.item_durations(name)
+            if durations:
+                entry['item_seconds'] = durations
+            stages[name] = entry
+        return {
+            'job_name': self.job_name,
+            'status': status,
+            'started_at': self.started_at.isoformat(),
+            'seconds': round(elapsed, 3),
+            'stages': stages,
+            **details
+        }
+
+    def prometheus_lines(self, status: str) -> List[str]:
+        """Prometheus文本格式 (textfile collector)，全部为最近一次运行的gauge"""
+        families: Dict[str, Dict] = {}
+
+        def sample(metric, help_text, labels, value):
+            family = families.setdefault(metric, {'help': help_text, 'samples': []})
+            family['samples'].append(f"{METRIC_PREFIX}_{metric}{_format_labels(labels)} {value}")
+
+        sample('last_run_info', '最近一次运行的作业名称和状态', {'job_name': self.job_name, 'status': status}, 1)
+        sample('last_run_timestamp_seconds', '最近一次运行的开始时间', {}, f"{self.started_at.timestamp():.3f}")
+        sample('last_run_duration_seconds', '最近一次运行的总耗时', {}, f"{time.monotonic() - self._started:.3f}")
+        for name, stage in self.stages.items():
+            sample('stage_duration_seconds', '阶段的墙钟耗时', {'stage': name}, f"{stage['seconds']:.3f}")
+            for key, (metric, help_text, labels) in _COUNTERS.items():
+                sample(metric, help_text, {'stage': name, **labels}, stage[key])
+            durations = self.item_durations(name)
+            if durations:
+                for q, value in durations['quantiles'].items():
+                    sample('item_duration_seconds', '阶段内逐项耗时', {'stage': name, 'quantile': q}, f"{value:.6f}")
+                sample('item_duration_seconds_sum', '阶段内逐项耗时', {'stage': name}, f"{durations['sum']:.6f}")
+                sample('item_duration_seconds_count', '阶段内逐项耗时', {'stage': name}, durations['count'])
+
+        lines = []
+        for metric, family in families.items():
+            if metric.startswith('item_duration_seconds_'):
+                # summary的 _sum/_count 属于同一个指标族，不单独声明
+                lines.extend(family['samples'])
+                continue
+            metric_type = 'summary' if metric == 'item_duration_seconds' else 'gauge'
+            lines.append(f"# HELP {METRIC_PREFIX}_{metric} {family['help']}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{metric} {metric_type}")
+            lines.extend(family['samples'])
+        return lines
+
+    def write_summary(self, summary_file: str, status: str, **details) -> Path:
+        summary_file = Path(summary_file)
+        summary_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(summary_file, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(status, **details), f, indent=2, default=str, ensure_ascii=False)
+        return summary_file
+
+    def write_prometheus(self, textfile: str, status: str) -> Path:
+        """
+        写出Prometheus指标文件
+        先写临时文件再重命名，避免node_exporter读到写了一半的文件
+        """
+        textfile = Path(textfile)
+        textfile.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = textfile.with_name(f".{textfile.name}.{os.getpid()}.tmp")
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.prometheus_lines(status)) + '\n')
+        os.replace(temp_file, textfile)
+        return textfile
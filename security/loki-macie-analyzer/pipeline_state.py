@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+管道运行状态检查点
+每次运行按 job_name 写入一个追加式状态文件 (JSON Lines)，记录运行参数、每个阶段的完成情况以及
+逐项进度 (已提取的chunk、已上传的文件、已创建的Macie作业)。运行中断后使用 --resume
+从第一个未完成的项目继续，而不是从提取重新开始。
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+STATE_SUFFIX = '.state.jsonl'
+
+# 每写入多少条项目记录同步一次到磁盘 (阶段完成时总是同步)
+SYNC_INTERVAL = 200
+
+
+class PipelineState:
+    """
+    追加式的运行状态文件
+    每行一条记录: run (运行参数)、item (阶段内单个项目完成)、stage (阶段完成)、finished (运行结束)
+    进程在写入中途崩溃时最后一行可能不完整，加载时忽略
+    重叠执行的流水线中多个阶段线程同时记录项目，写入互斥
+    """
+
+    def __init__(self, state_file: Path):
+        self.state_file = Path(state_file)
+        self.run: Dict[str, Any] = {}
+        self.stages: Dict[str, Any] = {}
+        self._items: Dict[str, Dict[str, Any]] = {}
+        self.finished: Optional[Dict] = None
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, directory: str, job_name: str, run: Dict) -> 'PipelineState':
+        """为新的运行创建状态文件"""
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        state = cls(Path(directory) / f"{job_name}{STATE_SUFFIX}")
+        if state.state_file.exists():
+            raise FileExistsError(f"状态文件已存在: {state.state_file}")
+        state.run = dict(run, job_name=job_name, version=STATE_VERSION)
+        state._append({'type': 'run', **state.run}, sync=True)
+        return state
+
+    @classmethod
+    def load(cls, state_file: Path) -> 'PipelineState':
+        """重放状态文件"""
+        state = cls(state_file)
+        with open(state.state_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"忽略状态文件中不完整的记录 (第 {line_number} 行): {state.state_file}")
+                    continue
+                kind = record.pop('type', None)
+                if kind == 'run':
+                    state.run = record
+                elif kind == 'item':
+                    state._items.setdefault(record['stage'], {})[record['item']] = record.get('value')
+                elif kind == 'stage':
+                    state.stages[record['stage']] = record.get('value')
+                elif kind == 'finished':
+                    state.finished = record
+        if state.run.get('version') != STATE_VERSION:
+            raise ValueError(f"状态文件版本不匹配: {state.state_file}")
+        return state
+
+    @staticmethod
+    def find(directory: str, job_name: Optional[str] = None) -> Optional[Path]:
+        """
+        查找状态文件: 指定 job_name 时返回该运行的状态文件，
+        否则返回最近修改的未完成运行的状态文件
+        """
+        directory = Path(directory)
+        if job_name:
+            state_file = directory / f"{job_name}{STATE_SUFFIX}"
+            return state_file if state_file.exists() else None
+        if not directory.is_dir():
+            return None
+        candidates = sorted(directory.glob(f"*{STATE_SUFFIX}"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for state_file in candidates:
+            if not PipelineState.load(state_file).finished:
+                return state_file
+        return None
+
+    def _append(self, record: Dict, sync: bool = False):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.state_file, 'a', encoding='utf-8')
+                if self._ends_with_partial_line():
+                    # 崩溃时写了一半的最后一行单独成行，新记录不能接在它后面 (否则重放时一起被忽略)
+                    self._file.write('\n')
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if sync or self._unsynced >= SYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def _ends_with_partial_line(self) -> bool:
+        size = self.state_file.stat().st_size
+        if not size:
+            return False
+        with open(self.state_file, 'rb') as f:
+            f.seek(size - 1)
+            return f.read(1) != b'\n'
+
+    def items(self, stage: str) -> Dict[str, Any]:
+        """阶段内已完成的项目 -> 记录的值"""
+        return self._items.setdefault(stage, {})
+
+    def record_item(self, stage: str, item: str, value: Any = None):
+        """记录阶段内一个项目已完成 (如一个chunk已提取、一个文件已上传)"""
+        self.items(stage)[item] = value
+        self._append({'type': 'item', 'stage': stage, 'item': item, 'value': value})
+
+    def stage_done(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def complete_stage(self, stage: str, value: Any = None):
+        """记录阶段完成及其输出 (如文件列表)"""
+        self.stages[stage] = value
+        self._append({'type': 'stage', 'stage': stage, 'value': value}, sync=True)
+
+    def finish(self, status: str, **details):
+        """记录运行结束，之后不再作为未完成的运行被自动恢复"""
+        self.finished = {'status': status, **details}
+        self._append({'type': 'finished', **self.finished}, sync=True)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
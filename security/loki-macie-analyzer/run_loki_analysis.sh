@@ -198,10 +198,8 @@ main() {
                 exit 1
             fi
         else
-            print_error "需要Go环境来编译chunks-inspect工具"
-            print_info "请安装Go: https://golang.org/dl/"
-            print_info "或手动编译chunks-inspect: https://github.com/grafana/loki/tree/main/cmd/chunks-inspect"
-            exit 1
+            print_warning "缺少Go环境，跳过chunks-inspect编译"
+            print_info "管道将使用内置的Python解码器 (loki_chunk_decoder.py)"
         fi
     fi
     
@@ -435,7 +433,9 @@ main() {
   "processing": {
     "chunk_directory": "./lokichunk",
     "output_directory": "./extracted_texts",
-    "temp_directory": "./temp"
+    "temp_directory": "./temp",
+    "decoder": "native",
+    "workers": 0
   },
   "logging": {
     "level": "INFO",
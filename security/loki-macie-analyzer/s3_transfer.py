@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+"""
+S3 传输工具
+提供流式分片上传写入器，数据在内存中最多缓冲一个分片，不落地本地磁盘；
+流式gzip压缩写入器，可在后台线程中压缩，与解码/读取并行；
+以及多对象并发上传器，共享可调的TransferConfig和连接池，
+可根据一次ListObjectsV2得到的对象索引跳过内容未变化的对象。
+"""
+
+import hashlib
+import math
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# S3分片上传限制: 除最后一个分片外，每个分片至少5MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+DEFAULT_COMPRESSION_LEVEL = 6
+# 每次交给压缩器的数据块大小 (zlib处理大块数据时释放GIL)
+COMPRESS_BLOCK_SIZE = 1024 * 1024
+
+# 并发上传默认值: 同时上传的对象数，以及每个对象内部的分片并发数
+DEFAULT_UPLOAD_CONCURRENCY = 8
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class S3MultipartWriter:
+    """
+    类文件对象: 写入的数据缓冲到一个分片大小后作为multipart分片上传
+    数据总量小于一个分片时，关闭时改用一次 put_object 上传
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, part_size: int = DEFAULT_PART_SIZE,
+                 extra_args: Optional[Dict] = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = max(int(part_size), MIN_PART_SIZE)
+        self.extra_args = extra_args or {}
+
+        self.bytes_written = 0
+        self.upload_id = None
+        self._parts = []
+        self._buffer = bytearray()
+        self._closed = False
+
+    def write(self, data) -> int:
+        """写入文本或字节，缓冲区满一个分片即上传"""
+        if self._closed:
+            raise ValueError(f"写入已关闭的S3对象: {self.key}")
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _upload_part(self, body: bytes):
+        """上传一个分片，首次调用时创建multipart上传"""
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                **self.extra_args
+            )
+            self.upload_id = response['UploadId']
+
+        part_number = len(self._parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self):
+        """上传剩余数据并完成对象写入"""
+        if self._closed:
+            return
+        if self.upload_id is None:
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                **self.extra_args
+            )
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self._parts}
+            )
+        self._buffer = bytearray()
+        self._closed = True
+
+    def abort(self):
+        """放弃写入，清理未完成的multipart上传"""
+        self._buffer = bytearray()
+        self._closed = True
+        if self.upload_id is not None:
+            try:
+                self.s3_client.abort_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id
+                )
+            except Exception as e:
+                logger.warning(f"取消分片上传失败 {self.key}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class GzipStreamWriter:
+    """
+    类文件对象: 将写入的文本或字节以gzip格式压缩后转发给内部写入器 (如 S3MultipartWriter)
+    threaded=True 时压缩和下游写入 (分片上传) 在后台线程中进行，与调用方的解码/读取重叠；
+    待压缩队列有上限，下游变慢时写入方会被阻塞，内存占用有界
+    close() 只结束压缩流，不关闭内部写入器
+    """
+
+    def __init__(self, inner, level: int = DEFAULT_COMPRESSION_LEVEL, threaded: bool = False,
+                 max_pending: int = 4, block_size: int = COMPRESS_BLOCK_SIZE):
+        self.inner = inner
+        self.block_size = block_size
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # wbits=31: 带gzip头和尾的deflate流
+        self._compressor = zlib.compressobj(int(level), zlib.DEFLATED, 31)
+        self._buffer = bytearray()
+        self._closed = False
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if threaded:
+            self._queue = queue.Queue(maxsize=max_pending)
+            self._thread = threading.Thread(target=self._run, name='gzip-compress', daemon=True)
+            self._thread.start()
+
+    def _compress(self, block: bytes):
+        data = self._compressor.compress(block)
+        if data:
+            self.inner.write(data)
+            self.bytes_out += len(data)
+
+    def _run(self):
+        """后台线程: 依次压缩队列中的数据块，出错后丢弃剩余数据块"""
+        while True:
+            block = self._queue.get()
+            if block is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self._compress(block)
+            except BaseException as e:
+                self._error = e
+
+    def _submit(self, block: bytes):
+        if self._thread is None:
+            self._compress(block)
+            return
+        if self._error is not None:
+            raise self._error
+        self._queue.put(block)
+
+    def write(self, data) -> int:
+        """写入文本或字节，缓冲满一个数据块即提交压缩"""
+        if self._closed:
+            raise ValueError("写入已关闭的gzip流")
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._buffer += data
+        self.bytes_in += len(data)
+        if len(self._buffer) >= self.block_size:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        return len(data)
+
+    def _stop_thread(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """压缩剩余数据并写入gzip尾部"""
+        if self._closed:
+            return
+        if self._buffer:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        self._stop_thread()
+        self._closed = True
+        if self._error is not None:
+            raise self._error
+        data = self._compressor.flush()
+        self.inner.write(data)
+        self.bytes_out += len(data)
+
+    def abort(self):
+        """放弃压缩，结束后台线程"""
+        self._buffer = bytearray()
+        self._closed = True
+        self._stop_thread()
+
+
+def upload_file_compressed(s3_client, file_path: str, bucket: str, key: str,
+                           level: int = DEFAULT_COMPRESSION_LEVEL, part_size: int = DEFAULT_PART_SIZE,
+                           extra_args: Optional[Dict] = None, block_size: int = COMPRESS_BLOCK_SIZE) -> Dict:
+    """
+    读取本地文件，边压缩边以multipart方式上传为gzip对象 (不生成本地 .gz 文件)
+    返回 {'bytes_in': 原始字节数, 'bytes_out': 压缩后字节数}
+    """
+    writer = S3MultipartWriter(s3_client, bucket, key, part_size=part_size, extra_args=extra_args)
+    compressor = GzipStreamWriter(writer, level=level, threaded=True, block_size=block_size)
+    try:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                compressor.write(block)
+        compressor.close()
+        writer.close()
+    except BaseException:
+        compressor.abort()
+        writer.abort()
+        raise
+    return {'bytes_in': compressor.bytes_in, 'bytes_out': compressor.bytes_out}
+
+
+class S3ObjectIndex:
+    """前缀下已有对象的内存索引 (键 -> 大小、ETag、最后修改时间)，一次分页ListObjectsV2构建"""
+
+    def __init__(self, objects: Optional[Dict[str, Dict]] = None):
+        self.objects = objects or {}
+
+    @classmethod
+    def build(cls, s3_client, bucket: str, prefix: str) -> 'S3ObjectIndex':
+        objects = {}
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                objects[obj['Key']] = {
+                    'size': obj['Size'],
+                    'etag': obj['ETag'].strip('"'),
+                    'last_modified': obj['LastModified']
+                }
+        return cls(objects)
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self.objects.get(key)
+
+    def __len__(self) -> int:
+        return len(self.objects)
+
+
+class PartitionedObjectIndex:
+    """
+    按分区 (键的目录部分) 惰性构建的已有对象索引
+    上传文件逐个到达、事先不知道全部分区时使用: 每个分区在第一次查询时分页列出一次，
+    不同分区由上传线程并发列出；列出失败时该分区视为没有已有对象 (全部上传)
+    """
+
+    def __init__(self, s3_client, bucket: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self._partitions: Dict[str, S3ObjectIndex] = {}
+        # 分区前缀 -> 列出该分区时持有的锁 (同一分区只列出一次)
+        self._partition_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, key: str) -> S3ObjectIndex:
+        prefix = key[:key.rfind('/') + 1]
+        index = self._partitions.get(prefix)
+        if index is not None:
+            return index
+        with self._lock:
+            partition_lock = self._partition_locks.setdefault(prefix, threading.Lock())
+        with partition_lock:
+            index = self._partitions.get(prefix)
+            if index is None:
+                try:
+                    index = S3ObjectIndex.build(self.s3_client, self.bucket, prefix)
+                    logger.info(f"已有对象索引: s3://{self.bucket}/{prefix} 下 {len(index)} 个对象")
+                except Exception as e:
+                    logger.warning(f"列出已有对象失败，该分区将全部上传: {e}")
+                    index = S3ObjectIndex()
+                self._partitions[prefix] = index
+        return index
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._partition(key).get(key)
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._partitions.values())
+
+
+class ETagHasher:
+    """
+    类文件对象: 按与上传相同的分片方式计算S3 ETag，不上传任何数据
+    总大小达到 threshold 时为分片上传的ETag (各分片MD5拼接后的MD5加 '-分片数')，否则为整体MD5
+    默认 threshold 等于 part_size，与 S3MultipartWriter 的行为一致
+    """
+
+    def __init__(self, part_size: int, threshold: Optional[int] = None):
+        self.part_size = int(part_size)
+        self.threshold = self.part_size if threshold is None else int(threshold)
+        self.size = 0
+        self._whole = hashlib.md5()
+        self._part = hashlib.md5()
+        self._part_bytes = 0
+        self._part_digests = []
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.size += len(data)
+        self._whole.update(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.part_size - self._part_bytes)
+            self._part.update(view[:take])
+            self._part_bytes += take
+            view = view[take:]
+            if self._part_bytes == self.part_size:
+                self._part_digests.append(self._part.digest())
+                self._part = hashlib.md5()
+                self._part_bytes = 0
+        return len(data)
+
+    def etag(self) -> str:
+        if self.size < self.threshold:
+            return self._whole.hexdigest()
+        digests = list(self._part_digests)
+        if self._part_bytes:
+            digests.append(self._part.digest())
+        return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def _hash_file(hasher, file_path: str, block_size: int = COMPRESS_BLOCK_SIZE):
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.write(block)
+
+
+# 常见的分片大小 (MB)，用于推算其他工具或配置上传的对象的分片大小
+_COMMON_PART_SIZES_MB = (5, 8, 16, 32, 64, 128, 256, 512)
+
+
+def _candidate_part_sizes(size: int, etag: str) -> List[int]:
+    """
+    根据对象大小和分片ETag中的分片数推算上传时可能使用的分片大小
+    分片大小 p 满足 (N-1)*p < size <= N*p，依次尝试按MB取整的最小值和范围内的常见分片大小
+    """
+    if '-' not in etag:
+        return []
+    parts = int(etag.rsplit('-', 1)[1])
+    if parts <= 0:
+        return []
+    mb = 1024 * 1024
+    candidates = [math.ceil(size / parts / mb) * mb]
+    for size_mb in _COMMON_PART_SIZES_MB:
+        part_size = size_mb * mb
+        if (parts - 1) * part_size < size <= parts * part_size and part_size not in candidates:
+            candidates.append(part_size)
+    return candidates
+
+
+def file_matches_etag(file_path: str, entry: Dict, part_size: int, threshold: int) -> bool:
+    """
+    本地文件内容是否与已有对象一致 (upload_file 上传的未压缩对象)
+    分片数与配置不一致时 (如s3transfer为满足分片数上限自动调大了分片) 按对象的分片数推算分片大小重试
+    """
+    size = os.path.getsize(file_path)
+    if size != entry['size']:
+        return False
+    hasher = ETagHasher(part_size, threshold)
+    _hash_file(hasher, file_path)
+    if hasher.etag() == entry['etag']:
+        return True
+    for candidate in _candidate_part_sizes(size, entry['etag']):
+        if candidate == part_size:
+            continue
+        hasher = ETagHasher(candidate, 0)
+        _hash_file(hasher, file_path)
+        if hasher.etag() == entry['etag']:
+            return True
+    return False
+
+
+def gzip_matches_etag(file_path: str, entry: Dict, level: int, part_size: int,
+                      block_size: int = COMPRESS_BLOCK_SIZE) -> bool:
+    """本地文件按 upload_file_compressed 相同的方式压缩后是否与已有对象一致 (只在本地计算，不上传)"""
+    hasher = ETagHasher(max(int(part_size), MIN_PART_SIZE))
+    compressor = GzipStreamWriter(hasher, level=level, block_size=block_size)
+    _hash_file(compressor, file_path, block_size)
+    compressor.close()
+    return hasher.size == entry['size'] and hasher.etag() == entry['etag']
+
+
+def build_transfer_config(upload_options: Optional[Dict] = None):
+    """
+    根据配置构建共享的 boto3 TransferConfig
+    upload_options: multipart_threshold_mb, multipart_chunksize_mb, max_concurrency
+    未安装boto3时 (替身客户端) 返回None，上传使用客户端自身的默认设置
+    """
+    try:
+        from boto3.s3.transfer import TransferConfig
+    except ImportError:
+        return None
+
+    upload_options = upload_options or {}
+    mb = 1024 * 1024
+    return TransferConfig(
+        multipart_threshold=int(upload_options.get('multipart_threshold_mb', 8) * mb),
+        multipart_chunksize=int(upload_options.get('multipart_chunksize_mb', 8) * mb),
+        max_concurrency=int(upload_options.get('max_concurrency', DEFAULT_MAX_CONCURRENCY)),
+        use_threads=True
+    )
+
+
+def pool_connections_for(upload_options: Optional[Dict] = None) -> int:
+    """botocore连接池大小: 未配置时按 同时上传的对象数 x 每个对象的分片并发数 计算"""
+    upload_options = upload_options or {}
+    if upload_options.get('max_pool_connections'):
+        return int(upload_options['max_pool_connections'])
+    concurrency = int(upload_options.get('concurrency', DEFAULT_UPLOAD_CONCURRENCY))
+    max_concurrency = int(upload_options.get('max_concurrency', DEFAULT_MAX_CONCURRENCY))
+    return max(concurrency * max_concurrency, 10)
+
+
+class ConcurrentUploader:
+    """
+    多对象并发上传: 同时进行 concurrency 个对象的上传，所有对象共享一个TransferConfig
+    结果按输入顺序产出，单个文件失败不影响其他文件；stats 中累计字节数、耗时和吞吐
+    提供 index (S3ObjectIndex 或 PartitionedObjectIndex) 时，内容与已有对象ETag一致的文件跳过上传 (result['skipped'])
+    """
+
+    def __init__(self, s3_client, bucket: str, transfer_config=None,
+                 concurrency: int = DEFAULT_UPLOAD_CONCURRENCY, extra_args: Optional[Dict] = None,
+                 compression_level: Optional[int] = None, part_size: int = DEFAULT_PART_SIZE,
+                 index: Optional[S3ObjectIndex] = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.transfer_config = transfer_config
+        self.concurrency = max(int(concurrency), 1)
+        self.extra_args = extra_args or {}
+        self.compression_level = compression_level
+        self.part_size = part_size
+        self.index = index
+        self.stats = {'files': 0, 'failed': 0, 'skipped': 0, 'bytes': 0, 'uploaded_bytes': 0, 'seconds': 0.0}
+
+    def _is_unchanged(self, file_path: str, key: str) -> bool:
+        """对象已存在且ETag与本地内容一致"""
+        entry = self.index.get(key) if self.index is not None else None
+        if entry is None:
+            return False
+        if self.compression_level is not None:
+            return gzip_matches_etag(file_path, entry, self.compression_level, self.part_size)
+        threshold = getattr(self.transfer_config, 'multipart_threshold', DEFAULT_PART_SIZE)
+        chunk_size = getattr(self.transfer_config, 'multipart_chunksize', DEFAULT_PART_SIZE)
+        return file_matches_etag(file_path, entry, chunk_size, threshold)
+
+    def _upload_one(self, file_path: str, key: str) -> Dict:
+        """上传单个文件，返回结果字典 (不抛出异常)"""
+        started = time.monotonic()
+        try:
+            if self._is_unchanged(file_path, key):
+                return {
+                    'file': file_path,
+                    's3_key': key,
+                    'bytes': os.path.getsize(file_path),
+                    'uploaded_bytes': 0,
+                    'seconds': time.monotonic() - started,
+                    'success': True,
+                    'skipped': True
+                }
+            if self.compression_level is not None:
+                sizes = upload_file_compressed(
+                    self.s3_client, file_path, self.bucket, key,
+                    level=self.compression_level, part_size=self.part_size, extra_args=self.extra_args
+                )
+            else:
+                size = os.path.getsize(file_path)
+                kwargs = {'ExtraArgs': self.extra_args}
+                if self.transfer_config is not None:
+                    kwargs['Config'] = self.transfer_config
+                self.s3_client.upload_file(file_path, self.bucket, key, **kwargs)
+                sizes = {'bytes_in': size, 'bytes_out': size}
+            return {
+                'file': file_path,
+                's3_key': key,
+                'bytes': sizes['bytes_in'],
+                'uploaded_bytes': sizes['bytes_out'],
+                'seconds': time.monotonic() - started,
+                'success': True
+            }
+        except Exception as e:
+            return {
+                'file': file_path,
+                's3_key': None,
+                'seconds': time.monotonic() - started,
+                'success': False,
+                'error': str(e)
+            }
+
+    def upload(self, uploads: Iterable[Tuple[str, str]]) -> Iterator[Dict]:
+        """
+        并发上传 (本地路径, S3键) 列表，按输入顺序逐个产出结果
+        进行中的任务数有上限，输入可以是惰性迭代器
+        """
+        started = time.monotonic()
+        pending = deque()
+        max_in_flight = self.concurrency * 2
+
+        def collect(future):
+            result = future.result()
+            self.stats['files'] += 1
+            if result.get('skipped'):
+                self.stats['skipped'] += 1
+            elif result['success']:
+                self.stats['bytes'] += result['bytes']
+                self.stats['uploaded_bytes'] += result['uploaded_bytes']
+            else:
+                self.stats['failed'] += 1
+            self.stats['seconds'] = time.monotonic() - started
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='s3-upload') as executor:
+            for file_path, key in uploads:
+                pending.append(executor.submit(self._upload_one, str(file_path), key))
+                while len(pending) >= max_in_flight:
+                    yield collect(pending.popleft())
+            while pending:
+                yield collect(pending.popleft())
+
+    @property
+    def throughput_mb_s(self) -> float:
+        """整体上传吞吐 (MB/s，按实际上传的字节数计算)"""
+        if self.stats['seconds'] <= 0:
+            return 0.0
+        return self.stats['uploaded_bytes'] / (1024 * 1024) / self.stats['seconds']
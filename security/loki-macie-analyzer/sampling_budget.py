@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+按扫描量自适应选择Macie采样比例
+根据本次上传的字节数和对象数，以及配置的时间或费用预算，选择 samplingPercentage，
+并估算采样结果的统计置信度 (比例估计的误差范围、低比例敏感数据被发现的概率)。
+"""
+
+import math
+from typing import Dict, Optional
+
+# Macie按扫描的数据量计费 (美元/GB，各区域不同，需按实际区域配置)
+DEFAULT_PRICE_PER_GB = 1.0
+
+# 单个作业的估计扫描吞吐 (MB/分钟)，建议根据以往作业的耗时校准
+DEFAULT_THROUGHPUT_MB_PER_MINUTE = 200
+
+DEFAULT_MIN_PERCENTAGE = 10
+
+# 95%置信水平的z值
+Z_95 = 1.96
+
+# 估算发现概率时假设的含敏感数据对象比例
+DETECTION_PREVALENCE = 0.01
+
+
+def margin_of_error(sampled: int, population: int) -> float:
+    """
+    95%置信水平下含敏感数据对象比例估计的误差范围 (最坏情况 p=0.5，含有限总体修正)，全量扫描时为0
+    """
+    if sampled <= 0:
+        return 1.0
+    if sampled >= population:
+        return 0.0
+    correction = math.sqrt((population - sampled) / (population - 1)) if population > 1 else 0.0
+    return Z_95 * math.sqrt(0.25 / sampled) * correction
+
+
+def detection_probability(sampled: int, population: int, prevalence: float = DETECTION_PREVALENCE) -> float:
+    """敏感数据出现在 prevalence 比例的对象中时，采样至少包含其中一个对象的概率"""
+    if sampled >= population:
+        return 1.0 if population * prevalence > 0 else 0.0
+    return 1 - (1 - prevalence) ** sampled
+
+
+def budget_bytes(options: Dict, parallel_jobs: int = 1) -> Optional[int]:
+    """
+    预算允许扫描的字节数 (时间预算和费用预算取较小者)，未配置预算时返回None
+    时间预算按同时运行的作业数并行计算
+    """
+    limits = []
+    if options.get('max_scan_minutes'):
+        throughput = options.get('throughput_mb_per_minute', DEFAULT_THROUGHPUT_MB_PER_MINUTE)
+        limits.append(options['max_scan_minutes'] * throughput * 1024 * 1024 * max(1, parallel_jobs))
+    if options.get('max_cost_usd'):
+        price = options.get('price_per_gb', DEFAULT_PRICE_PER_GB)
+        limits.append(options['max_cost_usd'] / price * 1024 ** 3)
+    return int(min(limits)) if limits else None
+
+
+def plan_sampling(total_bytes: int, total_objects: int, options: Dict, max_percentage: int = 100,
+                  override: Optional[int] = None, parallel_jobs: int = 1) -> Dict:
+    """
+    选择采样比例
+    override: 命令行指定的采样比例，直接使用
+    options: macie.sampling_budget 配置 (max_scan_minutes / throughput_mb_per_minute / max_cost_usd /
+             price_per_gb / min_percentage)，未配置预算时使用 max_percentage
+    Macie按对象采样，估算假设对象大小均匀。返回选择的比例、依据和置信度估计
+    """
+    if override is not None:
+        percentage, reason = override, 'override'
+    else:
+        limit = budget_bytes(options, parallel_jobs)
+        if limit is None or total_bytes <= 0:
+            percentage, reason = max_percentage, 'fixed'
+        else:
+            fitted = math.floor(limit / total_bytes * 100)
+            minimum = int(options.get('min_percentage', DEFAULT_MIN_PERCENTAGE))
+            percentage = min(max_percentage, max(minimum, fitted))
+            reason = 'budget' if fitted < max_percentage else 'within_budget'
+    percentage = max(1, min(100, int(percentage)))
+
+    sampled_objects = min(total_objects, math.ceil(total_objects * percentage / 100))
+    sampled_bytes = int(total_bytes * percentage / 100)
+    return {
+        'percentage': percentage,
+        'reason': reason,
+        'total_objects': total_objects,
+        'total_bytes': total_bytes,
+        'sampled_objects': sampled_objects,
+        'sampled_bytes': sampled_bytes,
+        'margin_of_error': round(margin_of_error(sampled_objects, total_objects), 4),
+        'detection_probability': round(detection_probability(sampled_objects, total_objects), 4),
+        'estimated_cost_usd': round(sampled_bytes / 1024 ** 3 * options.get('price_per_gb', DEFAULT_PRICE_PER_GB), 2),
+        'estimated_minutes': round(sampled_bytes / (1024 * 1024)
+                                   / options.get('throughput_mb_per_minute', DEFAULT_THROUGHPUT_MB_PER_MINUTE)
+                                   / max(1, parallel_jobs), 1)
+    }
+
+
+def sampling_tags(sampling: Dict) -> Dict[str, str]:
+    """记录在Macie作业标签中的采样信息"""
+    return {
+        'SamplingPercentage': str(sampling['percentage']),
+        'SamplingReason': sampling['reason'],
+        'SamplingMarginOfError': f"{sampling['margin_of_error']:.4f}",
+        'SamplingDetectionProbability': f"{sampling['detection_probability']:.4f}"
+    }
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Macie扫描记录
+记录每个S3对象被哪个Macie作业扫描过 (作业ID、作业创建时间以及扫描时对象的ETag)，持久化在状态目录中。
+ETag一致只说明对象内容未变化，不说明它被扫描过: 上传时只有内容未变化且当前内容已被某个作业扫描过的对象才跳过，
+上次运行上传后在创建作业前中断留下的对象会重新上传，由本次运行的作业扫描。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEDGER_VERSION = 1
+LEDGER_FILE_NAME = 'scanned_objects.json'
+
+
+class ScanLedger:
+    """
+    持久化的对象扫描记录 (JSON文件): S3键 -> etag、job_id、job_created_at (Unix时间戳)
+    持续监控和手动运行可能先后写入同一个文件，写回前重新加载并合并
+    """
+
+    def __init__(self, ledger_file: str):
+        self.ledger_file = Path(ledger_file)
+        self._lock = threading.Lock()
+        self.objects: Dict[str, Dict] = self._read()
+
+    def _read(self) -> Dict[str, Dict]:
+        if not self.ledger_file.exists():
+            return {}
+        with open(self.ledger_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != LEDGER_VERSION:
+            logger.warning(f"扫描记录版本不匹配，忽略旧记录: {self.ledger_file}")
+            return {}
+        return data.get('objects', {})
+
+    def scanned(self, key: str, etag: str) -> Optional[Dict]:
+        """对象的当前内容 (ETag) 已被扫描时返回扫描记录，否则返回None"""
+        entry = self.objects.get(key)
+        if entry is not None and entry.get('etag') == etag:
+            return entry
+        return None
+
+    def record_job(self, objects: Dict[str, Dict], job_id: str, created_at: datetime):
+        """
+        记录作业扫描的对象并原子方式写回
+        objects: 创建作业前列出的作业范围内的对象 (S3ObjectIndex.objects 格式: 键 -> size、etag、last_modified)
+        """
+        entries = {
+            key: {'etag': obj['etag'], 'job_id': job_id, 'job_created_at': created_at.timestamp()}
+            for key, obj in objects.items()
+        }
+        with self._lock:
+            self.objects = self._read()
+            self.objects.update(entries)
+            self.ledger_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.ledger_file.with_name(self.ledger_file.name + '.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'version': LEDGER_VERSION,
+                    'updated_at': datetime.now(timezone.utc).isoformat(),
+                    'objects': self.objects
+                }, f, indent=2)
+            os.replace(tmp_file, self.ledger_file)
+        logger.info(f"扫描记录: 作业 {job_id} 覆盖 {len(entries)} 个对象")
+
+    def filter_index(self, index) -> 'ScannedObjectIndex':
+        """只保留当前内容已被扫描过的已有对象的索引，用于判断是否跳过上传"""
+        return ScannedObjectIndex(index, self)
+
+
+class ScannedObjectIndex:
+    """
+    已有对象索引 (S3ObjectIndex 或 PartitionedObjectIndex) 的包装: 当前内容未被扫描过的对象视为不存在 (重新上传)，
+    被扫描过的对象的索引记录附加 'scanned' (扫描记录)
+    """
+
+    def __init__(self, index, ledger: ScanLedger):
+        self.index = index
+        self.ledger = ledger
+        # 已存在但当前内容尚未被扫描的对象数
+        self.unscanned = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        scanned = self.ledger.scanned(key, entry['etag'])
+        if scanned is None:
+            with self._lock:
+                self.unscanned += 1
+            return None
+        return dict(entry, scanned=scanned)
+
+    def __len__(self) -> int:
+        return len(self.index)
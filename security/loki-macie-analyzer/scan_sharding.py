@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+大规模扫描分片
+把本次上传的对象按键前缀划分为N个互不重叠的Macie作业范围，按对象字节数均衡，
+在并发作业数上限内提交，并把各分片作业的统计信息合并为一次逻辑运行。
+"""
+
+import asyncio
+import heapq
+import os
+from typing import Callable, Dict, List, Optional
+import logging
+
+from macie_poller import MacieJobPoller
+from time_partition import MAX_SCOPE_PREFIXES
+
+logger = logging.getLogger(__name__)
+
+# 细分前缀时的目标数量 (分片数的倍数)，前缀越多均衡越好，但作业范围条件越长
+REFINE_FACTOR = 8
+
+# 作业统计中可以直接相加的数值字段
+SUMMABLE_STATISTICS = ('approximateNumberOfObjectsToProcess', 'numberOfRuns')
+
+
+def _split_unit(prefix: str, keys: List[str]) -> Optional[Dict[str, List[str]]]:
+    """
+    按公共部分之后的下一个字符把前缀细分为子前缀，无法细分 (只有一个对象或某个键就是公共部分) 时返回None
+    """
+    if len(keys) < 2:
+        return None
+    common = os.path.commonprefix(keys)
+    if any(len(key) == len(common) for key in keys):
+        return None
+    children: Dict[str, List[str]] = {}
+    for key in keys:
+        children.setdefault(key[:len(common) + 1], []).append(key)
+    return children
+
+
+def plan_shards(object_sizes: Dict[str, int], scope_prefixes: List[str], shard_count: int,
+                max_prefixes: int = MAX_SCOPE_PREFIXES,
+                is_exclusive: Optional[Callable[[str, List[str]], bool]] = None) -> List[Dict]:
+    """
+    规划分片作业范围
+    object_sizes: 本次上传的S3键 -> 字节数
+    scope_prefixes: 整个扫描范围的前缀 (互不重叠)，每个前缀整体分配给一个分片
+    前缀数量不足以均衡时，把最大的前缀按对象键细分。细分后的前缀只覆盖本次上传的对象，
+    因此只细分 is_exclusive(前缀, 本次上传的键) 为True (前缀下没有其他对象) 的前缀；
+    其他前缀整体保留并警告分片可能不均衡，未提供 is_exclusive 时不细分。
+    前缀按字节数从大到小依次分配给当前字节数最少的分片 (LPT)，每个分片最多 max_prefixes 个前缀。
+    返回 [{'prefixes': [...], 'objects': 对象数, 'bytes': 字节数}, ...]，按前缀排序
+    """
+    units: Dict[str, List[str]] = {prefix: [] for prefix in scope_prefixes}
+    for key in sorted(object_sizes):
+        for prefix in scope_prefixes:
+            if key.startswith(prefix):
+                units[prefix].append(key)
+                break
+
+    def weight(prefix):
+        return sum(object_sizes[key] for key in units[prefix])
+
+    # 细分最大的前缀，直到前缀数量足够均衡或无法继续细分
+    # 整个扫描范围的前缀需先确认没有本次运行之外的对象，细分出的子前缀属于已确认的前缀
+    limit = shard_count * max_prefixes
+    target = min(limit, shard_count * REFINE_FACTOR)
+    unsplittable = set()
+    shared = []
+    while len(units) < target:
+        candidates = [p for p in units if p not in unsplittable]
+        if not candidates:
+            break
+        prefix = max(candidates, key=weight)
+        if prefix in scope_prefixes and (is_exclusive is None or not is_exclusive(prefix, units[prefix])):
+            unsplittable.add(prefix)
+            shared.append(prefix)
+            continue
+        children = _split_unit(prefix, units[prefix])
+        if children is None or len(units) - 1 + len(children) > limit:
+            unsplittable.add(prefix)
+            continue
+        del units[prefix]
+        units.update(children)
+    if shared:
+        logger.warning(f"⚠️ {len(shared)} 个前缀下有本次运行之外的对象 (或无法确认)，不按对象键细分，"
+                       f"整体分配给一个分片，分片可能不均衡: {', '.join(shared[:3])}"
+                       f"{' ...' if len(shared) > 3 else ''}")
+
+    # LPT: 大的前缀优先分配给字节数最少且前缀数未满的分片
+    shards = [{'prefixes': [], 'objects': 0, 'bytes': 0} for _ in range(shard_count)]
+    heap = [(0, index) for index in range(shard_count)]
+    for prefix in sorted(units, key=lambda p: (-weight(p), p)):
+        full = []
+        while True:
+            load, index = heapq.heappop(heap)
+            if len(shards[index]['prefixes']) < max_prefixes:
+                break
+            full.append((load, index))
+        shard = shards[index]
+        shard['prefixes'].append(prefix)
+        shard['objects'] += len(units[prefix])
+        shard['bytes'] += weight(prefix)
+        heapq.heappush(heap, (shard['bytes'], index))
+        for item in full:
+            heapq.heappush(heap, item)
+
+    shards = [shard for shard in shards if shard['prefixes']]
+    for shard in shards:
+        shard['prefixes'].sort()
+    return sorted(shards, key=lambda shard: shard['prefixes'][0])
+
+
+def effective_shard_count(total_bytes: int, shard_count: int, min_shard_bytes: int) -> int:
+    """分片数不超过 总字节数 / 每个分片的最小字节数，扫描量较小时不分片"""
+    if min_shard_bytes <= 0:
+        return max(1, shard_count)
+    return max(1, min(shard_count, -(-total_bytes // min_shard_bytes)))
+
+
+async def _submit_jobs(create_job: Callable[[int], str], shard_count: int, max_concurrent_jobs: int,
+                       created: Dict[int, str], poller: MacieJobPoller, totals: Dict[int, int],
+                       wait: bool) -> Dict[int, Dict]:
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrent_jobs)
+    # 分片数不超过并发上限且不需要等待时，提交后立即返回
+    hold = wait or shard_count > max_concurrent_jobs
+    results: Dict[int, Dict] = {}
+
+    async def run_shard(index):
+        async with semaphore:
+            job_id = created.get(index)
+            if job_id is None:
+                job_id = await loop.run_in_executor(None, create_job, index)
+            results[index] = {'job_id': job_id}
+            if hold:
+                results[index]['response'] = await poller.track(job_id, totals.get(index))
+
+    # 按顺序提交，保证前面的分片先获得并发名额
+    tasks = []
+    for index in range(shard_count):
+        tasks.append(asyncio.ensure_future(run_shard(index)))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return results
+
+
+def submit_sharded_jobs(create_job: Callable[[int], str], shards: List[Dict], poller_factory: Callable[[], MacieJobPoller],
+                        max_concurrent_jobs: int, created: Optional[Dict[int, str]] = None,
+                        wait: bool = False) -> Dict[int, Dict]:
+    """
+    在并发作业数上限内提交分片作业
+    create_job(index) 创建第 index 个分片的作业并返回作业ID；created 中已有的分片 (恢复运行) 不再创建。
+    分片数超过上限时，每个作业占用一个名额直到结束，后面的分片等待名额后再提交。
+    返回 index -> {'job_id', 'response' (等待结束时的作业描述)}
+    """
+    async def run():
+        # 轮询器需要在事件循环中创建
+        return await _submit_jobs(create_job, len(shards), max(1, max_concurrent_jobs), created or {},
+                                  poller_factory(), {i: shard['objects'] for i, shard in enumerate(shards)}, wait)
+    return asyncio.run(run())
+
+
+def merge_job_statistics(responses: List[Dict]) -> Dict:
+    """
+    把多个分片作业的描述合并为一次逻辑运行的状态和统计
+    全部完成时状态为 COMPLETE，否则为尚未结束或异常的状态 (按出现顺序取第一个)
+    """
+    statistics = {}
+    for response in responses:
+        for name in SUMMABLE_STATISTICS:
+            value = (response.get('statistics') or {}).get(name)
+            if value is not None:
+                statistics[name] = statistics.get(name, 0) + value
+    statuses = [response.get('jobStatus') for response in responses]
+    status = next((s for s in statuses if s != 'COMPLETE'), 'COMPLETE') if statuses else None
+    created = [r['createdAt'] for r in responses if r.get('createdAt')]
+    completed = [r['lastRunTime'] for r in responses if r.get('lastRunTime')]
+    return {
+        'jobStatus': status,
+        'createdAt': min(created) if created else None,
+        'lastRunTime': max(completed) if completed and status == 'COMPLETE' else None,
+        'statistics': statistics
+    }
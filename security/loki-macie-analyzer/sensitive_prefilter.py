@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+敏感数据本地预过滤
+在上传到S3之前，用多模式匹配器 (关键词 + 带前置字面量检查的正则) 扫描每一行日志，
+只保留可能包含敏感数据的候选行及其上下文，减少Macie按字节计费的扫描量。
+"""
+
+import re
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+import logging
+
+# 可选的C扩展Aho-Corasick自动机，未安装时逐个关键词做子串查找
+try:
+    import ahocorasick as _ahocorasick
+except ImportError:
+    _ahocorasick = None
+
+logger = logging.getLogger(__name__)
+
+# 候选敏感数据正则，键名与Macie托管数据标识符类型一致
+DEFAULT_PATTERNS = {
+    'EMAIL_ADDRESS': r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}',
+    'AWS_CREDENTIALS': r'\b(?:AKIA|ASIA)[0-9A-Z]{16}\b',
+    'CREDIT_CARD_NUMBER': r'\b(?:\d{4}[ -]?){3}\d{4}\b|\b3[47]\d{2}[ -]?\d{6}[ -]?\d{5}\b',
+    'USA_SOCIAL_SECURITY_NUMBER': r'\b\d{3}-\d{2}-\d{4}\b',
+    'PHONE_NUMBER': r'(?<!\d)1[3-9]\d{9}(?!\d)|\+\d{10,14}\b',
+    'CHINA_IDENTIFICATION': r'(?<!\d)\d{17}[\dXx](?!\d)',
+    'JSON_WEB_TOKEN': r'\beyJ[A-Za-z0-9_-]{5,}\.[A-Za-z0-9_-]{5,}\.[A-Za-z0-9_-]{5,}',
+    'PRIVATE_KEY': r'-----BEGIN [A-Z ]*PRIVATE KEY-----',
+}
+
+# 默认正则的前置字面量: 行中不含其中任何一个时正则不可能匹配，跳过正则搜索
+# 字面量在数字统一替换为0之后的行上检查，数字类正则以其必然包含的数字形状作为前置条件
+# (日志行几乎都含时间戳数字，只检查"含数字"无法跳过任何行)
+PATTERN_PRECURSORS = {
+    'EMAIL_ADDRESS': ('@',),
+    'AWS_CREDENTIALS': ('AKIA', 'ASIA'),
+    'CREDIT_CARD_NUMBER': ('00000000', '0000 0000', '0000-0000', '000 000000', '000-000000'),
+    'USA_SOCIAL_SECURITY_NUMBER': ('000-00-0000',),
+    'PHONE_NUMBER': ('00000000', '+0000000000'),
+    'CHINA_IDENTIFICATION': ('00000000',),
+    'JSON_WEB_TOKEN': ('eyJ',),
+    'PRIVATE_KEY': ('-----BEGIN',),
+}
+
+_DIGIT_SHAPE = str.maketrans('123456789', '000000000')
+
+# 常见的凭证/个人信息关键词 (不区分大小写)
+# token 只匹配赋值形式，避免 "token refreshed" 之类的普通日志成为候选行
+DEFAULT_KEYWORDS = [
+    'password', 'passwd', 'pwd=', 'secret', 'token=', 'token":', 'token:', 'access_token',
+    'refresh_token', 'id_token', 'auth_token', 'api_key', 'apikey',
+    'access_key', 'authorization', 'bearer ', 'credential', 'private_key',
+    'ssn', 'credit_card', 'card_number', '身份证', '手机号', '银行卡',
+]
+
+# 上下文之间的分隔行
+CONTEXT_SEPARATOR = '--'
+
+
+class MultiPatternMatcher:
+    """
+    多模式匹配器: 每行只转小写一次，关键词使用Aho-Corasick自动机 (需要pyahocorasick) 或子串查找；
+    正则逐个编译，有前置字面量的正则只在行中 (数字替换为0后) 出现该字面量时才搜索
+    (合并成单个大正则时每个位置都要尝试全部分支，比逐个搜索慢一个数量级)
+    """
+
+    def __init__(self, keywords: Iterable[str] = (), patterns: Optional[Dict[str, str]] = None,
+                 precursors: Optional[Dict[str, Iterable[str]]] = None):
+        """
+        patterns: {名称: 正则}
+        precursors: {名称: 字面量列表}，数字替换为0后的行至少包含其中一个时才搜索该正则
+        """
+        self._keywords = tuple(sorted({k.lower() for k in keywords if k}, key=len, reverse=True))
+        precursors = precursors or {}
+        self._regexes = [(tuple(precursors[name]) if precursors.get(name) else None, re.compile(regex))
+                         for name, regex in (patterns or {}).items()]
+
+        self._automaton = None
+        if self._keywords and _ahocorasick is not None:
+            automaton = _ahocorasick.Automaton()
+            for keyword in self._keywords:
+                automaton.add_word(keyword, keyword)
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    def _keyword_match(self, line: str) -> bool:
+        if not self._keywords:
+            return False
+        lowered = line.lower()
+        if self._automaton is not None:
+            for _ in self._automaton.iter(lowered):
+                return True
+            return False
+        for keyword in self._keywords:
+            if keyword in lowered:
+                return True
+        return False
+
+    def matches(self, line: str) -> bool:
+        """判断一行是否为候选敏感行"""
+        if self._keyword_match(line):
+            return True
+        shape = None
+        for literals, regex in self._regexes:
+            if literals is not None:
+                if shape is None:
+                    shape = line.translate(_DIGIT_SHAPE)
+                if not any(literal in shape for literal in literals):
+                    continue
+            if regex.search(line):
+                return True
+        return False
+
+
+class SensitivePreFilter:
+    """按行过滤: 保留候选行以及前后 context_lines 行上下文"""
+
+    def __init__(self, options: Optional[Dict] = None):
+        options = options or {}
+        patterns = dict(DEFAULT_PATTERNS)
+        patterns.update(options.get('patterns') or {})
+        keywords = list(DEFAULT_KEYWORDS) + list(options.get('keywords') or [])
+        # 被自定义正则覆盖的默认名称不再使用默认前置字面量
+        precursors = {name: PATTERN_PRECURSORS[name] for name, regex in patterns.items()
+                      if name in PATTERN_PRECURSORS and regex == DEFAULT_PATTERNS[name]}
+
+        self.matcher = MultiPatternMatcher(keywords, patterns, precursors)
+        self.context_lines = int(options.get('context_lines', 2))
+        self.stats = {'lines_in': 0, 'lines_out': 0, 'bytes_in': 0, 'bytes_out': 0, 'matched_lines': 0}
+        self._before = deque(maxlen=self.context_lines) if self.context_lines else None
+        self._after_remaining = 0
+        self._index = -1
+        self._last_emitted = -1
+        self._in_header = True
+
+    def _emit(self, out: List[str], line: str):
+        self.stats['lines_out'] += 1
+        self.stats['bytes_out'] += len(line.encode('utf-8'))
+        out.append(line)
+
+    def feed(self, line: str) -> List[str]:
+        """
+        输入一行 (含换行符)，返回需要输出的行
+        以 '#' 开头的提取文件注释头始终保留，便于追溯来源chunk
+        """
+        self._index += 1
+        self.stats['lines_in'] += 1
+        self.stats['bytes_in'] += len(line.encode('utf-8'))
+        out = []
+
+        if self._in_header:
+            if line.startswith('#'):
+                self._last_emitted = self._index
+                self._emit(out, line)
+                return out
+            self._in_header = False
+
+        if self.matcher.matches(line):
+            self.stats['matched_lines'] += 1
+            context = list(self._before) if self._before else []
+            first_index = self._index - len(context)
+            # 与上一段输出不连续时插入分隔行
+            if self._last_emitted >= 0 and first_index > self._last_emitted + 1:
+                self._emit(out, CONTEXT_SEPARATOR + '\n')
+            for context_line in context:
+                self._emit(out, context_line)
+            if self._before:
+                self._before.clear()
+            self._last_emitted = self._index
+            self._after_remaining = self.context_lines
+            self._emit(out, line)
+        elif self._after_remaining > 0:
+            self._after_remaining -= 1
+            self._last_emitted = self._index
+            self._emit(out, line)
+        elif self._before is not None:
+            self._before.append(line)
+        return out
+
+    def iter_filtered(self, lines: Iterable[str]) -> Iterator[str]:
+        """逐行过滤 (行尾保留换行符)"""
+        for line in lines:
+            yield from self.feed(line)
+
+    @property
+    def has_candidates(self) -> bool:
+        return self.stats['matched_lines'] > 0
+
+
+class PreFilterWriter:
+    """
+    类文件包装器: 接收任意切分的文本，按行过滤后转发给内部写入器
+    用于流式上传模式，过滤与解码同时进行
+    """
+
+    def __init__(self, inner, prefilter: SensitivePreFilter):
+        self.inner = inner
+        self.prefilter = prefilter
+        self._partial = ''
+
+    def write(self, data: str) -> int:
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            for out_line in self.prefilter.feed(line + '\n'):
+                self.inner.write(out_line)
+        return len(data)
+
+    def flush(self):
+        """输出末尾没有换行符的最后一行"""
+        if self._partial:
+            for out_line in self.prefilter.feed(self._partial + '\n'):
+                self.inner.write(out_line)
+            self._partial = ''
+
+
+def prefilter_file(input_file: str, output_file: str, options: Optional[Dict] = None) -> Dict:
+    """
+    过滤单个提取文件，返回结果字典 (不抛出异常)
+    没有任何候选行时不生成输出文件
+    """
+    output_path = Path(output_file)
+    try:
+        prefilter = SensitivePreFilter(options)
+        with open(input_file, 'r', encoding='utf-8', errors='replace') as src, \
+                open(output_path, 'w', encoding='utf-8') as dst:
+            for line in prefilter.iter_filtered(src):
+                dst.write(line)
+
+        if not prefilter.has_candidates:
+            output_path.unlink()
+            output_file = None
+        return {
+            'chunk_file': input_file,
+            'output_file': output_file,
+            'success': True,
+            'stats': prefilter.stats
+        }
+    except Exception as e:
+        if output_path.exists():
+            output_path.unlink()
+        return {
+            'chunk_file': input_file,
+            'output_file': None,
+            'success': False,
+            'error': str(e)
+        }
+
+
+def reduction_ratio(bytes_in: int, bytes_out: int) -> float:
+    """扫描量缩减倍数 (输入字节 / 输出字节)"""
+    if bytes_out == 0:
+        return float('inf') if bytes_in else 1.0
+    return bytes_in / bytes_out
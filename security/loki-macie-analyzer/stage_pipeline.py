@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+重叠执行的阶段流水线
+每个阶段在独立线程中运行，阶段之间通过有界队列逐项传递输出: 提取仍在进行时预过滤和上传已经开始，
+端到端耗时接近最慢的阶段而不是各阶段之和；下游处理不过来时上游阻塞在队列上 (背压)，
+两个阶段之间最多缓冲 queue_size 个项目。任一阶段出错时其余阶段尽快停止，异常在调用方重新抛出。
+"""
+
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 32
+
+# 阻塞在队列上时检查取消标志的间隔 (秒)
+POLL_SECONDS = 0.1
+
+# 阶段: (名称, 函数)，函数接收输入项目的迭代器，返回 (或逐个产出) 输出项目
+Stage = Tuple[str, Callable[[Iterator], Iterable]]
+
+_END = object()
+
+
+class _Cancelled(Exception):
+    """其他阶段出错，本阶段停止"""
+
+
+class StagePipeline:
+    """
+    按顺序连接的阶段，每个阶段一个线程
+    阶段函数在自己的线程中迭代输入，同一阶段内的项目顺序保持不变 (去重等依赖顺序的阶段结果与逐阶段执行一致)
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = DEFAULT_QUEUE_SIZE):
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self._cancel = threading.Event()
+        self._errors: List[Tuple[str, BaseException]] = []
+        # 各阶段输出队列中曾达到的最大项目数 (用于观察背压)
+        self.max_queued = {name: 0 for name, _ in stages}
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._cancel.is_set():
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _iter_queue(self, q: queue.Queue) -> Iterator:
+        while True:
+            if self._cancel.is_set():
+                raise _Cancelled()
+            try:
+                item = q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _run_stage(self, name: str, func, items: Iterable, output: queue.Queue):
+        try:
+            for item in func(items):
+                if not self._put(output, item):
+                    return
+                self.max_queued[name] = max(self.max_queued[name], output.qsize())
+            self._put(output, _END)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            logger.error(f"❌ 流水线阶段 {name} 失败: {e}")
+            self._errors.append((name, e))
+            self._cancel.set()
+
+    def run(self, source: Iterable) -> Iterator:
+        """
+        启动全部阶段并逐个产出最后一个阶段的输出
+        第一个阶段在自己的线程中迭代 source (可以是惰性的目录遍历)
+        """
+        threads = []
+        items = source
+        for name, func in self.stages:
+            output = queue.Queue(maxsize=self.queue_size)
+            thread = threading.Thread(target=self._run_stage, args=(name, func, items, output),
+                                      name=f"stage-{name}", daemon=True)
+            threads.append(thread)
+            items = self._iter_queue(output)
+        for thread in threads:
+            thread.start()
+
+        completed = False
+        try:
+            yield from items
+            completed = True
+        except _Cancelled:
+            pass
+        finally:
+            if not completed:
+                # 出错或调用方提前停止迭代
+                self._cancel.set()
+            for thread in threads:
+                thread.join()
+        if self._errors:
+            raise self._errors[0][1]
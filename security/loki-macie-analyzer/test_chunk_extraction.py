@@ -6,10 +6,13 @@ Loki Chunk文件解析测试工具
 
 import os
 import subprocess
+import tempfile
 from pathlib import Path
 import json
 from datetime import datetime
 
+from chunk_extractor import iter_chunks_inspect_output
+
 def test_chunks_inspect_tool():
     """测试chunks-inspect工具"""
     print("🔧 测试chunks-inspect工具...")
@@ -45,21 +48,25 @@ def analyze_chunk_file(chunk_file):
     file_size = chunk_file.stat().st_size
     print(f"   文件大小: {file_size:,} 字节")
     
-    # 使用chunks-inspect提取日志内容
+    # 使用chunks-inspect提取日志内容 (逐行流式读取，不在内存中保留完整输出)
     try:
         cmd = ['./chunks-inspect', '-l', str(chunk_file)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            output = result.stdout
-            lines = output.split('\n')
+        with tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file,
+                                    text=True, encoding='utf-8', errors='replace')
             
             # 解析元数据
             metadata = {}
-            log_lines = []
+            output_size = 0
+            log_count = 0
+            sample_logs = []
             in_log_section = False
             
-            for line in lines:
+            for line in proc.stdout:
+                output_size += len(line)
+                line = line.rstrip('\n')
+                is_log_line = False
+                
                 if line.startswith('UserID:'):
                     metadata['user_id'] = line.split(':', 1)[1].strip()
                 elif line.startswith('From:'):
@@ -70,18 +77,28 @@ def analyze_chunk_file(chunk_file):
                     in_log_section = False
                 elif line.strip() and not line.startswith('\t') and not any(line.startswith(prefix) for prefix in ['Chunks file:', 'Metadata length:', 'Data length:', 'UserID:', 'From:', 'Through:', 'Labels:']):
                     if in_log_section or any(char.isdigit() for char in line[:20]):  # 可能是日志行
-                        log_lines.append(line)
+                        is_log_line = True
                 elif 'INFO' in line or 'ERROR' in line or 'WARN' in line or 'DEBUG' in line:
-                    log_lines.append(line)
+                    is_log_line = True
+                
+                if is_log_line and line.strip():
+                    log_count += 1
+                    # 只保留前几行作为样本
+                    if len(sample_logs) < 3:
+                        sample_logs.append(line)
             
+            returncode = proc.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read(4096).decode('utf-8', errors='replace')
+        
+        if returncode == 0:
             print(f"   ✅ 解析成功")
-            print(f"   📊 输出大小: {len(output):,} 字符")
+            print(f"   📊 输出大小: {output_size:,} 字符")
             print(f"   👤 用户ID: {metadata.get('user_id', 'N/A')}")
             print(f"   ⏰ 时间范围: {metadata.get('from_time', 'N/A')} - {metadata.get('through_time', 'N/A')}")
-            print(f"   📝 日志行数: {len([l for l in log_lines if l.strip()])} 行")
+            print(f"   📝 日志行数: {log_count} 行")
             
             # 显示前几行日志样本
-            sample_logs = [l for l in log_lines if l.strip()][:3]
             if sample_logs:
                 print("   📋 日志样本:")
                 for i, log in enumerate(sample_logs, 1):
@@ -90,18 +107,18 @@ def analyze_chunk_file(chunk_file):
             return {
                 'file_name': chunk_file.name,
                 'file_size': file_size,
-                'output_size': len(output),
+                'output_size': output_size,
                 'metadata': metadata,
-                'log_count': len([l for l in log_lines if l.strip()]),
+                'log_count': log_count,
                 'success': True
             }
         else:
-            print(f"   ❌ 解析失败: {result.stderr}")
+            print(f"   ❌ 解析失败: {stderr}")
             return {
                 'file_name': chunk_file.name,
                 'file_size': file_size,
                 'success': False,
-                'error': result.stderr
+                'error': stderr
             }
             
     except Exception as e:
@@ -171,19 +188,17 @@ def save_extraction_test(results):
         sample_path = Path('./lokichunk') / sample_file
         
         try:
-            cmd = ['./chunks-inspect', '-l', str(sample_path)]
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            sample_output = output_dir / f'{sample_file}_sample.txt'
+            with open(sample_output, 'w', encoding='utf-8') as f:
+                f.write(f"# Loki Chunk文件提取样本\n")
+                f.write(f"# 文件: {sample_file}\n")
+                f.write(f"# 提取时间: {datetime.now().isoformat()}\n")
+                f.write("# " + "="*50 + "\n\n")
+                # 按固定大小切片转发输出
+                for text in iter_chunks_inspect_output(sample_path):
+                    f.write(text)
             
-            if result.returncode == 0:
-                sample_output = output_dir / f'{sample_file}_sample.txt'
-                with open(sample_output, 'w', encoding='utf-8') as f:
-                    f.write(f"# Loki Chunk文件提取样本\n")
-                    f.write(f"# 文件: {sample_file}\n")
-                    f.write(f"# 提取时间: {datetime.now().isoformat()}\n")
-                    f.write("# " + "="*50 + "\n\n")
-                    f.write(result.stdout)
-                
-                print(f"📝 样本文件已保存: {sample_output}")
+            print(f"📝 样本文件已保存: {sample_output}")
         except Exception as e:
             print(f"⚠️ 保存样本文件失败: {e}")
 
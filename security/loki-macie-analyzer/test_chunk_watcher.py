@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+持续监控模式测试
+验证微批的数量/等待时间触发和失败重试 (退避、最大尝试次数)、定期扫描的写完判断，
+以及监控模式下失败微批的chunk重新处理和待扫描窗口的持久化 (使用基准测试的进程内S3/Macie替身)
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from benchmark_pipeline import LocalMacieClient, LocalObjectStore, LocalSession, base_config
+from chunk_generator import generate_chunks
+from chunk_watcher import MicroBatcher, PollingWatcher
+from loki_macie_pipeline import LokiMaciePipeline
+
+
+def keys(batch):
+    return [str(path) for path in batch]
+
+
+def test_batch_ready_by_count():
+    batcher = MicroBatcher(max_chunks=2, max_age_seconds=60)
+    assert batcher.time_until_ready(now=0) is None
+    assert batcher.add(['a'], now=0) == 1
+    assert not batcher.ready(now=1)
+
+    # 取出前重复加入的文件只保留一次
+    assert batcher.add(['a', 'b', 'c'], now=1) == 2
+    assert batcher.ready(now=1)
+    assert keys(batcher.take(now=1)) == ['a', 'b']
+    assert keys(batcher.take(now=1)) == ['c']
+    assert len(batcher) == 0
+
+
+def test_batch_ready_by_age():
+    batcher = MicroBatcher(max_chunks=10, max_age_seconds=30)
+    batcher.add(['a'], now=100)
+    batcher.add(['b'], now=110)
+
+    assert batcher.oldest_age(now=120) == 20
+    assert batcher.time_until_ready(now=120) == 10
+    assert batcher.ready(now=130)
+
+
+def test_retry_backoff_and_priority():
+    batcher = MicroBatcher(max_chunks=10, max_age_seconds=30, max_attempts=5,
+                           retry_backoff_seconds=10, max_retry_backoff_seconds=25)
+    batcher.add(['a', 'b'], now=0)
+    batch = batcher.take(now=30)
+
+    assert batcher.retry(batch, now=30) == []
+    assert len(batcher) == 2
+    # 等待重试期间不重复加入，也不能取出
+    assert batcher.add(['a', 'new'], now=31) == 1
+    assert batcher.time_until_ready(now=31) == 9
+    assert keys(batcher.take(now=35)) == ['new']
+
+    # 退避时间到后重试的chunk排在队首，按已等待 max_age_seconds 计立即可以取出
+    batcher.add(['later'], now=39)
+    assert batcher.ready(now=40)
+    assert keys(batcher.take(now=40)) == ['a', 'b', 'later']
+
+    # 每次失败退避时间加倍，不超过上限
+    batcher.retry(['a'], now=40)
+    assert batcher.time_until_ready(now=40) == 20
+    batcher.take(now=60)
+    batcher.retry(['a'], now=60)
+    assert batcher.time_until_ready(now=60) == 25
+
+
+def test_retry_gives_up_after_max_attempts():
+    batcher = MicroBatcher(max_chunks=10, max_age_seconds=0, max_attempts=2, retry_backoff_seconds=1)
+    batcher.add(['a', 'b'], now=0)
+    batcher.retry(batcher.take(now=0), now=0)
+
+    batch = batcher.take(now=1)
+    assert keys(batch) == ['a', 'b']
+    # b 这次成功，a 第二次失败后放弃
+    batcher.done(['b'])
+    assert keys(batcher.retry(['a'], now=1)) == ['a']
+    assert len(batcher) == 0
+
+    # 放弃或成功后失败次数清零，之后再报告时重新计数
+    batcher.add(['a', 'b'], now=2)
+    assert batcher.retry(batcher.take(now=2), now=2) == []
+
+
+def test_release_retries_ignores_backoff_on_stop():
+    batcher = MicroBatcher(max_chunks=10, max_age_seconds=60, retry_backoff_seconds=600)
+    batcher.add(['a'], now=0)
+    batcher.retry(batcher.take(now=100), now=100)
+    assert batcher.take(now=101) == []
+
+    batcher.release_retries(math.inf)
+
+    assert keys(batcher.take(now=101)) == ['a']
+
+
+def write_chunk(path, content=b'chunk', age=60):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_polling_watcher_ignores_existing_files(tmp_path):
+    write_chunk(tmp_path / 'fake' / 'a' / 'old')
+    watcher = PollingWatcher(tmp_path, interval=0, settle_seconds=5)
+
+    assert watcher.poll(0) == []
+
+    new = write_chunk(tmp_path / 'fake' / 'b' / 'new')
+    assert watcher.poll(0) == [new]
+    assert watcher.poll(0) == []
+
+
+def test_polling_watcher_waits_for_settle_and_reports_rewrites(tmp_path):
+    existing = write_chunk(tmp_path / 'fake' / 'a' / 'chunk')
+    watcher = PollingWatcher(tmp_path, interval=0, settle_seconds=5, report_existing=True)
+    assert watcher.poll(0) == [existing]
+
+    # 最后修改未超过 settle_seconds 的文件可能仍在写入
+    writing = write_chunk(tmp_path / 'fake' / 'a' / 'writing', age=0)
+    assert watcher.poll(0) == []
+    os.utime(writing, (time.time() - 10, time.time() - 10))
+    assert watcher.poll(0) == [writing]
+
+    # 内容变化 (大小或修改时间) 后再次报告；隐藏文件不报告
+    write_chunk(existing, b'rewritten', age=30)
+    write_chunk(tmp_path / 'fake' / '.tmp' / 'x')
+    assert watcher.poll(0) == [existing]
+
+
+def test_polling_watcher_waits_for_interval(tmp_path):
+    watcher = PollingWatcher(tmp_path, interval=60, settle_seconds=0)
+    write_chunk(tmp_path / 'fake' / 'a' / 'chunk')
+
+    started = time.monotonic()
+    assert watcher.poll(0.01) == []
+    assert time.monotonic() - started < 1
+
+
+class WatchEnvironment:
+    """持续监控的管道: chunk目录、增量清单和基准测试的S3/Macie替身"""
+
+    def __init__(self, tmp_path, chunk_count=2, **watch_options):
+        self.tmp_path = tmp_path
+        self.chunk_dir = tmp_path / 'chunks'
+        generate_chunks(str(self.chunk_dir), count=chunk_count, chunk_size=20_000, streams=chunk_count, seed=5)
+        self.store = LocalObjectStore()
+        self.macie = LocalMacieClient(lambda: {})
+        config = base_config(tmp_path)
+        config['processing']['manifest_file'] = str(tmp_path / 'manifest.json')
+        config['processing']['watch'] = dict({'mode': 'poll', 'poll_interval_seconds': 0.05, 'settle_seconds': 0,
+                                              'batch_max_age_seconds': 0, 'retry_backoff_seconds': 0.01,
+                                              'job_interval_minutes': 60}, **watch_options)
+        self.config_file = tmp_path / 'config.json'
+        self.config_file.write_text(json.dumps(config), encoding='utf-8')
+
+    def pipeline(self):
+        return LokiMaciePipeline(config_file=str(self.config_file), session=LocalSession(self.store, self.macie),
+                                 interactive=False)
+
+    def watch(self, pipeline, stop_event, **kwargs):
+        return pipeline.watch_chunks(str(self.chunk_dir), str(self.tmp_path / 'extracted_texts'),
+                                     stop_event=stop_event, **kwargs)
+
+
+def fail_first_runs(pipeline, failures, stop_event, stop_after):
+    """前 failures 次运行抛出异常，之后调用真实的运行；运行 stop_after 次后停止监控"""
+    run = pipeline.run_complete_pipeline
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(list(kwargs['chunk_files']))
+        if len(calls) >= stop_after:
+            stop_event.set()
+        if len(calls) <= failures:
+            raise ConnectionError('S3 unavailable')
+        return run(*args, **kwargs)
+
+    pipeline.run_complete_pipeline = flaky
+    return calls
+
+
+def test_failed_batch_is_retried(tmp_path):
+    env = WatchEnvironment(tmp_path)
+    pipeline = env.pipeline()
+    stop_event = threading.Event()
+    calls = fail_first_runs(pipeline, failures=1, stop_event=stop_event, stop_after=2)
+
+    summary = env.watch(pipeline, stop_event)
+
+    assert len(calls) == 2
+    assert sorted(calls[1]) == sorted(calls[0])
+    assert summary['failed_batches'] == 1
+    assert summary['abandoned_chunks'] == 0
+    assert summary['chunks'] == 2
+    assert summary['uploaded_objects'] == 2
+    assert len(summary['job_ids']) == 1
+    # 重试成功的chunk记入增量清单
+    assert len(pipeline.manifest.chunks) == 2
+
+
+def test_failed_batch_abandoned_after_max_attempts(tmp_path):
+    env = WatchEnvironment(tmp_path, batch_max_attempts=2)
+    pipeline = env.pipeline()
+    stop_event = threading.Event()
+    calls = fail_first_runs(pipeline, failures=10, stop_event=stop_event, stop_after=10)
+    timer = threading.Timer(1.0, stop_event.set)
+    timer.start()
+    try:
+        summary = env.watch(pipeline, stop_event)
+    finally:
+        timer.cancel()
+
+    assert len(calls) == 2
+    assert summary['failed_batches'] == 2
+    assert summary['abandoned_chunks'] == 2
+    assert summary['uploaded_objects'] == 0
+    assert not summary['job_ids']
+    assert not pipeline.manifest.chunks
+
+
+def test_pending_retries_attempted_once_on_stop(tmp_path):
+    """停止时等待重试的chunk不等退避时间，再处理一次"""
+    env = WatchEnvironment(tmp_path, retry_backoff_seconds=600)
+    pipeline = env.pipeline()
+    stop_event = threading.Event()
+    calls = fail_first_runs(pipeline, failures=1, stop_event=stop_event, stop_after=1)
+
+    started = time.monotonic()
+    summary = env.watch(pipeline, stop_event)
+
+    assert time.monotonic() - started < 60
+    assert len(calls) == 2
+    assert summary['uploaded_objects'] == 2
+    assert summary['abandoned_chunks'] == 0
+
+
+def test_watch_window_round_trip(tmp_path):
+    env = WatchEnvironment(tmp_path)
+    pipeline = env.pipeline()
+    window_file = tmp_path / 'pipeline_state' / 'watch_window.json'
+    assert not window_file.exists()
+
+    window = pipeline._load_watch_window()
+    assert (window['partitions'], window['objects'], window['bytes']) == (set(), 0, 0)
+
+    since = datetime(2024, 1, 1, 8, 30, tzinfo=timezone.utc)
+    pipeline._save_watch_window({'since': since, 'partitions': {'2024/01/01/08', '2024/01/01/07'},
+                                 'objects': 3, 'bytes': 4096})
+
+    assert json.loads(window_file.read_text(encoding='utf-8'))['partitions'] == ['2024/01/01/07', '2024/01/01/08']
+    assert env.pipeline()._load_watch_window() == {'since': since, 'partitions': {'2024/01/01/07', '2024/01/01/08'},
+                                                   'objects': 3, 'bytes': 4096}
+
+
+class UnavailableMacieClient(LocalMacieClient):
+    def create_classification_job(self, **kwargs):
+        raise ConnectionError('Macie unavailable')
+
+
+def test_unscanned_window_survives_restart(tmp_path):
+    """作业创建失败时窗口保留在状态目录中，重启后为之前上传的对象创建作业"""
+    env = WatchEnvironment(tmp_path)
+    env.macie = UnavailableMacieClient(lambda: {})
+    pipeline = env.pipeline()
+    stop_event = threading.Event()
+    fail_first_runs(pipeline, failures=0, stop_event=stop_event, stop_after=1)
+
+    summary = env.watch(pipeline, stop_event)
+
+    assert summary['uploaded_objects'] == 2
+    assert not summary['job_ids']
+    saved = json.loads((tmp_path / 'pipeline_state' / 'watch_window.json').read_text(encoding='utf-8'))
+    assert saved['objects'] == 2
+    assert saved['partitions']
+
+    # 重启: 启动前的chunk已在增量清单中，不再上传；窗口中的对象由新的作业扫描
+    env.macie = LocalMacieClient(lambda: {})
+    restarted = env.pipeline()
+    stop_event = threading.Event()
+    stop_event.set()
+    summary = env.watch(restarted, stop_event)
+
+    assert summary['batches'] == 0
+    assert len(summary['job_ids']) == 1
+    job = env.macie.jobs[summary['job_ids'][0]]
+    assert job['createdAt'] >= datetime.fromtimestamp(saved['since'], timezone.utc)
+    assert json.loads((tmp_path / 'pipeline_state' / 'watch_window.json').read_text(encoding='utf-8'))['objects'] == 0
+
+
+def test_extract_only_watch_does_not_create_jobs(tmp_path):
+    env = WatchEnvironment(tmp_path)
+    pipeline = env.pipeline()
+    stop_event = threading.Event()
+    fail_first_runs(pipeline, failures=0, stop_event=stop_event, stop_after=1)
+
+    summary = env.watch(pipeline, stop_event, extract_only=True)
+
+    assert summary['chunks'] == 2
+    assert summary['uploaded_objects'] == 0
+    assert not env.macie.jobs
+    assert not (tmp_path / 'pipeline_state' / 'watch_window.json').exists()
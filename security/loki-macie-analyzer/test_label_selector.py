@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+LogQL风格标签选择器测试
+覆盖转义、四种匹配运算符、正则完整匹配和不存在标签按空字符串处理的语义
+"""
+
+import pytest
+
+from label_selector import parse_selector
+
+LABELS = {'namespace': 'payments', 'app': 'pay-api', 'env': 'prod'}
+
+
+def test_operators():
+    assert parse_selector('{namespace="payments"}').matches(LABELS)
+    assert not parse_selector('{namespace="orders"}').matches(LABELS)
+    assert parse_selector('{namespace!="orders"}').matches(LABELS)
+    assert not parse_selector('{namespace!="payments"}').matches(LABELS)
+    assert parse_selector('{app=~"pay-.*"}').matches(LABELS)
+    assert not parse_selector('{app=~"api"}').matches(LABELS)
+    assert parse_selector('{app!~"order.*"}').matches(LABELS)
+    assert not parse_selector('{app!~"pay.*"}').matches(LABELS)
+
+
+def test_all_matchers_must_match():
+    assert parse_selector('{namespace="payments", app=~"pay.*", env!="dev"}').matches(LABELS)
+    assert not parse_selector('{namespace="payments", env="dev"}').matches(LABELS)
+
+
+def test_regex_is_fully_anchored():
+    """与Prometheus/Loki一致，正则需匹配整个标签值"""
+    assert not parse_selector('{app=~"pay"}').matches(LABELS)
+    assert not parse_selector('{app=~"api"}').matches(LABELS)
+    assert parse_selector('{app=~"pay|pay-api"}').matches(LABELS)
+    assert parse_selector('{app=~"(?i)PAY-API"}').matches(LABELS)
+
+
+def test_missing_label_is_empty_string():
+    assert parse_selector('{team=""}').matches(LABELS)
+    assert not parse_selector('{team!=""}').matches(LABELS)
+    assert parse_selector('{team=~".*"}').matches(LABELS)
+    assert not parse_selector('{team=~".+"}').matches(LABELS)
+    assert parse_selector('{team!~".+"}').matches(LABELS)
+    assert not parse_selector('{namespace=""}').matches(LABELS)
+    assert parse_selector('{namespace!=""}').matches(LABELS)
+
+
+def test_escapes():
+    labels = {'msg': 'say "hi"\n', 'path': 'C:\\logs', 'host': 'a.b'}
+
+    assert parse_selector(r'{msg="say \"hi\"\n"}').matches(labels)
+    assert parse_selector(r'{path="C:\\logs"}').matches(labels)
+    # 未知转义保持原样，便于书写正则
+    assert parse_selector(r'{host=~"a\.b"}').matches(labels)
+    assert not parse_selector(r'{host=~"a\.b"}').matches({'host': 'axb'})
+
+
+def test_raw_string():
+    selector = parse_selector(r'{path=`C:\logs`, host=~`a\.b`}')
+
+    assert selector.matchers == [('path', '=', 'C:\\logs'), ('host', '=~', 'a\\.b')]
+    assert selector.matches({'path': 'C:\\logs', 'host': 'a.b'})
+
+
+def test_whitespace_and_braces_optional():
+    assert parse_selector('  namespace = "payments" ,app =~ "pay.*"  ').matches(LABELS)
+    assert parse_selector('{ namespace="payments", }').matches(LABELS)
+
+
+def test_equality_labels():
+    selector = parse_selector('{namespace="payments", team="", app=~"pay.*", env!="dev"}')
+
+    assert selector.equality_labels() == {'namespace': 'payments'}
+
+
+def test_str():
+    selector = parse_selector('{namespace="payments",app=~"pay.*"}')
+
+    assert str(selector) == '{namespace="payments", app=~"pay.*"}'
+    assert parse_selector(str(selector)).matchers == selector.matchers
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    '{}',
+    '{namespace="payments"',
+    '{namespace}',
+    '{namespace=payments}',
+    '{namespace=="payments"}',
+    '{1abc="x"}',
+    '{namespace="payments" app="x"}',
+    '{app=~"pay("}',
+])
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        parse_selector(text)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+跨chunk日志行去重测试
+验证有界内存下的代际淘汰 (经常重复的行不被淘汰)、时间戳规范化，以及旁路索引记录的来源位置
+"""
+
+import gzip
+
+from line_dedup import SIDECAR_HEADER, LineDeduplicator, dedup_text_files
+
+HEADER = '# Loki Chunk File: x\n'
+
+
+def entry(message, second=0):
+    return f"2024-01-01 00:00:{second:02d}.000000 UTC\t{message}\n"
+
+
+def write_files(tmp_path, contents):
+    files = []
+    for index, lines in enumerate(contents):
+        path = tmp_path / f"chunk_{index}.txt"
+        path.write_text(''.join(lines), encoding='utf-8')
+        files.append(str(path))
+    output = tmp_path / 'deduped'
+    output.mkdir()
+    return files, output
+
+
+def read_sidecar(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return f.readlines()
+
+
+def lookups(deduplicator, digests):
+    """依次查找，返回每次查找是否命中"""
+    return [deduplicator._lookup(digest, (0, line)) is not None for line, digest in enumerate(digests, 1)]
+
+
+def test_generation_rollover_evicts_unseen_lines():
+    deduplicator = LineDeduplicator(max_entries=4)
+
+    # 每代容量为2: a、b 写满第一代后成为上一代，c、d 写满后 a、b 被淘汰
+    assert lookups(deduplicator, [b'a', b'b', b'c', b'd']) == [False] * 4
+    assert lookups(deduplicator, [b'c', b'a']) == [True, False]
+
+
+def test_repeated_line_promoted_from_previous_generation():
+    """在上一代中命中的行复制到当前代，穿插在大量不同行之间也不会被淘汰"""
+    deduplicator = LineDeduplicator(max_entries=4)
+    digests = [b'hot']
+    for index in range(20):
+        digests += [f"cold-{index}".encode(), b'hot']
+
+    hits = lookups(deduplicator, digests)
+
+    assert hits[0] is False
+    assert all(hits[2::2])
+    assert not any(hits[1::2])
+    assert len(deduplicator._current) + len(deduplicator._previous) <= deduplicator.max_entries
+
+
+def test_promoted_hit_keeps_first_location():
+    deduplicator = LineDeduplicator(max_entries=4)
+    deduplicator._lookup(b'a', (0, 1))
+    deduplicator._lookup(b'b', (0, 2))
+
+    assert deduplicator._lookup(b'a', (3, 9)) == (0, 1)
+    assert deduplicator._current[b'a'] == (0, 1)
+
+
+def test_dedup_across_files_and_sidecar(tmp_path):
+    files, output = write_files(tmp_path, [
+        [HEADER, entry('a'), entry('b'), entry('a')],
+        [HEADER, entry('b'), entry('c')],
+        [HEADER, entry('a'), entry('c')],
+    ])
+    sidecar_file = tmp_path / 'sidecar.tsv.gz'
+
+    results = list(dedup_text_files(files, output, sidecar_file))
+
+    assert all(result['success'] for result in results)
+    assert (output / 'chunk_0.txt').read_text(encoding='utf-8') == HEADER + entry('a') + entry('b')
+    assert (output / 'chunk_1.txt').read_text(encoding='utf-8') == HEADER + entry('c')
+    # 所有日志条目都是重复行的文件不生成输出
+    assert results[2]['output_file'] is None
+    assert not (output / 'chunk_2.txt').exists()
+
+    header_size = len(HEADER)
+    entry_size = len(entry('a'))
+    assert read_sidecar(sidecar_file) == [
+        SIDECAR_HEADER,
+        f"chunk_0.txt\t4\t{header_size + 2 * entry_size}\tchunk_0.txt\t2\n",
+        f"chunk_1.txt\t2\t{header_size}\tchunk_0.txt\t3\n",
+        f"chunk_2.txt\t2\t{header_size}\tchunk_0.txt\t2\n",
+        f"chunk_2.txt\t3\t{header_size + entry_size}\tchunk_1.txt\t3\n",
+    ]
+    assert [result['stats']['duplicates'] for result in results] == [1, 1, 2]
+
+
+def test_strip_timestamps(tmp_path):
+    lines = [HEADER,
+             entry('ts=2024-01-01T00:00:01Z msg=retry', 1),
+             entry('ts=2024-01-01T00:00:02Z msg=retry', 2),
+             entry('msg=retry at 10:11:12', 3)]
+    files, output = write_files(tmp_path, [lines])
+
+    exact = list(dedup_text_files(files, output, tmp_path / 'exact.tsv.gz'))
+    assert exact[0]['stats']['duplicates'] == 0
+
+    stripped = list(dedup_text_files(files, output, tmp_path / 'stripped.tsv.gz', {'strip_timestamps': True}))
+    assert stripped[0]['stats']['duplicates'] == 1
+    assert (output / 'chunk_0.txt').read_text(encoding='utf-8') == HEADER + lines[1] + lines[3]
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Macie作业轮询测试
+用按脚本返回响应的假客户端 (毫秒级间隔) 验证限流退避、PAUSED超时、只有 COMPLETE/CANCELLED/USER_PAUSED 视为结束，
+以及按剩余对象数的下降估算ETA和轮询间隔
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from macie_poller import MAX_CONSECUTIVE_ERRORS, JobProgress, MacieJobPoller, is_throttling_error, wait_for_jobs
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError:
+    class ClientError(Exception):
+        """与botocore的ClientError结构相同 (response['Error']['Code'])"""
+
+        def __init__(self, error_response, operation_name):
+            super().__init__(f"An error occurred ({error_response['Error']['Code']}) when calling the "
+                             f"{operation_name} operation")
+            self.response = error_response
+            self.operation_name = operation_name
+
+FAST = {'min_interval': 0.001, 'max_interval': 0.005, 'max_backoff': 0.005}
+
+
+def throttled():
+    return ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                       'DescribeClassificationJob')
+
+
+def job(status, remaining=None):
+    response = {'jobStatus': status, 'ResponseMetadata': {'RetryAttempts': 0}}
+    if remaining is not None:
+        response['statistics'] = {'approximateNumberOfObjectsToProcess': remaining}
+    return response
+
+
+class ScriptedMacieClient:
+    """按作业依次返回脚本中的响应或抛出异常，脚本用完后重复最后一项"""
+
+    def __init__(self, scripts):
+        self.scripts = {job_id: list(steps) for job_id, steps in scripts.items()}
+        self.calls = {job_id: 0 for job_id in scripts}
+        self._lock = threading.Lock()
+
+    def describe_classification_job(self, jobId):
+        with self._lock:
+            steps = self.scripts[jobId]
+            step = steps[min(self.calls[jobId], len(steps) - 1)]
+            self.calls[jobId] += 1
+        if isinstance(step, Exception):
+            raise step
+        return dict(step, jobId=jobId)
+
+
+def poll(client, job_id='job-1', total_objects=None, **options):
+    async def run():
+        poller = MacieJobPoller(client, **dict(FAST, **options))
+        result = await poller.track(job_id, total_objects)
+        return poller, result
+
+    return asyncio.run(run())
+
+
+def test_is_throttling_error():
+    assert is_throttling_error(throttled())
+    assert not is_throttling_error(ClientError({'Error': {'Code': 'AccessDeniedException'}}, 'Describe'))
+    assert not is_throttling_error(RuntimeError('boom'))
+
+
+def test_throttling_backs_off_and_recovers():
+    """限流不计入连续错误次数，退避后继续轮询"""
+    client = ScriptedMacieClient({'job-1': [throttled()] * (MAX_CONSECUTIVE_ERRORS + 2) + [job('COMPLETE')]})
+
+    poller, result = poll(client)
+
+    assert result['jobStatus'] == 'COMPLETE'
+    assert 'timedOut' not in result
+    assert poller.stats == {'requests': MAX_CONSECUTIVE_ERRORS + 3, 'retries': MAX_CONSECUTIVE_ERRORS + 2,
+                            'errors': 0}
+    assert poller._throttle_attempts == 0
+    assert poller._throttled_until > 0
+
+
+def test_throttling_delays_other_jobs():
+    """一个作业被限流时，其他作业的下一次请求也等到退避结束"""
+    client = ScriptedMacieClient({'job-2': [job('COMPLETE')]})
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        poller = MacieJobPoller(client, **FAST)
+        # job-1 的退避截止时间 (与 time.monotonic 同一时钟)
+        poller._throttled_until = loop.time() + 0.2
+        started = loop.time()
+        await poller.track('job-2')
+        return loop.time() - started
+
+    assert asyncio.run(run()) >= 0.15
+
+
+def test_persistent_errors_give_up():
+    client = ScriptedMacieClient({'job-1': [job('RUNNING', 10), RuntimeError('boom')]})
+
+    poller, result = poll(client, max_backoff=0.001)
+
+    assert result['jobStatus'] == 'RUNNING'
+    assert result['error'] == 'boom'
+    assert poller.stats['errors'] == MAX_CONSECUTIVE_ERRORS
+
+
+def test_errors_before_any_response_report_unknown():
+    client = ScriptedMacieClient({'job-1': [RuntimeError('boom')]})
+
+    _, result = poll(client, max_backoff=0.001)
+
+    assert result == {'jobId': 'job-1', 'jobStatus': 'UNKNOWN', 'error': 'boom'}
+
+
+@pytest.mark.parametrize('status', ['COMPLETE', 'CANCELLED', 'USER_PAUSED'])
+def test_terminal_statuses(status):
+    client = ScriptedMacieClient({'job-1': [job('RUNNING', 5), job(status)]})
+
+    _, result = poll(client)
+
+    assert result['jobStatus'] == status
+    assert 'timedOut' not in result
+    assert client.calls['job-1'] == 2
+
+
+def test_paused_and_idle_are_not_terminal():
+    client = ScriptedMacieClient({'job-1': [job('PAUSED'), job('IDLE'), job('PAUSED'), job('RUNNING', 3),
+                                            job('COMPLETE')]})
+
+    _, result = poll(client, max_paused_seconds=60)
+
+    assert result['jobStatus'] == 'COMPLETE'
+    assert client.calls['job-1'] == 5
+
+
+def test_paused_too_long_times_out():
+    client = ScriptedMacieClient({'job-1': [job('RUNNING', 5), job('PAUSED', 5)]})
+
+    _, result = poll(client, max_wait_seconds=30, max_paused_seconds=0.05)
+
+    assert result['jobStatus'] == 'PAUSED'
+    assert result['timedOut'] is True
+    assert client.calls['job-1'] > 2
+
+
+def test_paused_without_limit_waits_for_total_timeout():
+    client = ScriptedMacieClient({'job-1': [job('PAUSED')]})
+
+    _, result = poll(client, max_wait_seconds=0.05, max_paused_seconds=None)
+
+    assert result['jobStatus'] == 'PAUSED'
+    assert result['timedOut'] is True
+
+
+def test_total_wait_timeout():
+    client = ScriptedMacieClient({'job-1': [job('RUNNING', 100)]})
+
+    _, result = poll(client, max_wait_seconds=0.05)
+
+    assert result['jobStatus'] == 'RUNNING'
+    assert result['timedOut'] is True
+
+
+def test_progress_follows_decreasing_remaining():
+    client = ScriptedMacieClient({'job-1': [job('RUNNING', 80), job('RUNNING', 60), job('RUNNING', 40),
+                                            job('COMPLETE', 0)]})
+
+    poller, result = poll(client, total_objects=100)
+
+    progress = poller.progress['job-1']
+    assert result['jobStatus'] == 'COMPLETE'
+    assert progress.total == 100
+    assert [remaining for _, remaining in progress.samples] == [80, 60, 40]
+    assert progress.percent == 60
+    assert progress.rate() > 0
+
+
+def test_job_progress_eta():
+    progress = JobProgress(total_objects=100)
+    assert progress.describe() == '等待统计信息'
+
+    progress.update(100, now=0)
+    assert progress.eta_seconds() is None
+    progress.update(80, now=10)
+    progress.update(60, now=20)
+
+    assert progress.rate() == 2
+    assert progress.eta_seconds() == 30
+    assert progress.percent == 40
+    assert '预计剩余 0.5 分钟' in progress.describe()
+
+
+def test_job_progress_total_grows_with_observed_remaining():
+    """剩余对象数是待处理数而不是已处理数，总数取已知总数与观察到的最大剩余数中较大者"""
+    progress = JobProgress()
+    progress.update(50, now=0)
+    progress.update(50, now=5)
+
+    assert progress.total == 50
+    assert progress.processed == 0
+    assert progress.rate() is None
+    assert '暂无法估算' in progress.describe()
+
+
+def test_next_interval():
+    poller = MacieJobPoller(None, min_interval=10, max_interval=300)
+    progress = JobProgress(1000)
+
+    # 没有进展时逐步拉长间隔，不超过最大值
+    assert poller._next_interval(progress, 10) == 15
+    assert poller._next_interval(progress, 250) == 300
+
+    # 有ETA时按剩余时间的四分之一轮询，不低于最小值
+    progress.update(1000, now=0)
+    progress.update(600, now=100)
+    assert progress.eta_seconds() == 150
+    assert poller._next_interval(progress, 300) == 37.5
+    progress.update(590, now=1000)
+    assert poller._next_interval(progress, 300) == 300
+    progress.update(10, now=1001)
+    assert poller._next_interval(progress, 300) == 10
+
+
+def test_wait_for_jobs_tracks_jobs_independently():
+    client = ScriptedMacieClient({
+        'job-1': [job('RUNNING', 10), job('COMPLETE', 0)],
+        'job-2': [job('PAUSED')],
+        'job-3': [throttled(), job('CANCELLED')],
+    })
+
+    results = wait_for_jobs(client, ['job-1', 'job-2', 'job-3'], max_wait_minutes=1,
+                            total_objects={'job-1': 10}, max_paused_seconds=0.05, **FAST)
+
+    assert {job_id: result['jobStatus'] for job_id, result in results.items()} == {
+        'job-1': 'COMPLETE', 'job-2': 'PAUSED', 'job-3': 'CANCELLED'}
+    assert results['job-2']['timedOut'] is True
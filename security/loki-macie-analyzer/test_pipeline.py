@@ -34,11 +34,16 @@ def test_environment():
     except FileNotFoundError:
         tests.append(("❌", "AWS CLI - 请安装AWS CLI"))
     
-    # 测试chunks-inspect工具
+    # 测试chunk解码器 (内置解码器必需，chunks-inspect可选)
+    if os.path.exists('./loki_chunk_decoder.py'):
+        tests.append(("✅", "内置chunk解码器"))
+    else:
+        tests.append(("❌", "内置chunk解码器 - 缺少 loki_chunk_decoder.py"))
+    
     if os.path.exists('./chunks-inspect') and os.access('./chunks-inspect', os.X_OK):
         tests.append(("✅", "chunks-inspect工具"))
     else:
-        tests.append(("❌", "chunks-inspect工具 - 请运行: chmod +x chunks-inspect"))
+        tests.append(("⚠️", "chunks-inspect工具 (可选) - 未安装，将使用内置解码器"))
     
     # 测试lokichunk目录
     if os.path.exists('./lokichunk') and os.path.isdir('./lokichunk'):
@@ -55,8 +60,8 @@ def test_environment():
     for status, message in tests:
         print(f"  {status} {message}")
     
-    # 返回是否所有测试都通过
-    return all(status == "✅" for status, _ in tests)
+    # 返回是否所有必需项都通过 (⚠️ 为可选项)
+    return all(status != "❌" for status, _ in tests)
 
 def test_chunk_extraction():
     """测试chunk文件提取"""
@@ -78,22 +83,19 @@ def test_chunk_extraction():
         test_file = chunk_files[0]
         print(f"  📄 测试文件: {test_file.name}")
         
-        # 运行chunks-inspect
-        cmd = ['./chunks-inspect', '-l', str(test_file)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # 使用内置解码器提取
+        from loki_chunk_decoder import LokiChunkReader
         
-        if result.returncode == 0:
-            # 保存测试结果
-            output_file = test_output / f"{test_file.name}_test.txt"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(result.stdout)
-            
-            print(f"  ✅ 提取成功，输出: {output_file}")
-            print(f"  📊 输出大小: {len(result.stdout)} 字符")
-            return True
-        else:
-            print(f"  ❌ 提取失败: {result.stderr}")
-            return False
+        output_file = test_output / f"{test_file.name}_test.txt"
+        output_size = 0
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for line in LokiChunkReader(test_file).iter_text_lines():
+                f.write(line + '\n')
+                output_size += len(line) + 1
+        
+        print(f"  ✅ 提取成功，输出: {output_file}")
+        print(f"  📊 输出大小: {output_size} 字符")
+        return True
             
     except Exception as e:
         print(f"  ❌ 测试异常: {e}")
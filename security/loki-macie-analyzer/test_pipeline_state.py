@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+运行状态检查点与中断恢复测试
+验证状态文件的重放 (最后一行写入不完整时忽略且之后的记录不受影响)，
+以及在提取、上传和创建Macie作业时中断后 --resume 只处理未完成的项目 (使用基准测试的进程内S3/Macie替身)
+"""
+
+import json
+
+import pytest
+
+import loki_macie_pipeline
+from benchmark_pipeline import SCAN_BUCKET, LocalMacieClient, LocalObjectStore, LocalSession, base_config
+from chunk_generator import generate_chunks
+from loki_macie_pipeline import LokiMaciePipeline
+from pipeline_state import STATE_SUFFIX, PipelineState
+
+CHUNK_COUNT = 4
+
+
+class Killed(Exception):
+    """模拟进程在运行中途被杀"""
+
+
+def test_replay(tmp_path):
+    state = PipelineState.create(tmp_path, 'job-1', {'chunk_dir': 'chunks'})
+    state.record_item('extract', '/chunks/a', '/out/a.txt')
+    state.record_item('extract', '/chunks/b', None)
+    state.complete_stage('extract', ['/out/a.txt'])
+    state.close()
+
+    loaded = PipelineState.load(state.state_file)
+
+    assert loaded.run['chunk_dir'] == 'chunks'
+    assert loaded.run['job_name'] == 'job-1'
+    assert loaded.items('extract') == {'/chunks/a': '/out/a.txt', '/chunks/b': None}
+    assert loaded.stages == {'extract': ['/out/a.txt']}
+    assert loaded.finished is None
+    with pytest.raises(FileExistsError):
+        PipelineState.create(tmp_path, 'job-1', {})
+
+
+def test_truncated_last_line_ignored(tmp_path):
+    state = PipelineState.create(tmp_path, 'job-1', {})
+    state.record_item('upload', '/out/a.txt', {'s3_key': 'a'})
+    state.close()
+    with open(state.state_file, 'a', encoding='utf-8') as f:
+        f.write('{"type": "item", "stage": "upload", "item": "/out/b.t')
+
+    loaded = PipelineState.load(state.state_file)
+    assert loaded.items('upload') == {'/out/a.txt': {'s3_key': 'a'}}
+
+    # 恢复后追加的记录不接在不完整的行后面
+    loaded.record_item('upload', '/out/b.txt', {'s3_key': 'b'})
+    loaded.finish('job_created', job_id='j')
+    loaded.close()
+    replayed = PipelineState.load(state.state_file)
+    assert replayed.items('upload') == {'/out/a.txt': {'s3_key': 'a'}, '/out/b.txt': {'s3_key': 'b'}}
+    assert replayed.finished == {'status': 'job_created', 'job_id': 'j'}
+
+
+def test_version_mismatch(tmp_path):
+    state_file = tmp_path / f"job-1{STATE_SUFFIX}"
+    state_file.write_text(json.dumps({'type': 'run', 'version': 0}) + '\n', encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        PipelineState.load(state_file)
+
+
+def test_find_latest_unfinished(tmp_path):
+    finished = PipelineState.create(tmp_path, 'job-1', {})
+    finished.finish('job_created')
+    finished.close()
+    unfinished = PipelineState.create(tmp_path, 'job-2', {})
+    unfinished.close()
+
+    assert PipelineState.find(tmp_path) == unfinished.state_file
+    assert PipelineState.find(tmp_path, 'job-1') == finished.state_file
+    assert PipelineState.find(tmp_path, 'job-3') is None
+    assert PipelineState.find(tmp_path / 'missing') is None
+
+
+class ResumeEnvironment:
+    """中断的运行和恢复运行共享的chunk目录、状态目录以及S3/Macie替身"""
+
+    def __init__(self, tmp_path, monkeypatch):
+        self.tmp_path = tmp_path
+        self.monkeypatch = monkeypatch
+        self.chunk_dir = tmp_path / 'chunks'
+        generate_chunks(str(self.chunk_dir), count=CHUNK_COUNT, chunk_size=20_000, streams=CHUNK_COUNT, seed=7)
+        self.store = LocalObjectStore()
+        self.macie = FlakyMacieClient(lambda: {})
+        self.config_file = tmp_path / 'config.json'
+        self.config_file.write_text(json.dumps(base_config(tmp_path)), encoding='utf-8')
+        self.extracted = []
+        self.uploaded = []
+        self._extract = loki_macie_pipeline.extract_chunks
+        self._upload = loki_macie_pipeline.ConcurrentUploader.upload
+        self.kill_after = {}
+        monkeypatch.setattr(loki_macie_pipeline, 'extract_chunks', self.extract_chunks)
+        monkeypatch.setattr(loki_macie_pipeline.ConcurrentUploader, 'upload', self.upload_method())
+
+    def extract_chunks(self, chunk_files, *args, **kwargs):
+        """记录提取的chunk，kill_after['extract'] 个结果之后中断"""
+        for index, result in enumerate(self._extract(chunk_files, *args, **kwargs)):
+            if index == self.kill_after.get('extract'):
+                raise Killed('extract')
+            self.extracted.append(result['chunk_file'])
+            yield result
+
+    def upload_method(self):
+        env = self
+
+        def upload(uploader, uploads):
+            for index, result in enumerate(env._upload(uploader, uploads)):
+                if index == env.kill_after.get('upload'):
+                    raise Killed('upload')
+                env.uploaded.append(result['s3_key'])
+                yield result
+
+        return upload
+
+    def run(self, **kwargs):
+        pipeline = LokiMaciePipeline(config_file=str(self.config_file), session=LocalSession(self.store, self.macie),
+                                     interactive=False)
+        return pipeline, pipeline.run_complete_pipeline(chunk_dir=str(self.chunk_dir),
+                                                        output_dir=str(self.tmp_path / 'extracted_texts'), **kwargs)
+
+    def interrupted_run(self, **kill_after):
+        self.kill_after = kill_after
+        with pytest.raises(Killed):
+            self.run()
+        self.kill_after = {}
+        state_file = PipelineState.find(self.tmp_path / 'pipeline_state')
+        assert state_file is not None
+        return PipelineState.load(state_file)
+
+    def resume(self):
+        self.extracted.clear()
+        self.uploaded.clear()
+        return self.run(resume='')
+
+
+class FlakyMacieClient(LocalMacieClient):
+    """fail_creates 次创建作业请求失败"""
+
+    def __init__(self, object_sizes):
+        super().__init__(object_sizes)
+        self.fail_creates = 0
+
+    def create_classification_job(self, **kwargs):
+        if self.fail_creates:
+            self.fail_creates -= 1
+            raise Killed('macie_job')
+        return super().create_classification_job(**kwargs)
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    return ResumeEnvironment(tmp_path, monkeypatch)
+
+
+def test_resume_after_extract_interrupted(env):
+    state = env.interrupted_run(extract=2)
+    done = set(state.items('extract'))
+    assert len(done) == 2
+    assert not state.stage_done('extract')
+    assert not env.store.objects(SCAN_BUCKET)
+    # 写到一半被杀: 最后一行不完整
+    with open(state.state_file, 'a', encoding='utf-8') as f:
+        f.write('{"type": "item", "stage": "extract", "it')
+
+    pipeline, result = env.resume()
+
+    assert result['status'] == 'job_created'
+    assert len(env.extracted) == CHUNK_COUNT - 2
+    assert not done & set(env.extracted)
+    assert len(env.store.objects(SCAN_BUCKET)) == CHUNK_COUNT
+    assert len(env.macie.jobs) == 1
+    assert PipelineState.load(state.state_file).finished['status'] == 'job_created'
+
+
+def test_resume_after_upload_interrupted(env):
+    state = env.interrupted_run(upload=1)
+    assert state.stage_done('extract')
+    assert len(state.items('upload')) == 1
+    first_upload = env.store.objects(SCAN_BUCKET)
+    uploaded_key, = [value['s3_key'] for value in state.items('upload').values()]
+
+    pipeline, result = env.resume()
+
+    assert result['status'] == 'job_created'
+    assert env.extracted == []
+    assert len(env.uploaded) == CHUNK_COUNT - 1
+    assert uploaded_key not in env.uploaded
+    objects = env.store.objects(SCAN_BUCKET)
+    assert len(objects) == CHUNK_COUNT
+    assert objects[uploaded_key] == first_upload[uploaded_key]
+    # 恢复的运行沿用原运行的作业名称，作业覆盖全部上传的对象
+    assert pipeline.job_name == state.run['job_name']
+    assert set(pipeline.object_sizes) == set(objects)
+    assert len(env.macie.jobs) == 1
+
+
+def test_resume_after_macie_job_failed(env):
+    env.macie.fail_creates = 1
+    with pytest.raises(Killed):
+        env.run()
+    state = PipelineState.load(PipelineState.find(env.tmp_path / 'pipeline_state'))
+    assert state.stage_done('upload')
+    assert not state.stage_done('macie_job')
+    objects = env.store.objects(SCAN_BUCKET)
+
+    pipeline, result = env.resume()
+
+    assert result['status'] == 'job_created'
+    assert env.extracted == [] and env.uploaded == []
+    assert env.store.objects(SCAN_BUCKET) == objects
+    assert len(env.macie.jobs) == 1
+    assert set(pipeline.object_sizes) == set(objects)
+
+
+def test_resume_after_macie_job_created(env, monkeypatch):
+    """作业已创建但结束记录未写入时中断，恢复后不重复创建作业"""
+    finish = PipelineState.finish
+
+    def killed_before_finish(state, status, **details):
+        if status == 'job_created':
+            raise Killed('finish')
+        return finish(state, status, **details)
+
+    monkeypatch.setattr(PipelineState, 'finish', killed_before_finish)
+    with pytest.raises(Killed):
+        env.run()
+    monkeypatch.setattr(PipelineState, 'finish', finish)
+    job_id, = env.macie.jobs
+    job_name = PipelineState.load(PipelineState.find(env.tmp_path / 'pipeline_state')).run['job_name']
+    requests = env.store.requests
+
+    _, result = env.resume()
+
+    assert result['status'] == 'job_created'
+    assert result['job_id'] == job_id
+    assert len(env.macie.jobs) == 1
+    assert env.extracted == [] and env.uploaded == []
+    assert env.store.requests == requests
+
+    # 已结束的运行再次恢复时直接返回原结果
+    _, again = env.run(resume=job_name)
+    assert again == {'job_id': job_id, 'status': 'job_created'}
+    assert len(env.macie.jobs) == 1
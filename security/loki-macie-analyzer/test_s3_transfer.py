@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+S3 ETag计算测试
+验证 ETagHasher / file_matches_etag 与S3的ETag规则一致 (单次上传为整体MD5，分片上传为各分片MD5拼接后的MD5加 '-分片数')，
+压缩上传用基准测试的进程内S3替身完成，不需要AWS
+"""
+
+import hashlib
+
+import pytest
+
+from benchmark_pipeline import LocalObjectStore, LocalS3Client
+from s3_transfer import ETagHasher, file_matches_etag, gzip_matches_etag, upload_file_compressed
+
+MB = 1024 * 1024
+
+
+def s3_etag(data: bytes, part_size: int, threshold: int) -> str:
+    """按S3规则直接计算ETag，作为对照"""
+    if len(data) < threshold:
+        return hashlib.md5(data).hexdigest()
+    digests = b''.join(hashlib.md5(data[i:i + part_size]).digest() for i in range(0, len(data), part_size))
+    parts = -(-len(data) // part_size)
+    return f"{hashlib.md5(digests).hexdigest()}-{parts}"
+
+
+def sample_bytes(size: int) -> bytes:
+    block = hashlib.sha256(b'loki').digest() * 64
+    return (block * (size // len(block) + 1))[:size]
+
+
+def write_file(tmp_path, data: bytes):
+    path = tmp_path / 'object.txt'
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('size', [0, 100, 1024, 1025, 4096, 10_000])
+def test_hasher_matches_s3_rule(size):
+    data = sample_bytes(size)
+    hasher = ETagHasher(part_size=1024)
+    # 写入的切分方式与分片边界无关
+    for i in range(0, len(data), 700):
+        hasher.write(data[i:i + 700])
+
+    assert hasher.size == size
+    assert hasher.etag() == s3_etag(data, 1024, 1024)
+
+
+def test_hasher_threshold():
+    data = sample_bytes(3000)
+
+    assert ETagHasher(1024, threshold=4096).etag() == hashlib.md5(b'').hexdigest()
+    hasher = ETagHasher(1024, threshold=4096)
+    hasher.write(data)
+    assert hasher.etag() == hashlib.md5(data).hexdigest()
+    hasher = ETagHasher(1024, threshold=0)
+    hasher.write(data)
+    assert hasher.etag().endswith('-3')
+
+
+def test_hasher_accepts_text():
+    hasher = ETagHasher(1024)
+    hasher.write('身份证')
+
+    assert hasher.etag() == hashlib.md5('身份证'.encode('utf-8')).hexdigest()
+
+
+def test_file_matches_etag(tmp_path):
+    data = sample_bytes(20 * MB + 123)
+    path = write_file(tmp_path, data)
+    entry = {'size': len(data), 'etag': s3_etag(data, 8 * MB, 8 * MB)}
+
+    assert file_matches_etag(path, entry, 8 * MB, 8 * MB)
+    assert not file_matches_etag(path, dict(entry, size=len(data) - 1), 8 * MB, 8 * MB)
+    assert not file_matches_etag(path, dict(entry, etag=s3_etag(b'other', 8 * MB, 8 * MB)), 8 * MB, 8 * MB)
+
+
+@pytest.mark.parametrize('uploaded_part_mb', [5, 16])
+def test_file_matches_etag_other_part_size(tmp_path, uploaded_part_mb):
+    """对象的分片大小与当前配置不同 (其他工具上传或s3transfer自动调大) 时按分片数推算"""
+    data = sample_bytes(33 * MB)
+    path = write_file(tmp_path, data)
+    entry = {'size': len(data), 'etag': s3_etag(data, uploaded_part_mb * MB, 8 * MB)}
+
+    assert file_matches_etag(path, entry, 8 * MB, 8 * MB)
+
+
+def test_file_matches_single_part_etag(tmp_path):
+    data = sample_bytes(3 * MB)
+    path = write_file(tmp_path, data)
+
+    assert file_matches_etag(path, {'size': len(data), 'etag': hashlib.md5(data).hexdigest()}, 8 * MB, 8 * MB)
+
+
+@pytest.mark.parametrize('size', [1000, 7 * MB])
+def test_gzip_matches_uploaded_object(tmp_path, size):
+    path = write_file(tmp_path, sample_bytes(size))
+    store = LocalObjectStore()
+    client = LocalS3Client(store)
+
+    upload_file_compressed(client, path, 'bucket', 'object.txt.gz', level=6, part_size=5 * MB)
+    entry = store.objects('bucket')['object.txt.gz']
+    entry = {'size': entry['Size'], 'etag': entry['ETag'].strip('"')}
+
+    assert gzip_matches_etag(path, entry, level=6, part_size=5 * MB)
+    assert not gzip_matches_etag(path, entry, level=1, part_size=5 * MB)
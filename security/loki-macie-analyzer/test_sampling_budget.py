@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Macie采样比例选择测试
+验证命令行指定比例、预算限制与预算内的比例选择、最小比例下限，以及置信度估计的边界 (全量扫描时误差为0、发现概率为1)
+"""
+
+import pytest
+
+from sampling_budget import (DEFAULT_MIN_PERCENTAGE, budget_bytes, detection_probability, margin_of_error,
+                             plan_sampling, sampling_tags)
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+
+def test_override_ignores_budget():
+    sampling = plan_sampling(10 * GB, 1000, {'max_cost_usd': 0.5}, override=30)
+
+    assert sampling['percentage'] == 30
+    assert sampling['reason'] == 'override'
+    assert sampling['sampled_objects'] == 300
+    assert sampling['sampled_bytes'] == 3 * GB
+
+
+def test_no_budget_uses_max_percentage():
+    assert plan_sampling(10 * GB, 1000, {})['reason'] == 'fixed'
+    assert plan_sampling(10 * GB, 1000, {}, max_percentage=40)['percentage'] == 40
+    # 没有上传数据时不按预算计算
+    assert plan_sampling(0, 0, {'max_cost_usd': 1})['reason'] == 'fixed'
+
+
+def test_budget_limited_by_cost():
+    sampling = plan_sampling(10 * GB, 1000, {'max_cost_usd': 5, 'price_per_gb': 2})
+
+    assert sampling['percentage'] == 25
+    assert sampling['reason'] == 'budget'
+    assert sampling['estimated_cost_usd'] == 5.0
+
+
+def test_budget_limited_by_time_with_parallel_jobs():
+    options = {'max_scan_minutes': 10, 'throughput_mb_per_minute': 100}
+
+    assert plan_sampling(4000 * MB, 400, options)['percentage'] == 25
+    sampling = plan_sampling(4000 * MB, 400, options, parallel_jobs=2)
+    assert sampling['percentage'] == 50
+    assert sampling['estimated_minutes'] == 10.0
+
+
+def test_smaller_budget_wins():
+    options = {'max_scan_minutes': 60, 'throughput_mb_per_minute': 1024, 'max_cost_usd': 30}
+
+    assert budget_bytes(options) == 30 * GB
+    assert budget_bytes(dict(options, max_cost_usd=100)) == 60 * GB
+    assert budget_bytes({}) is None
+
+
+@pytest.mark.parametrize('max_percentage', [100, 50])
+def test_within_budget(max_percentage):
+    sampling = plan_sampling(10 * GB, 1000, {'max_cost_usd': 20}, max_percentage=max_percentage)
+
+    assert sampling['percentage'] == max_percentage
+    assert sampling['reason'] == 'within_budget'
+
+
+def test_clamped_at_min_percentage():
+    sampling = plan_sampling(100 * GB, 1000, {'max_cost_usd': 1})
+
+    assert sampling['percentage'] == DEFAULT_MIN_PERCENTAGE
+    assert sampling['reason'] == 'budget'
+    assert plan_sampling(100 * GB, 1000, {'max_cost_usd': 1, 'min_percentage': 3})['percentage'] == 3
+    # 下限不超过配置的最大比例
+    assert plan_sampling(100 * GB, 1000, {'max_cost_usd': 1}, max_percentage=5)['percentage'] == 5
+
+
+def test_full_scan_confidence():
+    sampling = plan_sampling(10 * GB, 1000, {})
+
+    assert sampling['percentage'] == 100
+    assert sampling['sampled_objects'] == 1000
+    assert sampling['margin_of_error'] == 0
+    assert sampling['detection_probability'] == 1.0
+
+
+def test_confidence_limits():
+    assert margin_of_error(0, 1000) == 1.0
+    assert margin_of_error(1000, 1000) == 0.0
+    errors = [margin_of_error(sampled, 10000) for sampled in (100, 1000, 5000, 9999)]
+    assert errors == sorted(errors, reverse=True)
+    assert errors[0] == pytest.approx(1.96 * 0.05 * ((10000 - 100) / 9999) ** 0.5)
+
+    assert detection_probability(0, 1000) == 0.0
+    assert detection_probability(100, 10000) == pytest.approx(1 - 0.99 ** 100)
+    assert detection_probability(1000, 1000) == 1.0
+    assert detection_probability(0, 0) == 0.0
+
+
+def test_sampled_objects_rounds_up():
+    sampling = plan_sampling(GB, 7, {}, override=10)
+
+    assert sampling['sampled_objects'] == 1
+    assert 0 < sampling['margin_of_error'] < 1
+    assert sampling['detection_probability'] == pytest.approx(0.01)
+
+
+def test_sampling_tags():
+    tags = sampling_tags(plan_sampling(10 * GB, 1000, {'max_cost_usd': 5}))
+
+    assert tags['SamplingPercentage'] == '50'
+    assert tags['SamplingReason'] == 'budget'
+    assert float(tags['SamplingMarginOfError']) > 0
+    assert all(isinstance(value, str) for value in tags.values())
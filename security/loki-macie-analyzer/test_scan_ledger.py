@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+跳过未变化对象的测试
+用基准测试的进程内S3/Macie替身运行两次管道，验证同一个chunk重新提取的内容相同、已被作业扫描过的对象在重跑时跳过上传，
+上传后未创建作业 (中断) 的对象重新上传并被扫描，部分跳过时作业只扫描扫描记录中作业创建之后修改的对象
+"""
+
+import json
+import shutil
+
+import pytest
+
+from benchmark_pipeline import SCAN_BUCKET, LocalMacieClient, LocalObjectStore, LocalSession, base_config
+from chunk_extractor import extract_chunks
+from chunk_generator import generate_chunks
+from loki_macie_pipeline import LokiMaciePipeline
+from scan_ledger import ScanLedger
+
+
+class RecordingMacieClient(LocalMacieClient):
+    """记录每个作业的范围定义"""
+
+    def __init__(self, object_sizes):
+        super().__init__(object_sizes)
+        self.definitions = []
+
+    def create_classification_job(self, **kwargs):
+        self.definitions.append(kwargs['s3JobDefinition'])
+        return super().create_classification_job(**kwargs)
+
+
+class Environment:
+    """多次运行共享的S3/Macie替身、chunk目录和扫描记录文件"""
+
+    def __init__(self, tmp_path, chunk_count=3, bundle=False):
+        self.tmp_path = tmp_path
+        self.source = tmp_path / 'source'
+        generate_chunks(str(self.source), count=chunk_count, chunk_size=20_000, streams=chunk_count, seed=3)
+        self.chunk_names = chunk_paths(self.source)
+        self.chunk_dir = tmp_path / 'chunks'
+        self.chunk_dir.mkdir()
+        self.store = LocalObjectStore()
+        self.macie = RecordingMacieClient(lambda: {})
+        self.ledger_file = tmp_path / 'scanned_objects.json'
+        self.bundle = bundle
+        self.runs = 0
+
+    def add_chunks(self, names):
+        for name in names:
+            target = self.chunk_dir / name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(self.source / name, target)
+
+    def run(self, **kwargs):
+        """每次运行使用新的管道实例、状态目录和输出目录 (同一秒内的运行作业名称相同)"""
+        self.runs += 1
+        work_dir = self.tmp_path / f"run-{self.runs}"
+        work_dir.mkdir()
+        config = base_config(work_dir)
+        config['processing']['scan_ledger_file'] = str(self.ledger_file)
+        config['processing']['bundle'] = {'enabled': self.bundle, 'target_size_mb': 64}
+        config_file = work_dir / 'config.json'
+        config_file.write_text(json.dumps(config), encoding='utf-8')
+        pipeline = LokiMaciePipeline(config_file=str(config_file), session=LocalSession(self.store, self.macie),
+                                     interactive=False)
+        result = pipeline.run_complete_pipeline(chunk_dir=str(self.chunk_dir),
+                                                output_dir=str(work_dir / 'extracted_texts'), **kwargs)
+        return pipeline, result
+
+    def objects(self):
+        return self.store.objects(SCAN_BUCKET)
+
+
+def chunk_paths(chunk_dir):
+    """生成的chunk文件 (租户/流指纹/chunk) 相对于chunk目录的路径"""
+    return sorted(p.relative_to(chunk_dir) for p in chunk_dir.rglob('*')
+                  if p.is_file() and not p.name.startswith('.'))
+
+
+def modified_after_terms(definition):
+    return [term['simpleScopeTerm']['values'][0] for term in definition['scoping']['includes']['and']
+            if term['simpleScopeTerm']['key'] == 'OBJECT_LAST_MODIFIED_DATE']
+
+
+def test_reextraction_is_identical(tmp_path):
+    """提取文件的注释头不含提取时间，同一个chunk两次提取的内容完全相同"""
+    generate_chunks(str(tmp_path / 'chunks'), count=2, chunk_size=20_000, seed=1)
+    chunk_files = [tmp_path / 'chunks' / path for path in chunk_paths(tmp_path / 'chunks')]
+    outputs = []
+    for run in ('first', 'second'):
+        output_path = tmp_path / run
+        output_path.mkdir()
+        results = list(extract_chunks(chunk_files, output_path, chunk_root=tmp_path / 'chunks'))
+        assert all(result['success'] for result in results)
+        outputs.append({p.name: p.read_bytes() for p in output_path.iterdir()})
+
+    assert outputs[0] == outputs[1]
+    assert len(outputs[0]) == 2
+
+
+@pytest.mark.parametrize('bundle', [False, True])
+def test_rerun_skips_scanned_objects(tmp_path, bundle):
+    env = Environment(tmp_path, bundle=bundle)
+    env.add_chunks(env.chunk_names)
+
+    first, result = env.run()
+    assert result['status'] == 'job_created'
+    uploaded = env.objects()
+    ledger = ScanLedger(env.ledger_file)
+    assert set(ledger.objects) == set(uploaded)
+    assert {entry['job_id'] for entry in ledger.objects.values()} == {result['job_id']}
+
+    second, result = env.run()
+
+    assert result is None
+    assert second.state.finished['status'] == 'unchanged'
+    assert len(env.macie.jobs) == 1
+    # 未重新上传 (最后修改时间不变)
+    assert env.objects() == uploaded
+    assert len(second.unchanged_scanned_at) == len(uploaded)
+
+
+def test_uploaded_but_never_scanned_is_uploaded_again(tmp_path):
+    """上次运行上传后在创建作业前结束 (中断)，重跑时ETag一致也不跳过，由本次运行的作业扫描"""
+    env = Environment(tmp_path)
+    env.add_chunks(env.chunk_names)
+
+    _, result = env.run(create_job=False)
+    assert result['status'] == 'uploaded'
+    assert not env.macie.jobs
+    first_upload = env.objects()
+
+    second, result = env.run()
+
+    assert result['status'] == 'job_created'
+    assert len(env.macie.jobs) == 1
+    assert not second.unchanged_scanned_at
+    assert set(second.object_sizes) == set(first_upload)
+    assert all(env.objects()[key]['LastModified'] > first_upload[key]['LastModified'] for key in first_upload)
+    # 没有跳过的对象时作业不按最后修改时间限定范围
+    assert modified_after_terms(env.macie.definitions[-1]) == []
+    assert set(ScanLedger(env.ledger_file).objects) == set(first_upload)
+
+
+def test_partial_skip_scopes_job_by_scanning_job_creation(tmp_path):
+    env = Environment(tmp_path)
+    env.add_chunks(env.chunk_names[:2])
+    _, first = env.run()
+    first_job = env.macie.jobs[first['job_id']]
+
+    env.add_chunks(env.chunk_names[2:])
+    second, result = env.run()
+
+    assert result['status'] == 'job_created'
+    assert len(second.unchanged_scanned_at) == 2
+    assert len(second.object_sizes) == 1
+    assert modified_after_terms(env.macie.definitions[-1]) == [first_job['createdAt'].strftime('%Y-%m-%dT%H:%M:%SZ')]
+    ledger = ScanLedger(env.ledger_file)
+    new_key, = second.object_sizes
+    assert ledger.objects[new_key]['job_id'] == result['job_id']
+    assert set(ledger.objects) == set(env.objects())
+    # 作业范围按秒截断，与第一个作业同一秒内上传的对象也会被第二个作业扫描并记录
+    assert {entry['job_id'] for entry in ledger.objects.values()} <= {first['job_id'], result['job_id']}
+
+
+def test_changed_object_is_uploaded_again(tmp_path):
+    """扫描记录中的ETag与当前对象不一致 (对象在扫描后被替换) 时重新上传"""
+    env = Environment(tmp_path, chunk_count=1)
+    env.add_chunks(env.chunk_names)
+    env.run()
+    key, = env.objects()
+    env.store.put(SCAN_BUCKET, key, 1, 'replaced')
+
+    second, result = env.run()
+
+    assert result['status'] == 'job_created'
+    assert key in second.object_sizes
+    assert len(env.macie.jobs) == 2
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+扫描分片规划测试
+验证分片按字节数均衡、分片前缀互不重叠且覆盖整个扫描范围，以及含其他对象的分区不被按对象键细分
+"""
+
+import random
+
+import pytest
+
+from scan_sharding import effective_shard_count, plan_shards
+
+
+def hourly_objects(hours=6, per_hour=20, seed=7):
+    rng = random.Random(seed)
+    sizes = {}
+    for hour in range(hours):
+        for index in range(per_hour):
+            sizes[f"loki/2024/01/01/{hour:02d}/tenant__{index:03d}.txt"] = rng.randint(1, 100) * 1000
+    scope = [f"loki/2024/01/01/{hour:02d}/" for hour in range(hours)]
+    return sizes, scope
+
+
+def covering_prefixes(shards, key):
+    return [prefix for shard in shards for prefix in shard['prefixes'] if key.startswith(prefix)]
+
+
+def assert_covers(shards, sizes, scope):
+    prefixes = [prefix for shard in shards for prefix in shard['prefixes']]
+    # 分片前缀互不重叠，每个对象恰好属于一个分片
+    for a in prefixes:
+        assert not any(b != a and b.startswith(a) for b in prefixes)
+    for key in sizes:
+        assert len(covering_prefixes(shards, key)) == 1
+    # 细分后的前缀仍在扫描范围之内
+    for prefix in prefixes:
+        assert any(prefix.startswith(root) for root in scope)
+    assert sum(shard['objects'] for shard in shards) == len(sizes)
+    assert sum(shard['bytes'] for shard in shards) == sum(sizes.values())
+
+
+@pytest.mark.parametrize('shard_count', [2, 3, 4])
+def test_whole_partitions_balanced(shard_count):
+    sizes, scope = hourly_objects(hours=24)
+
+    shards = plan_shards(sizes, scope, shard_count)
+
+    assert len(shards) == shard_count
+    assert_covers(shards, sizes, scope)
+    loads = [shard['bytes'] for shard in shards]
+    assert max(loads) <= 1.3 * min(loads)
+    # 前缀数量足够均衡时不细分，每个分区整体分配
+    assert sorted(p for shard in shards for p in shard['prefixes']) == scope
+
+
+def test_refines_exclusive_partition():
+    """只有一个前缀时按对象键细分，细分结果仍覆盖全部对象"""
+    sizes, scope = hourly_objects(hours=1, per_hour=200)
+    checked = []
+
+    def is_exclusive(prefix, keys):
+        checked.append(prefix)
+        return True
+
+    shards = plan_shards(sizes, scope, 4, is_exclusive=is_exclusive)
+
+    assert checked == scope
+    assert len(shards) == 4
+    assert_covers(shards, sizes, scope)
+    loads = [shard['bytes'] for shard in shards]
+    assert max(loads) <= 1.3 * min(loads)
+
+
+def test_keeps_shared_partition_whole():
+    """分区中有本次运行之外的对象时，细分前缀会遗漏这些对象，只能整体保留"""
+    sizes, scope = hourly_objects(hours=2, per_hour=50)
+    shared = scope[0]
+
+    shards = plan_shards(sizes, scope, 4, is_exclusive=lambda prefix, keys: prefix != shared)
+
+    assert_covers(shards, sizes, scope)
+    assert any(shared in shard['prefixes'] for shard in shards)
+    # 只细分了确认没有其他对象的分区
+    refined = [p for shard in shards for p in shard['prefixes'] if p not in scope]
+    assert refined and all(p.startswith(scope[1]) for p in refined)
+
+
+def test_no_refinement_without_callback():
+    sizes, scope = hourly_objects(hours=1, per_hour=50)
+
+    shards = plan_shards(sizes, scope, 4)
+
+    assert shards == [{'prefixes': scope, 'objects': 50, 'bytes': sum(sizes.values())}]
+
+
+def test_max_prefixes_per_shard():
+    sizes, scope = hourly_objects(hours=48, per_hour=2)
+
+    shards = plan_shards(sizes, scope, 4, max_prefixes=12)
+
+    assert all(len(shard['prefixes']) <= 12 for shard in shards)
+    assert_covers(shards, sizes, scope)
+
+
+def test_empty_prefixes_are_kept_in_scope():
+    """扫描范围中没有本次上传对象的前缀 (如时间窗口回看的分区) 也要分配给某个分片"""
+    sizes, scope = hourly_objects(hours=2)
+    scope = scope + ['loki/2024/01/01/22/', 'loki/2024/01/01/23/']
+
+    shards = plan_shards(sizes, scope, 2)
+
+    assert sorted(p for shard in shards for p in shard['prefixes']) == sorted(scope)
+
+
+def test_effective_shard_count():
+    mb = 1024 * 1024
+
+    assert effective_shard_count(100 * mb, 8, 256 * mb) == 1
+    assert effective_shard_count(600 * mb, 8, 256 * mb) == 3
+    assert effective_shard_count(100_000 * mb, 8, 256 * mb) == 8
+    assert effective_shard_count(100 * mb, 8, 0) == 8
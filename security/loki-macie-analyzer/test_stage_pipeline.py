@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+阶段流水线测试
+验证阶段顺序与逐阶段执行一致、有界队列的背压、出错或调用方提前停止时全部阶段线程退出
+"""
+
+import itertools
+import threading
+import time
+
+import pytest
+
+from stage_pipeline import StagePipeline
+
+
+def stage_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith('stage-')]
+
+
+def double(items):
+    for item in items:
+        yield item * 2
+
+
+def increment(items):
+    return (item + 1 for item in items)
+
+
+def test_output_matches_sequential():
+    pipeline = StagePipeline([('double', double), ('increment', increment)], queue_size=2)
+
+    assert list(pipeline.run(range(100))) == [item * 2 + 1 for item in range(100)]
+    assert not stage_threads()
+
+
+def test_requires_stages():
+    with pytest.raises(ValueError):
+        StagePipeline([])
+
+
+def test_backpressure():
+    """下游慢时上游阻塞在队列上，领先的项目数不超过各队列容量之和"""
+    produced = []
+    lead = []
+
+    def produce(items):
+        for item in items:
+            produced.append(item)
+            yield item
+
+    pipeline = StagePipeline([('produce', produce), ('pass', lambda items: items)], queue_size=3)
+    for consumed, item in enumerate(pipeline.run(range(40)), 1):
+        time.sleep(0.005)
+        lead.append(len(produced) - consumed)
+
+    assert max(lead) <= 2 * 3 + 2
+    assert max(pipeline.max_queued.values()) <= 3
+
+
+def test_error_cancels_other_stages():
+    """任一阶段出错时，无限输入的上游也会停止，异常在调用方重新抛出"""
+    def fail_after_five(items):
+        for item in items:
+            if item == 5:
+                raise RuntimeError('stage failed')
+            yield item
+
+    pipeline = StagePipeline([('source', lambda items: items), ('fail', fail_after_five),
+                              ('slow', increment)], queue_size=2)
+    outputs = []
+    with pytest.raises(RuntimeError, match='stage failed'):
+        for item in pipeline.run(itertools.count()):
+            outputs.append(item)
+
+    assert outputs == [1, 2, 3, 4, 5][:len(outputs)]
+    assert not stage_threads()
+
+
+def test_error_in_source():
+    def broken_source():
+        yield 1
+        raise KeyError('source')
+
+    with pytest.raises(KeyError):
+        list(StagePipeline([('pass', lambda items: items)]).run(broken_source()))
+    assert not stage_threads()
+
+
+def test_caller_stops_early():
+    """调用方提前停止迭代时取消全部阶段 (上游阻塞在已满的队列上也能退出)"""
+    pipeline = StagePipeline([('double', double), ('increment', increment)], queue_size=1)
+    results = pipeline.run(itertools.count())
+
+    assert [next(results) for _ in range(3)] == [1, 3, 5]
+    results.close()
+
+    assert not stage_threads()
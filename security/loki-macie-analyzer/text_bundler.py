@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+提取文件打包
+将大量小的提取文本文件按顺序合并为接近目标大小的打包对象 (如64-256MB)，
+减少S3 PUT请求数和Macie的单对象开销。每个打包对象末尾嵌入chunk边界索引，
+Macie发现中的行号可以据此定位回原始chunk。
+"""
+
+import argparse
+import hashlib
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET_SIZE = 128 * 1024 * 1024
+
+INDEX_MARKER = '# Bundle index: '
+INDEX_COLUMNS = '# start_line\tend_line\toffset\tlength\tfile'
+
+
+def _group_by_size(text_files: Iterable[str], target_size: int,
+                   group_key: Optional[Callable[[str], str]] = None) -> Iterator[List[str]]:
+    """
+    按顺序分组，每组累计大小达到目标大小即结束 (超过目标大小的单个文件独立成组)
+    指定 group_key 时先按键稳定排序，键不同的文件不会进入同一组
+    """
+    if group_key is not None:
+        keyed = sorted(((group_key(f), f) for f in text_files), key=lambda item: item[0])
+    else:
+        keyed = ((None, f) for f in text_files)
+
+    group = []
+    group_size = 0
+    current_key = None
+    for key, text_file in keyed:
+        size = os.path.getsize(text_file)
+        if group and (group_size + size > target_size or key != current_key):
+            yield group
+            group = []
+            group_size = 0
+        current_key = key
+        group.append(text_file)
+        group_size += size
+    if group:
+        yield group
+
+
+def write_bundle(members: List[str], bundle_file: Path, block_size: int = 1024 * 1024) -> List[Dict]:
+    """
+    顺序拼接成员文件并在末尾写入边界索引，返回成员列表
+    每个成员记录在打包对象中的起止行号 (从1开始) 和字节范围
+    """
+    entries = []
+    line_number = 1
+    offset = 0
+    with open(bundle_file, 'wb') as out:
+        for member in members:
+            lines = 0
+            length = 0
+            last_byte = b'\n'
+            with open(member, 'rb') as src:
+                for block in iter(lambda: src.read(block_size), b''):
+                    out.write(block)
+                    lines += block.count(b'\n')
+                    length += len(block)
+                    last_byte = block[-1:]
+            if last_byte != b'\n':
+                # 保证下一个成员从新行开始
+                out.write(b'\n')
+                lines += 1
+                length += 1
+            entries.append({
+                'file': Path(member).name,
+                'start_line': line_number,
+                'end_line': line_number + lines - 1,
+                'offset': offset,
+                'length': length
+            })
+            line_number += lines
+            offset += length
+
+        trailer = ['# ' + '=' * 50, f"{INDEX_MARKER}{len(entries)} chunk files", INDEX_COLUMNS]
+        trailer.extend(
+            f"# {e['start_line']}\t{e['end_line']}\t{e['offset']}\t{e['length']}\t{e['file']}"
+            for e in entries
+        )
+        out.write(('\n'.join(trailer) + '\n').encode('utf-8'))
+    return entries
+
+
+def bundle_name(members: List[str], bundle_prefix: str) -> str:
+    """
+    打包对象的文件名: <bundle_prefix>-<成员文件名的摘要>.txt
+    成员相同的打包对象在不同运行中同名，重跑时可按ETag识别为未变化
+    """
+    digest = hashlib.sha256('\n'.join(Path(member).name for member in members).encode('utf-8')).hexdigest()
+    return f"{bundle_prefix}-{digest[:16]}.txt"
+
+
+def pack_text_files(text_files: Iterable[str], output_path: Path, bundle_prefix: str,
+                    target_size: int = DEFAULT_TARGET_SIZE,
+                    group_key: Optional[Callable[[str], str]] = None) -> Iterator[Dict]:
+    """
+    打包提取文件到 output_path/<bundle_prefix>-<成员文件名的摘要>.txt，逐个产出结果字典 (不抛出异常)
+    result['members'] 为成员文件路径列表，result['index'] 为边界索引
+    group_key: 可选的分组键 (如日志时间分区)，同一个打包对象中的成员分组键相同
+    """
+    for members in _group_by_size(text_files, target_size, group_key):
+        bundle_file = output_path / bundle_name(members, bundle_prefix)
+        try:
+            index = write_bundle(members, bundle_file)
+            yield {
+                'output_file': str(bundle_file),
+                'members': members,
+                'index': index,
+                'success': True
+            }
+        except Exception as e:
+            if bundle_file.exists():
+                bundle_file.unlink()
+            yield {
+                'output_file': None,
+                'members': members,
+                'success': False,
+                'error': str(e)
+            }
+
+
+def read_bundle_index(bundle_file: str, tail_size: int = 64 * 1024) -> List[Dict]:
+    """从打包文件末尾读取边界索引 (索引较大时逐步扩大读取范围)"""
+    file_size = os.path.getsize(bundle_file)
+    with open(bundle_file, 'rb') as f:
+        while True:
+            start = max(file_size - tail_size, 0)
+            f.seek(start)
+            tail = f.read().decode('utf-8', errors='replace')
+            marker = tail.rfind('\n' + INDEX_MARKER)
+            if marker >= 0 or start == 0:
+                break
+            tail_size *= 4
+
+    if marker < 0:
+        if not tail.startswith(INDEX_MARKER):
+            raise ValueError(f"不是打包文件或索引缺失: {bundle_file}")
+        marker = -1
+
+    entries = []
+    for line in tail[marker + 1:].splitlines()[2:]:
+        start_line, end_line, offset, length, name = line[2:].split('\t', 4)
+        entries.append({
+            'file': name,
+            'start_line': int(start_line),
+            'end_line': int(end_line),
+            'offset': int(offset),
+            'length': int(length)
+        })
+    return entries
+
+
+def locate_line(index: List[Dict], line_number: int) -> Optional[Dict]:
+    """根据打包对象中的行号 (如Macie发现的lineRanges) 查找所属的成员文件"""
+    low, high = 0, len(index) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        entry = index[middle]
+        if line_number < entry['start_line']:
+            high = middle - 1
+        elif line_number > entry['end_line']:
+            low = middle + 1
+        else:
+            return entry
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='查询打包对象中的行号所属的原始chunk')
+    parser.add_argument('bundle_file', help='打包文件 (可先从S3下载)')
+    parser.add_argument('--line', type=int, action='append', help='Macie发现中的行号，可重复指定；不指定时列出全部成员')
+
+    args = parser.parse_args()
+    index = read_bundle_index(args.bundle_file)
+
+    if not args.line:
+        for entry in index:
+            print(f"{entry['start_line']}-{entry['end_line']}\t{entry['file']}")
+        return 0
+
+    for line_number in args.line:
+        entry = locate_line(index, line_number)
+        if entry is None:
+            print(f"{line_number}\t(不属于任何成员文件)")
+        else:
+            print(f"{line_number}\t{entry['file']}\t成员内第 {line_number - entry['start_line'] + 1} 行")
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+按日志时间分区
+根据每个chunk自身的 From/Through 时间 (而不是管道运行时间) 生成 YYYY/MM/DD/HH 分区，
+并把时间窗口换算为Macie作业的对象键前缀，只扫描需要的时间范围。
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from loki_chunk_decoder import LokiChunkReader
+
+# 提取文件注释头中记录chunk时间范围的行
+TIME_RANGE_HEADER = '# Log time: '
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# 流式上传时S3键中的分区占位符，由工作进程解析chunk头部后替换
+PARTITION_PLACEHOLDER = '{partition}'
+
+# 读取注释头时最多检查的行数
+HEADER_SCAN_LINES = 16
+
+# Macie作业中前缀条件的最大数量，超过时合并为更粗的粒度
+MAX_SCOPE_PREFIXES = 50
+
+
+def format_log_time(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, timezone.utc).strftime(TIME_FORMAT)
+
+
+def parse_log_time(value: str) -> int:
+    dt = datetime.strptime(value, TIME_FORMAT).replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def time_range_header(from_ms: int, through_ms: int) -> str:
+    """提取文件注释头中的时间范围行 (不含换行符)"""
+    return f"{TIME_RANGE_HEADER}{format_log_time(from_ms)} / {format_log_time(through_ms)}"
+
+
+def chunk_time_range(chunk_file) -> Tuple[int, int]:
+    """只解析chunk头部元数据，返回 (from_ms, through_ms)"""
+    reader = LokiChunkReader(chunk_file)
+    return reader.from_ms, reader.through_ms
+
+
+def read_time_range(text_file) -> Optional[Tuple[int, int]]:
+    """从提取文件 (或其去重、预过滤结果) 的注释头读取时间范围，没有时返回None"""
+    with open(text_file, 'r', encoding='utf-8', errors='replace') as f:
+        for _, line in zip(range(HEADER_SCAN_LINES), f):
+            if line.startswith(TIME_RANGE_HEADER):
+                from_value, through_value = line[len(TIME_RANGE_HEADER):].strip().split(' / ')
+                return parse_log_time(from_value), parse_log_time(through_value)
+            if not line.startswith('#'):
+                break
+    return None
+
+
+def hour_partition(ts_ms: int) -> str:
+    """时间戳所在的小时分区 YYYY/MM/DD/HH"""
+    return datetime.fromtimestamp(ts_ms / 1000, timezone.utc).strftime('%Y/%m/%d/%H')
+
+
+def chunk_partition(chunk_file, default: str) -> str:
+    """chunk起始时间所在的小时分区，无法解析头部时使用默认分区"""
+    try:
+        from_ms, _ = chunk_time_range(chunk_file)
+    except Exception:
+        return default
+    return hour_partition(from_ms)
+
+
+def parse_time_arg(value: str) -> datetime:
+    """解析命令行时间参数 (UTC)，支持 YYYY-MM-DD[THH[:MM[:SS]]]"""
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间: {value} (格式: YYYY-MM-DD[THH[:MM[:SS]]])")
+
+
+def window_partitions(start: datetime, end: datetime, lookback_hours: int = 0) -> List[str]:
+    """
+    时间窗口覆盖的小时分区列表
+    chunk按起始时间分区，一个chunk可能跨越多个小时，因此窗口起点向前多包含 lookback_hours 小时
+    """
+    hour = (start - timedelta(hours=lookback_hours)).astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    end = end.astimezone(timezone.utc)
+    partitions = []
+    while hour <= end:
+        partitions.append(hour.strftime('%Y/%m/%d/%H'))
+        hour += timedelta(hours=1)
+    return partitions
+
+
+def collapse_partitions(partitions: Iterable[str], max_prefixes: int = MAX_SCOPE_PREFIXES) -> List[str]:
+    """
+    分区数量超过上限时依次合并为天、月、年粒度 (会多包含同一天/月内的其他小时)
+    """
+    prefixes = sorted(set(partitions))
+    for depth in (3, 2, 1):
+        if len(prefixes) <= max_prefixes:
+            break
+        prefixes = sorted({'/'.join(p.split('/')[:depth]) for p in prefixes})
+    return prefixes